@@ -1,9 +1,7 @@
 
 from __future__ import print_function
-import gc
-import time
+import collections
 import numpy
-import functools
 import threading
 from Dataset import Dataset
 from Log import log
@@ -11,12 +9,41 @@ from Util import NumbersDict
 
 
 class CachedDataset(Dataset):
+  """
+  Base class for datasets which load the seqs via :func:`_load_seqs` into a cache (e.g. :class:`HDFDataset`).
 
-  def __init__(self, cache_byte_size=0, **kwargs):
+  The input data ("data") is cached per seq, indexed by the real (corpus) seq idx,
+  thus a seq stays cached across epochs, also when the seq order changes.
+  With a limited `cache_byte_size`, the cache consists of two parts:
+
+  * The start cache (2/3 of the bytes): the first seqs of the epoch (in the epoch seq order).
+    They are loaded in a background thread in :func:`init_seq_order` and are not evicted in this epoch.
+  * The dynamic cache (the remaining bytes): all other loaded seqs, with LRU eviction.
+
+  With a negative `cache_byte_size`, nothing is evicted.
+  The targets are kept in arrays for the whole corpus (indexed via the real seq idx), see :func:`get_real_seq_start`.
+
+  With `shared_cache`, the input data of the whole corpus is instead kept in a node-local shared memory segment
+  (:class:`TaskSystem.NodeSharedMem`), which is created by the Horovod local rank 0,
+  and all other ranks on the node attach to it. Whatever seq some rank loads, it writes it there,
+  and all ranks read it from there, thus the node holds only a single copy. `cache_byte_size` is ignored then.
+  This also covers the targets which are allocated via :func:`_alloc_targets`.
+
+  With `lazy_window`, the cache holds the raw frames, and the context windows (option `window`)
+  are constructed only when the data is accessed (see :func:`get_input_data`, :func:`get_data_slice`).
+  """
+  supports_lazy_window = True
+
+  def __init__(self, cache_byte_size=0, shared_cache=False, shared_cache_key=None, **kwargs):
     """
     :param int cache_byte_size:
+    :param bool shared_cache: share the cached input data between all Horovod ranks on the node
+    :param str|None shared_cache_key: identifies the shared cache on the node.
+      by default derived from the corpus and the parent process (i.e. the job launcher, e.g. mpirun)
     """
     super(CachedDataset, self).__init__(**kwargs)
+    assert not (self.shuffle_frames_of_nseqs and self.window > 1 and self.lazy_window), (
+      "%s: shuffle_frames_of_nseqs would destroy the context of the frames with lazy_window" % self)
     self.cache_byte_size_total_limit = cache_byte_size
     if cache_byte_size < 0:
       self.cache_byte_size_limit_at_start = 1
@@ -26,27 +53,46 @@ class CachedDataset(Dataset):
     self.num_seqs_cached_at_start = 0
     self.cached_bytes_at_start = 0
     self.start_cache_initialized = False
-    self.preload_set = set([])
-    self.preload_end = 0
+    self.definite_cache_leftover = 0
     self.max_ctc_length = 0
     self.ctc_targets = None
-    self.alloc_intervals = None
+    self._cache_cond = threading.Condition()  # protects all of the cache state below
+    self._start_cache = {}  # type: dict[int,numpy.ndarray]  # real seq idx -> data
+    self._lru_cache = collections.OrderedDict()  # type: dict[int,numpy.ndarray]  # real seq idx -> data. oldest first
+    self._lru_cache_bytes = 0
+    self._start_cache_real_idxs = set()  # type: set[int]  # real seq idx which belong to the start cache
+    self._pending_real_idxs = set()  # type: set[int]  # real seq idx which the preload thread will load
+    self._protected_real_idxs = set()  # type: set[int]  # real seq idx which must not be evicted right now
+    self._preload_thread = None  # type: threading.Thread|None
+    self._cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+    self._shuffle_buffers = {}  # type: dict[str,numpy.ndarray]  # see _get_shuffle_buffer
+    self.shared_cache = shared_cache
+    self.shared_cache_key = shared_cache_key
+    self._shared_cache_mem = None  # type: TaskSystem.NodeSharedMem|None
+    self._shared_cache_flags = None  # type: numpy.ndarray|None  # real seq idx -> whether loaded
+    self._shared_cache_data = None  # type: numpy.ndarray|None  # (total frames, dim)
+    self._shared_cache_targets = {}  # type: dict[str,numpy.ndarray]  # key -> targets of the whole corpus
     self._seq_start = []  # [numpy.array([0,0])]  # uses sorted seq idx, see set_batching()
+    self._real_seq_start = numpy.zeros((0, 0), dtype="int64")  # real seq idx -> start of data and all targets
     self._seq_index = []; """ :type: list[int] """  # Via init_seq_order(). seq_index idx -> hdf seq idx
     self._index_map = range(len(self._seq_index))  # sorted seq idx -> seq_index idx
     self._seq_lengths = numpy.zeros((0, 0))  # real seq idx -> tuple of len of data and all targets
     self._tags = []; """ :type: list[str|bytes] """  # uses real seq idx. access via _get_tag_by_real_idx
     self._tag_idx = {}; ":type: dict[str,int] "  # map of tag -> real-seq-idx. call _update_tag_idx
-    self.targets = {}
+    self.targets = {}  # key -> targets of the whole corpus, see get_real_seq_start
     self.target_keys = []
 
+  def _base_init(self):
+    super(CachedDataset, self)._base_init()
+    if self.shared_cache and not self._shared_cache_mem:
+      self._init_shared_cache(is_creator=self._is_shared_cache_creator())
+
   def initialize(self):
     super(CachedDataset, self).initialize()
 
     # Calculate cache sizes.
     temp_cache_size_bytes = max(0, self.cache_byte_size_total_limit)
     self.definite_cache_leftover = temp_cache_size_bytes if self.num_seqs_cached_at_start == self.num_seqs else 0
-    self.cache_num_frames_free = temp_cache_size_bytes // self.nbytes
 
     print("cached %i seqs" % self.num_seqs_cached_at_start,
           "%s GB" % (self.cached_bytes_at_start / float(1024 * 1024 * 1024)),
@@ -68,27 +114,23 @@ class CachedDataset(Dataset):
     else:
       seq_index = self.get_seq_order_for_epoch(epoch, self._num_seqs, lambda s: self._seq_lengths[s][0])
 
-    old_index_map = self._index_map[:]
-    self._index_map = range(len(seq_index))  # sorted seq idx -> seq_index idx
-
     if self._seq_index == seq_index and self.start_cache_initialized:
       return False
 
     if epoch is not None:
       # Give some hint to the user in case he is wondering why the cache is reloading.
       print("Reinitialize dataset seq order for epoch %i." % epoch, file=log.v4)
+    self._print_cache_stats_and_reset()
 
-    if self.num_seqs_cached_at_start != len(seq_index) or not self.start_cache_initialized:
-      self._seq_index = seq_index
-      self._seq_index_inv = dict(zip(seq_index, range(len(seq_index))))  # hdf seq idx -> seq_index idx
-      self._init_seq_starts()
-      self._init_alloc_intervals()
-      self._init_start_cache()
-      self.start_cache_initialized = True
-    else:
-      self._index_map = [self._seq_index_inv[i] for i in seq_index]  # sorted seq idx -> seq_index idx
-      if self._index_map == old_index_map:
-        return False
+    if self._preload_thread:
+      # The start cache of the last epoch might still be loading. It uses the old seq order, so wait for it.
+      self._preload_thread.join()
+      self._preload_thread = None
+    self._seq_index = seq_index
+    self._index_map = range(len(seq_index))  # sorted seq idx -> seq_index idx
+    self._init_seq_starts()
+    self._init_start_cache()
+    self.start_cache_initialized = True
     return True
 
   def _get_tag_by_real_idx(self, real_idx):
@@ -103,50 +145,104 @@ class CachedDataset(Dataset):
   def batch_set_generator_cache_whole_epoch(self):
     return True
 
-  def _init_alloc_intervals(self):
-    assert self.num_seqs > 0
-    assert self.num_inputs > 0
-    assert self.window > 0
-    self.preload_set = set([])
-    self.alloc_intervals = \
-      [(0, 0, numpy.zeros([1] + self.get_data_shape("data"), dtype=self.get_data_dtype("data"))),
-       (self.num_seqs, self.num_seqs, numpy.zeros([1] + self.get_data_shape("data"), dtype=self.get_data_dtype("data")))]
-    # self.alloc_intervals[i] is (idx start, idx end, data), where
-    # idx start/end is the sorted seq idx start/end, end exclusive,
-    # and data is a numpy.array.
-
   def _init_seq_starts(self):
     self._seq_start = [self._seq_start[0] * 0]  # idx like in seq_index, *not* real idx
     for i in range(self.num_seqs):
       ids = self._seq_index[i]
       self._seq_start.append(self._seq_start[-1] + self._seq_lengths[ids])
+    self._init_real_seq_starts()
 
-  def _init_start_cache(self):
-    if not self.alloc_intervals:
-      return
-    if not self.nbytes:
-      return
+  def _init_real_seq_starts(self):
+    seq_lengths = numpy.array(self._seq_lengths, dtype="int64").reshape((len(self._seq_lengths), -1))
+    self._real_seq_start = numpy.zeros((seq_lengths.shape[0] + 1, seq_lengths.shape[1]), dtype="int64")
+    numpy.cumsum(seq_lengths, axis=0, out=self._real_seq_start[1:])
 
+  def _init_start_cache(self):
+    """
+    Selects the first seqs (in the epoch seq order) for the start cache,
+    moves them from/to the dynamic cache, and starts loading the missing ones in a background thread.
+    """
     num_cached = 0
     cached_bytes = 0
-    for i in range(self.num_seqs):
-      if i == num_cached:
+    if self.nbytes:
+      for i in range(self.num_seqs):
         nbytes = self.get_seq_length_2d(i)[0] * self.nbytes
-        if self.cache_byte_size_limit_at_start >= cached_bytes + nbytes:
-          num_cached = i + 1
-          cached_bytes += nbytes
-
+        if self.cache_byte_size_limit_at_start < cached_bytes + nbytes:
+          break
+        num_cached = i + 1
+        cached_bytes += nbytes
     self.num_seqs_cached_at_start = num_cached
     self.cached_bytes_at_start = cached_bytes
-    if num_cached > 0:
-      self.preload_end = num_cached
-      threading.Thread(target=self._preload_seqs,args=(0,num_cached)).start()
+
+    start_cache_real_idxs = set([self._seq_index[i] for i in range(num_cached)])
+    with self._cache_cond:
+      for real_idx in list(self._start_cache.keys()):
+        if real_idx not in start_cache_real_idxs:
+          self._lru_cache[real_idx] = self._start_cache.pop(real_idx)
+          self._lru_cache_bytes += self._lru_cache[real_idx].nbytes
+      for real_idx in start_cache_real_idxs:
+        if real_idx in self._lru_cache:
+          self._lru_cache_bytes -= self._lru_cache[real_idx].nbytes
+          self._start_cache[real_idx] = self._lru_cache.pop(real_idx)
+      self._start_cache_real_idxs = start_cache_real_idxs
+      self._protected_real_idxs = set()
+      self._evict()
+      self._pending_real_idxs = set([i for i in start_cache_real_idxs if self._get_cached_data(i) is None])
+
+    if self._pending_real_idxs:
+      self._preload_thread = threading.Thread(
+        target=self._preload_seqs, args=(0, num_cached), name="%s preload" % self.name)
+      self._preload_thread.daemon = True
+      self._preload_thread.start()
+
+  def _evict(self):
+    """
+    Evicts the least recently used seqs from the dynamic cache, until we are within the limit.
+    Expects that we hold self._cache_cond.
+    """
+    if self.cache_byte_size_total_limit < 0:  # unlimited
+      return
+    num_protected = 0
+    while self._lru_cache_bytes > self.cache_byte_size_total_limit and len(self._lru_cache) > num_protected:
+      real_idx, data = self._lru_cache.popitem(last=False)
+      if real_idx in self._protected_real_idxs:
+        self._lru_cache[real_idx] = data  # move to the end
+        num_protected += 1
+        continue
+      self._lru_cache_bytes -= data.nbytes
+      self._cache_stats["evictions"] += 1
+
+  def _get_cached_data(self, real_idx):
+    """
+    :param int real_idx:
+    :rtype: numpy.ndarray|None
+    """
+    if self._shared_cache_mem:
+      if not self._shared_cache_flags[real_idx]:
+        return None
+      start = self._real_seq_start[real_idx][0]
+      data = self._shared_cache_data[start:start + self._seq_lengths[real_idx][0]]
+      data.flags.writeable = False  # shared with the other ranks
+      return data
+    data = self._start_cache.get(real_idx)
+    if data is None:
+      data = self._lru_cache.get(real_idx)
+    return data
+
+  def _print_cache_stats_and_reset(self):
+    stats = self._cache_stats
+    if stats["hits"] + stats["misses"] > 0:
+      print("%s: cache hits: %i seqs, misses: %i seqs, hit rate %.1f%%, evictions: %i seqs" % (
+        self.name, stats["hits"], stats["misses"], 100. * stats["hits"] / (stats["hits"] + stats["misses"]),
+        stats["evictions"]), file=log.v4)
+    for key in stats:
+      stats[key] = 0
 
   def load_seqs(self, start, end):
     """
     Load data sequences.
     As a side effect, will modify / fill-up:
-      self.alloc_intervals
+      the cache
       self.targets
     This does some extra logic for the cache and calls self._load_seqs()
     for the real loading.
@@ -156,247 +252,251 @@ class CachedDataset(Dataset):
     """
     assert start >= 0
     assert start <= end
-
-    if self.is_cached(start, end, blocking=True): return
-
-    if self.cache_byte_size_total_limit > 0:  # If the cache is enabled.
-      self._load_seqs_with_cache(start, end)
-      return self.is_cached(start, end, blocking=True)
+    if start == end:
+      return
+    real_idxs = [self._seq_index[self._index_map[i]] for i in range(start, end)]
+    load_start, load_end = self._get_load_seqs_superset(start, end)  # e.g. for shuffle_frames_of_nseqs
+
+    with self._cache_cond:
+      # Wait for the seqs which are loaded by the preload thread.
+      while self._pending_real_idxs.intersection(real_idxs):
+        self._cache_cond.wait()
+      num_hits = 0
+      for real_idx in real_idxs:
+        if real_idx in self._lru_cache:
+          num_hits += 1
+          self._lru_cache[real_idx] = self._lru_cache.pop(real_idx)  # mark as recently used
+        elif self._get_cached_data(real_idx) is not None:
+          num_hits += 1
+      self._cache_stats["hits"] += num_hits
+      self._cache_stats["misses"] += len(real_idxs) - num_hits
+      if num_hits == len(real_idxs):
+        return
+      self._protected_real_idxs = set(
+        [self._seq_index[self._index_map[i]] for i in range(load_start, min(load_end, self.num_seqs))])
 
     super(CachedDataset, self).load_seqs(start, end)
 
   def _load_seqs(self, start, end):
-    raise NotImplementedError
+    """
+    Load the data of the sorted seq idx [start,end), which are not cached yet (see :func:`_get_uncached_seqs`),
+    and store it via :func:`_set_cached_seq_data`, and the targets in self.targets.
+    Can be called from the preload thread.
 
-  def _load_seqs_with_cache(self, start, end, clear=True):
-    if not clear:
-      # only remove as many frames as required
-      num_needed_cache_frames = self.get_seq_start(end)[0] - self.get_seq_start(start)[0]
-      if self.cache_num_frames_free < num_needed_cache_frames:
-        self.cache_num_frames_free += self.delete(num_needed_cache_frames - self.cache_num_frames_free)
-        gc.collect()
-      self.cache_num_frames_free -= num_needed_cache_frames
-      threading.Thread(target=self._preload_seqs,args=(start,end)).start()
-    else:
-      # First, delete everything.
-      self.cache_num_frames_free += self.delete(None)
-      gc.collect()
-      # Preload as much as we can so that we fill up the cache.
-      while end < self.num_seqs:
-        num_needed_cache_frames = self.get_seq_length_2d(end)[0]
-        if self.cache_num_frames_free - num_needed_cache_frames < 0:
-          break
-        self.cache_num_frames_free -= num_needed_cache_frames
-        end += 1
-      self.preload_end = end
-      threading.Thread(target=self._preload_seqs,args=(start,end)).start()
+    :param int start: start sorted seq idx
+    :param int end: end sorted seq idx
+    """
+    raise NotImplementedError
 
   def _preload_seqs(self,start,end):
     print("Preloading cache from", start, "to", end, file=log.v4)
-    super(CachedDataset, self).load_seqs(start, end)
-    self.preload_end = self.num_seqs_cached_at_start
+    try:
+      super(CachedDataset, self).load_seqs(start, end)
+    finally:
+      with self._cache_cond:
+        self._pending_real_idxs = set()
+        self._cache_cond.notify_all()
+
+  @staticmethod
+  def _is_shared_cache_creator():
+    """
+    :return: whether we create the shared cache on this node, i.e. whether we are the Horovod local rank 0
+    :rtype: bool
+    """
+    import horovod.tensorflow as hvd
+    from TFUtil import init_horovod
+    init_horovod()  # make sure it is initialized
+    return hvd.local_rank() == 0
 
-  def _shuffle_frames_in_seqs(self, start, end):
+  def _get_shared_cache_key(self):
     """
-    :type start: int
-    :type end: int
+    :return: key for :class:`TaskSystem.NodeSharedMem`. the same for all ranks of the same job on the node
+    :rtype: str
     """
-    assert start < end
-    assert self.is_cached(start, end)
-    alloc_idx = self.alloc_interval_index(start)
-    alloc_start, alloc_end, alloc_data = self.alloc_intervals[alloc_idx]
-    assert start >= alloc_start
-    assert end <= alloc_end
-    rnd = numpy.random.RandomState(start)  # Some deterministic way to shuffle!
-    num_frames = self._seq_start[end][0] - self._seq_start[start][0]
-    assert num_frames > 0
-    perm = rnd.permutation(num_frames)
-    alloc_offset = self._seq_start[start][0] - self._seq_start[alloc_start][0]
-    assert alloc_offset + num_frames <= alloc_data.shape[0]
-    # Permute alloc_data.
-    data = alloc_data[alloc_offset:alloc_offset + num_frames]
-    alloc_data[alloc_offset:alloc_offset + num_frames] = data[perm]
-    # Permute targets.
-    for k in self.targets:
-      idx = self.target_keys.index(k) + 1
-      targets = self.targets[k][self._seq_start[idx]:self._seq_start[start][idx] + num_frames]
-      self.targets[k][self._seq_start[start][idx]:self._seq_start[start][idx] + self._seq_start[end][idx] - self._seq_start[start][idx]] = targets[perm]
+    if self.shared_cache_key:
+      return self.shared_cache_key
+    import hashlib
+    import os
+    h = hashlib.md5()
+    h.update(("%s %s %i %i %s %s" % (
+      self.__class__.__name__, self.name, self.num_inputs, self.window, self.lazy_window,
+      self.get_data_dtype("data"))).encode("utf8"))
+    h.update(numpy.ascontiguousarray(self._seq_lengths, dtype="int64").tobytes())
+    # All ranks on the node are started by the same launcher process (e.g. mpirun or orted).
+    return "%s-%i" % (h.hexdigest(), os.getppid())
+
+  def _init_shared_cache(self, is_creator):
+    """
+    Creates or attaches to the node-local shared memory, for the input data of the whole corpus.
 
-  def _set_alloc_intervals_data(self, idc, data):
+    :param bool is_creator:
     """
-    :param int idc: index of sorted seq idx
-    :param numpy.ndarray data: raw data
+    from TaskSystem import NodeSharedMem
+    self._init_real_seq_starts()
+    num_seqs = len(self._seq_lengths)
+    num_frames = int(self._real_seq_start[-1][0]) if num_seqs else 0
+    dim = self.num_inputs * (1 if self.lazy_window else self.window)
+    dtype = numpy.dtype(self.get_data_dtype("data"))
+
+    def aligned(n):
+      """
+      :param int n: num bytes
+      :rtype: int
+      """
+      return (n + 63) // 64 * 64
+
+    offset = aligned(num_seqs)  # after the flags
+    data_offset = offset
+    offset += aligned(num_frames * dim * dtype.itemsize)
+    targets_layout = []  # list of (key, offset, shape, dtype)
+    for target_key in sorted(self.targets.keys()):
+      if self.targets[target_key] is not None:  # already allocated, not via _alloc_targets
+        continue
+      target_shape, target_dtype = self._get_targets_shape_dtype(target_key)
+      target_dtype = numpy.dtype(target_dtype)
+      targets_layout.append((target_key, offset, target_shape, target_dtype))
+      offset += aligned(int(numpy.prod(target_shape, dtype="int64")) * target_dtype.itemsize)
+    size = offset
+    key = self._get_shared_cache_key()
+    print("%s: %s node-local shared cache %r, %.3f GB" % (
+      self.name, "create" if is_creator else "attach to", key, size / float(1024 * 1024 * 1024)), file=log.v4)
+
+    def init_targets(mem):
+      """
+      :param NodeSharedMem mem:
+      """
+      for target_key_, target_offset_, target_shape_, target_dtype_ in targets_layout:
+        mem.get_numpy_array(offset=target_offset_, shape=target_shape_, dtype=target_dtype_)[...] = -1
+
+    self._shared_cache_mem = NodeSharedMem(key=key, size=size, is_creator=is_creator, init_func=init_targets)
+    self._shared_cache_flags = self._shared_cache_mem.get_numpy_array(offset=0, shape=(num_seqs,), dtype="uint8")
+    self._shared_cache_data = self._shared_cache_mem.get_numpy_array(
+      offset=data_offset, shape=(num_frames, dim), dtype=dtype)
+    for target_key, target_offset, target_shape, target_dtype in targets_layout:
+      self._shared_cache_targets[target_key] = self._shared_cache_mem.get_numpy_array(
+        offset=target_offset, shape=target_shape, dtype=target_dtype)
+      self.targets[target_key] = self._shared_cache_targets[target_key]  # also the seqs loaded by other ranks
+
+  def _get_targets_shape_dtype(self, key):
     """
-    idi = self.alloc_interval_index(idc)
-    assert idi >= 0
-    o = self._seq_start[idc][0] - self._seq_start[self.alloc_intervals[idi][0]][0]
-    l = data.shape[0]
-    x = data
-    x = self.preprocess(x)
-    if self.window > 1:
-      x = self.sliding_window(x)
-    self.alloc_intervals[idi][2][o:o + l] = x
+    :param str key: target key
+    :return: shape and dtype of the targets of the whole corpus, as in self.targets[key]
+    :rtype: (tuple[int], str)
+    """
+    raise NotImplementedError
 
-  def alloc_interval_index(self, ids):
+  def _alloc_targets(self, key):
     """
-    :param int ids: sorted seq idx
-    :return index in self.alloc_intervals
-    :rtype: int
+    :param str key: target key
+    :return: the array for self.targets[key], for the whole corpus, initialized with -1.
+      Lives in the shared cache if enabled.
+    :rtype: numpy.ndarray
     """
-    s = 0
-    e = len(self.alloc_intervals)
-    # Binary search.
-    while s < e:
-      i = (s + e) // 2
-      alloc_start, alloc_end, _ = self.alloc_intervals[i]
-      if alloc_start <= ids < alloc_end:
-        return i
-      elif alloc_start <= ids and ids >= alloc_end:
-        if s == i: return -1
-        s = i
-      elif alloc_start > ids:
-        if e == i: return -1
-        e = i
-      else:
-        assert False
-    return -1
+    if key in self._shared_cache_targets:
+      return self._shared_cache_targets[key]
+    shape, dtype = self._get_targets_shape_dtype(key)
+    return numpy.zeros(shape, dtype=dtype) - 1
 
-  def _insert_alloc_interval(self, pos, value, merge=False):
+  def _get_uncached_seqs(self, start, end):
     """
-    Insert np.zeros into self.alloc_intervals.
-    :param int pos: idx in self.alloc_intervals
-    :param (int,int) value: (start,end) like in load_seqs(), sorted seq idx
-    :rtype: int
+    :param int start: start sorted seq idx
+    :param int end: end sorted seq idx
+    :return: sorted seq idx in [start,end) which are not cached
+    :rtype: list[int]
     """
-    ci = self.alloc_intervals[pos][1]
-    ni = self.alloc_intervals[pos + 1][0]
-    xc = self.alloc_intervals[pos][2]
-    xn = self.alloc_intervals[pos + 1][2]
-    if value[0] == ci and value[1] == ni and merge:
-      nj = self.alloc_intervals[pos][0]
-      nk = self.alloc_intervals[pos + 1][1]
-      del self.alloc_intervals[pos]
-      del self.alloc_intervals[pos]
-      self.alloc_intervals.insert(pos,
-        (nj,nk,
-         numpy.concatenate(
-           [xc,
-            numpy.zeros(
-              [self._seq_start[ni][0]] + self.get_data_shape("data"),
-              dtype=self.get_data_dtype("data")),
-            xn])))
-      return 0
-    elif value[0] == ci and merge:
-      nj = self.alloc_intervals[pos][0]
-      del self.alloc_intervals[pos]
-      self.alloc_intervals.insert(pos, (nj,value[1],
-                                        numpy.concatenate([xc, numpy.zeros([self._seq_start[value[1]][0] - self._seq_start[ci][0]] + self.get_data_shape("data"), dtype=self.get_data_dtype("data"))])))
-      return 0
-    elif value[1] == ni and merge:
-      nk = self.alloc_intervals[pos + 1][1]
-      del self.alloc_intervals[pos + 1]
-      self.alloc_intervals.insert(pos + 1, (value[0], nk,
-                                            numpy.concatenate([numpy.zeros([self._seq_start[ni][0] - self._seq_start[value[0]][0]] + self.get_data_shape("data"), dtype=self.get_data_dtype("data")), xc])))
-      return 0
-    else:
-      self.alloc_intervals.insert(pos + 1,
-        value + (numpy.zeros(
-            [self._seq_start[value[1]][0] - self._seq_start[value[0]][0]] + self.get_data_shape("data"),
-            dtype=self.get_data_dtype("data")),))
-      return 1
+    with self._cache_cond:
+      return [
+        i for i in range(start, end)
+        if self._get_cached_data(self._seq_index[self._index_map[i]]) is None]
 
-  def _remove_alloc_interval(self, pos, value):
+  def _set_cached_seq_data(self, idc, data):
     """
-    Remove data from self.alloc_intervals.
-    :param int pos: idx in self.alloc_intervals
-    :param (int,int) value: (start,end) like in load_seqs(), sorted seq idx
-    :rtype: int
+    :param int idc: sorted seq idx
+    :param numpy.ndarray data: raw data
     """
-    ci, ni, xi = self.alloc_intervals[pos]
-    if value[0] == ci and value[1] == ni:
-      del self.alloc_intervals[pos]
-      return -1
-    elif value[0] == ci:
-      self.alloc_intervals.insert(pos, (value[1], ni, xi[self._seq_start[value[1]][0] - self._seq_start[ci][0]:]))
-      del self.alloc_intervals[pos + 1]
-      return 0
-    elif value[1] == ni:
-      self.alloc_intervals.insert(pos, (ci, value[0], xi[:self._seq_start[value[0]][0] - self._seq_start[ci][0]]))
-      del self.alloc_intervals[pos + 1]
-      return 0
-    else:
-      self.alloc_intervals.insert(pos, (value[1], ni, xi[self._seq_start[value[1]][0] - self._seq_start[ci][0]:]))
-      self.alloc_intervals.insert(pos, (ci, value[0], xi[:self._seq_start[value[0]][0] - self._seq_start[ci][0]]))
-      del self.alloc_intervals[pos + 2]
-      return 1
+    x = data
+    x = self.preprocess(x)
+    if self.window > 1 and not self.lazy_window:
+      x = self.sliding_window(x)
+    x = numpy.array(x)  # we want our own copy. e.g. sliding_window returns a view
+    real_idx = self._seq_index[self._index_map[idc]]
+    if self._shared_cache_mem:
+      start = self._real_seq_start[real_idx][0]
+      # Other ranks might write the same seq at the same time, but it is the same data.
+      self._shared_cache_data[start:start + x.shape[0]] = x
+      with self._cache_cond:
+        self._shared_cache_flags[real_idx] = 1  # only after the data was written
+        self._cache_cond.notify_all()
+      return
+    with self._cache_cond:
+      if real_idx in self._start_cache_real_idxs:
+        self._start_cache[real_idx] = x
+      else:
+        if real_idx in self._lru_cache:
+          self._lru_cache_bytes -= self._lru_cache.pop(real_idx).nbytes
+        self._lru_cache[real_idx] = x
+        self._lru_cache_bytes += x.nbytes
+        self._evict()
+      self._cache_cond.notify_all()
 
-  def _modify_alloc_intervals(self, start, end, invert):
+  def _shuffle_frames_in_seqs(self, start, end):
     """
-    Inserts/removes sorted seq idx range (start,end).
-    :param int start: like in load_seqs(), sorted seq idx
-    :param int end: like in load_seqs(), sorted seq idx
-    :param bool invert: True->insert, False->remove
-    :rtype: list[int]
-    :return selection list, modified sorted seq idx in self.alloc_intervals
+    Draws one permutation over all frames of the seqs [start, end)
+    and applies it inplace to the data and all targets,
+    via one gather per key (fancy indexing), into reused buffers.
+
+    :type start: int
+    :type end: int
     """
-    if end is None: end = start + 1
-    if start == end: return
     assert start < end
-    i = 0
-    selection = []; """ :type: list[int] """
-    modify = self._insert_alloc_interval if invert else self._remove_alloc_interval
-    while i < len(self.alloc_intervals) - invert:
-      ni = self.alloc_intervals[i + invert][1 - invert]  # insert mode: start idx of next alloc
-      ci = self.alloc_intervals[i][invert]               # insert mode: end idx of cur alloc
-      flag = ((ci <= start < ni), (ci < end <= ni), (ci < start and ni <= start) or (ci >= end and ni > end))
-      if not flag[0] and not flag[1]:
-        if not flag[2]:
-          selection.extend(range(ci, ni))
-          i += modify(i, (ci, ni))
-      elif flag[1]:
-        v = (start if flag[0] else ci, end)
-        selection.extend(range(v[0], v[1]))
-        i += modify(i, v)
-        break
-      elif flag[0]:
-        selection.extend(range(start, ni))
-        i += modify(i, (start, ni))
-      i += 1
-    if self.alloc_intervals[0][0] != 0:
-      self.alloc_intervals.insert(0, (0, 0, numpy.zeros([1] + self.get_data_shape("data"), dtype=self.get_data_dtype("data"))))
-    if self.alloc_intervals[-1][1] != self.num_seqs:
-      self.alloc_intervals.append((self.num_seqs, self.num_seqs, numpy.zeros([1] + self.get_data_shape("data"), dtype=self.get_data_dtype("data"))))
-    return selection
-
-  def insert_alloc_interval(self, start, end=None):
-    return self._modify_alloc_intervals(start, end, True)
-
-  def remove_alloc_interval(self, start, end=None):
-    return self._modify_alloc_intervals(start, end, False)
-
-  def delete(self, nframes):
-    """
-    :param int|None nframes: how much frames to delete max.
-      Note that this limit is not strict. We can end up
-      deleting more than nframes.
-    :return: number of frames deleted
-    :rtype: int
+    assert self.is_cached(start, end)
+    assert not self._shared_cache_mem, "frame shuffling would modify the data of the other ranks"
+    rnd = numpy.random.RandomState(start)  # Some deterministic way to shuffle!
+    real_idxs = numpy.array([self._seq_index[self._index_map[i]] for i in range(start, end)])
+    seq_lens = self._seq_lengths[real_idxs]  # (num seqs, 1 + num targets)
+    num_frames = int(numpy.sum(seq_lens[:, 0]))
+    assert num_frames > 0
+    perm = rnd.permutation(num_frames)
+    with self._cache_cond:
+      datas = [self._get_cached_data(real_idx) for real_idx in real_idxs]
+      data = self._get_shuffle_buffer("data", (num_frames,) + datas[0].shape[1:], datas[0].dtype)
+      data_shuffled = self._get_shuffle_buffer("data_shuffled", data.shape, data.dtype)
+      numpy.concatenate(datas, axis=0, out=data)
+      numpy.take(data, perm, axis=0, out=data_shuffled)
+      offset = 0
+      for x in datas:
+        x[...] = data_shuffled[offset:offset + x.shape[0]]  # inplace
+        offset += x.shape[0]
+    for k in self.targets:
+      idx = self.target_keys.index(k) + 1
+      if self.targets[k] is None:
+        continue
+      assert numpy.array_equal(seq_lens[:, idx], seq_lens[:, 0]), "frame shuffling needs the same len for %r" % k
+      # Frame idx into self.targets[k] for every frame of the seqs.
+      # The seqs are not contiguous in there, as they are placed by real seq idx.
+      seq_offsets = numpy.cumsum(seq_lens[:, 0]) - seq_lens[:, 0]  # offsets in the concatenated frames
+      frame_idxs = numpy.arange(num_frames) + numpy.repeat(
+        self._real_seq_start[real_idxs, idx] - seq_offsets, seq_lens[:, 0])
+      src_frame_idxs = self._get_shuffle_buffer("frame_idxs", frame_idxs.shape, frame_idxs.dtype)
+      numpy.take(frame_idxs, perm, out=src_frame_idxs)
+      targets_shuffled = self._get_shuffle_buffer(
+        "targets_%s" % k, (num_frames,) + self.targets[k].shape[1:], self.targets[k].dtype)
+      numpy.take(self.targets[k], src_frame_idxs, axis=0, out=targets_shuffled)
+      self.targets[k][frame_idxs] = targets_shuffled
+
+  def _get_shuffle_buffer(self, name, shape, dtype):
     """
-    if nframes is not None:
-      if nframes == 0:
-        return 0
-      assert nframes > 0
-    deleted = 0
-    i = 0
-    while (not nframes or deleted < nframes) and i < len(self.alloc_intervals):
-      ai = self.alloc_intervals[i]
-      if ai[1] > self.num_seqs_cached_at_start and ai[0] < ai[1]:
-        removed = self.remove_alloc_interval(max(ai[0],self.num_seqs_cached_at_start), ai[1])
-        self.preload_set -= set(removed)
-        deleted += sum([self._seq_lengths[self._seq_index[i]][0] for i in removed])
-      else:
-        i += 1
-    return deleted
+    :param str name:
+    :param tuple[int] shape:
+    :param str|numpy.dtype dtype:
+    :return: buffer of the given shape, reused over calls (grown if needed). the content is undefined
+    :rtype: numpy.ndarray
+    """
+    buf = self._shuffle_buffers.get(name)
+    if buf is None or buf.dtype != numpy.dtype(dtype) or buf.shape[1:] != tuple(shape[1:]) or buf.shape[0] < shape[0]:
+      buf = numpy.empty((max(shape[0], buf.shape[0] * 2 if buf is not None else 0),) + tuple(shape[1:]), dtype=dtype)
+      self._shuffle_buffers[name] = buf
+    return buf[:shape[0]]
 
   @property
   def num_seqs(self):
@@ -404,21 +504,17 @@ class CachedDataset(Dataset):
       return len(self._index_map)
     return self._num_seqs
 
-  def is_cached(self, start, end, blocking = False):
+  def is_cached(self, start, end):
     """
     :param int start: like in load_seqs(), sorted seq idx
     :param int end: like in load_seqs(), sorted seq idx
     :rtype: bool
     :returns whether we have the full range (start,end) of sorted seq idx
-      cached in self.alloc_intervals (end is exclusive).
+      in the cache (end is exclusive).
     """
     if start == end: return True  # Empty.
     assert start < end
-    if blocking and end <= self.preload_end:
-      while not set(range(start,end)) <= self.preload_set:
-        time.sleep(0.2)
-      return True
-    return set(range(start,end)) <= self.preload_set
+    return not self._get_uncached_seqs(start, end)
 
   def get_seq_length_2d(self, sorted_seq_idx):
     """
@@ -450,16 +546,37 @@ class CachedDataset(Dataset):
     seq_len = self.get_seq_length_2d(sorted_seq_idx)[0]
     return self.timestamps[seq_start:seq_start + seq_len]
 
+  def get_real_seq_start(self, real_seq_idx):
+    """
+    :param int real_seq_idx:
+    :return: start frame of data and all targets, in the whole corpus (e.g. for self.targets)
+    :rtype: numpy.ndarray
+    """
+    return self._real_seq_start[real_seq_idx]
+
   def get_input_data(self, sorted_seq_idx):
-    seq_idx = self._index_map[sorted_seq_idx]
-    idi = self.alloc_interval_index(seq_idx)
-    assert idi >= 0, "failed to get data for seq %i" % sorted_seq_idx
-    alloc_start_seq, alloc_end_seq, alloc_data = self.alloc_intervals[idi]
-    o = self.get_seq_start(seq_idx)[0] - self.get_seq_start(alloc_start_seq)[0]
-    assert o >= 0
-    l = self.get_seq_length_2d(sorted_seq_idx)[0]
-    assert alloc_data.shape[0] >= o + l
-    return alloc_data[o:o + l]
+    data = self._get_cached_input_data(sorted_seq_idx)
+    if self.window > 1 and self.lazy_window:
+      data = self.sliding_window(data)
+    return data
+
+  def get_data_slice(self, seq_idx, key, start_frame, end_frame):
+    if key == "data" and self.window > 1 and self.lazy_window:
+      # Only construct the windows of the requested frames, e.g. of one chunk.
+      return self.sliding_window(self._get_cached_input_data(seq_idx), start_frame=start_frame, end_frame=end_frame)
+    return super(CachedDataset, self).get_data_slice(seq_idx, key, start_frame, end_frame)
+
+  def _get_cached_input_data(self, sorted_seq_idx):
+    """
+    :param int sorted_seq_idx:
+    :return: the data as it is stored in the cache, i.e. without the context windows if lazy_window
+    :rtype: numpy.ndarray
+    """
+    real_seq_idx = self._seq_index[self._index_map[sorted_seq_idx]]
+    with self._cache_cond:
+      data = self._get_cached_data(real_seq_idx)
+    assert data is not None, "failed to get data for seq %i, not loaded" % sorted_seq_idx
+    return data
 
   def get_data_dim(self, key):
     if key == "data":
@@ -469,9 +586,9 @@ class CachedDataset(Dataset):
     return 1 if len(self.targets[key].shape) == 1 else self.targets[key].shape[1]
 
   def get_targets(self, target, sorted_seq_idx):
-    seq_idx = self._index_map[sorted_seq_idx]
+    real_seq_idx = self._seq_index[self._index_map[sorted_seq_idx]]
     idx = self.target_keys.index(target) + 1
-    seq_start = self.get_seq_start(seq_idx)[idx]
+    seq_start = self.get_real_seq_start(real_seq_idx)[idx]
     seq_len = self.get_seq_length_2d(sorted_seq_idx)[idx]
     return self.targets[target][seq_start:seq_start + seq_len]
 
@@ -1,6 +1,8 @@
 
+from __future__ import print_function
 
 from Dataset import Dataset, DatasetSeq
+from Log import log
 import math
 
 
@@ -16,12 +18,31 @@ class CachedDataset2(Dataset):
   - handle seq ordering by overriding `init_seq_order`
   - you can set `_estimated_num_seqs`
   - you can set `_num_seqs` or `_num_timesteps` if you know them in advance
+
+  With `prefetch_num_seqs`, the seqs are collected in a background thread (see :class:`_SeqPrefetcher`),
+  in the order of the seq idx, ahead of what was requested via `load_seqs`.
+  This only works if `_collect_single_seq` does not depend on anything which is done in `_load_seqs`
+  (thus not for MetaDataset and co, which override `_load_seqs`),
+  and the dataset must not modify the state which `_collect_single_seq` uses outside of `init_seq_order`.
   """
 
-  def __init__(self, **kwargs):
+  prefetch_num_seqs = 0  # default, in case a derived class does not call our __init__
+  _prefetcher = None  # type: _SeqPrefetcher|None
+
+  def __init__(self, prefetch_num_seqs=0, prefetch_max_mb=None, **kwargs):
+    """
+    :param int prefetch_num_seqs: if >0, collect up to this number of seqs ahead in a background thread
+    :param float|None prefetch_max_mb: additionally limits the prefetched (not yet requested) data, in MB
+    """
     super(CachedDataset2, self).__init__(**kwargs)
     self._num_timesteps = None
     self.epoch = None
+    self.prefetch_num_seqs = prefetch_num_seqs
+    self.prefetch_max_bytes = int(prefetch_max_mb * 1024 * 1024) if prefetch_max_mb else None
+    self._prefetcher = None
+    if prefetch_num_seqs:
+      assert type(self)._load_seqs == CachedDataset2._load_seqs, (
+        "%s: prefetching is not supported as _load_seqs is overwritten" % self.__class__.__name__)
 
   def init_seq_order(self, epoch=None, seq_list=None):
     """
@@ -33,6 +54,7 @@ class CachedDataset2(Dataset):
     This is called when we start a new epoch, or at initialization.
     Call this when you reset the seq list.
     """
+    self._stop_prefetcher()
     super(CachedDataset2, self).init_seq_order(epoch=epoch, seq_list=seq_list)
     if not epoch:
       epoch = 1
@@ -44,6 +66,11 @@ class CachedDataset2(Dataset):
     self.epoch = epoch
     return True
 
+  def _stop_prefetcher(self):
+    if self._prefetcher:
+      self._prefetcher.stop()
+      self._prefetcher = None
+
   def _cleanup_old_seqs(self, seq_idx_end):
     i = 0
     while i < len(self.added_data):
@@ -85,8 +112,14 @@ class CachedDataset2(Dataset):
       self.expected_load_seq_start = start
     if self.added_data:
       start = max(self.added_data[-1].seq_idx + 1, start)
-    seqs = [self._collect_single_seq(seq_idx=seq_idx) for seq_idx in range(start, end)]
-    seqs = list(filter(None, seqs))  # We might not know the num seqs in advance.
+    if self.prefetch_num_seqs:
+      if not self._prefetcher:
+        self._prefetcher = _SeqPrefetcher(
+          dataset=self, start_seq_idx=start, max_num_seqs=self.prefetch_num_seqs, max_bytes=self.prefetch_max_bytes)
+      seqs = self._prefetcher.get_seqs(start, end)
+    else:
+      seqs = [self._collect_single_seq(seq_idx=seq_idx) for seq_idx in range(start, end)]
+      seqs = list(filter(None, seqs))  # We might not know the num seqs in advance.
     self._num_timesteps_accumulated += sum([seq.num_frames for seq in seqs])
     self.added_data += seqs
 
@@ -197,3 +230,129 @@ class CachedDataset2(Dataset):
   def get_data_dtype(self, key):
     self._load_something()
     return self.added_data[0].get_data(key).dtype
+
+
+class _SeqPrefetcher(object):
+  """
+  Calls :func:`CachedDataset2._collect_single_seq` in a background thread, for the seq idx in increasing order,
+  starting from some seq idx, until it returns None (end of the epoch).
+  It stays at most `max_num_seqs` seqs (and `max_bytes`) ahead of what was taken via :func:`get_seqs`,
+  except that what was requested via :func:`get_seqs` is always collected.
+  The taken seqs end up in `CachedDataset2.added_data`, which is cleaned up via `_cleanup_old_seqs` as usual,
+  so the memory is bounded in total.
+  """
+
+  def __init__(self, dataset, start_seq_idx, max_num_seqs, max_bytes=None):
+    """
+    :param CachedDataset2 dataset:
+    :param int start_seq_idx:
+    :param int max_num_seqs:
+    :param int|None max_bytes:
+    """
+    from threading import Thread, Condition
+    self.dataset = dataset
+    self.max_num_seqs = max_num_seqs
+    self.max_bytes = max_bytes
+    self.cond = Condition()
+    self.seqs = {}  # type: dict[int,DatasetSeq|None]  # seq idx -> seq, or None for the end
+    self.next_seq_idx = start_seq_idx  # next seq idx to collect (by the thread)
+    self.taken_seq_idx_end = start_seq_idx  # all seq idx before have been taken
+    self.requested_seq_idx_end = start_seq_idx
+    self.num_bytes = 0  # of self.seqs
+    self.reached_end = False
+    self.exception = None  # type: Exception|None
+    self.stopped = False
+    self.thread = Thread(target=self._thread_main, name="%s prefetch" % dataset.name)
+    self.thread.daemon = True
+    self.thread.start()
+
+  @staticmethod
+  def _get_num_bytes(seq):
+    """
+    :param DatasetSeq|None seq:
+    :rtype: int
+    """
+    if seq is None:
+      return 0
+    return sum([v.nbytes for v in seq.features.values()])
+
+  def _want_more(self):
+    """
+    :rtype: bool
+    """
+    if self.next_seq_idx < self.requested_seq_idx_end:
+      return True
+    if self.next_seq_idx - self.taken_seq_idx_end >= self.max_num_seqs:
+      return False
+    if self.max_bytes is not None and self.num_bytes >= self.max_bytes:
+      return False
+    return True
+
+  def _thread_main(self):
+    import sys
+    while True:
+      with self.cond:
+        while not self.stopped and not self._want_more():
+          self.cond.wait()
+        if self.stopped:
+          return
+        seq_idx = self.next_seq_idx
+      try:
+        seq = self.dataset._collect_single_seq(seq_idx=seq_idx)
+      except Exception as exc:
+        print("%s: exception in prefetch thread for seq %i" % (self.dataset.name, seq_idx), file=log.v1)
+        sys.excepthook(*sys.exc_info())
+        with self.cond:
+          self.exception = exc
+          self.cond.notify_all()
+        return
+      with self.cond:
+        self.seqs[seq_idx] = seq
+        self.num_bytes += self._get_num_bytes(seq)
+        self.next_seq_idx = seq_idx + 1
+        if seq is None:
+          self.reached_end = True
+        self.cond.notify_all()
+        if self.reached_end:
+          return
+
+  def get_seqs(self, start, end):
+    """
+    Waits until the seqs are collected, and takes them.
+
+    :param int start: seq idx. >= all seq idx which were taken before
+    :param int end: seq idx, exclusive
+    :return: the seqs in [start,end), or less if we reached the end
+    :rtype: list[DatasetSeq]
+    """
+    assert start >= self.taken_seq_idx_end
+    res = []
+    with self.cond:
+      self.requested_seq_idx_end = max(self.requested_seq_idx_end, end)
+      self.cond.notify_all()
+      for seq_idx in range(self.taken_seq_idx_end, end):
+        while seq_idx not in self.seqs:
+          if self.exception is not None:
+            raise self.exception
+          if self.reached_end and seq_idx >= self.next_seq_idx:
+            break
+          self.cond.wait()
+        seq = self.seqs.get(seq_idx)
+        if seq is None:  # end reached. keep the end marker
+          break
+        del self.seqs[seq_idx]
+        self.num_bytes -= self._get_num_bytes(seq)
+        self.taken_seq_idx_end = seq_idx + 1
+        if seq_idx >= start:
+          res.append(seq)
+      self.cond.notify_all()
+    return res
+
+  def stop(self):
+    """
+    Stops the thread, and waits for it.
+    """
+    with self.cond:
+      self.stopped = True
+      self.cond.notify_all()
+    self.thread.join()
@@ -20,10 +20,11 @@ import functools
 
 from Log import log
 from EngineBatch import Batch, BatchSetGenerator
-from Util import try_run, NumbersDict, unicode
+from Util import try_run, NumbersDict, unicode, Stats
 
 
 class Dataset(object):
+  supports_lazy_window = False  # see option lazy_window
 
   @staticmethod
   def kwargs_update_from_config(config, kwargs):
@@ -37,6 +38,7 @@ class Dataset(object):
       if value is not None and key not in kwargs:
         kwargs[key] = value
     set_or_remove("window", config.int('window', 0) or None)
+    set_or_remove("lazy_window", config.bool('lazy_window', False) or None)
     set_or_remove("context_window", config.typed_value("context_window"))
     set_or_remove("chunking", config.opt_typed_value("chunking", None))
     set_or_remove("seq_ordering", config.value("batching", None))
@@ -54,7 +56,7 @@ class Dataset(object):
     return cls(**kwargs)
 
   def __init__(self, name=None,
-               window=1, context_window=None, chunking=None,
+               window=1, lazy_window=False, context_window=None, chunking=None,
                seq_ordering='default', partition_epoch=None,
                shuffle_frames_of_nseqs=0, min_chunk_size=0,
                estimated_num_seqs=None,):
@@ -62,6 +64,11 @@ class Dataset(object):
     :param str name: e.g. "train" or "eval"
     :param int window: features will be of dimension window * feature_dim, as we add a context-window around.
       not all datasets support this option.
+    :param bool lazy_window: with window > 1, the dataset keeps the raw frames (e.g. in its cache),
+      and the context windows are only constructed in get_data() / get_data_slice(), i.e. at batch time.
+      This reduces the memory of the dataset by the window size.
+      Ignored by datasets which do not support it (see supports_lazy_window),
+      e.g. when set globally in the config.
     :param None|int|dict|NumbersDict context_window: will add this context for each chunk
     :param None|str|int|(int,int)|dict|(dict,dict) chunking: "chunk_size:chunk_step"
     :param str seq_ordering: "batching"-option in config. e.g. "default", "sorted" or "random".
@@ -75,6 +82,9 @@ class Dataset(object):
     self.num_inputs = 0  # usually not used, but num_outputs instead, which is more generic
     self.num_outputs = None; " :type: dict[str,(int,int)] "  # tuple is num-classes, len(shape).
     self.window = window
+    self.lazy_window = bool(lazy_window and self.supports_lazy_window)
+    if lazy_window and not self.supports_lazy_window:
+      print("%s: lazy_window not supported, ignored." % self.__class__.__name__, file=log.v4)
     self.seq_ordering = seq_ordering  # "default", "sorted" or "random". See self.get_seq_order_for_epoch().
     self.partition_epoch = partition_epoch or 1
     self.timestamps = None
@@ -125,18 +135,28 @@ class Dataset(object):
       getattr(self, "name", "<unknown>"),
       getattr(self, "epoch", "<unknown>"))
 
-  def sliding_window(self, xr):
+  def sliding_window(self, xr, start_frame=0, end_frame=None):
     """
-    :type xr: numpy.ndarray
+    :param numpy.ndarray xr: raw frames, (time, num_inputs)
+    :param int start_frame: only construct the windows of the frames [start_frame, end_frame)
+    :param int|None end_frame: len of xr by default
+    :return: context windows, zero-padded at the borders, (end_frame - start_frame, num_inputs * window)
     :rtype: numpy.ndarray
     """
     from numpy.lib.stride_tricks import as_strided
-    x = numpy.concatenate([self.zpad, xr, self.zpad])
+    if end_frame is None:
+      end_frame = xr.shape[0]
+    context = int(self.window) // 2
+    # Only the raw frames which are needed for the requested windows, plus the zero padding.
+    x = numpy.concatenate([
+      self.zpad[:max(context - start_frame, 0)],
+      xr[max(start_frame - context, 0):end_frame + context],
+      self.zpad[:max(end_frame + context - xr.shape[0], 0)]])
     return as_strided(
       x,
       shape=(x.shape[0] - self.window + 1, 1, self.window, self.num_inputs),
       strides=(x.strides[0], x.strides[1] * self.num_inputs) + x.strides
-      ).reshape((xr.shape[0], self.num_inputs * self.window))
+      ).reshape((end_frame - start_frame, self.num_inputs * self.window))
 
   def preprocess(self, seq):
     """
@@ -240,7 +260,7 @@ class Dataset(object):
     """
     raise NotImplementedError
 
-  def get_seq_order_for_epoch(self, epoch, num_seqs, get_seq_len=None):
+  def get_seq_order_for_epoch(self, epoch, num_seqs, get_seq_len=None, seq_lens=None):
     """
     Returns the order of the given epoch.
     This is mostly a static method, except that is depends on the configured type of ordering,
@@ -249,9 +269,29 @@ class Dataset(object):
     :param int epoch: for 'random', this determines the random seed
     :param int num_seqs:
     :param ((int) -> int)|None get_seq_len: function (originalSeqIdx: int) -> int
+    :param numpy.ndarray|None seq_lens: (num_seqs,), originalSeqIdx -> len. alternative to get_seq_len.
+      The sorting is vectorized then, which is much faster for big corpora. The resulting order is the same.
     :return: the order for the given epoch. such that seq_idx -> underlying idx
     :rtype: list[int]
     """
+    if seq_lens is not None:
+      seq_lens = numpy.asarray(seq_lens, dtype="int64")
+      assert seq_lens.shape == (num_seqs,)
+
+    def sort_seq_index(idxs, reverse=False):
+      """
+      :param list[int] idxs:
+      :param bool reverse:
+      :return: idxs sorted by seq len. stable, just like list.sort
+      :rtype: list[int]
+      """
+      if seq_lens is None:
+        assert get_seq_len
+        return sorted(idxs, key=get_seq_len, reverse=reverse)
+      idxs = numpy.array(idxs, dtype="int64")
+      lens = seq_lens[idxs]
+      return idxs[numpy.argsort(-lens if reverse else lens, kind="mergesort")].tolist()
+
     partition_epoch = self.partition_epoch or 1
     if not epoch:
       epoch = 1
@@ -263,13 +303,10 @@ class Dataset(object):
     if self.seq_ordering == 'default':
       pass  # Keep order as-is.
     elif self.seq_ordering == 'sorted':
-      assert get_seq_len
-      seq_index.sort(key=get_seq_len)  # sort by length, starting with shortest
+      seq_index = sort_seq_index(seq_index)  # sort by length, starting with shortest
     elif self.seq_ordering == "sorted_reverse":
-      assert get_seq_len
-      seq_index.sort(key=get_seq_len, reverse=True)  # sort by length, in reverse, starting with longest
+      seq_index = sort_seq_index(seq_index, reverse=True)  # sort by length, in reverse, starting with longest
     elif self.seq_ordering.startswith('laplace'):
-      assert get_seq_len
       tmp = self.seq_ordering.split(':')
       bins = int(tmp[1]) if len(tmp) > 1 else 2
       nth = int(tmp[2]) if len(tmp) > 2 else 1
@@ -282,8 +319,7 @@ class Dataset(object):
           part = seq_index[i * len(seq_index) // bins:][:]
         else:
           part = seq_index[i * len(seq_index) // bins:(i + 1) * len(seq_index) // bins][:]
-        part.sort(key=get_seq_len, reverse=(i % 2 == 1))
-        out_index += part
+        out_index += sort_seq_index(part, reverse=(i % 2 == 1))
       seq_index = out_index
     elif self.seq_ordering.startswith('random'):
       tmp = self.seq_ordering.split(':')
@@ -334,7 +370,8 @@ class Dataset(object):
     if int(self.window) % 2 == 0:
       self.window += 1
 
-    self.nbytes = numpy.array([], dtype=numpy.float32).itemsize * (self.num_inputs * self.window + 1 + 1)
+    stored_window = 1 if self.lazy_window else self.window
+    self.nbytes = numpy.array([], dtype=numpy.float32).itemsize * (self.num_inputs * stored_window + 1 + 1)
 
     if self.window > 1:
       self.zpad = numpy.zeros((int(self.window) // 2, self.num_inputs), dtype=numpy.float32)
@@ -412,6 +449,14 @@ class Dataset(object):
     """
     return "seq-%i" % sorted_seq_idx
 
+  def get_all_tags(self):
+    """
+    :return: all seq tags of the corpus, in the default order (i.e. the order of the corpus),
+      without iterating through the dataset. not supported by all datasets
+    :rtype: list[str]
+    """
+    raise NotImplementedError
+
   def have_corpus_seq_idx(self):
     """
     :rtype: bool
@@ -584,15 +629,35 @@ class Dataset(object):
     return " ".join(map(self.labels[key].__getitem__, data))
 
   def calculate_priori(self, target="classes"):
-    priori = numpy.zeros((self.num_outputs[target][0],), dtype=numpy.float32)
-    i = 0
-    while self.is_less_than_num_seqs(i):
-      self.load_seqs(i, i + 1)
-      for t in self.get_targets(target, i):
-        priori[t] += 1
-      i += 1
+    """
+    :param str target: sparse key
+    :return: class counts over the whole dataset, divided by the num of timesteps, shape (dim,)
+    :rtype: numpy.ndarray
+    """
+    stats = self.collect_statistics(keys=[target])
+    priori = numpy.array(stats.class_counts[target], dtype=numpy.float32)
     return numpy.array(priori / self.get_num_timesteps(), dtype=numpy.float32)
 
+  def collect_statistics(self, keys=None, start_seq=0, end_seq=None):
+    """
+    Goes once over the seqs in [start_seq, end_seq) in the current seq order.
+    See :func:`collect_dataset_statistics` to do this in parallel over multiple processes.
+
+    :param list[str]|None keys: data keys. all by default
+    :param int start_seq:
+    :param int|None end_seq: until the end by default
+    :rtype: DatasetStatistics
+    """
+    if keys is None:
+      keys = self.get_data_keys()
+    stats = DatasetStatistics()
+    seq_idx = start_seq
+    while (end_seq is None or seq_idx < end_seq) and self.is_less_than_num_seqs(seq_idx):
+      self.load_seqs(seq_idx, seq_idx + 1)
+      stats.collect_seq(dataset=self, seq_idx=seq_idx, keys=keys)
+      seq_idx += 1
+    return stats
+
   def iterate_seqs(self, chunk_size=None, chunk_step=None, used_data_keys=None):
     """
     Takes chunking into consideration.
@@ -838,6 +903,171 @@ class DatasetSeq:
     return "<DataCache seq_idx=%i>" % self.seq_idx
 
 
+class DatasetStatistics(object):
+  """
+  Statistics over (a part of) a dataset, which can be merged with the statistics over other parts.
+  For dense data: mean/variance/min/max (via :class:`Util.Stats`),
+  for sparse data: class counts (e.g. for priors),
+  for all data: histogram of the seq lengths.
+  """
+
+  def __init__(self):
+    self.num_seqs = 0
+    self.dense_stats = {}  # type: dict[str,Stats]  # key -> stats
+    self.class_counts = {}  # type: dict[str,numpy.ndarray]  # key -> int64 array (dim,)
+    self.seq_len_counts = {}  # type: dict[str,numpy.ndarray]  # key -> int64 array (max_len+1,)
+
+  def collect_seq(self, dataset, seq_idx, keys):
+    """
+    :param Dataset dataset:
+    :param int seq_idx: seq must be loaded
+    :param list[str] keys:
+    """
+    self.num_seqs += 1
+    for key in keys:
+      data = dataset.get_data(seq_idx, key)
+      self._add_counts(self.seq_len_counts, key, numpy.bincount([data.shape[0] if data.ndim >= 1 else 1]))
+      if dataset.is_data_sparse(key):
+        # Sparse data might be stored as float (e.g. the targets in HDFDataset), but bincount needs ints.
+        self._add_counts(
+          self.class_counts, key, numpy.bincount(data.ravel().astype("int64"), minlength=dataset.get_data_dim(key)))
+      else:
+        if key not in self.dense_stats:
+          self.dense_stats[key] = Stats()
+        self.dense_stats[key].collect(data)
+
+  @staticmethod
+  def _add_counts(counts_dict, key, counts):
+    """
+    :param dict[str,numpy.ndarray] counts_dict:
+    :param str key:
+    :param numpy.ndarray counts: via numpy.bincount. can be shorter or longer than the existing counts
+    """
+    counts = counts.astype("int64")
+    if key not in counts_dict:
+      counts_dict[key] = counts
+      return
+    existing = counts_dict[key]
+    if len(existing) < len(counts):
+      existing, counts = counts, existing
+    existing[:len(counts)] += counts
+    counts_dict[key] = existing
+
+  def merge(self, other):
+    """
+    :param DatasetStatistics other: e.g. collected over another part of the dataset
+    """
+    self.num_seqs += other.num_seqs
+    for key, stats in sorted(other.dense_stats.items()):
+      if key not in self.dense_stats:
+        self.dense_stats[key] = Stats()
+      self.dense_stats[key].merge(stats)
+    for key, counts in sorted(other.class_counts.items()):
+      self._add_counts(self.class_counts, key, counts.copy())
+    for key, counts in sorted(other.seq_len_counts.items()):
+      self._add_counts(self.seq_len_counts, key, counts.copy())
+
+  def get_priors(self, key="classes"):
+    """
+    :param str key: sparse key
+    :return: relative class frequencies, shape (dim,)
+    :rtype: numpy.ndarray
+    """
+    counts = self.class_counts[key]
+    return counts / float(max(numpy.sum(counts), 1))
+
+  def dump(self, output_file_prefix=None, stream=None):
+    """
+    :param str|None output_file_prefix: if given, will numpy.savetxt mean/std_dev, priors, seq len histograms
+    :param io.TextIOBase|None stream: sys.stdout by default
+    """
+    if stream is None:
+      stream = sys.stdout
+    print("Statistics over %i seqs:" % self.num_seqs, file=stream)
+    for key, counts in sorted(self.seq_len_counts.items()):
+      lens = numpy.arange(len(counts))
+      num_seqs = max(int(numpy.sum(counts)), 1)
+      print("  %r seq lens: total %i, min %i, max %i, mean %f" % (
+        key, int(numpy.sum(lens * counts)), int(numpy.min(lens[counts > 0])), len(counts) - 1,
+        numpy.sum(lens * counts) / float(num_seqs)), file=stream)
+      if output_file_prefix:
+        numpy.savetxt("%s.%s.seq_len_counts.txt" % (output_file_prefix, key), counts, fmt="%i")
+    for key, stats in sorted(self.dense_stats.items()):
+      stats.dump(
+        output_file_prefix=("%s.%s" % (output_file_prefix, key)) if output_file_prefix else None,
+        stream=stream, stream_prefix="  %r " % key)
+    for key, counts in sorted(self.class_counts.items()):
+      print("  %r classes: %i used of %i, %i total" % (
+        key, int(numpy.count_nonzero(counts)), len(counts), int(numpy.sum(counts))), file=stream)
+      if output_file_prefix:
+        print("  Write priors to %s.%s.priors.txt." % (output_file_prefix, key), file=stream)
+        numpy.savetxt("%s.%s.priors.txt" % (output_file_prefix, key), self.get_priors(key))
+
+
+_collect_statistics_worker_dataset = None  # type: Dataset
+
+
+def _collect_statistics_worker_init(dataset_opts, epoch):
+  """
+  Initializer of the worker processes of :func:`collect_dataset_statistics`.
+
+  :param dict[str]|str dataset_opts:
+  :param int epoch:
+  """
+  global _collect_statistics_worker_dataset
+  _collect_statistics_worker_dataset = init_dataset(dataset_opts)
+  _collect_statistics_worker_dataset.init_seq_order(epoch=epoch)
+
+
+def _collect_statistics_worker(args):
+  """
+  :param (list[str],int,int) args: keys, start_seq, end_seq
+  :rtype: DatasetStatistics
+  """
+  keys, start_seq, end_seq = args
+  return _collect_statistics_worker_dataset.collect_statistics(keys=keys, start_seq=start_seq, end_seq=end_seq)
+
+
+def collect_dataset_statistics(dataset_opts, keys=None, epoch=1, num_workers=1, num_shards=None):
+  """
+  Collects :class:`DatasetStatistics` in one pass over the dataset.
+  With multiple workers, the seqs are split into consecutive shards,
+  each worker process creates its own dataset instance and collects the statistics of its shards,
+  and the results are merged.
+
+  :param dict[str]|str dataset_opts: for :func:`init_dataset`. the num of seqs must be known in advance
+  :param list[str]|None keys: data keys. all by default
+  :param int epoch: for the seq order
+  :param int num_workers: num of processes. if <= 1, collects in this process
+  :param int|None num_shards: by default 4 * num_workers
+  :rtype: DatasetStatistics
+  """
+  dataset = init_dataset(dataset_opts)
+  dataset.init_seq_order(epoch=epoch)
+  if keys is None:
+    keys = dataset.get_data_keys()
+  if num_workers <= 1:
+    return dataset.collect_statistics(keys=keys)
+  num_seqs = dataset.num_seqs
+  del dataset
+  if not num_shards:
+    num_shards = num_workers * 4
+  num_shards = max(min(num_shards, num_seqs), 1)
+  shards = [(keys, num_seqs * i // num_shards, num_seqs * (i + 1) // num_shards) for i in range(num_shards)]
+  import multiprocessing
+  pool = multiprocessing.Pool(
+    processes=num_workers, initializer=_collect_statistics_worker_init, initargs=(dataset_opts, epoch))
+  try:
+    stats = DatasetStatistics()
+    # imap (not imap_unordered) such that the merge order, and thus the result, is deterministic.
+    for shard_stats in pool.imap(_collect_statistics_worker, shards):
+      stats.merge(shard_stats)
+  finally:
+    pool.terminate()
+    pool.join()
+  return stats
+
+
 def get_dataset_class(name):
   from importlib import import_module
   # Only those modules which make sense to be loaded by the user,
@@ -1074,6 +1074,8 @@ class FastBwFsaShared:
   def __init__(self):
     self.num_states = 1
     self.edges = []  # type: list[Edge]
+    self._edges_array = None  # type: numpy.ndarray|None  # (3,num_edges), (from,to,emission_idx), see _get_arrays
+    self._weights_array = None  # type: numpy.ndarray|None
 
   def add_edge(self, source_state_idx, target_state_idx, emission_idx, weight=0.0):
     """
@@ -1085,6 +1087,8 @@ class FastBwFsaShared:
     edge = Edge(source_state_idx=source_state_idx, target_state_idx=target_state_idx, label=emission_idx, weight=weight)
     self.num_states = max(self.num_states, edge.source_state_idx + 1, edge.target_state_idx + 1)
     self.edges.append(edge)
+    self._edges_array = None
+    self._weights_array = None
 
   def add_inf_loop(self, state_idx, num_emission_labels):
     """
@@ -1094,6 +1098,18 @@ class FastBwFsaShared:
     for emission_idx in range(num_emission_labels):
       self.add_edge(source_state_idx=state_idx, target_state_idx=state_idx, emission_idx=emission_idx)
 
+  def _get_arrays(self):
+    """
+    :return: edges (3,num_edges) (from,to,emission_idx) and weights (num_edges,) of the single FSA
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    if self._edges_array is None:
+      self._edges_array = numpy.array(
+        [(edge.source_state_idx, edge.target_state_idx, edge.label) for edge in self.edges],
+        dtype="int32").reshape((len(self.edges), 3)).transpose()
+      self._weights_array = numpy.array([edge.weight for edge in self.edges], dtype="float32")
+    return self._edges_array, self._weights_array
+
   def get_num_edges(self, n_batch):
     """
     :param int n_batch:
@@ -1107,15 +1123,13 @@ class FastBwFsaShared:
     :return edges: (4,num_edges), edges of the graph (from,to,emission_idx,sequence_idx)
     :rtype: numpy.ndarray
     """
-    num_edges = len(self.edges)
-    res = numpy.zeros((4, num_edges * n_batch), dtype="int32")
-    for batch_idx in range(n_batch):
-      for edge_idx, edge in enumerate(self.edges):
-        res[:, batch_idx * num_edges + edge_idx] = (
-          edge.source_state_idx + batch_idx * self.num_states,
-          edge.target_state_idx + batch_idx * self.num_states,
-          edge.label,
-          batch_idx)
+    single_edges, _ = self._get_arrays()
+    num_edges = single_edges.shape[1]
+    batch_idxs = numpy.repeat(numpy.arange(n_batch, dtype="int32"), num_edges)  # (num_edges * n_batch,)
+    res = numpy.empty((4, num_edges * n_batch), dtype="int32")
+    res[:3] = numpy.tile(single_edges, (1, n_batch))
+    res[:2] += batch_idxs[None, :] * self.num_states
+    res[3] = batch_idxs
     return res
 
   def get_weights(self, n_batch):
@@ -1124,12 +1138,8 @@ class FastBwFsaShared:
     :return weights: (num_edges,), weights of the edges
     :rtype: numpy.ndarray
     """
-    num_edges = len(self.edges)
-    res = numpy.zeros((num_edges * n_batch,), dtype="float32")
-    for batch_idx in range(n_batch):
-      for edge_idx, edge in enumerate(self.edges):
-        res[batch_idx * num_edges + edge_idx] = edge.weight
-    return res
+    _, single_weights = self._get_arrays()
+    return numpy.tile(single_weights, n_batch)
 
   def get_start_end_states(self, n_batch):
     """
@@ -1139,12 +1149,8 @@ class FastBwFsaShared:
     """
     start_state_idx = 0
     end_state_idx = self.num_states - 1
-    res = numpy.zeros((2, n_batch), dtype="int32")
-    for batch_idx in range(n_batch):
-      res[:, batch_idx] = (
-        start_state_idx + batch_idx * self.num_states,
-        end_state_idx + batch_idx * self.num_states)
-    return res
+    state_offsets = numpy.arange(n_batch, dtype="int32") * self.num_states
+    return numpy.stack([start_state_idx + state_offsets, end_state_idx + state_offsets])
 
   def get_fast_bw_fsa(self, n_batch):
     """
@@ -1157,10 +1163,136 @@ class FastBwFsaShared:
       start_end_states=self.get_start_end_states(n_batch))
 
 
+class FastBwSingleFsa:
+  """
+  FSA for a single seq, in array representation.
+  Multiple of these can be put together via :func:`fast_bw_fsa_from_single_fsas`.
+  The start state is 0, the end state is num_states - 1.
+  """
+
+  def __init__(self, num_states, edges, weights=None):
+    """
+    :param int num_states:
+    :param numpy.ndarray edges: (3,num_edges), (from,to,emission_idx)
+    :param numpy.ndarray|None weights: (num_edges,). zero if not given
+    """
+    assert edges.ndim == 2 and edges.shape[0] == 3
+    if weights is None:
+      weights = numpy.zeros((edges.shape[1],), dtype="float32")
+    assert weights.shape == (edges.shape[1],)
+    self.num_states = num_states
+    self.edges = edges
+    self.weights = weights
+
+
+class FastBwSingleFsaCache:
+  """
+  Cache for single-seq FSAs, keyed e.g. by the label sequence (transcription),
+  such that the FSA for a seq which occurs again (e.g. in the next epoch) does not need to be constructed again.
+  """
+
+  def __init__(self, builder, max_num_entries=100000):
+    """
+    :param (object)->FastBwSingleFsa builder: gets the key, returns the FSA
+    :param int max_num_entries: if we have more than this, we remove the oldest entries
+    """
+    from collections import OrderedDict
+    self.builder = builder
+    self.max_num_entries = max_num_entries
+    self._cache = OrderedDict()
+
+  def get(self, key):
+    """
+    :param object key: must be hashable, e.g. tuple of label indices
+    :rtype: FastBwSingleFsa
+    """
+    if key in self._cache:
+      return self._cache[key]
+    fsa = self.builder(key)
+    assert isinstance(fsa, FastBwSingleFsa)
+    self._cache[key] = fsa
+    while len(self._cache) > self.max_num_entries:
+      self._cache.popitem(last=False)
+    return fsa
+
+
+def fast_bw_fsa_from_single_fsas(fsas):
+  """
+  Puts together the FSAs for each seq of a batch, by offsetting the state indices.
+
+  :param list[FastBwSingleFsa] fsas: for each seq in the batch
+  :rtype: FastBaumWelchBatchFsa
+  """
+  n_batch = len(fsas)
+  num_states = numpy.array([fsa.num_states for fsa in fsas], dtype="int32")
+  num_edges = numpy.array([fsa.edges.shape[1] for fsa in fsas], dtype="int32")
+  state_offsets = numpy.zeros((n_batch,), dtype="int32")
+  state_offsets[1:] = numpy.cumsum(num_states)[:-1]
+  batch_idxs = numpy.repeat(numpy.arange(n_batch, dtype="int32"), num_edges)  # (total_num_edges,)
+  edges = numpy.empty((4, batch_idxs.shape[0]), dtype="int32")
+  if n_batch > 0:
+    edges[:3] = numpy.concatenate([fsa.edges for fsa in fsas], axis=1)
+    weights = numpy.concatenate([fsa.weights for fsa in fsas]).astype("float32")
+  else:
+    weights = numpy.zeros((0,), dtype="float32")
+  edges[:2] += state_offsets[batch_idxs][None, :]
+  edges[3] = batch_idxs
+  return FastBaumWelchBatchFsa(
+    edges=edges, weights=weights,
+    start_end_states=numpy.stack([state_offsets, state_offsets + num_states - 1]))
+
+
+def _fast_bw_fsa_staircase_single(key):
+  """
+  :param (int,bool,int|None,int|None,int|None) key: seq_len, with_loop, max_skip, start_max_skip, end_max_skip.
+    See :func:`fast_bw_fsa_staircase`.
+  :rtype: FastBwSingleFsa
+  """
+  seq_len, with_loop, max_skip, start_max_skip, end_max_skip = key
+  assert seq_len > 0
+  edges = []
+  # Conventions:
+  # * create seq_len + 1 states
+  # * state 't': all outgoing edges have emission 't'
+  # * state t=0 is initial/first; state t=seq_len is final.
+  # * need extra handling for first:
+  #   - all outgoing edges can have emissions up to the skip-len
+  for i in range(seq_len):
+    cur_max_skip = None
+    if not cur_max_skip and i == 0:
+      cur_max_skip = start_max_skip
+    if not cur_max_skip and end_max_skip and i + end_max_skip >= seq_len:
+      cur_max_skip = end_max_skip
+    if not cur_max_skip:
+      cur_max_skip = max_skip
+    j_max = seq_len
+    if cur_max_skip:
+      j_max = min(j_max, i + cur_max_skip)
+    if with_loop:
+      edges += [(i, i, i)]
+    if i > 0:
+      edges += [(i, j, i) for j in range(i + 1, j_max + 1)]
+      continue
+    for j in range(i + 1, j_max + 1):  # see comment above. extra rule for first state
+      for t in range(i, j):
+        if with_loop and i == t and j < seq_len:
+          continue
+        edges += [(i, j, t)]
+      if with_loop and j < seq_len:
+        edges += [(i, j, j)]
+  return FastBwSingleFsa(
+    num_states=seq_len + 1, edges=numpy.array(edges, dtype="int32").reshape((len(edges), 3)).transpose())
+
+
+_fast_bw_fsa_staircase_cache = FastBwSingleFsaCache(builder=_fast_bw_fsa_staircase_single)
+
+
 def fast_bw_fsa_staircase(seq_lens, with_loop=False, max_skip=None, start_max_skip=None, end_max_skip=None):
   """
   Builds up a staircase FSA, returns a FastBaumWelchBatchFsa.
   The emissions are indices [0, ..., seq_len - 1].
+  The FSA for each seq is cached (by seq len and options), and then they are put together
+  via :func:`fast_bw_fsa_from_single_fsas`.
 
   :param list[int] seq_lens:
   :param bool with_loop:
@@ -1176,61 +1308,87 @@ def fast_bw_fsa_staircase(seq_lens, with_loop=False, max_skip=None, start_max_sk
     start_max_skip = [start_max_skip] * n_batch
   if not isinstance(end_max_skip, list):
     end_max_skip = [end_max_skip] * n_batch
-  # numpy.ndarray edges: (4,num_edges), edges of the graph (from,to,emission_idx,sequence_idx)
-  # numpy.ndarray weights: (num_edges,), weights of the edges
-  # numpy.ndarray start_end_states: (2, batch), (start,end) state idx in automaton.
-  state_idx = 0
-  edges = []
-  start_end_states = []
-  for batch in range(n_batch):
-    seq_len = seq_lens[batch]
-    assert seq_len > 0
-    start_state_idx = state_idx
-    # Conventions:
-    # * create seq_len + 1 states
-    # * state 't': all outgoing edges have emission 't'
-    # * state t=0 is initial/first; state t=seq_len is final.
-    # * need extra handling for first:
-    #   - all outgoing edges can have emissions up to the skip-len
-    for i in range(seq_len):
-      cur_state_idx = state_idx
-      cur_max_skip = None
-      if not cur_max_skip and i == 0:
-        cur_max_skip = start_max_skip[batch]
-      if not cur_max_skip and end_max_skip[batch] and i + end_max_skip[batch] >= seq_len:
-        cur_max_skip = end_max_skip[batch]
-      if not cur_max_skip:
-        cur_max_skip = max_skip[batch]
-      j_max = seq_len
-      if cur_max_skip:
-        j_max = min(j_max, i + cur_max_skip)
-      if with_loop:
-        emission_idx = i
-        target_state_idx = cur_state_idx
-        edges += [(cur_state_idx, target_state_idx, emission_idx, batch)]
-      for j in range(i + 1, j_max + 1):
-        target_state_idx = cur_state_idx + j - i
-        if i > 0:
-          emission_idx = i
-          edges += [(cur_state_idx, target_state_idx, emission_idx, batch)]
-        else:  # see comment above. extra rule for first state
-          for t in range(i, j):
-            if with_loop and i == t and j < seq_len:
-              continue
-            emission_idx = t
-            edges += [(cur_state_idx, target_state_idx, emission_idx, batch)]
-          if with_loop and j < seq_len:
-            emission_idx = j
-            edges += [(cur_state_idx, target_state_idx, emission_idx, batch)]
-      state_idx += 1
-    end_state_idx = state_idx
-    start_end_states += [(start_state_idx, end_state_idx)]
-    state_idx += 1
-  weights = [0.0] * len(edges)
-  return FastBaumWelchBatchFsa(
-    edges=numpy.array(edges).transpose(),
-    weights=numpy.array(weights),
-    start_end_states=numpy.array(start_end_states).transpose())
+  return fast_bw_fsa_from_single_fsas([
+    _fast_bw_fsa_staircase_cache.get(
+      (int(seq_lens[batch]), bool(with_loop), max_skip[batch], start_max_skip[batch], end_max_skip[batch]))
+    for batch in range(n_batch)])
+
+
+def ctc_fsa_for_label_seq(num_labels, label_seq, blank_idx=None):
+  """
+  Array-based construction of the CTC FSA for a single label seq, i.e. without :class:`Edge` objects.
+  Every edge consumes one frame.
+  For the label seq l_1 ... l_N, we have the start state 0, and then for each i = 0...N,
+  state 2i+1 (after i labels, last emission was blank or nothing) and state 2i+2 (last emission was l_{i+1}),
+  and one single final state (2N+3, i.e. num_states - 1),
+  which is reached by all the edges which go into the final states (after N labels) of the CTC topology.
+
+  :param int num_labels: number of labels without blank
+  :param list[int]|numpy.ndarray label_seq:
+  :param int|None blank_idx: emission idx of blank. num_labels by default
+  :return: num_states, edges (3,num_edges), (from,to,emission_idx)
+  :rtype: (int, numpy.ndarray)
+  """
+  if blank_idx is None:
+    blank_idx = num_labels
+  labels = numpy.asarray(label_seq, dtype="int32")
+  assert labels.ndim == 1
+  num_labels_seq = labels.shape[0]
+  blank_states = numpy.arange(num_labels_seq + 1, dtype="int32") * 2 + 1  # (N+1,)
+  label_states = blank_states[:-1] + 1  # (N,)
+  final_state = 2 * num_labels_seq + 2
+  blanks = numpy.full((num_labels_seq + 1,), blank_idx, dtype="int32")
+  different_next = labels[1:] != labels[:-1]  # (N-1,)
+  edges = numpy.concatenate([
+    # from start state: blank, or first label
+    numpy.array([[0], [blank_states[0]], [blank_idx]], dtype="int32"),
+    numpy.stack([numpy.zeros_like(labels[:1]), label_states[:1], labels[:1]]),
+    # blank loops
+    numpy.stack([blank_states, blank_states, blanks]),
+    # blank state -> next label
+    numpy.stack([blank_states[:-1], label_states, labels]),
+    # label loops
+    numpy.stack([label_states, label_states, labels]),
+    # label -> blank
+    numpy.stack([label_states, blank_states[1:], blanks[1:]]),
+    # label -> next label, if it is different
+    numpy.stack([label_states[:-1][different_next], label_states[1:][different_next], labels[1:][different_next]]),
+  ], axis=1)
+  # All edges into the final states of the CTC topology also go into the single final state.
+  into_final = edges[1] == blank_states[-1]
+  if num_labels_seq > 0:
+    into_final |= edges[1] == label_states[-1]
+  final_edges = edges[:, into_final].copy()
+  final_edges[1] = final_state
+  edges = numpy.concatenate([edges, final_edges], axis=1)
+  return final_state + 1, edges
+
+
+def fast_bw_fsa_ctc(label_seqs, num_labels, blank_idx=None, cache=None):
+  """
+  :param list[list[int]|numpy.ndarray] label_seqs: for each seq in the batch
+  :param int num_labels: number of labels without blank
+  :param int|None blank_idx: emission idx of blank. num_labels by default
+  :param FastBwSingleFsaCache|None cache: if given, should have been created via :func:`make_fast_bw_fsa_ctc_cache`
+  :rtype: FastBaumWelchBatchFsa
+  """
+  if cache is None:
+    cache = make_fast_bw_fsa_ctc_cache(num_labels=num_labels, blank_idx=blank_idx)
+  return fast_bw_fsa_from_single_fsas([cache.get(tuple(int(l) for l in seq)) for seq in label_seqs])
+
+
+def make_fast_bw_fsa_ctc_cache(num_labels, blank_idx=None, **kwargs):
+  """
+  :param int num_labels: number of labels without blank
+  :param int|None blank_idx: emission idx of blank. num_labels by default
+  :param kwargs: passed to :class:`FastBwSingleFsaCache`
+  :return: cache of CTC FSAs, keyed by the label seq (tuple of ints)
+  :rtype: FastBwSingleFsaCache
+  """
+  def builder(label_seq):
+    num_states, edges = ctc_fsa_for_label_seq(num_labels=num_labels, label_seq=label_seq, blank_idx=blank_idx)
+    return FastBwSingleFsa(num_states=num_states, edges=edges)
+  return FastBwSingleFsaCache(builder=builder, **kwargs)
 
 
 class LoadWfstOp(theano.Op):
@@ -2,7 +2,6 @@
 from __future__ import print_function
 import collections
 import functools as fun
-import gc
 import h5py
 import numpy
 import theano
@@ -11,6 +10,7 @@ from CachedDataset2 import CachedDataset2
 from Dataset import Dataset, DatasetSeq
 from Log import log
 import Util
+from Util import PY3
 
 
 # Common attribute names for HDF dataset, which should be used in order to be proceed with HDFDataset class.
@@ -155,18 +155,15 @@ class HDFDataset(CachedDataset):
     """
     Load data sequences.
     As a side effect, will modify / fill-up:
-      self.alloc_intervals
+      the cache, via self._set_cached_seq_data
       self.targets
-      self.chars
 
     :param int start: start sorted seq idx
     :param int end: end sorted seq idx
     """
     assert start < self.num_seqs
     assert end <= self.num_seqs
-    selection = self.insert_alloc_interval(start, end)
-    assert len(selection) <= end - start, "DEBUG: more sequences requested (" + str(len(selection)) + ") as required (" + str(end-start) + ")"
-    self.preload_set |= set(range(start,end)) - set(selection)
+    selection = self._get_uncached_seqs(start, end)
     file_info = [ [] for l in range(len(self.files)) ]; """ :type: list[list[int]] """
     # file_info[i] is (sorted seq idx from selection, real seq idx)
     for idc in selection:
@@ -188,19 +185,21 @@ class HDFDataset(CachedDataset):
         s = ids - self.file_start[i]
         p = self.file_seq_start[i][s]
         l = self._seq_lengths[ids]
+        q = self.get_real_seq_start(ids)
         if 'targets' in fin:
           for k in fin['targets/data']:
             if self.targets[k] is None:
-              if self.data_dtype[k] == 'int32':
-                self.targets[k] = numpy.zeros((self._num_codesteps[self.target_keys.index(k)],), dtype=theano.config.floatX) - 1
-              else:
-                self.targets[k] = numpy.zeros((self._num_codesteps[self.target_keys.index(k)],tdim), dtype=theano.config.floatX) - 1
+              self.targets[k] = self._alloc_targets(k)
             ldx = self.target_keys.index(k) + 1
-            self.targets[k][self.get_seq_start(idc)[ldx]:self.get_seq_start(idc)[ldx] + l[ldx]] = targets[k][p[ldx] : p[ldx] + l[ldx]]
-        self._set_alloc_intervals_data(idc, data=inputs[p[0] : p[0] + l[0]])
-        self.preload_set.add(idc)
+            self.targets[k][q[ldx]:q[ldx] + l[ldx]] = targets[k][p[ldx] : p[ldx] + l[ldx]]
+        self._set_cached_seq_data(idc, data=inputs[p[0] : p[0] + l[0]])
       fin.close()
-    gc.collect()
+
+  def _get_targets_shape_dtype(self, key):
+    num_frames = self._num_codesteps[self.target_keys.index(key)]
+    if self.data_dtype[key] == 'int32':
+      return (num_frames,), theano.config.floatX
+    return (num_frames, self.num_outputs[key][0]), theano.config.floatX
 
   def _get_tag_by_real_idx(self, real_idx):
     s = self._tags[real_idx]
@@ -230,19 +229,36 @@ class HDFDataset(CachedDataset):
 # ------------------------------------------------------------------------------
 
 class StreamParser(object):
+  """
+  Reads the seqs of one stream of a :class:`NextGenHDFDataset` file, i.e. stream['data'][seq_name].
+  The seq lengths are kept in a table (seq name -> len), so that :func:`get_seq_length` does not need to access the file.
+  """
+
   def __init__(self, seq_names, stream):
     self.seq_names = seq_names
     self.stream = stream
+    self.seq_lengths = {}  # type: dict[str,int]  # seq name -> len. filled by derived classes
 
     self.num_features = None
     self.feature_type = None  # 1 for sparse, 2 for dense
     self.dtype        = None
 
-  def get_data(self, seq_name):
+  @classmethod
+  def read_data(cls, stream, seq_name):
+    """
+    Can also be used without a parser instance, e.g. in a reader process with its own h5py file handle.
+
+    :param h5py.Group stream:
+    :param str seq_name: normalized seq name
+    :rtype: numpy.ndarray
+    """
     raise NotImplementedError()
 
+  def get_data(self, seq_name):
+    return self.read_data(self.stream, seq_name)
+
   def get_seq_length(self, seq_name):
-    raise NotImplementedError()
+    return self.seq_lengths[seq_name]
 
   def get_dtype(self):
     return self.dtype
@@ -263,14 +279,13 @@ class FeatureSequenceStreamParser(StreamParser):
 
       assert seq_data.shape[1] == self.num_features
       assert seq_data.dtype    == self.dtype
+      self.seq_lengths[s] = seq_data.shape[0]
 
     self.feature_type = 2
 
-  def get_data(self, seq_name):
-    return self.stream['data'][seq_name][...]
-
-  def get_seq_length(self, seq_name):
-    return self.stream['data'][seq_name].shape[0]
+  @classmethod
+  def read_data(cls, stream, seq_name):
+    return stream['data'][seq_name][...]
 
 
 class SparseStreamParser(StreamParser):
@@ -284,15 +299,14 @@ class SparseStreamParser(StreamParser):
       if self.dtype is None:
         self.dtype = seq_data.dtype
       assert seq_data.dtype == self.dtype
+      self.seq_lengths[s] = seq_data.shape[0]
 
     self.num_features = self.stream['feature_names'].shape[0]
     self.feature_type = 1
 
-  def get_data(self, seq_name):
-    return self.stream['data'][seq_name][:]
-
-  def get_seq_length(self, seq_name):
-    return self.stream['data'][seq_name].shape[0]
+  @classmethod
+  def read_data(cls, stream, seq_name):
+    return stream['data'][seq_name][:]
 
 
 class SegmentAlignmentStreamParser(StreamParser):
@@ -312,25 +326,47 @@ class SegmentAlignmentStreamParser(StreamParser):
     self.num_features = self.stream['feature_names'].shape[0]
     self.feature_type = 1
 
-  def get_data(self, seq_name):
+  @classmethod
+  def read_data(cls, stream, seq_name):
     # we return flatted two-dimensional data where the 2nd dimension is 2 [classs, segment end]
-    length = self.get_seq_length(seq_name) // 2
-    segments = self.stream['data'][seq_name][:]
-
-    alignment = numpy.zeros((length,2,), dtype=self.dtype)
-    num_segments = segments.shape[0]
-    seg_end = 0
-    for i in range(num_segments):
-      next_seg_end = seg_end + segments[i,1]
-      alignment[seg_end:next_seg_end,0] = segments[i,0]  # set class
-      alignment[      next_seg_end-1,1] = 1              # mark segment end
-      seg_end = next_seg_end
+    segments = stream['data'][seq_name][:]
+    seg_lens = segments[:, 1]
+    seg_ends = numpy.cumsum(seg_lens)
+    length = int(seg_ends[-1]) if len(seg_ends) else 0
+
+    alignment = numpy.zeros((length,2,), dtype=segments.dtype)
+    alignment[:, 0] = numpy.repeat(segments[:, 0], seg_lens)  # set class
+    alignment[seg_ends - 1, 1] = 1                              # mark segment end
 
     alignment = alignment.reshape((-1,))
     return alignment
 
   def get_seq_length(self, seq_name):
-    return 2 * sum(self.stream['data'][seq_name][:,1])
+    if seq_name not in self.seq_lengths:  # needs to read the data, thus only on demand
+      self.seq_lengths[seq_name] = 2 * int(numpy.sum(self.stream['data'][seq_name][:, 1]))
+    return self.seq_lengths[seq_name]
+
+
+_next_gen_hdf_reader_files = {}  # type: dict[str,h5py.File]  # path -> file. per process, see _next_gen_hdf_read_seq
+
+
+def _next_gen_hdf_read_seq(path, norm_seq_name, stream_parser_names):
+  """
+  Used by the reader processes of :class:`NextGenHDFDataset`.
+  Every process keeps its own h5py file handle per file.
+
+  :param str path: hdf file
+  :param str norm_seq_name:
+  :param dict[str,str] stream_parser_names: stream name -> parser name, see NextGenHDFDataset.parsers
+  :return: stream name -> data
+  :rtype: dict[str,numpy.ndarray]
+  """
+  if path not in _next_gen_hdf_reader_files:
+    _next_gen_hdf_reader_files[path] = h5py.File(path, "r")
+  streams = _next_gen_hdf_reader_files[path]['streams']
+  return {
+    name: NextGenHDFDataset.parsers[parser_name].read_data(streams[name], norm_seq_name)
+    for (name, parser_name) in stream_parser_names.items()}
 
 
 class NextGenHDFDataset(CachedDataset2):
@@ -341,11 +377,16 @@ class NextGenHDFDataset(CachedDataset2):
               'sparse'            : SparseStreamParser,
               'segment_alignment' : SegmentAlignmentStreamParser }
 
-  def __init__(self, input_stream_name, files=None, partition_epoch=1, **kwargs):
+  def __init__(self, input_stream_name, files=None, partition_epoch=1,
+               num_reader_processes=0, reader_lookahead=None, **kwargs):
     """
     :param str input_stream_name:
     :param None|list[str] files:
     :param int partition_epoch:
+    :param int num_reader_processes: if >0, the seqs are read in a pool of that many processes
+      (each with its own h5py file handles), for the upcoming seqs in the seq order, concurrently
+    :param int|None reader_lookahead: how many seqs to read ahead with the reader processes.
+      4 * num_reader_processes by default
     """
     super(NextGenHDFDataset, self).__init__(**kwargs)
 
@@ -359,6 +400,13 @@ class NextGenHDFDataset(CachedDataset2):
     self.file_indices    = []
     self.seq_order       = []
     self.all_parsers     = collections.defaultdict(list)
+    self.stream_parser_names = []  # type: list[dict[str,str]]  # per file: stream name -> parser name
+
+    self.num_reader_processes = num_reader_processes
+    self.reader_lookahead     = reader_lookahead or 4 * num_reader_processes
+    self._reader_pool         = None  # type: multiprocessing.pool.Pool|None
+    self._reader_pending      = {}  # type: dict[int,multiprocessing.pool.AsyncResult]  # seq idx -> result
+    self._reader_next_seq_idx = 0  # next seq idx to submit to the reader pool
 
     self.partitions        = []
     self.current_partition = 1
@@ -375,7 +423,7 @@ class NextGenHDFDataset(CachedDataset2):
 
     assert {'seq_names', 'streams'}.issubset(set(cur_file.keys())), "%s does not contain all required datasets/groups" % path
 
-    seqs = list(cur_file['seq_names'])
+    seqs = [s.decode("utf8") if isinstance(s, bytes) else s for s in cur_file['seq_names']]  # bytes with Python 3
     norm_seqs = [self._normalize_seq_name(s) for s in seqs]
 
     prev_no_seqs      = len(self.all_seq_names)
@@ -389,6 +437,7 @@ class NextGenHDFDataset(CachedDataset2):
     assert self.input_stream_name in all_streams, "%s does not contain the input stream %s" % (path, self.input_stream_name)
 
     parsers = { name : NextGenHDFDataset.parsers[stream.attrs['parser']](norm_seqs, stream) for name, stream in cur_file['streams'].items()}
+    self.stream_parser_names.append({name: stream.attrs['parser'] for name, stream in cur_file['streams'].items()})
     for k, v in parsers.items():
       self.all_parsers[k].append(v)
 
@@ -417,6 +466,8 @@ class NextGenHDFDataset(CachedDataset2):
     :param list[str] | None seq_list: In case we want to set a predefined order.
     """
     super(NextGenHDFDataset, self).init_seq_order(epoch, seq_list)
+    self._reader_pending.clear()  # the results of the old seq order are not needed anymore
+    self._reader_next_seq_idx = 0
 
     if seq_list is not None:
       self.seq_order = [self.seq_name_to_idx[s] for s in seq_list]
@@ -443,18 +494,76 @@ class NextGenHDFDataset(CachedDataset2):
     if seq_idx >= len(self.seq_order):
       return None
 
-    partition_offset = self.partitions[self.current_partition]
-    real_seq_index   = partition_offset + self.seq_order[seq_idx]
-    file_index       = self.file_indices[real_seq_index]
-    seq_name         = self.all_seq_names[real_seq_index]
-    norm_seq_name    = self._normalize_seq_name(seq_name)
-    targets          = { name : parsers[file_index].get_data(norm_seq_name) for name, parsers in self.all_parsers.items() }
+    real_seq_index, file_index, seq_name, norm_seq_name = self._get_seq_info(seq_idx)
+    if self.num_reader_processes > 0:
+      # Drop the results of skipped seqs. They might have been submitted already.
+      for skipped_seq_idx in [i for i in self._reader_pending.keys() if i < seq_idx]:
+        del self._reader_pending[skipped_seq_idx]
+      self._reader_next_seq_idx = max(self._reader_next_seq_idx, seq_idx)
+      self._submit_reads(seq_idx + self.reader_lookahead + 1)
+      targets = self._reader_pending.pop(seq_idx).get()
+    else:
+      targets = { name : parsers[file_index].get_data(norm_seq_name) for name, parsers in self.all_parsers.items() }
     features         = targets[self.input_stream_name]
     return DatasetSeq(seq_idx=seq_idx,
                       seq_tag=seq_name,
                       features=features,
                       targets=targets)
 
+  def _get_seq_info(self, seq_idx):
+    """
+    :param int seq_idx:
+    :return: real seq idx, file idx, seq name, normalized seq name
+    :rtype: (int,int,str,str)
+    """
+    partition_offset = self.partitions[self.current_partition]
+    real_seq_index   = partition_offset + self.seq_order[seq_idx]
+    file_index       = self.file_indices[real_seq_index]
+    seq_name         = self.all_seq_names[real_seq_index]
+    norm_seq_name    = self._normalize_seq_name(seq_name)
+    return real_seq_index, file_index, seq_name, norm_seq_name
+
+  def _submit_read(self, seq_idx):
+    """
+    :param int seq_idx:
+    """
+    if self._reader_pool is None:
+      import multiprocessing
+      if PY3:
+        # Do not fork, the parent might have threads and h5py/HDF5 handles.
+        multiprocessing = multiprocessing.get_context("spawn")
+      self._reader_pool = multiprocessing.Pool(processes=self.num_reader_processes)
+    _, file_index, _, norm_seq_name = self._get_seq_info(seq_idx)
+    self._reader_pending[seq_idx] = self._reader_pool.apply_async(
+      _next_gen_hdf_read_seq, (self.files[file_index], norm_seq_name, self.stream_parser_names[file_index]))
+
+  def close_reader_pool(self):
+    """
+    Terminates the reader processes, if there are any.
+    They will be restarted on demand.
+    """
+    self._reader_pending.clear()
+    if self._reader_pool is not None:
+      self._reader_pool.terminate()
+      self._reader_pool.join()
+      self._reader_pool = None
+
+  def __del__(self):
+    if getattr(self, "_reader_pool", None) is not None:  # might not be set if __init__ failed
+      self.close_reader_pool()
+
+  def _submit_reads(self, end):
+    """
+    Submits the reads for the seqs up to end (exclusive) to the reader pool.
+
+    :param int end: seq idx
+    """
+    end = min(end, len(self.seq_order))
+    while self._reader_next_seq_idx < end:
+      if self._reader_next_seq_idx not in self._reader_pending:
+        self._submit_read(self._reader_next_seq_idx)
+      self._reader_next_seq_idx += 1
+
   def get_data_dtype(self, key):
     if key == 'data':
       return self.get_data_dtype(self.input_stream_name)
@@ -19,10 +19,20 @@ or use real training intermediate results and resume from them.
 We could even do some simple search in the beginning of each epoch when we keep it cheap enough.
 
 Also, we could store the population of hyper params on disk to allow resuming of a search.
+
+By default, the individuals are trained in a pool of threads (``num_threads``) within this process.
+With ``num_processes``, they are trained in a pool of worker processes instead,
+each with its own TF session and own TF thread pools (``num_tf_threads_per_process``).
+The worker processes reload the config from the command line arguments (``sys.argv``) of this process,
+and the static train data is shared with them read-only via a file in shared memory (``/dev/shm``).
+With ``early_termination``, individuals whose intermediate train cost is clearly worse than
+the cost of the already finished individuals of the current iteration (at the same training progress)
+are stopped early and get an infinite cost.
 """
 
 from __future__ import print_function
 
+import os
 import sys
 import time
 import numpy
@@ -320,6 +330,13 @@ class Optimization:
       "num_kill_individuals", self.num_individuals // 2)
     self.num_best = self.opts.get("num_best", 10)
     self.num_threads = self.opts.get("num_threads", guess_requested_max_num_threads())
+    self.num_processes = self.opts.get("num_processes", 0)
+    self.num_tf_threads_per_process = self.opts.get(
+      "num_tf_threads_per_process", max(guess_requested_max_num_threads() // max(self.num_processes, 1), 1))
+    self.process_report_interval = self.opts.get("process_report_interval", 5.0)
+    self.early_termination = self.opts.get("early_termination", False)
+    self.early_termination_min_complete_frac = self.opts.get("early_termination_min_complete_frac", 0.2)
+    self.early_termination_cost_factor = self.opts.get("early_termination_cost_factor", 1.0)
     self.opts.assert_all_read()
 
   def _find_hyper_params(self, base=None, visited=None):
@@ -411,7 +428,11 @@ class Optimization:
     return config
 
   def work(self):
-    print("Starting hyper param search. Using %i threads." % self.num_threads, file=log.v1)
+    if self.num_processes:
+      print("Starting hyper param search. Using %i processes with %i TF threads each." % (
+        self.num_processes, self.num_tf_threads_per_process), file=log.v1)
+    else:
+      print("Starting hyper param search. Using %i threads." % self.num_threads, file=log.v1)
     from TFUtil import get_available_gpu_devices
     from Log import wrap_log_streams, StreamDummy
     from threading import Thread, Condition
@@ -423,6 +444,7 @@ class Optimization:
       population = []
       exit = False
       exception = None
+      early_termination = None  # type: _EarlyTermination|None
 
     class WorkerThread(Thread):
       def __init__(self, gpu_ids):
@@ -450,6 +472,18 @@ class Optimization:
             return self.trainer.runner.data_provider.get_complete_frac()
         return 0.0
 
+      def check_early_termination(self):
+        with Outstanding.cond:
+          trainer = self.trainer
+          if not trainer or not trainer.runner or trainer.early_terminated or trainer.individual.cost is not None:
+            return
+          Outstanding.early_termination.add_intermediate_cost(
+            trainer.individual.name,
+            complete_frac=trainer.runner.data_provider.get_complete_frac(),
+            cost=trainer.get_intermediate_cost())
+          if Outstanding.early_termination.should_terminate(trainer.individual.name):
+            trainer.terminate_early()
+
       def run(self_thread):
         try:
           while True:
@@ -464,6 +498,9 @@ class Optimization:
               self_thread.trainer = _IndividualTrainer(optim=self, individual=individual, gpu_ids=self_thread.gpu_ids)
             self_thread.name = "Hyper param tune train thread on %r" % individual.name
             self_thread.trainer.run()
+            with Outstanding.cond:
+              if Outstanding.early_termination and not self_thread.trainer.early_terminated:
+                Outstanding.early_termination.set_finished(individual.name, cost=individual.cost)
         except Exception as exc:
           with Outstanding.cond:
             if not Outstanding.exception:
@@ -484,6 +521,10 @@ class Optimization:
     print("Num available GPUs:", num_gpus)
     num_gpus = num_gpus or 1  # Would be ignored anyway.
     interactive = is_tty()
+    process_pool = None
+    if self.num_processes:
+      # Start this before any further TF usage in this process (e.g. the dry run).
+      process_pool = _TrainProcessPool(optim=self, num_gpus=num_gpus)
     try:
       print("Population of %i individuals (hyper param setting instances), running for %i evaluation iterations." % (
         self.num_individuals, self.num_iterations), file=log.v2)
@@ -503,45 +544,54 @@ class Optimization:
           # Later we will strip away all log output.
           print("Very first try with log output:", file=log.v2)
           _IndividualTrainer(optim=self, individual=population[0], gpu_ids={0}).run()
-        print("Starting training with thread pool of %i threads." % self.num_threads)
+        early_termination = _EarlyTermination(optim=self) if self.early_termination else None
         iteration_start_time = time.time()
-        with wrap_log_streams(StreamDummy(), also_sys_stdout=True, tf_log_verbosity="WARN"):
-          Outstanding.exit = False
-          Outstanding.population = list(population)
-          Outstanding.threads = [WorkerThread(gpu_ids={i % num_gpus}) for i in range(self.num_threads)]
-          try:
-            while True:
-              with Outstanding.cond:
-                if all([thread.finished for thread in Outstanding.threads]) or Outstanding.exception:
-                  break
-                complete_frac = max(len(population) - len(Outstanding.population) - len(Outstanding.threads), 0)
-                complete_frac += sum([thread.get_complete_frac() for thread in Outstanding.threads])
-                complete_frac /= float(len(population))
-                remaining_str = ""
-                if complete_frac > 0:
-                  start_elapsed = time.time() - iteration_start_time
-                  total_time_estimated = start_elapsed / complete_frac
-                  remaining_estimated = total_time_estimated - start_elapsed
-                  remaining_str = hms(remaining_estimated)
-                if interactive:
-                  progress_bar(complete_frac, prefix=remaining_str, file=sys.__stdout__)
-                else:
-                  print(
-                    "Progress: %.02f%%" % (complete_frac * 100),
-                    "remaining:", remaining_str or "unknown", file=sys.__stdout__)
-                  sys.__stdout__.flush()
-                Outstanding.cond.wait(1 if interactive else 10)
-            for thread in Outstanding.threads:
-              thread.join()
-          finally:
-            Outstanding.exit = True
-            for thread in Outstanding.threads:
-              thread.cancel(join=True)
-        Outstanding.threads = []
+        if process_pool:
+          print("Starting training with process pool of %i processes." % self.num_processes)
+          process_pool.train(population=population, early_termination=early_termination, interactive=interactive)
+        else:
+          print("Starting training with thread pool of %i threads." % self.num_threads)
+          with wrap_log_streams(StreamDummy(), also_sys_stdout=True, tf_log_verbosity="WARN"):
+            Outstanding.exit = False
+            Outstanding.early_termination = early_termination
+            Outstanding.population = list(population)
+            Outstanding.threads = [WorkerThread(gpu_ids={i % num_gpus}) for i in range(self.num_threads)]
+            try:
+              while True:
+                with Outstanding.cond:
+                  if all([thread.finished for thread in Outstanding.threads]) or Outstanding.exception:
+                    break
+                  if Outstanding.early_termination:
+                    for thread in Outstanding.threads:
+                      thread.check_early_termination()
+                  complete_frac = max(len(population) - len(Outstanding.population) - len(Outstanding.threads), 0)
+                  complete_frac += sum([thread.get_complete_frac() for thread in Outstanding.threads])
+                  complete_frac /= float(len(population))
+                  remaining_str = ""
+                  if complete_frac > 0:
+                    start_elapsed = time.time() - iteration_start_time
+                    total_time_estimated = start_elapsed / complete_frac
+                    remaining_estimated = total_time_estimated - start_elapsed
+                    remaining_str = hms(remaining_estimated)
+                  if interactive:
+                    progress_bar(complete_frac, prefix=remaining_str, file=sys.__stdout__)
+                  else:
+                    print(
+                      "Progress: %.02f%%" % (complete_frac * 100),
+                      "remaining:", remaining_str or "unknown", file=sys.__stdout__)
+                    sys.__stdout__.flush()
+                  Outstanding.cond.wait(1 if interactive else 10)
+              for thread in Outstanding.threads:
+                thread.join()
+            finally:
+              Outstanding.exit = True
+              for thread in Outstanding.threads:
+                thread.cancel(join=True)
+          Outstanding.threads = []
+          if Outstanding.exception:
+            raise Outstanding.exception
+          assert not Outstanding.population
         print("Training iteration elapsed time:", hms(time.time() - iteration_start_time))
-        if Outstanding.exception:
-          raise Outstanding.exception
-        assert not Outstanding.population
         print("Training iteration finished.")
         population.sort(key=lambda p: p.cost)
         del population[-self.num_kill_individuals:]
@@ -555,6 +605,9 @@ class Optimization:
     except KeyboardInterrupt:
       print("KeyboardInterrupt, canceled search.")
       canceled = True
+    finally:
+      if process_pool:
+        process_pool.shutdown()
 
     print("Best %i settings:" % len(best_individuals))
     for individual in best_individuals:
@@ -573,8 +626,28 @@ class _IndividualTrainer:
     self.optim = optim
     self.individual = individual
     self.runner = None  # type: Runner
+    self.engine = None  # type: Engine
     self.gpu_ids = gpu_ids
     self.cancel_flag = False
+    self.early_terminated = False
+
+  def get_intermediate_cost(self):
+    """
+    :return: train cost accumulated so far, or None if not available yet
+    :rtype: float|None
+    """
+    if not self.runner:
+      return None
+    return self.runner.get_intermediate_score().get("cost:output", None)
+
+  def terminate_early(self):
+    """
+    Stops the training. :func:`run` will then set an infinite cost for this individual.
+    """
+    self.early_terminated = True
+    self.cancel_flag = True
+    if self.runner:
+      self.runner.cancel_flag = True
 
   def run(self):
     if self.individual.cost is not None:
@@ -586,6 +659,7 @@ class _IndividualTrainer:
       print(" %s -> %s" % (p.description(), hyper_param_mapping[p]), file=log.v2)
     config = self.optim.create_config_instance(hyper_param_mapping, gpu_ids=self.gpu_ids)
     engine = Engine(config=config)
+    self.engine = engine
     train_data = StaticDataset.copy_from_dataset(self.optim.train_data)
     engine.init_train_from_config(config=config, train_data=train_data)
     # Not directly calling train() as we want to have full control.
@@ -605,6 +679,14 @@ class _IndividualTrainer:
     if self.cancel_flag:
       raise CancelTrainingException("Trainer cancel flag is set")
     trainer.run(report_prefix="hyper param tune train %r" % self.individual.name)
+    if not trainer.finalized and self.early_terminated:
+      print(
+        "Individual %s:" % self.individual.name,
+        "Terminated early with intermediate train cost:", self.get_intermediate_cost(),
+        "elapsed time:", hms_fraction(time.time() - start_time),
+        file=self.optim.log)
+      self.individual.cost = float("inf")
+      return
     if not trainer.finalized:
       print("Trainer exception:", trainer.run_exception, file=log.v1)
       raise trainer.run_exception
@@ -617,6 +699,323 @@ class _IndividualTrainer:
     self.individual.cost = cost
 
 
+class _EarlyTermination:
+  """
+  Decides whether the training of an individual can be stopped early,
+  by comparing its intermediate train cost to the train cost of the already finished individuals
+  of the current iteration at the same training progress.
+  An individual is stopped when it is worse than all those which would survive this iteration anyway.
+  """
+
+  def __init__(self, optim):
+    """
+    :param Optimization optim:
+    """
+    self.num_survivors = max(optim.num_individuals - optim.num_kill_individuals, 1)
+    self.min_complete_frac = optim.early_termination_min_complete_frac
+    self.cost_factor = optim.early_termination_cost_factor
+    self.curves = {}  # type: dict[str,list[(float,float)]]  # individual name -> list of (complete_frac, cost)
+    self.finished = set()  # type: set[str]
+    self.num_terminated = 0
+
+  def add_intermediate_cost(self, name, complete_frac, cost):
+    """
+    :param str name: individual name
+    :param float complete_frac:
+    :param float|None cost:
+    """
+    if cost is None:
+      return
+    self.curves.setdefault(name, []).append((complete_frac, cost))
+
+  def set_finished(self, name, cost):
+    """
+    :param str name: individual name
+    :param float cost: final cost
+    """
+    self.add_intermediate_cost(name, complete_frac=1.0, cost=cost)
+    self.finished.add(name)
+
+  @staticmethod
+  def _get_cost_at(curve, complete_frac):
+    """
+    :param list[(float,float)] curve:
+    :param float complete_frac:
+    :return: last cost at or before complete_frac
+    :rtype: float|None
+    """
+    res = None
+    for frac, cost in curve:
+      if frac > complete_frac:
+        break
+      res = cost
+    return res
+
+  def should_terminate(self, name):
+    """
+    :param str name: individual name
+    :rtype: bool
+    """
+    curve = self.curves.get(name)
+    if not curve:
+      return False
+    complete_frac, cost = curve[-1]
+    if complete_frac < self.min_complete_frac:
+      return False
+    ref_costs = [self._get_cost_at(self.curves[other], complete_frac) for other in self.finished]
+    ref_costs = sorted([c for c in ref_costs if c is not None])
+    if len(ref_costs) < self.num_survivors:
+      return False
+    if cost > ref_costs[self.num_survivors - 1] * self.cost_factor:
+      self.num_terminated += 1
+      return True
+    return False
+
+
+class _SharedStaticDataset:
+  """
+  Stores the data of a :class:`StaticDataset` in files in shared memory (``/dev/shm``, if available),
+  such that other processes can use it read-only via :func:`numpy.load` with ``mmap_mode``, i.e. without a copy.
+  This object is picklable, and thus can be passed to other processes.
+  """
+
+  def __init__(self, dataset):
+    """
+    :param StaticDataset dataset:
+    """
+    import tempfile
+    shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    self.dirname = tempfile.mkdtemp(prefix="returnn_hyper_param_tuning_", dir=shm_dir)
+    self.data_keys = dataset.get_data_keys()
+    self.target_list = dataset.get_target_list()
+    self.output_dim = dataset.num_outputs
+    self.input_dim = dataset.num_inputs
+    self.num_seqs = len(dataset.data)
+    for key_idx, key in enumerate(self.data_keys):
+      seqs = [seq[key] for seq in dataset.data]
+      numpy.save(self._get_filename(key_idx, "seq_lens"), numpy.array([len(x) for x in seqs], dtype="int64"))
+      numpy.save(self._get_filename(key_idx, "data"), numpy.concatenate(seqs, axis=0))
+
+  def _get_filename(self, key_idx, name):
+    """
+    :param int key_idx:
+    :param str name:
+    :rtype: str
+    """
+    return "%s/%i.%s.npy" % (self.dirname, key_idx, name)
+
+  def get_dataset(self):
+    """
+    :return: dataset where all the data are read-only views into the shared memory
+    :rtype: StaticDataset
+    """
+    data = [{} for _ in range(self.num_seqs)]
+    for key_idx, key in enumerate(self.data_keys):
+      seq_lens = numpy.load(self._get_filename(key_idx, "seq_lens"))
+      key_data = numpy.load(self._get_filename(key_idx, "data"), mmap_mode="r")
+      offsets = numpy.concatenate([[0], numpy.cumsum(seq_lens)])
+      for seq_idx in range(self.num_seqs):
+        data[seq_idx][key] = key_data[offsets[seq_idx]:offsets[seq_idx + 1]]
+    return StaticDataset(
+      data=data, target_list=self.target_list, output_dim=self.output_dim, input_dim=self.input_dim)
+
+  def remove(self):
+    import shutil
+    shutil.rmtree(self.dirname, ignore_errors=True)
+
+
+class _TrainProcessPool:
+  """
+  Pool of worker processes, where each trains one individual at a time (via :class:`_IndividualTrainer`)
+  with its own TF session and own TF thread pools.
+  The processes are started via the "spawn" method (not via fork, as the TF runtime does not survive a fork),
+  and they reload the config from our command line arguments.
+  The static train data is shared read-only via :class:`_SharedStaticDataset`.
+  """
+
+  def __init__(self, optim, num_gpus):
+    """
+    :param Optimization optim:
+    :param int num_gpus:
+    """
+    import multiprocessing
+    from Util import PY3
+    assert PY3, "hyper param tuning with num_processes needs Python 3"
+    self.optim = optim
+    self.shared_data = _SharedStaticDataset(optim.train_data)
+    ctx = multiprocessing.get_context("spawn")
+    self.task_queue = ctx.Queue()
+    self.result_queue = ctx.Queue()
+    self.cancel_task_ids = [ctx.Value("i", -1) for _ in range(optim.num_processes)]
+    self.processes = []
+    self._task_idx = 0
+    for i in range(optim.num_processes):
+      proc = ctx.Process(
+        name="Hyper param tune train process %i" % i,
+        target=_train_process_main,
+        kwargs=dict(
+          worker_idx=i, config_args=sys.argv[1:], gpu_ids={i % num_gpus},
+          num_tf_threads=optim.num_tf_threads_per_process, report_interval=optim.process_report_interval,
+          shared_data=self.shared_data, task_queue=self.task_queue, result_queue=self.result_queue,
+          cancel_task_id=self.cancel_task_ids[i]))
+      proc.daemon = True
+      proc.start()
+      self.processes.append(proc)
+
+  def train(self, population, early_termination, interactive):
+    """
+    Trains all individuals without cost, and sets their cost.
+
+    :param list[Individual] population:
+    :param _EarlyTermination|None early_termination:
+    :param bool interactive: whether to show a progress bar
+    """
+    from queue import Empty
+    from Util import progress_bar, hms
+    start_time = time.time()
+    tasks = {}  # type: dict[int,Individual]  # task idx -> individual, pending or running
+    for individual in population:
+      if individual.cost is not None:
+        continue
+      self._task_idx += 1
+      tasks[self._task_idx] = individual
+      self.task_queue.put(
+        (self._task_idx, individual.name, [individual.hyper_param_mapping[p] for p in self.optim.hyper_params]))
+    num_tasks = len(tasks)
+    complete_fracs = {}  # type: dict[int,float]  # task idx -> complete frac, for running tasks
+    last_report_time = start_time
+    while tasks:
+      try:
+        msg = self.result_queue.get(timeout=1)
+      except Empty:
+        msg = None
+        dead_procs = [proc.name for proc in self.processes if not proc.is_alive()]
+        if dead_procs:
+          raise TrainException("Hyper param tune train processes died: %s" % ", ".join(dead_procs))
+      if msg:
+        kind, worker_idx, task_idx = msg[:3]
+        if kind == "progress":
+          complete_frac, cost = msg[3:]
+          complete_fracs[task_idx] = complete_frac
+          if early_termination:
+            name = tasks[task_idx].name
+            early_termination.add_intermediate_cost(name, complete_frac=complete_frac, cost=cost)
+            if early_termination.should_terminate(name):
+              self.cancel_task_ids[worker_idx].value = task_idx
+        elif kind == "done":
+          cost, early_terminated = msg[3:]
+          individual = tasks.pop(task_idx)
+          complete_fracs.pop(task_idx, None)
+          individual.cost = cost
+          if early_termination and not early_terminated:
+            early_termination.set_finished(individual.name, cost=cost)
+        elif kind == "error":
+          exc_str, = msg[3:]
+          raise TrainException("Training of individual %s failed in process %i:\n%s" % (
+            tasks[task_idx].name, worker_idx, exc_str))
+        else:
+          raise Exception("invalid message %r" % (msg,))
+      if time.time() - last_report_time >= (1 if interactive else 10) or not tasks:
+        last_report_time = time.time()
+        complete_frac = (num_tasks - len(tasks) + sum(complete_fracs.values())) / float(max(num_tasks, 1))
+        remaining_str = ""
+        if complete_frac > 0:
+          start_elapsed = time.time() - start_time
+          remaining_str = hms(start_elapsed / complete_frac - start_elapsed)
+        if interactive:
+          progress_bar(complete_frac, prefix=remaining_str, file=sys.__stdout__)
+        else:
+          print(
+            "Progress: %.02f%%" % (complete_frac * 100),
+            "remaining:", remaining_str or "unknown", file=sys.__stdout__)
+          sys.__stdout__.flush()
+    if early_termination:
+      print("Terminated %i individuals early." % early_termination.num_terminated)
+
+  def shutdown(self):
+    """
+    Stops all processes and removes the shared data.
+    """
+    for _ in self.processes:
+      self.task_queue.put(None)
+    for proc in self.processes:
+      proc.join(timeout=10)
+      if proc.is_alive():
+        proc.terminate()
+    self.processes = []
+    self.shared_data.remove()
+
+
+def _train_process_main(worker_idx, config_args, gpu_ids, num_tf_threads, report_interval,
+                        shared_data, task_queue, result_queue, cancel_task_id):
+  """
+  Main function of a worker process of :class:`_TrainProcessPool`.
+
+  :param int worker_idx:
+  :param list[str] config_args: command line args, to reload the config
+  :param set[int] gpu_ids:
+  :param int num_tf_threads: for the TF intra and inter op thread pools
+  :param float report_interval: in secs, how often to report progress and intermediate cost
+  :param _SharedStaticDataset shared_data:
+  :param multiprocessing.Queue task_queue:
+  :param multiprocessing.Queue result_queue:
+  :param multiprocessing.Value cancel_task_id: set by the parent to the task idx which should be terminated early
+  """
+  import traceback
+  from threading import Thread, Event
+  from Log import wrap_log_streams, StreamDummy
+  from TFUtil import setup_tf_thread_pools
+  import rnn
+  rnn.initConfig(commandLineOptions=config_args)
+  config = rnn.config
+  log.initialize(verbosity=[0])
+  setup_tf_thread_pools(
+    num_threads=num_tf_threads, tf_session_opts=config.typed_dict.setdefault("tf_session_opts", {}))
+
+  def report_loop(task_idx, trainer, finished):
+    """
+    :param int task_idx:
+    :param _IndividualTrainer trainer:
+    :param threading.Event finished:
+    """
+    while not finished.wait(report_interval):
+      if not trainer.runner:
+        continue
+      if cancel_task_id.value == task_idx:
+        trainer.terminate_early()
+        return
+      result_queue.put(
+        ("progress", worker_idx, task_idx,
+         trainer.runner.data_provider.get_complete_frac(), trainer.get_intermediate_cost()))
+
+  with wrap_log_streams(StreamDummy(), also_sys_stdout=True, tf_log_verbosity="WARN"):
+    optim = Optimization(config=config, train_data=shared_data.get_dataset())
+    while True:
+      task = task_queue.get()
+      if task is None:
+        break
+      task_idx, name, values = task
+      assert len(values) == len(optim.hyper_params)
+      individual = Individual(dict(zip(optim.hyper_params, values)), name=name)
+      trainer = _IndividualTrainer(optim=optim, individual=individual, gpu_ids=gpu_ids)
+      finished = Event()
+      report_thread = Thread(
+        target=report_loop, name="Hyper param tune report thread", args=(task_idx, trainer, finished))
+      report_thread.daemon = True
+      report_thread.start()
+      try:
+        trainer.run()
+      except Exception:
+        result_queue.put(("error", worker_idx, task_idx, traceback.format_exc()))
+        return
+      finally:
+        finished.set()
+        report_thread.join()
+        if trainer.engine:
+          trainer.engine.finalize()
+      result_queue.put(("done", worker_idx, task_idx, individual.cost, trainer.early_terminated))
+
+
 class _AttribOrKey:
   ColTypeConfig = Config
   ColTypeDict = dict
@@ -21,15 +21,19 @@ class MetaDataset(CachedDataset2):
                datasets,
                data_map, data_dims,
                data_dtypes=None,
+               load_seqs_parallel=False,
                window=1, **kwargs):
     """
     :param str seq_list_file: filename. line-separated
-    :param str seq_lens_file: filename. json. dict[str,dict[str,int]], seq-tag -> data-key -> len
+    :param str seq_lens_file: filename. json. dict[str,dict[str,int]], seq-tag -> data-key -> len.
+      Or (if it ends with ".npz") the compact binary format, see :func:`load_seq_lens`
+      and tools/convert-seq-lens-json.py, which is much faster to load and needs much less memory for big corpora.
     :param dict[str,dict[str]] datasets: dataset-key -> dataset-kwargs. including keyword 'class' and maybe 'files'
     :param dict[str,(str,str)] data_map: self-data-key -> (dataset-key, dataset-data-key).
       Should contain 'data' as key. Also defines the target-list, which is all except 'data'.
     :param dict[str,(int,int)] data_dims: self-data-key -> data-dimension, len(shape) (1 ==> sparse repr).
     :param dict[str,str] data_dtypes: self-data-key -> dtype. automatic if not specified
+    :param bool load_seqs_parallel: load the seqs of the sub datasets in parallel threads. see :class:`SubDatasetsLoader`
     """
     assert window == 1  # not implemented
     super(MetaDataset, self).__init__(**kwargs)
@@ -54,7 +58,7 @@ class MetaDataset(CachedDataset2):
     self._num_seqs = len(self.seq_list_original[self.default_dataset_key])
     for key in self.dataset_keys:
       assert len(self.seq_list_original[key]) == self._num_seqs
-    self.tag_idx = {tag: idx for (idx, tag) in enumerate(self.seq_list_original[self.default_dataset_key])}
+    self._tag_idx = None  # type: dict[str,int]|None  # see tag_idx
 
     data_dims = convert_data_dims(data_dims)
     self.data_dims = data_dims
@@ -67,17 +71,14 @@ class MetaDataset(CachedDataset2):
     self.data_dtypes = {data_key: _select_dtype(data_key, data_dims, data_dtypes) for data_key in self.data_keys}
 
     if seq_lens_file:
-      seq_lens = load_json(filename=seq_lens_file)
-      assert isinstance(seq_lens, dict)
-      # dict[str,NumbersDict], seq-tag -> data-key -> len
-      self._seq_lens = {tag: NumbersDict(l) for (tag, l) in seq_lens.items()}
+      # data-key -> lens, aligned to the original seq list
+      self._seq_lens = load_seq_lens(
+        filename=seq_lens_file, seq_list=self.seq_list_original[self.default_dataset_key])  # type: dict[str,numpy.ndarray]|None
+      self._num_timesteps = NumbersDict({key: int(numpy.sum(lens)) for (key, lens) in self._seq_lens.items()})
     else:
       self._seq_lens = None
-
-    if self._seq_lens:
-      self._num_timesteps = sum([self._seq_lens[s] for s in self.seq_list_original[self.default_dataset_key]])
-    else:
       self._num_timesteps = None
+    self._seq_index = None  # type: list[int]|None  # sorted seq idx -> original seq idx
 
     # Will only init the needed datasets.
     self.datasets = {
@@ -88,6 +89,17 @@ class MetaDataset(CachedDataset2):
       dataset = self.datasets[dataset_key]
       if dataset_data_key in dataset.labels:
         self.labels[data_key] = dataset.labels[dataset_data_key]
+    self.sub_datasets_loader = SubDatasetsLoader(name=self.name, parallel=load_seqs_parallel)
+
+  @property
+  def tag_idx(self):
+    """
+    :return: seq-tag -> original seq idx. only created on first usage, as this is big for big corpora
+    :rtype: dict[str,int]
+    """
+    if self._tag_idx is None:
+      self._tag_idx = {tag: idx for (idx, tag) in enumerate(self.seq_list_original[self.default_dataset_key])}
+    return self._tag_idx
 
   def init_seq_order(self, epoch=None, seq_list=None):
     need_reinit = self.epoch is None or self.epoch != epoch or seq_list
@@ -97,15 +109,14 @@ class MetaDataset(CachedDataset2):
       self._num_seqs = len(self.seq_list_ordered[self.default_dataset_key])
       return False
 
+    self.sub_datasets_loader.print_stats_and_reset()
     if seq_list:
       seq_index = [self.tag_idx[tag] for tag in seq_list]
     else:
-      if self._seq_lens:
-        get_seq_len = lambda s: self._seq_lens[self.seq_list_original[self.default_dataset_key][s]]["data"]
-      else:
-        get_seq_len = None
       total_seqs = len(self.seq_list_original[self.default_dataset_key])
-      seq_index = self.get_seq_order_for_epoch(epoch, total_seqs, get_seq_len)
+      seq_index = self.get_seq_order_for_epoch(
+        epoch, total_seqs, seq_lens=self._seq_lens["data"] if self._seq_lens else None)
+    self._seq_index = seq_index
     self._num_seqs = len(seq_index)
     self.seq_list_ordered = {key: [ls[s] for s in seq_index] for (key, ls) in self.seq_list_original.items()}
 
@@ -114,8 +125,9 @@ class MetaDataset(CachedDataset2):
     return True
 
   def _load_seqs(self, start, end):
+    self.sub_datasets_loader.load_seqs([
+      (dataset_key, self.datasets[dataset_key], start, end) for dataset_key in sorted(self.dataset_keys)])
     for dataset_key in self.dataset_keys:
-      self.datasets[dataset_key].load_seqs(start, end)
       for seq_idx in range(start, end):
         self._check_dataset_seq(dataset_key, seq_idx)
     super(MetaDataset, self)._load_seqs(start=start, end=end)
@@ -152,7 +164,8 @@ class MetaDataset(CachedDataset2):
 
   def get_seq_length(self, sorted_seq_idx):
     if self._seq_lens:
-      return self._seq_lens[self.seq_list_ordered[self.default_dataset_key][sorted_seq_idx]]
+      seq_idx = self._seq_index[sorted_seq_idx]
+      return NumbersDict({key: int(lens[seq_idx]) for (key, lens) in self._seq_lens.items()})
     return super(MetaDataset, self).get_seq_length(sorted_seq_idx)
 
   def get_partial_tag(self, dataset_key, sorted_seq_idx):
@@ -162,6 +175,15 @@ class MetaDataset(CachedDataset2):
     partial_tags = [ self.seq_list_ordered[dataset_key][sorted_seq_idx] for dataset_key in self.dataset_keys ]
     return "<->".join(t for t in partial_tags)
 
+  def get_all_tags(self):
+    """
+    :return: all seq tags of the seq list, like :func:`get_tag`, in the order of the seq list
+    :rtype: list[str]
+    """
+    return [
+      "<->".join(self.seq_list_original[dataset_key][seq_idx] for dataset_key in self.dataset_keys)
+      for seq_idx in range(len(self.seq_list_original[self.default_dataset_key]))]
+
   def get_target_list(self):
     return self.target_list
 
@@ -176,6 +198,154 @@ class MetaDataset(CachedDataset2):
     return dtype
 
 
+_SeqListHashKey = "__seq_list_hash__"  # in the npz of the seq lens, see save_seq_lens
+
+
+def _get_seq_list_hash(seq_list):
+  """
+  :param list[str] seq_list:
+  :return: hash of the ordered seq list
+  :rtype: str
+  """
+  import hashlib
+  return hashlib.md5("\n".join(seq_list).encode("utf8")).hexdigest()
+
+
+def save_seq_lens(filename, seq_lens, seq_list):
+  """
+  Saves the seq lens in the compact binary format (npz), see :func:`load_seq_lens`.
+
+  :param str filename: npz
+  :param dict[str,numpy.ndarray] seq_lens: data-key -> int32 array (num_seqs,), aligned to seq_list
+  :param list[str] seq_list: stored as hash, to check it in :func:`load_seq_lens`
+  """
+  assert filename.endswith(".npz")
+  assert _SeqListHashKey not in seq_lens
+  seq_lens = dict(seq_lens)
+  seq_lens[_SeqListHashKey] = numpy.array(_get_seq_list_hash(seq_list))
+  numpy.savez(filename, **seq_lens)
+
+
+def load_seq_lens(filename, seq_list):
+  """
+  Loads the seq lens, as used by :class:`MetaDataset` (option ``seq_lens_file``).
+  Supported formats:
+
+  * json: dict[str,dict[str,int]], seq-tag -> data-key -> len.
+  * npz (numpy.savez): data-key -> int32 array of lens, aligned to the seq list,
+    and a hash of the seq list, see :func:`save_seq_lens`.
+    This is much more compact, and much faster to load. Use tools/convert-seq-lens-json.py to create it.
+
+  :param str filename: json or npz
+  :param list[str] seq_list: the (original) seq list, which defines the order of the returned arrays
+  :return: data-key -> int32 array (num_seqs,), aligned to seq_list
+  :rtype: dict[str,numpy.ndarray]
+  """
+  if filename.endswith(".npz"):
+    with numpy.load(filename) as f:
+      seq_lens = {key: f[key] for key in f.files}
+    if _SeqListHashKey not in seq_lens:
+      raise Exception("%s: no seq list hash. Create it via tools/convert-seq-lens-json.py." % filename)
+    seq_list_hash = str(seq_lens.pop(_SeqListHashKey))
+    if seq_list_hash != _get_seq_list_hash(seq_list):
+      raise Exception(
+        "%s: the seq lens were created for another seq list (or another order) than the given one with %i seqs" % (
+          filename, len(seq_list)))
+    for key, lens in seq_lens.items():
+      assert lens.shape == (len(seq_list),), (
+        "%s: data-key %r: lens shape %r does not match the seq list with %i seqs" % (
+          filename, key, lens.shape, len(seq_list)))
+      assert lens.dtype == numpy.int32, "%s: data-key %r: unexpected dtype %r" % (filename, key, lens.dtype)
+    return seq_lens
+  seq_lens_json = load_json(filename=filename)
+  assert isinstance(seq_lens_json, dict)
+  if not seq_list:
+    return {}
+  data_keys = sorted(seq_lens_json[seq_list[0]].keys())
+  return {
+    key: numpy.array([seq_lens_json[tag][key] for tag in seq_list], dtype="int32")
+    for key in data_keys}
+
+
+class SubDatasetsLoader(object):
+  """
+  Calls :func:`Dataset.load_seqs` on multiple sub datasets (e.g. of :class:`MetaDataset` or :class:`CombinedDataset`),
+  either one after another, or (if parallel) each in its own thread, as they are independent (mostly I/O).
+  Also collects the time spent per sub dataset, so that we see which source is the bottleneck.
+  """
+
+  def __init__(self, name, parallel=False):
+    """
+    :param str name: for logging, e.g. the name of the owning dataset
+    :param bool parallel: whether to load the sub datasets in parallel threads
+    """
+    self.name = name
+    self.parallel = parallel
+    self.load_times = {}  # type: dict[str,float]  # dataset-key -> secs
+    self.total_load_time = 0.0
+    self.num_calls = 0
+
+  def load_seqs(self, requests):
+    """
+    :param list[(str,Dataset,int,int)] requests: list of (dataset-key, dataset, start, end)
+    """
+    import time
+    start_time = time.time()
+    if self.parallel and len(requests) > 1:
+      from threading import Thread
+      results = {}  # dataset-key -> (secs, exception|None)
+
+      def load(dataset_key, dataset, start, end):
+        """
+        :param str dataset_key:
+        :param Dataset dataset:
+        :param int start:
+        :param int end:
+        """
+        import sys
+        sub_start_time = time.time()
+        try:
+          dataset.load_seqs(start, end)
+          results[dataset_key] = (time.time() - sub_start_time, None)
+        except Exception as exc:
+          print("%s: exception in load_seqs of sub dataset %r" % (self.name, dataset_key), file=log.v1)
+          sys.excepthook(*sys.exc_info())
+          results[dataset_key] = (time.time() - sub_start_time, exc)
+
+      threads = [
+        Thread(target=load, args=request, name="%s load_seqs %s" % (self.name, request[0])) for request in requests]
+      for thread in threads:
+        thread.daemon = True
+        thread.start()
+      for thread in threads:
+        thread.join()
+      for dataset_key, _, _, _ in requests:
+        secs, exc = results[dataset_key]
+        self.load_times[dataset_key] = self.load_times.get(dataset_key, 0.0) + secs
+        if exc is not None:
+          raise exc
+    else:
+      for dataset_key, dataset, start, end in requests:
+        sub_start_time = time.time()
+        dataset.load_seqs(start, end)
+        self.load_times[dataset_key] = self.load_times.get(dataset_key, 0.0) + time.time() - sub_start_time
+    self.total_load_time += time.time() - start_time
+    self.num_calls += 1
+
+  def print_stats_and_reset(self):
+    """
+    Prints the accumulated times per sub dataset (if we have any) to the log, and resets them.
+    """
+    if self.num_calls:
+      print("%s: load_seqs statistics (%s): %i calls, %.3f secs total (wall time), per sub dataset: %s" % (
+        self.name, "parallel" if self.parallel else "serial", self.num_calls, self.total_load_time,
+        ", ".join(["%s: %.3f secs" % (key, secs) for (key, secs) in sorted(self.load_times.items())])),
+        file=log.v4)
+    self.load_times.clear()
+    self.total_load_time = 0.0
+    self.num_calls = 0
+
+
 class ClusteringDataset(CachedDataset2):
   """
   This is a special case of MetaDataset,
@@ -401,6 +571,7 @@ class CombinedDataset(CachedDataset2):
                datasets,
                data_map, data_dims,
                data_dtypes=None,
+               load_seqs_parallel=False,
                window=1, **kwargs):
     """
     :param dict[str,dict[str]] datasets: dataset-key -> dataset-kwargs. including keyword 'class' and maybe 'files'
@@ -408,6 +579,7 @@ class CombinedDataset(CachedDataset2):
       Should contain 'data' as key. Also defines the target-list, which is all except 'data'.
     :param dict[str,(int,int)] data_dims: self-data-key -> data-dimension, len(shape) (1 ==> sparse repr).
     :param dict[str,str] data_dtypes: self-data-key -> dtype. automatic if not specified
+    :param bool load_seqs_parallel: load the seqs of the sub datasets in parallel threads. see :class:`SubDatasetsLoader`
     """
     assert window == 1  # not implemented
     super(CombinedDataset, self).__init__(**kwargs)
@@ -441,6 +613,7 @@ class CombinedDataset(CachedDataset2):
 
     # Will only init the needed datasets.
     self.datasets = {key: init_dataset(datasets[key]) for key in self.dataset_keys}
+    self.sub_datasets_loader = SubDatasetsLoader(name=self.name, parallel=load_seqs_parallel)
 
     try:
       self._num_seqs = sum([self.datasets[k].num_seqs for k in sorted(self.datasets.keys())])
@@ -480,6 +653,7 @@ class CombinedDataset(CachedDataset2):
     super(CombinedDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
     if not need_reinit:
       return False
+    self.sub_datasets_loader.print_stats_and_reset()
 
     if self.know_num_seqs_beforehand:
       # We just select for which seq-idx we will use which dataset.
@@ -571,13 +745,15 @@ class CombinedDataset(CachedDataset2):
 
     requested_seqs = self.dataset_seq_idxs[start:end]
 
+    sub_load_requests = []  # list of (dataset-key, dataset, start, end)
     for i in range(len(self.datasets)):
       dataset = self.datasets[self.dataset_idxs[i]]
       sub_requested_seqs = [s[1] for s in requested_seqs if s[0]==i]
       if sub_requested_seqs == []:
         continue
       sub_start, sub_end = min(sub_requested_seqs), max(sub_requested_seqs)
-      dataset.load_seqs(sub_start, sub_end+1)
+      sub_load_requests.append((self.dataset_idxs[i], dataset, sub_start, sub_end + 1))
+    self.sub_datasets_loader.load_seqs(sub_load_requests)
     super(CombinedDataset, self)._load_seqs(start=start, end=end)
 
   def _check_dataset_seq(self, dataset, seq_idx): # TODO this check makes no sense here
@@ -1,5 +1,8 @@
 
+#include <algorithm>
 #include <assert.h>
+#include <cmath>
+#include <functional>
 #include <iostream>
 #include <fstream>
 #include <limits>
@@ -295,6 +298,8 @@ typedef Ndarray_DIM_Type const* Ndarray_DIMS_Type;
 #define DIM_BLOCK 512
 
 #define DEF_KERNEL __global__
+// for functions which are called from kernels
+#define DEF_DEV_FUNC __device__
 // <<<DimGrid,DimBlock,ShmemSize|0,Stream|0>>>. http://docs.nvidia.com/cuda/cuda-c-programming-guide/#execution-configuration
 #define start_dev_kernel(kernel, args) \
 	(kernel<<<DIM_GRID,DIM_BLOCK,0,CUDA_CUR_STREAM>>>  args);
@@ -392,6 +397,7 @@ typedef Ndarray_DIM_Type const* Ndarray_DIMS_Type;
 #define Ndarray_memset(s, c, size) (memset(s, c, size))
 
 #define DEF_KERNEL
+#define DEF_DEV_FUNC
 #define start_dev_kernel(kernel, args) \
 	{ for(_KernelLoop loop; !loop.finished(); loop.next()) { kernel args; } }
 
@@ -537,6 +543,19 @@ void _free(void* ptr) {
 #define device_malloc Context(CONTEXT_ARGS)._malloc
 #define device_free Context(CONTEXT_ARGS)._free
 
+#if !CUDA
+// Calls fn(begin, end) on disjoint ranges covering [0, total), in parallel on the TF intra-op thread pool.
+// cost_per_unit: estimated number of (scalar) ops per unit, used to decide about the number of shards.
+// See tensorflow::Shard. fn must be thread-safe for disjoint ranges.
+void _parallel_for(long total, long cost_per_unit, const std::function<void(long, long)>& fn) {
+    const DeviceBase::CpuWorkerThreads* worker_threads = context->device()->tensorflow_cpu_worker_threads();
+    Shard(
+        worker_threads->num_threads, worker_threads->workers, total, cost_per_unit,
+        [&fn](int64 begin, int64 end) { fn(begin, end); });
+}
+#define parallel_for Context(CONTEXT_ARGS)._parallel_for
+#endif
+
 #if CUDA
 cublasHandle_t _handle() {
     assert("not available" && 0);
@@ -546,6 +565,15 @@ cublasHandle_t _handle() {
 #endif
 #endif
 
+#if !TENSORFLOW && !CUDA
+// Same interface as the TF variant above, but we don't have a thread pool here, so this runs serially.
+void _parallel_for(long total, long cost_per_unit, const std::function<void(long, long)>& fn) {
+    if(total > 0)
+        fn(0, total);
+}
+#define parallel_for Context(CONTEXT_ARGS)._parallel_for
+#endif
+
 
 //C[x] += A[x]*B[x]
 //(if not 4-dimensional, then indexing [x] is ignored (e.g. for weight matrices))
@@ -1280,6 +1280,8 @@ class NativeLstm2(NativeOpGenBase):
   and also has some more options (like the direction).
   But it requires time * batch * cells more memory,
   thus time * batch * cells * 6 in total.
+  On CPU (TF), every time frame is computed in parallel over chunks of the batch on the TF intra-op thread pool,
+  where each chunk does the recurrent matmul (BLAS sgemm) and the fused gates.
 
   inputs:
     :param X: (time,batch,dim*4)
@@ -1316,7 +1318,43 @@ class NativeLstm2(NativeOpGenBase):
     return (X, W, y0, c0, i, start, step,   Y, C, H,   DY, Dd)
 
   c_extra_support_code = {
-    "lstm_kernel": """
+    "01_lstm_cell_fwd": """
+      DEF_DEV_FUNC
+      inline void lstm_cell_fwd(
+        int idx, int n_cells, const float* mask,
+        float* h,
+        float* prev_y,
+        float* prev_c,
+        float* y,
+        float* c,
+        float* y_prev_out)
+      {
+        int batch_idx = idx / n_cells;
+        int cell_idx = idx % n_cells;
+        int intern_offset = batch_idx * 4 * n_cells + cell_idx;
+        float prev_c_b = prev_c[idx];
+        float mask_b = mask[batch_idx];
+
+        // cell-in + input, forget and output gates
+        float cellIn = tanhf(h[intern_offset]);
+        float inpGate = 1.f / (1.f + expf(-h[intern_offset + n_cells]));
+        float fgtGate = 1.f / (1.f + expf(-h[intern_offset + 2 * n_cells]));
+        float outGate = 1.f / (1.f + expf(-h[intern_offset + 3 * n_cells]));
+
+        h[intern_offset] = cellIn;
+        h[intern_offset + n_cells] = inpGate;
+        h[intern_offset + 2 * n_cells] = fgtGate;
+        h[intern_offset + 3 * n_cells] = outGate;
+
+        float c_b = (prev_c_b * fgtGate + cellIn * inpGate) * mask_b
+                  + prev_c_b * (1.f - mask_b);
+        c[idx] = c_b;
+        float y_b = tanhf(c_b) * outGate * mask_b;
+        y[idx] = y_b;
+        y_prev_out[idx] = y_b + prev_y[idx] * (1.f - mask_b);
+      }
+      """,
+    "02_lstm_kernel": """
       DEF_KERNEL
       void lstm_kernel(
         int n_batch, int n_cells, const float* mask,
@@ -1329,35 +1367,65 @@ class NativeLstm2(NativeOpGenBase):
       {
         int idx = threadIdx.x + blockDim.x * blockIdx.x;
         while (idx < n_cells * n_batch) {
-          int batch_idx = idx / n_cells;
-          int cell_idx = idx % n_cells;
-          int intern_offset = batch_idx * 4 * n_cells + cell_idx;
-          float prev_c_b = prev_c[idx];
-          float mask_b = mask[batch_idx];
-
-          // cell-in + input, forget and output gates
-          float cellIn = tanhf(h[intern_offset]);
-          float inpGate = 1.f / (1.f + expf(-h[intern_offset + n_cells]));
-          float fgtGate = 1.f / (1.f + expf(-h[intern_offset + 2 * n_cells]));
-          float outGate = 1.f / (1.f + expf(-h[intern_offset + 3 * n_cells]));
-
-          h[intern_offset] = cellIn;
-          h[intern_offset + n_cells] = inpGate;
-          h[intern_offset + 2 * n_cells] = fgtGate;
-          h[intern_offset + 3 * n_cells] = outGate;
-
-          float c_b = (prev_c_b * fgtGate + cellIn * inpGate) * mask_b
-                    + prev_c_b * (1.f - mask_b);
-          c[idx] = c_b;
-          float y_b = tanhf(c_b) * outGate * mask_b;
-          y[idx] = y_b;
-          y_prev_out[idx] = y_b + prev_y[idx] * (1.f - mask_b);
-
+          lstm_cell_fwd(idx, n_cells, mask, h, prev_y, prev_c, y, c, y_prev_out);
           idx += gridDim.x * blockDim.x;
         }
       }
       """,
-    "lstm_bwd_kernel": """
+    "03_lstm_cell_bwd": """
+      DEF_DEV_FUNC
+      inline void lstm_cell_bwd(
+        int idx, int n_cells, const float* mask,
+        float* h,
+        float* prev_c,
+        float* y,
+        float* c,
+        float* d_y,
+        float* d_h,
+        float* d_c,
+        float* d_x,
+        float* d_x0)
+      {
+        int batch_idx = idx / n_cells;
+        int cell_idx = idx % n_cells;
+        int intern_offset = batch_idx * 4 * n_cells + cell_idx;
+        float mask_b = mask[batch_idx];
+        float d_y_b = (d_y[idx] + d_h[idx]) * mask_b;
+        float d_c_b = d_c[idx] * mask_b;
+        float prev_c_b = prev_c[idx];
+
+        // cell-in + input, forget and output gates
+        float cellIn = h[intern_offset];
+        float inpGate = h[intern_offset + n_cells];
+        float fgtGate = h[intern_offset + 2 * n_cells];
+        float outGate = h[intern_offset + 3 * n_cells];
+
+        float c_b = prev_c_b * fgtGate + cellIn * inpGate;
+        float gc = tanhf(c_b);
+        float d_outGate_in = (1.f - outGate) * outGate * gc * d_y_b;
+        float d_c2 = d_c_b + outGate * d_y_b * (1.f - gc * gc);
+        float d_cellIn_in = (1.f - cellIn * cellIn) * inpGate * d_c2;
+        float d_inpGate_in = (1.f - inpGate) * inpGate * cellIn * d_c2;
+        float d_fgtGate_in = (1.f - fgtGate) * fgtGate * prev_c_b * d_c2;
+        d_c[idx] = fgtGate * d_c2 + d_c[idx] * (1.f - mask_b);
+
+        d_x[intern_offset] = d_cellIn_in;
+        d_x[intern_offset + n_cells] = d_inpGate_in;
+        d_x[intern_offset + 2 * n_cells] = d_fgtGate_in;
+        d_x[intern_offset + 3 * n_cells] = d_outGate_in;
+
+        #define set_x0(off) { d_x0[off] = d_x[off] + d_x0[off] * (1.f - mask_b); }
+        set_x0(intern_offset);
+        set_x0(intern_offset + n_cells);
+        set_x0(intern_offset + 2 * n_cells);
+        set_x0(intern_offset + 3 * n_cells);
+        #undef set_x0
+
+        // Reset if used frame, otherwise leave as-is.
+        d_h[idx] *= (1.f - mask_b);
+      }
+      """,
+    "04_lstm_bwd_kernel": """
       DEF_KERNEL
       void lstm_bwd_kernel(
         int n_batch, int n_cells, const float* mask,
@@ -1373,44 +1441,7 @@ class NativeLstm2(NativeOpGenBase):
       {
         int idx = threadIdx.x + blockDim.x * blockIdx.x;
         while (idx < n_cells * n_batch) {
-          int batch_idx = idx / n_cells;
-          int cell_idx = idx % n_cells;
-          int intern_offset = batch_idx * 4 * n_cells + cell_idx;
-          float mask_b = mask[batch_idx];
-          float d_y_b = (d_y[idx] + d_h[idx]) * mask_b;
-          float d_c_b = d_c[idx] * mask_b;
-          float prev_c_b = prev_c[idx];
-
-          // cell-in + input, forget and output gates
-          float cellIn = h[intern_offset];
-          float inpGate = h[intern_offset + n_cells];
-          float fgtGate = h[intern_offset + 2 * n_cells];
-          float outGate = h[intern_offset + 3 * n_cells];
-
-          float c_b = prev_c_b * fgtGate + cellIn * inpGate;
-          float gc = tanhf(c_b);
-          float d_outGate_in = (1.f - outGate) * outGate * gc * d_y_b;
-          float d_c2 = d_c_b + outGate * d_y_b * (1.f - gc * gc);
-          float d_cellIn_in = (1.f - cellIn * cellIn) * inpGate * d_c2;
-          float d_inpGate_in = (1.f - inpGate) * inpGate * cellIn * d_c2;
-          float d_fgtGate_in = (1.f - fgtGate) * fgtGate * prev_c_b * d_c2;
-          d_c[idx] = fgtGate * d_c2 + d_c[idx] * (1.f - mask_b);
-
-          d_x[intern_offset] = d_cellIn_in;
-          d_x[intern_offset + n_cells] = d_inpGate_in;
-          d_x[intern_offset + 2 * n_cells] = d_fgtGate_in;
-          d_x[intern_offset + 3 * n_cells] = d_outGate_in;
-
-          #define set_x0(off) { d_x0[off] = d_x[off] + d_x0[off] * (1.f - mask_b); }
-          set_x0(intern_offset);
-          set_x0(intern_offset + n_cells);
-          set_x0(intern_offset + 2 * n_cells);
-          set_x0(intern_offset + 3 * n_cells);
-          #undef set_x0
-
-          // Reset if used frame, otherwise leave as-is.
-          d_h[idx] *= (1.f - mask_b);
-
+          lstm_cell_bwd(idx, n_cells, mask, h, prev_c, y, c, d_y, d_h, d_c, d_x, d_x0);
           idx += gridDim.x * blockDim.x;
         }
       }
@@ -1493,6 +1524,28 @@ class NativeLstm2(NativeOpGenBase):
       }
       int t = start;
       for(; (step > 0) ? (t <= end) : (t >= end); t += step) {
+#if TENSORFLOW && !CUDA
+        // On CPU, we split the batch into chunks and run them in parallel on the TF intra-op thread pool.
+        // Per chunk, the matmul and the (fused) gates, so that the chunk stays in the cache.
+        // The rows of one chunk are independent from the other chunks, also for the inplace y_prev.
+        float* prev_y_t = (t != start) ? y_prev : Ndarray_DEV_DATA(y0);
+        float* prev_c_t = (t != start) ? data_ptr(C, t-step) : Ndarray_DEV_DATA(c0);
+        float* mask_t = Ndarray_DEV_DATA(i) + t * n_batch;
+        float* h_t = data_ptr(H, t);
+        float* y_t = data_ptr(Y, t);
+        float* c_t = data_ptr(C, t);
+        float* w = Ndarray_DEV_DATA(W);
+        parallel_for(n_batch, (long) n_cells * n_cells * 8 + (long) n_cells * 50, [&](long b_begin, long b_end) {
+          // H[t] += Y[t-1] * W
+          affine_raw(
+            prev_y_t + b_begin * n_cells, b_end - b_begin, n_cells,
+            w, n_cells, n_cells * 4,
+            h_t + b_begin * n_cells * 4, b_end - b_begin, n_cells * 4,
+            false, false);
+          for(long idx = b_begin * n_cells; idx < b_end * n_cells; ++idx)
+            lstm_cell_fwd(idx, n_cells, mask_t, h_t, prev_y_t, prev_c_t, y_t, c_t, y_prev);
+        });
+#else
         // H[t] += Y[t-1] * W
         affine_raw(
           (t != start) ? y_prev : Ndarray_DEV_DATA(y0), n_batch, n_cells,
@@ -1511,6 +1564,7 @@ class NativeLstm2(NativeOpGenBase):
           data_ptr(C, t),  // out
           y_prev  // out
         ));
+#endif
       }
 
       Ndarray_memcpy(Ndarray_DEV_DATA(d), data_ptr(C, t - step), n_batch * n_cells * sizeof(float));
@@ -1636,6 +1690,29 @@ class NativeLstm2(NativeOpGenBase):
       for(; (step > 0) ? (t >= start) : (t <= start); t -= step) {
         bool right = (step > 0) ? (t - step >= start) : (t - step <= start);
 
+#if TENSORFLOW && !CUDA
+        // See forward: in parallel over chunks of the batch, the (fused) gates and the matmul.
+        float* mask_t = Ndarray_DEV_DATA(i) + t * n_batch;
+        float* h_t = data_ptr(H, t);
+        float* prev_c_t = right ? data_ptr(C, t-step) : Ndarray_DEV_DATA(c0);
+        float* y_t = data_ptr(Y, t);
+        float* c_t = data_ptr(C, t);
+        float* dy_t = data_ptr(DY, t);
+        float* dx_t = data_ptr(DX, t);
+        float* dy0 = Ndarray_DEV_DATA(Dy0);
+        float* dc0 = Ndarray_DEV_DATA(Dc0);
+        float* w = Ndarray_DEV_DATA(W);
+        parallel_for(n_batch, (long) n_cells * n_cells * 8 + (long) n_cells * 60, [&](long b_begin, long b_end) {
+          for(long idx = b_begin * n_cells; idx < b_end * n_cells; ++idx)
+            lstm_cell_bwd(idx, n_cells, mask_t, h_t, prev_c_t, y_t, c_t, dy_t, dy0, dc0, dx_t, dx0);
+          // (Dy0) DY[t-1] += DX[t] * W^T
+          affine_raw(
+            dx_t + b_begin * n_cells * 4, b_end - b_begin, n_cells * 4,
+            w, n_cells, n_cells * 4,
+            dy0 + b_begin * n_cells, b_end - b_begin, n_cells,
+            false, true);
+        });
+#else
         start_dev_kernel(lstm_bwd_kernel, (
           n_batch,
           n_cells,
@@ -1657,6 +1734,7 @@ class NativeLstm2(NativeOpGenBase):
           Ndarray_DEV_DATA(W), n_cells, n_cells * 4,
           Ndarray_DEV_DATA(Dy0), n_batch, n_cells,
           false, true);
+#endif
       }
 
       //DW = Y[0..T-2]^T * DX[1..T-1]  (if step==1)
@@ -2612,13 +2690,16 @@ def crossentropy_softmax_and_gradient_z_sparse__slow(z, z_mask, y_target_t, y_ta
 
 common_fast_bw_kernels = {
   "001_set_start_states" : """
+    #if CUDA
     __global__
     void set_start_states(float* states, unsigned* start_states) {
       unsigned state_idx = start_states[blockIdx.x * blockDim.x + threadIdx.x];
       states[state_idx] = 0.0;
     }
+    #endif
   """,
   "010_fill_array" : """
+    #if CUDA
     __global__
     void fill_array(float* array, float value, unsigned size) {
       unsigned idx = blockIdx.x * blockDim.x + threadIdx.x;
@@ -2626,8 +2707,10 @@ common_fast_bw_kernels = {
         array[idx] = value;
       }
     }
+    #endif
   """,
   "011_remove_inf": """
+  #if CUDA
   __global__
   void remove_inf(float* array, unsigned size) {
     unsigned idx = blockIdx.x * blockDim.x + threadIdx.x;
@@ -2635,8 +2718,10 @@ common_fast_bw_kernels = {
       array[idx] = fminf(array[idx], 1e32);
     }
   }
+  #endif
   """,
   "012_prob_add": """
+    #if CUDA
     __device__
     float prob_add(float a, float b) {
       float diff = a - b;
@@ -2647,8 +2732,10 @@ common_fast_bw_kernels = {
         return -log1p(exp(-abs(diff))) + min(a, b);
       }
     }
+    #endif
   """,
   "013_atomic_prob_add": """
+    #if CUDA
     __device__
     void atomic_prob_add(float* a, float b) {
       int* addr = (int*)a;
@@ -2659,8 +2746,10 @@ common_fast_bw_kernels = {
         old     = atomicCAS(addr, assumed, __float_as_int(prob_add(__int_as_float(old), b)));
       } while (old != assumed);
     }
+    #endif
   """,
   "020_dump_to_file": """
+    #if CUDA
     template<typename T>
     void dump_to_file_1d(T* d_mem, unsigned n_d1, std::string const& path) {
       std::vector<T> buffer(n_d1);
@@ -2708,12 +2797,17 @@ common_fast_bw_kernels = {
         }
       }
     }
+    #endif
   """,
 }
 
 
 class FastBaumWelchOp(NativeOpGenBase):
   """
+  Forward-backward (Baum-Welch) over the batched automata, in -log space.
+  There is the CUDA implementation, and the CPU implementation (see CpuFastBw),
+  which uses the TF intra-op thread pool (parallel over the states in each frame).
+
   inputs:
     :param am_scores: scores in -log space. 3d (time,batch,dim)
     :param edges: edges of the graph (from,to,emission_idx,sequence_idx)
@@ -2737,6 +2831,7 @@ class FastBaumWelchOp(NativeOpGenBase):
   c_extra_support_code = copy.copy(common_fast_bw_kernels)
   c_extra_support_code.update({
     "100_init_bwd_state_buffer": """
+      #if CUDA
       __global__
       void init_bwd_state_buffer(float* states, unsigned* end_states, unsigned t, unsigned max_t, float* index, unsigned index_stride) {
         unsigned idx = blockIdx.x * blockDim.x + threadIdx.x;
@@ -2745,8 +2840,10 @@ class FastBaumWelchOp(NativeOpGenBase):
           states[state_idx] = 0.0;
         }
       }
+      #endif
     """,
     "101_next_frame": """
+      #if CUDA
       __global__
       void next_frame(bool fwd, unsigned num_edges, unsigned  num_emissions,
                       unsigned* sequence_idxs, unsigned* from_buffer, unsigned* to_buffer, float* weight_buffer, unsigned* emission_idxs,
@@ -2778,8 +2875,10 @@ class FastBaumWelchOp(NativeOpGenBase):
         }
         atomic_prob_add(next_frame + to, val);
       }
+      #endif
     """,
     "102_normalize": """
+      #if CUDA
       __global__
       void normalize(float* buffer, unsigned* sequence_idxs, unsigned num_edges, unsigned num_seqs, float* sum_output) {
         extern __shared__ float sum[];
@@ -2810,8 +2909,10 @@ class FastBaumWelchOp(NativeOpGenBase):
           buffer[e] -= sum[s];
         }
       }
+      #endif
     """,
     "103_compute_result": """
+      #if CUDA
       __global__
       void compute_result(float* edge_buffer, float* out, unsigned* emission_idxs, unsigned* sequence_idxs,
                           unsigned frame_stride, unsigned seq_stride,
@@ -2829,8 +2930,10 @@ class FastBaumWelchOp(NativeOpGenBase):
 
         atomic_prob_add(out + frame * frame_stride + seq_idx * seq_stride + emission_idx, score);
       }
+      #endif
     """,
     "110_write_alignment_to_file": """
+      #if CUDA
       void write_alignment_to_file(float* d_state_buffer, float* d_index, unsigned index_stride,
                                    unsigned* d_start_states, unsigned* d_end_states,
                                    float pruning, unsigned n_frames, unsigned n_seqs, unsigned n_states, unsigned batch_idx) {
@@ -2869,8 +2972,10 @@ class FastBaumWelchOp(NativeOpGenBase):
           }
         }
       }
+      #endif
     """,
     "111_write_output_to_file": """
+      #if CUDA
       void write_output_to_file(float* d_out, float* d_index, unsigned index_stride,
                                 float pruning, unsigned n_frames, unsigned n_seqs, unsigned n_emissions, unsigned batch_idx) {
         std::vector<float> buffer(n_frames * n_seqs * n_emissions);
@@ -2896,6 +3001,161 @@ class FastBaumWelchOp(NativeOpGenBase):
           }
         }
       }
+      #endif
+    """,
+    "200_cpu_fast_bw": """
+      #if !CUDA
+      static inline float cpu_prob_add(float a, float b) {
+        // Like prob_add.
+        float diff = a - b;
+        if (std::isnan(diff)) {
+          return std::numeric_limits<float>::infinity();
+        }
+        return -std::log1p(std::exp(-std::abs(diff))) + std::min(a, b);
+      }
+
+      struct CpuFastBw {
+        /*
+        CPU variant of the kernels above (next_frame, normalize, compute_result).
+        The CUDA kernels go over all edges in parallel and do an atomic log-add into the target state.
+        Here, we group the edges by their target state (separately for the fwd and the bwd direction),
+        such that every state of the next frame is calculated by exactly one thread, without atomics,
+        and we can use a stable log-sum-exp (first the min, then the sum) over the incoming edges.
+        */
+        unsigned n_states, n_edges;
+        unsigned const* from;
+        unsigned const* to;
+        unsigned const* emission_idxs;
+        unsigned const* sequence_idxs;
+        float const* weights;
+        std::vector<unsigned> fwd_offsets, fwd_edges;  // edges grouped by to-state
+        std::vector<unsigned> bwd_offsets, bwd_edges;  // edges grouped by from-state
+
+        CpuFastBw(unsigned n_states_, unsigned n_edges_,
+                  unsigned const* from_, unsigned const* to_, unsigned const* emission_idxs_, unsigned const* sequence_idxs_,
+                  float const* weights_)
+        : n_states(n_states_), n_edges(n_edges_),
+          from(from_), to(to_), emission_idxs(emission_idxs_), sequence_idxs(sequence_idxs_), weights(weights_) {
+          group_edges(to, fwd_offsets, fwd_edges);
+          group_edges(from, bwd_offsets, bwd_edges);
+        }
+
+        void group_edges(unsigned const* states, std::vector<unsigned>& offsets, std::vector<unsigned>& edges) const {
+          offsets.assign(n_states + 1u, 0u);
+          for (unsigned e = 0u; e < n_edges; e++) {
+            assert_cmp(states[e], <, n_states);
+            offsets[states[e] + 1u]++;
+          }
+          for (unsigned s = 0u; s < n_states; s++) {
+            offsets[s + 1u] += offsets[s];
+          }
+          edges.resize(n_edges);
+          std::vector<unsigned> pos(offsets.begin(), offsets.end() - 1);
+          for (unsigned e = 0u; e < n_edges; e++) {
+            edges[pos[states[e]]++] = e;
+          }
+        }
+
+        // Estimated cost per state in next_frame(), for parallel_for.
+        long cost_per_state() const {
+          return 40l * (n_edges / std::max(n_states, 1u) + 1u);
+        }
+
+        // Like next_frame, for the states [state_begin, state_end) of next_frame.
+        // fwd: the edges go from -> to. bwd: to -> from, and edge_buffer gets the bwd scores added.
+        void next_frame(bool fwd, long state_begin, long state_end, unsigned seq_stride,
+                        float const* prev_frame, float* next_frame, float const* am_scores, float* edge_buffer) const {
+          const float inf = std::numeric_limits<float>::infinity();
+          std::vector<unsigned> const& offsets = fwd ? fwd_offsets : bwd_offsets;
+          std::vector<unsigned> const& edges   = fwd ? fwd_edges   : bwd_edges;
+          unsigned const* prev_states          = fwd ? from        : to;
+          for (long s = state_begin; s < state_end; s++) {
+            float min_val = inf;
+            for (unsigned i = offsets[s]; i < offsets[s + 1]; i++) {
+              unsigned e        = edges[i];
+              float    prev_val = prev_frame[prev_states[e]];
+              if (std::isinf(prev_val)) {
+                edge_buffer[e] = inf;
+                continue;
+              }
+              float val = prev_val + weights[e] + am_scores[sequence_idxs[e] * seq_stride + emission_idxs[e]];
+              edge_buffer[e] += fwd ? val : prev_val;
+              min_val = std::min(min_val, val);
+            }
+            if (std::isinf(min_val)) {
+              next_frame[s] = inf;
+              continue;
+            }
+            float sum = 0.0f;
+            for (unsigned i = offsets[s]; i < offsets[s + 1]; i++) {
+              unsigned e        = edges[i];
+              float    prev_val = prev_frame[prev_states[e]];
+              if (std::isinf(prev_val)) {
+                continue;
+              }
+              float val = prev_val + weights[e] + am_scores[sequence_idxs[e] * seq_stride + emission_idxs[e]];
+              sum += std::exp(min_val - val);
+            }
+            next_frame[s] = min_val - std::log(sum);
+          }
+        }
+
+        // Estimated cost per frame in finish_frames(), for parallel_for.
+        long cost_per_frame() const {
+          return 60l * n_edges;
+        }
+
+        // Like normalize and compute_result (and remove_inf if requested), for the frames [frame_begin, frame_end).
+        void finish_frames(long frame_begin, long frame_end, unsigned n_seqs, float* edge_buffer, float* sum_output,
+                           float* out, unsigned frame_stride, unsigned seq_stride, bool remove_inf) const {
+          const float inf = std::numeric_limits<float>::infinity();
+          std::vector<float> sums(n_seqs), min_vals(n_seqs);
+          for (long t = frame_begin; t < frame_end; t++) {
+            float* buffer = edge_buffer + (size_t) t * n_edges;
+            std::fill(min_vals.begin(), min_vals.end(), inf);
+            std::fill(sums.begin(), sums.end(), 0.0f);
+            for (unsigned e = 0u; e < n_edges; e++) {
+              unsigned s = sequence_idxs[e];
+              min_vals[s] = std::min(min_vals[s], buffer[e]);
+            }
+            for (unsigned e = 0u; e < n_edges; e++) {
+              unsigned s = sequence_idxs[e];
+              if (!std::isinf(min_vals[s])) {
+                sums[s] += std::exp(min_vals[s] - buffer[e]);
+              }
+            }
+            for (unsigned s = 0u; s < n_seqs; s++) {
+              if (std::isinf(min_vals[s])) {
+                // if the frame is empty (happens due to batching of seqs with unequal length), set it to 0
+                sums[s] = inf;
+                sum_output[t * n_seqs + s] = 0.0f;
+              }
+              else {
+                sums[s] = min_vals[s] - std::log(sums[s]);
+                sum_output[t * n_seqs + s] = sums[s];
+              }
+            }
+            float* out_frame = out + (size_t) t * frame_stride;
+            std::fill(out_frame, out_frame + frame_stride, inf);
+            for (unsigned e = 0u; e < n_edges; e++) {
+              unsigned s = sequence_idxs[e];
+              if (std::isinf(sums[s])) {
+                buffer[e] = inf;
+                continue;
+              }
+              buffer[e] -= sums[s];
+              float* o = out_frame + s * seq_stride + emission_idxs[e];
+              *o = cpu_prob_add(*o, buffer[e]);
+            }
+            if (remove_inf) {
+              for (unsigned i = 0u; i < frame_stride; i++) {
+                out_frame[i] = std::min(out_frame[i], 1e32f);
+              }
+            }
+          }
+        }
+      };
+      #endif
     """,
   })
 
@@ -2976,6 +3236,7 @@ class FastBaumWelchOp(NativeOpGenBase):
     //std::cerr << "sequnence_stride: " << sequence_stride << std::endl;
     //std::cerr << "index_stride: "     << index_stride    << std::endl;
 
+    #if CUDA
     // initialize edge buffer
     float* d_edge_buffer = reinterpret_cast<float*>(device_malloc(n_edges * n_frames * sizeof(float)));
     if(!d_edge_buffer) return;  // error should have been set in device_malloc
@@ -3074,13 +3335,59 @@ class FastBaumWelchOp(NativeOpGenBase):
     if (d_state_buffer_all != NULL) {
       device_free(d_state_buffer_all);
     }
+    #else  // CUDA
+    // CPU implementation, see CpuFastBw. Same algorithm as above, but we parallelize over the states in each frame.
+    const float inf = std::numeric_limits<float>::infinity();
+    CpuFastBw fast_bw(n_states, n_edges, d_from, d_to, d_emission_idxs, d_sequence_idxs, d_weights);
+    std::vector<float> edge_buffer((size_t) n_edges * n_frames, 0.0f);
+
+    // fwd pass
+    std::fill(d_state_buffer_prev, d_state_buffer_prev + n_states, inf);
+    for (unsigned s = 0u; s < n_seqs; s++) {
+      d_state_buffer_prev[d_start_states[s]] = 0.0f;
+    }
+    for (unsigned t = 0u; t < n_frames; t++) {
+      parallel_for(n_states, fast_bw.cost_per_state(), [&](long state_begin, long state_end) {
+        fast_bw.next_frame(
+          true, state_begin, state_end, sequence_stride, d_state_buffer_prev, d_state_buffer_next,
+          d_am_scores + t * frame_stride, edge_buffer.data() + (size_t) t * n_edges);
+      });
+      std::swap(d_state_buffer_prev, d_state_buffer_next);
+    }
+
+    // bwd pass
+    std::fill(d_state_buffer_prev, d_state_buffer_prev + n_states, inf);
+    for (unsigned t = n_frames; t > 0; t--) {
+      // like init_bwd_state_buffer
+      for (unsigned s = 0u; s < n_seqs; s++) {
+        if (d_index[(t - 1) * index_stride + s] == 1.0 && (t == n_frames || d_index[t * index_stride + s] == 0.0)) {
+          d_state_buffer_prev[d_end_states[s]] = 0.0f;
+        }
+      }
+      parallel_for(n_states, fast_bw.cost_per_state(), [&](long state_begin, long state_end) {
+        fast_bw.next_frame(
+          false, state_begin, state_end, sequence_stride, d_state_buffer_prev, d_state_buffer_next,
+          d_am_scores + (t - 1) * frame_stride, edge_buffer.data() + (size_t) (t - 1) * n_edges);
+      });
+      std::swap(d_state_buffer_prev, d_state_buffer_next);
+    }
+
+    // normalize at each time frame, and compute the result
+    frame_stride    = Ndarray_STRIDE(out, 0);
+    sequence_stride = Ndarray_STRIDE(out, 1);
+    parallel_for(n_frames, fast_bw.cost_per_frame(), [&](long frame_begin, long frame_end) {
+      // With TensorFlow, we replace inf by a very high number, see above.
+      fast_bw.finish_frames(
+        frame_begin, frame_end, n_seqs, edge_buffer.data(), d_sum_output,
+        d_out, frame_stride, sequence_stride, TENSORFLOW);
+    });
+    #endif  // CUDA
+
     batch_idx++;
   """
 
   c_bw_code = None
 
-  cpu_support = False  # TODO: fix CPU support...
-
 
 class MultiEndFastBaumWelchOp(NativeOpGenBase):
   """
@@ -3109,6 +3416,7 @@ class MultiEndFastBaumWelchOp(NativeOpGenBase):
   c_extra_support_code = copy.copy(FastBaumWelchOp.c_extra_support_code)
   c_extra_support_code.update({
     "100_init_bwd_state_buffer": """
+      #if CUDA
       __global__
       void init_bwd_state_buffer(unsigned t, unsigned max_t, unsigned num_endstates, unsigned index_stride,
                                  float* states, unsigned const* end_states, float const* end_state_weights, float const* index) {
@@ -3124,6 +3432,7 @@ class MultiEndFastBaumWelchOp(NativeOpGenBase):
           states[state_idx] = weight;
         }
       }
+      #endif
     """})
 
   c_fw_code = """
@@ -3201,6 +3510,7 @@ class MultiEndFastBaumWelchOp(NativeOpGenBase):
 //    std::cerr << "sequence_stride: "  << sequence_stride << std::endl;
 //    std::cerr << "index_stride: "     << index_stride    << std::endl;
 
+    #if CUDA
     // initialize edge buffer
     float* d_edge_buffer = reinterpret_cast<float*>(device_malloc(n_edges * n_frames * sizeof(float)));
 //    cudaDeviceSynchronize();
@@ -3315,13 +3625,60 @@ class MultiEndFastBaumWelchOp(NativeOpGenBase):
     if (d_state_buffer_all != NULL) {
       device_free(d_state_buffer_all);
     }
+    #else  // CUDA
+    // CPU implementation, see CpuFastBw. Same algorithm as above, but we parallelize over the states in each frame.
+    const float inf = std::numeric_limits<float>::infinity();
+    CpuFastBw fast_bw(n_states, n_edges, d_from, d_to, d_emission_idxs, d_sequence_idxs, d_weights);
+    std::vector<float> edge_buffer((size_t) n_edges * n_frames, 0.0f);
+
+    // fwd pass
+    std::fill(d_state_buffer_prev, d_state_buffer_prev + n_states, inf);
+    for (unsigned i = 0u; i < n_start_states; i++) {
+      d_state_buffer_prev[d_start_states[i]] = 0.0f;
+    }
+    for (unsigned t = 0u; t < n_frames; t++) {
+      parallel_for(n_states, fast_bw.cost_per_state(), [&](long state_begin, long state_end) {
+        fast_bw.next_frame(
+          true, state_begin, state_end, sequence_stride, d_state_buffer_prev, d_state_buffer_next,
+          d_am_scores + t * frame_stride, edge_buffer.data() + (size_t) t * n_edges);
+      });
+      std::swap(d_state_buffer_prev, d_state_buffer_next);
+    }
+
+    // bwd pass
+    std::fill(d_state_buffer_prev, d_state_buffer_prev + n_states, inf);
+    for (unsigned t = n_frames; t > 0; t--) {
+      // like init_bwd_state_buffer
+      for (unsigned i = 0u; i < n_end_states; i++) {
+        unsigned s = d_end_states[i * 2u + 0u];
+        if (d_index[(t - 1) * index_stride + s] == 1.0 && (t == n_frames || d_index[t * index_stride + s] == 0.0)) {
+          d_state_buffer_prev[d_end_states[i * 2u + 1u]] = d_end_state_weights[i];
+        }
+      }
+      parallel_for(n_states, fast_bw.cost_per_state(), [&](long state_begin, long state_end) {
+        fast_bw.next_frame(
+          false, state_begin, state_end, sequence_stride, d_state_buffer_prev, d_state_buffer_next,
+          d_am_scores + (t - 1) * frame_stride, edge_buffer.data() + (size_t) (t - 1) * n_edges);
+      });
+      std::swap(d_state_buffer_prev, d_state_buffer_next);
+    }
+
+    // normalize at each time frame, and compute the result
+    frame_stride    = Ndarray_STRIDE(out, 0);
+    sequence_stride = Ndarray_STRIDE(out, 1);
+    parallel_for(n_frames, fast_bw.cost_per_frame(), [&](long frame_begin, long frame_end) {
+      // With TensorFlow, we replace inf by a very high number, see above.
+      fast_bw.finish_frames(
+        frame_begin, frame_end, n_seqs, edge_buffer.data(), d_sum_output,
+        d_out, frame_stride, sequence_stride, TENSORFLOW);
+    });
+    #endif  // CUDA
+
     batch_idx++;
   """
 
   c_bw_code = None
 
-  cpu_support = False  # TODO: fix CPU support...
-
 
 class SegmentFastBaumWelchOp(NativeOpGenBase):
   in_info = (
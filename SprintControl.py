@@ -220,6 +220,12 @@ class PythonControl:
     self.cond = Condition()
     self.pipe_c2p = os.fdopen(c2p_fd, "wb")
     self.pipe_p2c = os.fdopen(p2c_fd, "rb")
+    config = kwargs.get("config") or {}
+    self.ring_buffer = None  # type: TaskSystem.SharedMemRingBuffer|None
+    if "SharedMemRingBufferShmId" in config:
+      # See SprintErrorSignals.SprintSubprocessInstance. This is for the child-to-parent direction.
+      self.ring_buffer = TaskSystem.SharedMemRingBuffer(
+        size=int(config["SharedMemRingBufferSize"]), shmid=int(config["SharedMemRingBufferShmId"]), is_writer=True)
     self.sprint_callback = None  # via self._init
     self.sprint_version_number = None  # via self._init
     self.callback = None  # either via Sprint, or self.own_threaded_callback
@@ -315,7 +321,7 @@ class PythonControl:
     return loss, error_signal
 
   def _send(self, data):
-    Pickler(self.pipe_c2p).dump(data)
+    Pickler(self.pipe_c2p, ring_buffer=self.ring_buffer).dump(data)
     self.pipe_c2p.flush()
 
   def _read(self):
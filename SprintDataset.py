@@ -509,11 +509,14 @@ class ExternSprintDataset(SprintDatasetBase):
   The Sprint subprocess will use SprintExternInterface to communicate with us.
   """
 
-  def __init__(self, sprintTrainerExecPath, sprintConfigStr, partitionEpoch=None, **kwargs):
+  def __init__(self, sprintTrainerExecPath, sprintConfigStr, partitionEpoch=None, sharedMemRingBufferSize=0,
+               **kwargs):
     """
     :param str|list[str] sprintTrainerExecPath:
     :param str | list[str] | ()->str | list[()->str] | ()->list[str] | ()->list[()->str] sprintConfigStr: via eval_shell_str
     :param int|None partitionEpoch: deprecated. use partition_epoch instead
+    :param int sharedMemRingBufferSize: in bytes. if set, the features and targets are transferred via
+      a TaskSystem.SharedMemRingBuffer, and only a small header goes over the pipe
     """
     super(ExternSprintDataset, self).__init__(**kwargs)
     self.add_data_thread_id = None
@@ -527,6 +530,9 @@ class ExternSprintDataset(SprintDatasetBase):
     self.parent_pid = os.getpid()
     self.reader_thread = None  # type: Thread
     self.seq_list_file = None
+    self.ring_buffer = None  # type: TaskSystem.SharedMemRingBuffer|None
+    if sharedMemRingBufferSize:
+      self.ring_buffer = TaskSystem.SharedMemRingBuffer(size=sharedMemRingBufferSize, is_writer=False)
     self.useMultipleEpochs()
     # There is no generic way to see whether Python is exiting.
     # This is our workaround. We check for it in self.run_inner().
@@ -570,6 +576,8 @@ class ExternSprintDataset(SprintDatasetBase):
     self.pipe_p2c = self._pipe_open()
     args = self._build_sprint_args()
     print("%s: epoch" % self, epoch, "exec", args, file=log.v5)
+    if self.ring_buffer:
+      self.ring_buffer.reset()  # new writer
 
     pid = os.fork()
     if pid == 0:  # child
@@ -634,6 +642,9 @@ class ExternSprintDataset(SprintDatasetBase):
       self.pipe_c2p[1].fileno(), self.pipe_p2c[0].fileno())
     if TaskSystem.SharedMemNumpyConfig["enabled"]:
       config_str += ",EnableAutoNumpySharedMemPickling:True"
+    if self.ring_buffer:
+      config_str += ",SharedMemRingBufferSize:%i,SharedMemRingBufferShmId:%i" % (
+        self.ring_buffer.mem.size, self.ring_buffer.mem.shmid)
     epoch = self.crnnEpoch or 1
     assert epoch >= 1
     if isinstance(self.sprintTrainerExecPath, (list, tuple)):
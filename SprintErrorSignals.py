@@ -19,7 +19,7 @@ import atexit
 import signal
 from threading import RLock
 import TaskSystem
-from TaskSystem import Pickler, Unpickler, numpy_set_unused
+from TaskSystem import Pickler, Unpickler, numpy_set_unused, numpy_copy_and_set_unused
 from Util import eval_shell_str, make_hashable
 from Log import log
 
@@ -36,12 +36,15 @@ class SprintSubprocessInstance:
     "exit" -> (exit)
     "get_loss_and_error_signal", seg_name, seg_len, posteriors -> "ok", loss, error_signal
       Numpy arrays encoded via TaskSystem.Pickler (which is optimized for Numpy).
+      With sharedMemRingBufferSize, the array data is passed via TaskSystem.SharedMemRingBuffer instead,
+      one for each direction, and only a small header goes over the pipe.
   On the Sprint side, we handle this via the SprintControl Sprint interface.
   """
 
   Version = 1  # increase when some protocol changes
 
-  def __init__(self, sprintExecPath, minPythonControlVersion=2, sprintConfigStr="", sprintControlConfig=None, usePythonSegmentOrder=True):
+  def __init__(self, sprintExecPath, minPythonControlVersion=2, sprintConfigStr="", sprintControlConfig=None,
+               usePythonSegmentOrder=True, sharedMemRingBufferSize=0):
     """
     :param str sprintExecPath: this executable will be called for the sub proc.
     :param int minPythonControlVersion: will be checked in the subprocess. via Sprint PythonControl
@@ -49,6 +52,8 @@ class SprintSubprocessInstance:
       can have "config:" prefix - in that case, looked up in config.
       handled via eval_shell_str(), can thus have lazy content (if it is callable, will be called).
     :param dict[str]|None sprintControlConfig: passed to SprintControl.init().
+    :param bool usePythonSegmentOrder:
+    :param int sharedMemRingBufferSize: in bytes. if set, Numpy arrays are transferred via shared memory
     """
     assert os.path.exists(sprintExecPath)
     self.sprintExecPath = sprintExecPath
@@ -70,6 +75,13 @@ class SprintSubprocessInstance:
     self._cur_seg_name = None
     self._cur_posteriors_shape = None
     self.is_calculating = False
+    self.sharedMemRingBufferSize = sharedMemRingBufferSize
+    self.ring_buffer_p2c = None  # type: TaskSystem.SharedMemRingBuffer|None
+    self.ring_buffer_c2p = None  # type: TaskSystem.SharedMemRingBuffer|None
+    if sharedMemRingBufferSize:
+      # We create both, so that they live as long as we do. The child attaches to them.
+      self.ring_buffer_p2c = TaskSystem.SharedMemRingBuffer(size=sharedMemRingBufferSize, is_writer=True)
+      self.ring_buffer_c2p = TaskSystem.SharedMemRingBuffer(size=sharedMemRingBufferSize, is_writer=False)
     self.init()
 
   def _exit_child(self, should_interrupt=False):
@@ -116,6 +128,9 @@ class SprintSubprocessInstance:
     self.pipe_p2c = self._pipe_open()
     args = self._build_sprint_args()
     print("SprintSubprocessInstance: exec", args, file=log.v5)
+    if self.sharedMemRingBufferSize:
+      self.ring_buffer_p2c.reset()
+      self.ring_buffer_c2p.reset()
 
     pid = os.fork()
     if pid == 0:  # child
@@ -163,6 +178,9 @@ class SprintSubprocessInstance:
     config_str += ",minPythonControlVersion:%i" % self.minPythonControlVersion
     if TaskSystem.SharedMemNumpyConfig["enabled"]:
       config_str += ",EnableAutoNumpySharedMemPickling:True"
+    if self.sharedMemRingBufferSize:
+      config_str += ",SharedMemRingBufferSize:%i,SharedMemRingBufferShmId:%i" % (
+        self.ring_buffer_c2p.mem.size, self.ring_buffer_c2p.mem.shmid)
     if self.sprintControlConfig:
       config_str += "," + ",".join(["%s:%s" % (k, v) for (k, v) in sorted(self.sprintControlConfig.items())])
     my_mod_name = "SprintControl"
@@ -190,7 +208,7 @@ class SprintSubprocessInstance:
   def _send(self, v):
     assert os.getpid() == self.parent_pid
     p = self.pipe_p2c[1]  # see _start_child
-    Pickler(p).dump(v)
+    Pickler(p, ring_buffer=self.ring_buffer_p2c).dump(v)
 
   def _read(self):
     assert os.getpid() == self.parent_pid
@@ -300,8 +318,14 @@ class SprintInstancePool:
     assert isinstance(sprint_opts, dict)
     sprint_opts = sprint_opts.copy()
     self.max_num_instances = int(sprint_opts.pop("numInstances", 1))
+    automata_cache_dir = sprint_opts.pop("automataCacheDir", None)
+    automata_cache_max_in_memory = int(sprint_opts.pop("automataCacheMaxInMemory", 10000))
     self.sprint_opts = sprint_opts
     self.instances = []; ":type: list[SprintSubprocessInstance]"
+    self.automata_cache = None  # type: SprintAutomataCache|None
+    if automata_cache_dir:
+      self.automata_cache = SprintAutomataCache(
+        cache_dir=automata_cache_dir, sprint_opts=sprint_opts, max_num_in_memory=automata_cache_max_in_memory)
 
   def _maybe_create_new_instance(self):
     if len(self.instances) < self.max_num_instances:
@@ -374,50 +398,87 @@ class SprintInstancePool:
       weights are of shape (num_edges,), of dtype float32.
       start_end_states are of shape (2, batch), each (start,stop) state idx, batch = len(tags), of dtype uint32.
     :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+
+    If the automata cache is enabled (via the "automataCacheDir" Sprint option),
+    we only ask Sprint for the segments which are not in the cache yet.
+    """
+    segment_names = [self._get_segment_name(tags, b) for b in range(len(tags))]
+    all_automata = [None] * len(tags)  # type: list[(int,numpy.ndarray,numpy.ndarray)]
+    if self.automata_cache:
+      for b, segment_name in enumerate(segment_names):
+        all_automata[b] = self.automata_cache.get(segment_name)
+    missing = [b for b in range(len(tags)) if all_automata[b] is None]
+    for b, automaton in zip(missing, self._get_automata_from_sprint([segment_names[b] for b in missing])):
+      all_automata[b] = automaton
+      if self.automata_cache:
+        self.automata_cache.add(segment_names[b], *automaton)
+    return self._join_automata(all_automata)
+
+  @staticmethod
+  def _get_segment_name(tags, b):
+    """
+    :param list[str]|numpy.ndarray tags:
+    :param int b: batch idx
+    :rtype: str
+    """
+    if isinstance(tags[0], str):
+      segment_name = tags[b]
+    elif isinstance(tags[0], bytes):  # e.g. from tf.py_func in Python 3
+      segment_name = tags[b].decode("utf8")
+    else:
+      segment_name = tags[b].view('S%d' % tags.shape[1])[0]
+    assert isinstance(segment_name, str)
+    return segment_name
+
+  def _get_automata_from_sprint(self, segment_names):
+    """
+    :param list[str] segment_names:
+    :return: for each segment: (num_states, edges, weights).
+      edges are of shape (3, num_edges), each (from, to, emission-idx), of dtype uint32.
+    :rtype: list[(int,numpy.ndarray,numpy.ndarray)]
     """
-    all_num_states = [None] * len(tags)  # type: list[int]
-    all_num_edges  = [None] * len(tags)  # type: list[int]
-    all_edges      = [None] * len(tags)  # type: list[numpy.ndarray]
-    all_weights    = [None] * len(tags)  # type: list[numpy.ndarray]
-    for bb in range(0, len(tags), self.max_num_instances):
+    res = [None] * len(segment_names)  # type: list[(int,numpy.ndarray,numpy.ndarray)]
+    for bb in range(0, len(segment_names), self.max_num_instances):
       for i in range(self.max_num_instances):
         b = bb + i
-        if b >= len(tags): break
+        if b >= len(segment_names): break
         instance = self._get_instance(i)
-        if isinstance(tags[0], str):
-          segment_name = tags[b]
-        else:
-          segment_name = tags[b].view('S%d' % tags.shape[1])[0]
-        assert isinstance(segment_name, str)
-        instance._send(("export_allophone_state_fsa_by_segment_name", segment_name))
+        instance._send(("export_allophone_state_fsa_by_segment_name", segment_names[b]))
       for i in range(self.max_num_instances):
         b = bb + i
-        if b >= len(tags): break
+        if b >= len(segment_names): break
         instance = self._get_instance(i)
         r = instance._read()
         if r[0] != 'ok':
           raise RuntimeError(r[1])
         num_states, num_edges, edges, weights = r[1:]
-        all_num_states[b] = num_states
-        all_num_edges [b] = num_edges
-        all_edges     [b] = edges.reshape((3, num_edges))  # (from, to, emission-idx) for each edge, uint32
-        all_weights   [b] = weights  # for each edge, float32
-    state_offset = 0
-    for idx in range(len(all_edges)):
-      num_edges = all_num_edges[idx]
-      all_edges[idx][0:2,:] += state_offset
-      state_offset += all_num_states[idx]
-      # add sequence_idx. becomes (from, to, emission-idx, seq-idx) for each edge
-      all_edges[idx] = numpy.vstack((all_edges[idx], numpy.ones((1, num_edges), dtype='uint32') * idx))
-
-    start_end_states = numpy.empty((2, len(all_num_states)), dtype='uint32')
-    state_offset = 0
-    for idx, num_states in enumerate(all_num_states):
-      start_end_states[0,idx] = state_offset
-      start_end_states[1,idx] = state_offset + num_states - 1
-      state_offset += num_states
-
-    return numpy.hstack(all_edges), numpy.hstack(all_weights), start_end_states
+        # We might keep them in the automata cache, so copy them out of any shared memory.
+        edges, weights = numpy_copy_and_set_unused(edges), numpy_copy_and_set_unused(weights)
+        # (from, to, emission-idx) for each edge, uint32. weights: for each edge, float32
+        res[b] = (num_states, edges.reshape((3, num_edges)), weights)
+    return res
+
+  @staticmethod
+  def _join_automata(all_automata):
+    """
+    :param list[(int,numpy.ndarray,numpy.ndarray)] all_automata: for each seq: (num_states, edges, weights)
+    :return: (edges, weights, start_end_states), see get_automata_for_batch
+    :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+    """
+    num_states = numpy.array([a[0] for a in all_automata], dtype="uint32")
+    num_edges = numpy.array([a[1].shape[1] for a in all_automata], dtype="int64")
+    state_offsets = numpy.zeros_like(num_states)
+    state_offsets[1:] = numpy.cumsum(num_states)[:-1]
+    edges = numpy.empty((4, int(num_edges.sum())), dtype="uint32")
+    if len(all_automata) > 0:
+      edges[:3] = numpy.hstack([a[1] for a in all_automata])
+    seq_idx = numpy.repeat(numpy.arange(len(all_automata), dtype="uint32"), num_edges)
+    edges[0:2] += state_offsets[seq_idx][None, :]  # make state idx global
+    edges[3] = seq_idx  # becomes (from, to, emission-idx, seq-idx) for each edge
+    weights = numpy.hstack([a[2] for a in all_automata] or [numpy.zeros((0,), dtype="float32")])
+    start_end_states = numpy.stack([state_offsets, state_offsets + num_states - 1])
+    return edges, weights, start_end_states
+
 
   def get_free_instance(self):
     for inst in self.instances:
@@ -426,6 +487,120 @@ class SprintInstancePool:
     return self._maybe_create_new_instance()
 
 
+class SprintAutomataCache:
+  """
+  Caches the per-segment automata which we get from Sprint (see SprintInstancePool.get_automata_for_batch).
+  Generating the automata in Sprint is expensive and they are the same in every epoch,
+  so we store them on disk (one file per segment) and keep the most recently used ones in memory.
+  The cache dir is shared by all Sprint configs, i.e. the entries are keyed by a hash of the Sprint options
+  and the segment name.
+  Note that we only hash the Sprint options themselves, not the content of any files they refer to.
+  If you change e.g. the lexicon, use a new cache dir or delete the old one.
+  """
+
+  def __init__(self, cache_dir, sprint_opts, max_num_in_memory=10000):
+    """
+    :param str cache_dir:
+    :param dict[str] sprint_opts: the options for SprintSubprocessInstance
+    :param int max_num_in_memory: max number of automata kept in memory. 0 to disable the in-memory cache
+    """
+    from collections import OrderedDict
+    self.sprint_opts_hash = self._hash_str(repr(self._sorted_items(sprint_opts)))
+    self.cache_dir = os.path.join(os.path.expanduser(cache_dir), self.sprint_opts_hash)
+    self.max_num_in_memory = max_num_in_memory
+    self.in_memory = OrderedDict()  # segment_name -> (num_states, edges, weights)
+    self.num_hits = 0
+    self.num_misses = 0
+
+  @classmethod
+  def _sorted_items(cls, obj):
+    if isinstance(obj, dict):
+      return [(k, cls._sorted_items(v)) for (k, v) in sorted(obj.items())]
+    return obj
+
+  @staticmethod
+  def _hash_str(s):
+    """
+    :param str s:
+    :rtype: str
+    """
+    import hashlib
+    return hashlib.md5(s.encode("utf8")).hexdigest()
+
+  def _get_filename(self, segment_name):
+    """
+    :param str segment_name:
+    :rtype: str
+    """
+    h = self._hash_str(segment_name)
+    return os.path.join(self.cache_dir, h[:2], "%s.npz" % h)
+
+  def get(self, segment_name):
+    """
+    :param str segment_name:
+    :return: (num_states, edges, weights) or None if not in the cache.
+      edges are of shape (3, num_edges), each (from, to, emission-idx), of dtype uint32.
+    :rtype: (int,numpy.ndarray,numpy.ndarray)|None
+    """
+    if segment_name in self.in_memory:
+      self.num_hits += 1
+      res = self.in_memory.pop(segment_name)
+      self.in_memory[segment_name] = res  # mark as most recently used
+      return res
+    filename = self._get_filename(segment_name)
+    if not os.path.exists(filename):
+      self.num_misses += 1
+      return None
+    with numpy.load(filename) as f:
+      if str(f["segment_name"]) != segment_name:  # hash collision
+        self.num_misses += 1
+        return None
+      res = (int(f["num_states"]), f["edges"], f["weights"])
+    self.num_hits += 1
+    self._add_in_memory(segment_name, res)
+    return res
+
+  def add(self, segment_name, num_states, edges, weights):
+    """
+    :param str segment_name:
+    :param int num_states:
+    :param numpy.ndarray edges: (3, num_edges), uint32
+    :param numpy.ndarray weights: (num_edges,), float32
+    """
+    import tempfile
+    res = (int(num_states), edges, weights)
+    self._add_in_memory(segment_name, res)
+    filename = self._get_filename(segment_name)
+    if not os.path.exists(os.path.dirname(filename)):
+      try:
+        os.makedirs(os.path.dirname(filename))
+      except OSError:  # maybe some other process created it in the meantime
+        assert os.path.isdir(os.path.dirname(filename))
+    # Write to a temp file first and rename it, so that concurrent readers never see partial files.
+    fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=".tmp-", suffix=".npz")
+    try:
+      with os.fdopen(fd, "wb") as f:
+        numpy.savez(
+          f, segment_name=numpy.array(segment_name), num_states=numpy.array(num_states, dtype="int64"),
+          edges=edges, weights=weights)
+      os.rename(tmp_filename, filename)
+    except Exception:
+      if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+      raise
+
+  def _add_in_memory(self, segment_name, automaton):
+    """
+    :param str segment_name:
+    :param (int,numpy.ndarray,numpy.ndarray) automaton:
+    """
+    if self.max_num_in_memory <= 0:
+      return
+    self.in_memory[segment_name] = automaton
+    while len(self.in_memory) > self.max_num_in_memory:
+      self.in_memory.popitem(last=False)
+
+
 class SeqTrainParallelControlDevHost:
   """
   Counterpart to Engine.SeqTrainParallelControl.
@@ -110,8 +110,14 @@ def _init_global_sprintDataset(inputDim, outputDim, config):
   global sprintDataset
   if sprintDataset: return
   numSegments = len(segmentOrderList) if segmentOrderList is not None else None
+  ring_buffer = None
+  if "SharedMemRingBufferShmId" in config:
+    # See ExternSprintDataset.
+    ring_buffer = TaskSystem.SharedMemRingBuffer(
+      size=int(config["SharedMemRingBufferSize"]), shmid=int(config["SharedMemRingBufferShmId"]), is_writer=True)
   sprintDataset = ExternSprintDatasetSource(c2p_fd=int(config["c2p_fd"]), p2c_fd=int(config["p2c_fd"]),
-                                            inputDim=inputDim, outputDim=outputDim, numSegments=numSegments)
+                                            inputDim=inputDim, outputDim=outputDim, numSegments=numSegments,
+                                            ring_buffer=ring_buffer)
 
 
 def exit():
@@ -198,7 +204,7 @@ class ExternSprintDatasetSource:
   and is waiting for our data.
   """
 
-  def __init__(self, c2p_fd, p2c_fd, inputDim, outputDim, numSegments):
+  def __init__(self, c2p_fd, p2c_fd, inputDim, outputDim, numSegments, ring_buffer=None):
     """
     :param int c2p_fd: child-to-parent file descriptor
     :param int p2c_fd: parent-to-child file descriptor
@@ -206,7 +212,9 @@ class ExternSprintDatasetSource:
     :type outputDim: int
     :type numSegments: int | None
     :param numSegments: can be None if not known in advance
+    :param TaskSystem.SharedMemRingBuffer|None ring_buffer: if given, used to transfer the Numpy arrays
     """
+    self.ring_buffer = ring_buffer
     self.pipe_c2p = os.fdopen(c2p_fd, "wb")
     self.pipe_p2c = os.fdopen(p2c_fd, "rb")
     self._send("init", (inputDim, outputDim, numSegments))
@@ -214,7 +222,7 @@ class ExternSprintDatasetSource:
   def _send(self, dataType, args=None):
     import struct
     stream = BytesIO()
-    Pickler(stream).dump((dataType, args))
+    Pickler(stream, ring_buffer=self.ring_buffer).dump((dataType, args))
     raw_data = stream.getvalue()
     self.pipe_c2p.write(struct.pack("<i", len(raw_data)))
     self.pipe_c2p.write(raw_data)
@@ -248,6 +248,22 @@ class Runner(object):
     self.num_steps = num_steps
     self.finalized = True
 
+  def get_intermediate_score(self):
+    """
+    Can be called while :func:`run` is still running (e.g. from another thread).
+
+    :return: score accumulated over all steps so far, like ``self.score`` after :func:`_finalize`,
+      e.g. {"cost:output": 2.3}. Empty if no step was done yet.
+    :rtype: dict[str,float]
+    """
+    results_accumulated = self._results_accumulated.copy()
+    inv_norm_accumulated = self._inv_norm_accumulated.copy()
+    if not inv_norm_accumulated.keys():
+      return {}
+    return {
+      key: self._normalize_loss(value, key, inv_norm_accumulated)
+      for (key, value) in results_accumulated.items() if key.startswith("cost:")}
+
   def _get_batch_dim_from_fetches(self, fetches_results):
     """
     :param dict[str,numpy.ndarray|None] fetches_results: results of calculations, see self._get_fetches_dict()
@@ -695,7 +711,9 @@ class Engine(object):
     self.use_dynamic_train_flag = False
     self.use_search_flag = config.value("task", None) == "search"
     self.use_eval_flag = config.value("task", None) != "forward"
+    self.network_from_graph_cache = False  # see network_graph_cache_dir
     self._const_cache = {}  # type: dict[str,tf.Tensor]
+    self._seq_tags_in_default_order_cache = None  # type: (Dataset,int|None,list[str])|None  # see search
 
   def finalize(self):
     self._close_tf_session()
@@ -1042,12 +1060,31 @@ class Engine(object):
       extern_data = ExternData()
       extern_data.init_from_config(self.config)
       # TODO...
+    graph_cache = None
+    self.network_from_graph_cache = False
+    if self.config.value("network_graph_cache_dir", None) and train_flag is False:
+      # Only for inference (forward/search) without eval, as the cached graph has no losses. See NetworkGraphCache.
+      from TFNetwork import NetworkGraphCache
+      if self._network_needs_eval():
+        print("Network graph cache: not used, as we need eval (e.g. search_do_eval).", file=log.v3)
+      else:
+        graph_cache = NetworkGraphCache(
+          cache_dir=self.config.value("network_graph_cache_dir", None), config=self.config,
+          net_dict=net_desc, search_flag=self.use_search_flag, eval_flag=self.use_eval_flag)
+    if graph_cache:
+      self.network = graph_cache.load(session=self.tf_session)
+      if self.network:
+        self.updater = None
+        self.network_from_graph_cache = True
+        return
     self.network, self.updater = self.create_network(
       config=self.config,
       rnd_seed=net_random_seed,
       train_flag=train_flag, eval_flag=self.use_eval_flag, search_flag=self.use_search_flag,
       initial_learning_rate=getattr(self, "initial_learning_rate", None),
       net_dict=net_desc)
+    if graph_cache:
+      graph_cache.save(network=self.network)
     self.network.initialize_params(session=self.tf_session)
     if self.config.is_true("use_horovod"):
       # Note: Might not be needed as it should be deterministic. But just to be sure...
@@ -1058,6 +1095,17 @@ class Engine(object):
         for var in self.network.get_params_list() + self.network.get_auxiliary_params()])
       self.tf_session.run(bcast_op)
 
+  def _network_needs_eval(self):
+    """
+    :return: whether the job needs the losses of the network, e.g. the search with search_do_eval (default)
+    :rtype: bool
+    """
+    if not self.use_eval_flag:
+      return False
+    if self.use_search_flag:
+      return self.config.bool("search_do_eval", True)  # see rnn.executeMainTask
+    return True
+
   @classmethod
   def create_network(cls, config, rnd_seed, train_flag, eval_flag, search_flag, net_dict, initial_learning_rate=1.0):
     """
@@ -1763,8 +1811,57 @@ class Engine(object):
       sys.exit(1)
     return analyzer
 
+  def _get_seq_tags_in_default_order(self, dataset, epoch):
+    """
+    Takes the seq tags from the seq list of the dataset (:func:`Dataset.get_all_tags`) if possible,
+    otherwise this will iterate through the whole dataset (in default order) to collect the seq tags.
+    The result is cached per dataset and epoch.
+
+    :param Dataset.Dataset dataset:
+    :param int|None epoch:
+    :return: seq tags in the default order, i.e. the order of the corpus
+    :rtype: list[str]
+    """
+    if self._seq_tags_in_default_order_cache:
+      cached_dataset, cached_epoch, seq_tags = self._seq_tags_in_default_order_cache
+      if cached_dataset is dataset and cached_epoch == epoch:
+        return seq_tags
+    seq_tags = None
+    if dataset.partition_epoch == 1:  # otherwise we only get a part of the corpus in this epoch
+      try:
+        seq_tags = dataset.get_all_tags()
+      except NotImplementedError:
+        pass
+    if seq_tags is None:
+      print("Dataset does not provide all seq tags, iterate through it in default order first.", file=log.v3)
+      dataset.seq_ordering = "default"
+      dataset.init_seq_order(epoch=epoch)
+      seq_tags = []
+      seq_idx = 0
+      while dataset.is_less_than_num_seqs(seq_idx):
+        dataset.load_seqs(seq_idx, seq_idx + 1)
+        seq_tags.append(dataset.get_tag(seq_idx))
+        seq_idx += 1
+    self._seq_tags_in_default_order_cache = (dataset, epoch, seq_tags)
+    return seq_tags
+
+  def _get_search_beam_size(self):
+    """
+    :return: max beam size of all layers in the network, or 1 if there is no search
+    :rtype: int
+    """
+    beam_size = 1
+    for layer in self.network.layers.values():
+      beam_size = max(beam_size, layer.output.beam_size or 1)
+    return beam_size
+
   def search(self, dataset, do_eval=True, output_layer_name="output", output_file=None, output_file_format="txt"):
     """
+    The seqs are always sorted by length (longest first), such that the batches have minimal padding.
+    The outputs are written to the output file incrementally, in the original order of the corpus.
+    The batches are built by a compute budget, i.e. beam_size * max_len * num_seqs <= search_batch_size,
+    where search_batch_size defaults to batch_size * beam_size, i.e. the same number of frames as before.
+
     :param Dataset.Dataset dataset:
     :param bool do_eval: calculate errors. can only be done if we have the reference target
     :param str output_layer_name:
@@ -1782,24 +1879,32 @@ class Engine(object):
         print("Reinit network with search flag.", file=log.v3)
       self.init_network_from_config(self.config)
     if do_eval:
+      assert not self.network_from_graph_cache, (
+        "search: eval not possible with network_graph_cache_dir, set search_do_eval = False")
       # It's constructed lazily and it will set used_data_keys, so make sure that we have it now.
       self.network.maybe_construct_objective()
-    if output_file:
-      if dataset.have_corpus_seq_idx():
-        # We can sort it. Sort it in reverse to make sure that we have enough memory right at the beginning.
-        print("Dataset have_corpus_seq_idx == True, i.e. it will be sorted for optimal performance.", file=log.v3)
-        dataset.seq_ordering = "sorted_reverse"
-      else:
-        print("Dataset have_corpus_seq_idx == False, i.e. it will not be sorted for optimal performance.", file=log.v3)
-        dataset.seq_ordering = "default"  # enforce order as-is, so that the order in the written file corresponds
+    # seq tag -> index in the output file. Only needed if we cannot use the corpus seq idx.
+    seq_tag_to_out_idx = None  # type: dict[str,int]|None
+    if output_file and output_file_format == "txt" and not dataset.have_corpus_seq_idx():
+      print("Dataset have_corpus_seq_idx == False, use the seq tags in default order.", file=log.v3)
+      seq_tags = self._get_seq_tags_in_default_order(dataset, epoch=self.epoch)
+      seq_tag_to_out_idx = {tag: i for (i, tag) in enumerate(seq_tags)}
+      assert len(seq_tag_to_out_idx) == len(seq_tags), "seq tags are not unique"
+    # We sort it in reverse to make sure that we have enough memory right at the beginning.
+    dataset.seq_ordering = "sorted_reverse"
 
     max_seq_length=self.config.typed_value('max_seq_length', None) or self.config.float('max_seq_length', 0)
     assert not max_seq_length, "Set max_seq_length = 0 for search (i.e. no maximal length). We want to keep all source sentences."
 
+    beam_size = self._get_search_beam_size()
+    batch_size = self.config.int('batch_size', 1)
+    search_batch_size = self.config.int('search_batch_size', batch_size * beam_size)
+    print("Search beam size %i, batch size %i (beam_size * max_len * num_seqs)." % (
+      beam_size, search_batch_size), file=log.v3)
     dataset.init_seq_order(epoch=self.epoch)
     batches = dataset.generate_batches(
       recurrent_net=self.network.recurrent,
-      batch_size=self.config.int('batch_size', 1),
+      batch_size=max(search_batch_size // beam_size, 1),
       max_seqs=self.config.int('max_seqs', -1),
       max_seq_length=max_seq_length,
       used_data_keys=self.network.used_data_keys)
@@ -1815,17 +1920,42 @@ class Engine(object):
     target_key = output_layer.target or self.network.extern_data.default_target
 
     out_cache = None
-    seq_idx_to_tag = {}
+    out_next_idx = [0]  # next index to write in the output file. list for the closure
+    num_seqs_written = [0]
     if output_file:
       assert output_file_format in {"txt", "py"}
       assert dataset.can_serialize_data(target_key)
       assert not os.path.exists(output_file)
       print("Will write outputs to: %s" % output_file, file=log.v2)
       output_file = open(output_file, "w")
-      out_cache = {}  # corpus-seq-idx -> str|list[(float,str)]
+      out_cache = {}  # out idx -> str|list[(float,str)]
+      if output_file_format == "py":
+        output_file.write("{\n")
     if not log.verbose[4]:
       print("Set log_verbosity to level 4 or higher to see seq info on stdout.", file=log.v2)
 
+    def write_output(out_idx, seq_tag, value):
+      """
+      Writes to the output file as soon as possible.
+      For the "py" format, the order does not matter, as it is a dict seq tag -> outputs.
+      For the "txt" format, we keep the outputs in out_cache until all previous seqs are written.
+
+      :param int out_idx: index in the output file (corpus seq idx)
+      :param str seq_tag:
+      :param str|list[(float,str)] value:
+      """
+      if output_file_format == "py":
+        output_file.write("%r: %r,\n" % (seq_tag, value))
+        num_seqs_written[0] += 1
+        return
+      assert out_idx not in out_cache and out_idx >= out_next_idx[0]
+      out_cache[out_idx] = value
+      while out_next_idx[0] in out_cache:
+        output_file.write("%s\n" % out_cache.pop(out_next_idx[0]))
+        out_next_idx[0] += 1
+        num_seqs_written[0] += 1
+      output_file.flush()
+
     def extra_fetches_callback(seq_idx, seq_tag, output, targets=None, beam_scores=None):
       """
       :param list[int] seq_idx: of length batch (without beam)
@@ -1864,16 +1994,20 @@ class Engine(object):
                 dataset.serialize_data(key=target_key, data=output[out_idx + b]),
                 file=log.v4)
         if out_cache is not None:
-          corpus_seq_idx = dataset.get_corpus_seq_idx(seq_idx[i])
-          assert corpus_seq_idx not in out_cache
-          seq_idx_to_tag[corpus_seq_idx] = seq_tag[i]
+          if seq_tag_to_out_idx is not None:
+            corpus_seq_idx = seq_tag_to_out_idx[seq_tag[i]]
+          elif output_file_format == "txt":
+            corpus_seq_idx = dataset.get_corpus_seq_idx(seq_idx[i])
+          else:
+            corpus_seq_idx = None  # not needed
           if out_beam_size is None:
-            out_cache[corpus_seq_idx] = dataset.serialize_data(key=target_key, data=output[out_idx])
+            value = dataset.serialize_data(key=target_key, data=output[out_idx])
           else:
             assert beam_scores is not None
-            out_cache[corpus_seq_idx] = [
-              (beam_scores[i][b], dataset.serialize_data(key=target_key, data=output[out_idx + b]))
+            value = [
+              (float(beam_scores[i][b]), dataset.serialize_data(key=target_key, data=output[out_idx + b]))
               for b in range(out_beam_size)]
+          write_output(out_idx=corpus_seq_idx, seq_tag=seq_tag[i], value=value)
 
     train = self._maybe_prepare_train_in_eval(targets_via_search=True)
     runner = Runner(
@@ -1892,19 +2026,10 @@ class Engine(object):
     print("Search done. Num steps %i, Final: score %s error %s" % (
       runner.num_steps, self.format_score(runner.score), self.format_score(runner.error)), file=log.v1)
     if output_file:
-      assert out_cache
-      assert 0 in out_cache
-      assert len(out_cache) - 1 in out_cache
-      if output_file_format == "txt":
-        for i in range(len(out_cache)):
-          output_file.write("%s\n" % out_cache[i])
-      elif output_file_format == "py":
-        output_file.write("{\n")
-        for i in range(len(out_cache)):
-          output_file.write("%r: %r,\n" % (seq_idx_to_tag[i], out_cache[i]))
+      assert num_seqs_written[0] > 0
+      assert not out_cache, "missing outputs for seqs %r" % sorted(out_cache.keys())[:10]
+      if output_file_format == "py":
         output_file.write("}\n")
-      else:
-        raise Exception("invalid output_file_format %r" % output_file_format)
       output_file.close()
 
   def search_single(self, dataset, seq_idx, output_layer_name=None):
@@ -19,6 +19,7 @@ kenlm_dir = returnn_dir + "/extern/kenlm"
 # https://github.com/tensorflow/tensorflow/blob/master/tensorflow/core/lib/strings/str_util.h
 _src_code = """
 #include <exception>
+#include <cstring>
 #include "tensorflow/core/framework/op.h"
 #include "tensorflow/core/framework/op_kernel.h"
 #include "tensorflow/core/framework/shape_inference.h"
@@ -88,6 +89,63 @@ REGISTER_OP("KenLmAbsScoreBpeStringsDense")
   " dense output, for all possible succeeding labels.");
 
 
+REGISTER_OP("KenLmScoreBpeStep")
+.Input("handle: resource")
+.Input("bpe_merge_symbol: string")
+.Input("states: uint8")
+.Input("partial_strings: string")
+.Input("new_strings: string")
+.Output("new_states: uint8")
+.Output("new_partial_strings: string")
+.Output("scores: float32")
+.SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
+  c->set_output(0, c->input(2));
+  c->set_output(1, c->input(3));
+  c->set_output(2, c->input(3));
+  return Status::OK();
+})
+.Doc("KenLmScoreBpeStep: incremental variant of KenLmAbsScoreBpeStrings."
+  " states (shape strings + [KENLM_TF_STATE_NUM_BYTES]) is the serialized KenLM state after all completed words,"
+  " together with their accumulated score."
+  " partial_strings is the remaining text of the incomplete last word."
+  " new_strings is appended. Only the newly completed words are scored."
+  " returns the new states, and the same absolute score as KenLmAbsScoreBpeStrings would return"
+  " for the whole text.");
+
+
+REGISTER_OP("KenLmScoreBpeStepDense")
+.Input("handle: resource")
+.Input("bpe_merge_symbol: string")
+.Input("states: uint8")
+.Input("partial_strings: string")
+.Input("new_strings: string")
+.Input("labels: string")
+.Output("new_states: uint8")
+.Output("new_partial_strings: string")
+.Output("scores: float32")
+.Output("dense_scores: float32")
+.SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
+  c->set_output(0, c->input(2));
+  c->set_output(1, c->input(3));
+  c->set_output(2, c->input(3));
+  ::tensorflow::shape_inference::ShapeHandle out_shape;
+  TF_RETURN_IF_ERROR(c->Concatenate(c->input(3), c->input(5), &out_shape));
+  c->set_output(3, out_shape);
+  return Status::OK();
+})
+.Doc("KenLmScoreBpeStepDense: incremental variant of KenLmAbsScoreBpeStringsDense, see KenLmScoreBpeStep.");
+
+
+// Serialized into the uint8 states tensor of KenLmScoreBpeStep, padded to KENLM_TF_STATE_NUM_BYTES.
+// All zeros is the initial state.
+struct KenLmHypState {
+  lm::ngram::State lm_state;  // after all completed words
+  float score;  // of all completed words, in +log10 space
+  int32 is_initialized;
+};
+static_assert(sizeof(KenLmHypState) <= KENLM_TF_STATE_NUM_BYTES, "KENLM_TF_STATE_NUM_BYTES too small");
+
+
 // https://github.com/kpu/kenlm/blob/master/lm/model.hh
 // https://github.com/kpu/kenlm/blob/master/lm/virtual_interface.hh
 // https://github.com/kpu/kenlm/blob/master/python/kenlm.pyx
@@ -151,6 +209,78 @@ struct KenLmModel : public ResourceBase {
     return total_score * logf(10.);
   }
 
+  // Incremental variant of abs_score/abs_score_dense. See KenLmScoreBpeStep.
+  // We go through the raw text (partial + new_text) just like StringReplace(text, bpe_merge_symbol + " ", "")
+  // and Split(text, ' ') would do it, and score all words which are followed by a space.
+  // partial will be set to the raw remaining text of the last incomplete word.
+  // Returns the BPE-merged incomplete last word. mu_ must be locked.
+  string score_step_completed_words(
+        const string& bpe_merge_symbol, KenLmHypState* state, string* partial, const string& new_text) {
+    if(!state->is_initialized) {
+      model_.BeginSentenceWrite(&state->lm_state);
+      state->score = 0;
+      state->is_initialized = 1;
+    }
+    const string text = *partial + new_text;
+    const string merge_pattern = bpe_merge_symbol.empty() ? string() : (bpe_merge_symbol + " ");
+    string word;
+    size_t word_start = 0;
+    size_t i = 0;
+    while(i < text.size()) {
+      if(!merge_pattern.empty() && text.compare(i, merge_pattern.size(), merge_pattern) == 0) {
+        i += merge_pattern.size();
+        continue;
+      }
+      if(text[i] == ' ') {
+        if(!word.empty()) {
+          lm::ngram::State out_state;
+          auto word_idx = model_.BaseVocabulary().Index(word);
+          state->score += model_.FullScore(state->lm_state, word_idx, out_state).prob;
+          state->lm_state = out_state;
+          word.clear();
+        }
+        ++i;
+        word_start = i;
+        continue;
+      }
+      word += text[i];
+      ++i;
+    }
+    *partial = text.substr(word_start);
+    return word;
+  }
+
+  float score_step(const string& bpe_merge_symbol, KenLmHypState* state, string* partial, const string& new_text) {
+    mutex_lock l(mu_);
+    string last_word = score_step_completed_words(bpe_merge_symbol, state, partial, new_text);
+    float total_score = state->score;
+    if(!last_word.empty()) {
+      lm::ngram::State out_state;
+      auto word_idx = model_.BaseVocabulary().Index(last_word);
+      total_score += model_.FullScore(state->lm_state, word_idx, out_state).prob;
+    }
+    return total_score * logf(10.);
+  }
+
+  float score_step_dense(
+        const string& bpe_merge_symbol, KenLmHypState* state, string* partial, const string& new_text,
+        const TTypes<string>::ConstFlat labels, float* out_dense_scores) {
+    mutex_lock l(mu_);
+    string last_word = score_step_completed_words(bpe_merge_symbol, state, partial, new_text);
+    float total_score = state->score;
+    lm::ngram::State out_state;
+    for(int i = 0; i < labels.size(); ++i) {
+      auto word_idx = model_.BaseVocabulary().Index(last_word + labels(i));
+      float score = model_.FullScore(state->lm_state, word_idx, out_state).prob;
+      out_dense_scores[i] = (total_score + score) * logf(10.);
+    }
+    if(!last_word.empty()) {
+      auto word_idx = model_.BaseVocabulary().Index(last_word + bpe_merge_symbol);
+      total_score += model_.FullScore(state->lm_state, word_idx, out_state).prob;
+    }
+    return total_score * logf(10.);
+  }
+
   string DebugString() override {
     return strings::StrCat("KenLmModel[", filename_, "]");
   }
@@ -320,6 +450,85 @@ class KenLmAbsScoreBpeStringsDenseOp : public OpKernel {
 
 REGISTER_KERNEL_BUILDER(Name("KenLmAbsScoreBpeStringsDense").Device(DEVICE_CPU), KenLmAbsScoreBpeStringsDenseOp);
 
+
+template<bool dense>
+class KenLmScoreBpeStepOp : public OpKernel {
+ public:
+  using OpKernel::OpKernel;
+
+  void Compute(OpKernelContext* context) override {
+    KenLmModel* lm;
+    {
+      const Tensor* handle;
+      OP_REQUIRES_OK(context, context->input("handle", &handle));
+      OP_REQUIRES_OK(context, GetResourceFromContext(context, "handle", &lm));
+    }
+    core::ScopedUnref unref(lm);
+
+    OP_REQUIRES(context, context->input(1).NumElements() == 1,
+      errors::InvalidArgument(
+        "bpe_merge_symbol must be a single element but got shape ",
+        context->input(1).shape().DebugString()));
+    const string& bpe_merge_symbol = context->input(1).flat<string>()(0);
+
+    const Tensor& states_tensor = context->input(2);
+    const Tensor& partial_tensor = context->input(3);
+    const Tensor& new_strings_tensor = context->input(4);
+    TensorShape expected_states_shape(partial_tensor.shape());
+    expected_states_shape.AddDim(KENLM_TF_STATE_NUM_BYTES);
+    OP_REQUIRES(context, states_tensor.shape() == expected_states_shape,
+      errors::InvalidArgument(
+        "states shape ", states_tensor.shape().DebugString(),
+        " does not match partial_strings shape ", partial_tensor.shape().DebugString()));
+    OP_REQUIRES(context, new_strings_tensor.shape() == partial_tensor.shape(),
+      errors::InvalidArgument(
+        "new_strings shape ", new_strings_tensor.shape().DebugString(),
+        " does not match partial_strings shape ", partial_tensor.shape().DebugString()));
+    auto states = states_tensor.flat_inner_dims<uint8>();
+    auto partial_flat = partial_tensor.flat<string>();
+    auto new_strings_flat = new_strings_tensor.flat<string>();
+
+    Tensor* out_states_tensor = NULL;
+    OP_REQUIRES_OK(context, context->allocate_output(0, states_tensor.shape(), &out_states_tensor));
+    auto out_states = out_states_tensor->flat_inner_dims<uint8>();
+    Tensor* out_partial_tensor = NULL;
+    OP_REQUIRES_OK(context, context->allocate_output(1, partial_tensor.shape(), &out_partial_tensor));
+    auto out_partial_flat = out_partial_tensor->flat<string>();
+    Tensor* out_scores_tensor = NULL;
+    OP_REQUIRES_OK(context, context->allocate_output(2, partial_tensor.shape(), &out_scores_tensor));
+    auto out_scores_flat = out_scores_tensor->flat<float>();
+
+    const Tensor* labels_tensor = NULL;
+    float* out_dense_scores = NULL;
+    if(dense) {
+      labels_tensor = &context->input(5);
+      Tensor* out_dense_tensor = NULL;
+      TensorShape out_dense_shape(partial_tensor.shape());
+      out_dense_shape.AppendShape(labels_tensor->shape());
+      OP_REQUIRES_OK(context, context->allocate_output(3, out_dense_shape, &out_dense_tensor));
+      out_dense_scores = out_dense_tensor->flat<float>().data();
+    }
+
+    for(int i = 0; i < partial_flat.size(); ++i) {
+      KenLmHypState state;
+      std::memcpy(&state, &states(i, 0), sizeof(KenLmHypState));
+      string partial = partial_flat(i);
+      if(dense)
+        out_scores_flat(i) = lm->score_step_dense(
+          bpe_merge_symbol, &state, &partial, new_strings_flat(i),
+          labels_tensor->flat<string>(), out_dense_scores + i * labels_tensor->NumElements());
+      else
+        out_scores_flat(i) = lm->score_step(bpe_merge_symbol, &state, &partial, new_strings_flat(i));
+      std::memset(&out_states(i, 0), 0, KENLM_TF_STATE_NUM_BYTES);
+      std::memcpy(&out_states(i, 0), &state, sizeof(KenLmHypState));
+      out_partial_flat(i) = partial;
+    }
+  }
+};
+
+REGISTER_KERNEL_BUILDER(Name("KenLmScoreBpeStep").Device(DEVICE_CPU), KenLmScoreBpeStepOp<false>);
+REGISTER_KERNEL_BUILDER(Name("KenLmScoreBpeStepDense").Device(DEVICE_CPU), KenLmScoreBpeStepOp<true>);
+
 """
 
 _kenlm_src_code_workarounds = """
@@ -331,6 +540,11 @@ _kenlm_src_code_workarounds = """
 """
 
 
+# Size of the serialized KenLM state per hypothesis, see KenLmScoreBpeStep.
+# This must be big enough for lm::ngram::State, which depends on KENLM_MAX_ORDER.
+ken_lm_max_order = 6
+ken_lm_state_num_bytes = 64
+
 _tf_mod = None
 
 
@@ -373,9 +587,11 @@ def get_tf_mod(verbose=False):
   src_code += _src_code
 
   compiler = OpCodeCompiler(
-    base_name="KenLM", code_version=1, code=src_code,
+    base_name="KenLM", code_version=2, code=src_code,
     include_paths=(kenlm_dir, kenlm_dir + "/util/double-conversion"),
-    c_macro_defines={"NDEBUG": 1, "KENLM_MAX_ORDER": 6, "HAVE_ZLIB": 1},
+    c_macro_defines={
+      "NDEBUG": 1, "KENLM_MAX_ORDER": ken_lm_max_order, "HAVE_ZLIB": 1,
+      "KENLM_TF_STATE_NUM_BYTES": ken_lm_state_num_bytes},
     ld_flags=["-l%s" % lib for lib in libs],
     is_cpp=True, use_cuda_if_available=False,
     verbose=verbose)
@@ -429,6 +645,57 @@ def ken_lm_abs_score_bpe_strings_dense(handle, bpe_merge_symbol, strings, labels
     handle=handle, bpe_merge_symbol=bpe_merge_symbol, strings=strings, labels=labels)
 
 
+def ken_lm_initial_states(shape):
+  """
+  :param list[int|tf.Tensor]|tf.Tensor shape: e.g. (batch,)
+  :return: initial states for :func:`ken_lm_score_bpe_step`, shape + [ken_lm_state_num_bytes], uint8
+  :rtype: tf.Tensor
+  """
+  if isinstance(shape, tf.Tensor):
+    shape = tf.concat([shape, [ken_lm_state_num_bytes]], axis=0)
+  else:
+    shape = list(shape) + [ken_lm_state_num_bytes]
+  return tf.zeros(shape, dtype=tf.uint8)
+
+
+def ken_lm_score_bpe_step(handle, bpe_merge_symbol, states, partial_strings, new_strings):
+  """
+  Incremental variant of :func:`ken_lm_abs_score_bpe_strings`.
+  Each step only scores the newly completed words, i.e. this is O(1) per step, not O(step).
+  The states are just a tensor, so you can reorder them (e.g. by beam indices) via tf.gather or so.
+
+  :param tf.Tensor handle: TF resource handle returned by :func:`ken_lm_load`
+  :param str bpe_merge_symbol: e.g. "@@"
+  :param tf.Tensor states: shape partial_strings + [ken_lm_state_num_bytes], uint8. see :func:`ken_lm_initial_states`
+  :param tf.Tensor partial_strings: the remaining text of the incomplete last word, initially empty
+  :param tf.Tensor new_strings: same shape as `partial_strings`, appended to the text
+  :return: (new_states, new_partial_strings, abs_scores).
+    abs_scores is the same as :func:`ken_lm_abs_score_bpe_strings` would return for the whole text
+  :rtype: (tf.Tensor, tf.Tensor, tf.Tensor)
+  """
+  return get_tf_mod().ken_lm_score_bpe_step(
+    handle=handle, bpe_merge_symbol=bpe_merge_symbol,
+    states=states, partial_strings=partial_strings, new_strings=new_strings)
+
+
+def ken_lm_score_bpe_step_dense(handle, bpe_merge_symbol, states, partial_strings, new_strings, labels):
+  """
+  Incremental variant of :func:`ken_lm_abs_score_bpe_strings_dense`. See :func:`ken_lm_score_bpe_step`.
+
+  :param tf.Tensor handle: TF resource handle returned by :func:`ken_lm_load`
+  :param str bpe_merge_symbol: e.g. "@@"
+  :param tf.Tensor states: shape partial_strings + [ken_lm_state_num_bytes], uint8
+  :param tf.Tensor partial_strings: the remaining text of the incomplete last word, initially empty
+  :param tf.Tensor new_strings: same shape as `partial_strings`, appended to the text
+  :param tf.Tensor|tf.Variable labels:
+  :return: (new_states, new_partial_strings, abs_scores, abs_scores_dense)
+  :rtype: (tf.Tensor, tf.Tensor, tf.Tensor, tf.Tensor)
+  """
+  return get_tf_mod().ken_lm_score_bpe_step_dense(
+    handle=handle, bpe_merge_symbol=bpe_merge_symbol,
+    states=states, partial_strings=partial_strings, new_strings=new_strings, labels=labels)
+
+
 if __name__ == "__main__":
   import better_exchook
   better_exchook.install()
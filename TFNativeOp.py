@@ -289,6 +289,8 @@ class OpMaker(object):
     #include "tensorflow/core/framework/shape_inference.h"
     #include "tensorflow/core/framework/op_kernel.h"
     #include "tensorflow/core/common_runtime/device.h"
+    #include "tensorflow/core/util/work_sharder.h"
+    #include <functional>
     """
     if self.with_cuda:
       # http://docs.nvidia.com/cuda/cublas
@@ -359,6 +361,7 @@ class OpMaker(object):
         #undef Ndarray_memset
         #undef Ndarray_sgemm
         #undef DEF_KERNEL
+        #undef DEF_DEV_FUNC
         #undef start_dev_kernel
         #undef assert_cmp
         #undef threadIdx
@@ -864,17 +867,19 @@ def fast_baum_welch_staircase(am_scores, seq_lens, **opts):
     am_scores=am_scores, edges=edges, weights=weights, start_end_states=start_end_states, float_idx=float_idx)
 
 
-def _debug_dumped_fast_baum_welch(prefix, postfix=".dump"):
+def _debug_dumped_fast_baum_welch(prefix, postfix=".dump", device=None):
   """
   If you uncomment the debug_print statements in FastBaumWelchOp, as well as dump_to_file inside debug_print,
   you will get some dump files in the current directory. These can be loaded here and evald again.
+  E.g. dumps from a GPU run can be evald with device "/cpu:0" to compare the CPU and the GPU implementation.
 
   :param str prefix: filename prefix, e.g. "ff_out_bw__FastBaumWelchOp_"
   :param str postfix: filename postfix
+  :param str|None device: e.g. "/cpu:0" or "/gpu:0". by default, the TF default placement
   :return: output from fast_baum_welch(), evald
   :rtype: (numpy.ndarray. numpy.ndarray)
   """
-  with tf.Graph().as_default() as graph:
+  with tf.Graph().as_default() as graph, tf.device(device):
     with tf.Session(graph=graph) as session:
       arg_names = {
         "am_scores": None, "edges": None, "weights": None, "start_end_states": None, "float_idx": "index",
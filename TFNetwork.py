@@ -1944,3 +1944,241 @@ def set_custom_post_init(var, func):
   # This custom attribute is a big ugly but simple.
   # It's read in TFNetwork.initialize_params().
   var.custom_post_init = func
+
+
+class NetworkGraphCache(object):
+  """
+  Caches the constructed TF graph of a network for inference (search/forward),
+  i.e. the meta graph (graph def + saver def) and the information about the layer outputs and extern data.
+  On the next run with the same network and config, we import the graph directly,
+  and skip the construction of the network (see :func:`TFNetwork.construct_from_dict`).
+  The resulting network only has :class:`InternalLayer` instances with the outputs of the original layers,
+  and there are no losses, i.e. this can only be used without eval.
+  The engine thus only uses it when the job does not need eval (e.g. search with ``search_do_eval = False``).
+  The params are loaded via the imported saver, as usual via :func:`TFNetwork.load_params_from_file`.
+
+  See the config option ``network_graph_cache_dir`` in :class:`TFEngine.Engine`.
+  """
+
+  Version = 1
+
+  def __init__(self, cache_dir, config, net_dict, search_flag, eval_flag):
+    """
+    :param str cache_dir:
+    :param Config.Config config:
+    :param dict[str,dict[str]] net_dict:
+    :param bool search_flag:
+    :param bool eval_flag: as used for the construction of the network
+    """
+    import os
+    self.cache_dir = cache_dir
+    self.config = config
+    self.search_flag = search_flag
+    self.eval_flag = eval_flag
+    self.key = self._get_key(config=config, net_dict=net_dict, search_flag=search_flag, eval_flag=eval_flag)
+    self.filename_prefix = os.path.join(cache_dir, "net-graph-%s" % self.key)
+
+  # Config options which have an influence on the graph construction (besides the net dict).
+  ConfigKeys = [
+    "extern_data", "num_outputs", "num_inputs", "target",
+    "device", "tf_session_opts",
+    "optimize_move_layers_out", "param_storage_quantization", "calculate_exp_loss",
+    "debug_print_layer_output_template", "debug_print_layer_output_shape", "debug_add_check_numerics_on_output"]
+
+  @classmethod
+  def _sorted_repr(cls, obj, _visited=None):
+    """
+    :param obj: e.g. the net dict
+    :param set[int]|None _visited: ids of the objects on the current path, to avoid endless recursion
+    :return: deterministic repr, e.g. sorted dicts, functions via their code, and no memory addresses
+    :rtype: str
+    """
+    import types
+    import numpy
+    if isinstance(obj, (bool, int, float, str, bytes, type(None))):
+      return repr(obj)
+    if _visited is None:
+      _visited = set()
+    if id(obj) in _visited:
+      return "<recursion %s>" % type(obj).__name__
+    _visited = _visited | {id(obj)}
+
+    def r(v):
+      """
+      :rtype: str
+      """
+      return cls._sorted_repr(v, _visited=_visited)
+
+    if isinstance(obj, dict):
+      items = sorted(obj.items(), key=lambda item: repr(item[0]))
+      return "{%s}" % ", ".join(["%s: %s" % (r(k), r(v)) for (k, v) in items])
+    if isinstance(obj, (set, frozenset)):
+      return "%s(%s)" % (type(obj).__name__, ", ".join(sorted([r(v) for v in obj])))
+    if isinstance(obj, (list, tuple)):
+      return "%s(%s)" % (type(obj).__name__, ", ".join([r(v) for v in obj]))
+    if isinstance(obj, types.FunctionType):
+      # The name is not enough: lambdas all have the same name, and the function body might have changed.
+      closure = [c.cell_contents for c in obj.__closure__ or ()]
+      return "<function %s.%s %s defaults=%s closure=%s>" % (
+        obj.__module__, obj.__name__, r(obj.__code__), r(obj.__defaults__), r(closure))
+    if isinstance(obj, types.MethodType):
+      return "<method %s self=%s>" % (r(obj.__func__), r(obj.__self__))
+    if isinstance(obj, (types.BuiltinFunctionType, type)):
+      return "<%s.%s>" % (getattr(obj, "__module__", None), obj.__name__)
+    if isinstance(obj, types.CodeType):
+      import hashlib
+      return "<code %s %s consts=%s names=%s>" % (
+        obj.co_name, hashlib.md5(obj.co_code).hexdigest(), r(obj.co_consts), r(obj.co_names))
+    if isinstance(obj, numpy.ndarray):
+      import hashlib
+      return "<ndarray %s %s %s>" % (
+        obj.dtype, obj.shape, hashlib.md5(numpy.ascontiguousarray(obj).tobytes()).hexdigest())
+    if obj.__class__.__module__ not in ["builtins", "__builtin__"] and hasattr(obj, "__dict__"):
+      # E.g. some custom object. The default repr would contain the memory address.
+      return "<%s.%s %s>" % (obj.__class__.__module__, obj.__class__.__name__, r(vars(obj)))
+    return repr(obj)
+
+  @classmethod
+  def _get_key(cls, config, net_dict, search_flag, eval_flag):
+    """
+    :param Config.Config config:
+    :param dict[str,dict[str]] net_dict:
+    :param bool search_flag:
+    :param bool eval_flag:
+    :return: hash of everything which has an influence on the graph
+    :rtype: str
+    """
+    import hashlib
+    from Util import describe_crnn_version, describe_tensorflow_version
+    s = cls._sorted_repr([
+      cls.Version, net_dict, search_flag, eval_flag,
+      {key: config.typed_value(key, None) for key in cls.ConfigKeys},
+      describe_crnn_version(), describe_tensorflow_version()])
+    return hashlib.md5(s.encode("utf8")).hexdigest()
+
+  @classmethod
+  def _data_to_dict(cls, data):
+    """
+    :param Data data:
+    :rtype: dict[str]
+    """
+    return {
+      "kwargs": data.get_kwargs(),
+      "placeholder": data.placeholder.name if data.placeholder is not None else None,
+      "size_placeholder": {i: v.name for (i, v) in (data.size_placeholder or {}).items()}}
+
+  @classmethod
+  def _data_from_dict(cls, d, graph):
+    """
+    :param dict[str] d: via _data_to_dict
+    :param tf.Graph graph:
+    :rtype: Data
+    """
+    return Data(
+      placeholder=graph.get_tensor_by_name(d["placeholder"]) if d["placeholder"] else None,
+      size_placeholder={i: graph.get_tensor_by_name(v) for (i, v) in d["size_placeholder"].items()},
+      **d["kwargs"])
+
+  def save(self, network):
+    """
+    :param TFNetwork network: constructed via :func:`TFNetwork.construct_from_dict`
+    """
+    import os
+    import pickle
+    import tempfile
+    from TFUtil import OpCodeCompiler
+    assert network.train_flag is False and network.search_flag == self.search_flag
+    assert network.eval_flag == self.eval_flag
+    # Make sure that these exist in the graph. They are used e.g. in TFEngine.search.
+    network.get_extern_data("seq_idx", mark_data_key_as_used=False)
+    network.get_extern_data("seq_tag", mark_data_key_as_used=False)
+    if not network.saver:
+      network._create_saver()
+    layers = {}
+    for name, layer in network.layers.items():
+      if layer.output.placeholder is None:
+        continue
+      search_choices = layer.get_search_choices() if network.search_flag else None
+      layers[name] = {
+        "output": self._data_to_dict(layer.output),
+        "target": layer.target,
+        "is_output_layer": layer.is_output_layer(),
+        "search_choices": {
+          "beam_size": search_choices.beam_size,
+          "is_decided": search_choices.is_decided,
+          "beam_scores": search_choices.beam_scores.name if search_choices.beam_scores is not None else None,
+        } if search_choices else None}
+    info = {
+      "extern_data": {key: self._data_to_dict(data) for (key, data) in network.extern_data.data.items()},
+      "default_input": network.extern_data.default_input,
+      "default_target": network.extern_data.default_target,
+      "used_data_keys": sorted(network.used_data_keys),
+      "recurrent": network.recurrent,
+      "layers": layers,
+      "global_train_step": network.global_train_step.name,
+      "op_libs": list(OpCodeCompiler.LoadedLibFilenames)}
+    if not os.path.exists(self.cache_dir):
+      os.makedirs(self.cache_dir)
+    # Write to temp files first and rename, such that concurrent jobs never see incomplete files.
+    for ext, write_func in [
+          (".meta", lambda filename: network.saver.export_meta_graph(filename)),
+          (".info.pkl", lambda filename: pickle.dump(info, open(filename, "wb"), protocol=2))]:
+      fd, tmp_filename = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-", suffix=ext)
+      os.close(fd)
+      write_func(tmp_filename)
+      os.rename(tmp_filename, self.filename_prefix + ext)
+    print("Stored network graph in cache: %s" % self.filename_prefix, file=log.v3)
+
+  def load(self, session, name="root"):
+    """
+    Imports the cached graph into the current graph (which is expected to be empty).
+
+    :param tf.Session session: the imported variables will be initialized in here
+    :param str name: for the TFNetwork
+    :return: network, or None if not cached
+    :rtype: TFNetwork|None
+    """
+    import os
+    import pickle
+    from TFNetworkLayer import InternalLayer, SearchChoices
+    if not os.path.exists(self.filename_prefix + ".info.pkl") or not os.path.exists(self.filename_prefix + ".meta"):
+      return None
+    info = pickle.load(open(self.filename_prefix + ".info.pkl", "rb"))
+    for op_lib in info["op_libs"]:
+      if not os.path.exists(op_lib):
+        print("Network graph cache: op lib %r does not exist anymore, ignore cache." % op_lib, file=log.v3)
+        return None
+    for op_lib in info["op_libs"]:
+      tf.load_op_library(op_lib)
+    print("Load network graph from cache: %s" % self.filename_prefix, file=log.v3)
+    graph = tf.get_default_graph()
+    saver = tf.train.import_meta_graph(self.filename_prefix + ".meta")
+    extern_data = ExternData(default_input=info["default_input"], default_target=info["default_target"])
+    for key, d in info["extern_data"].items():
+      extern_data.data[key] = self._data_from_dict(d, graph=graph)
+    global_train_step = [v for v in tf.global_variables() if v.name == info["global_train_step"]]
+    assert len(global_train_step) == 1, "%r not found in %r" % (info["global_train_step"], tf.global_variables())
+    # This will create a new global step var, which we replace by the imported one.
+    network = TFNetwork(
+      name=name, config=self.config, extern_data=extern_data,
+      train_flag=False, eval_flag=False, search_flag=self.search_flag)
+    for key in [tf.GraphKeys.GLOBAL_VARIABLES, tf.GraphKeys.GLOBAL_STEP]:
+      tf.get_collection_ref(key).remove(network.global_train_step)
+    network.global_train_step = global_train_step[0]
+    network.used_data_keys = set(info["used_data_keys"])
+    network.recurrent = info["recurrent"]
+    network.saver = saver
+    for layer_name, d in sorted(info["layers"].items()):
+      layer = InternalLayer(
+        name=layer_name, network=network, output=self._data_from_dict(d["output"], graph=graph),
+        target=d["target"], is_output_layer=d["is_output_layer"])
+      if d["search_choices"]:
+        layer.search_choices = SearchChoices(
+          owner=layer, beam_size=d["search_choices"]["beam_size"], is_decided=d["search_choices"]["is_decided"])
+        if d["search_choices"]["beam_scores"]:
+          layer.search_choices.beam_scores = graph.get_tensor_by_name(d["search_choices"]["beam_scores"])
+      network.layers[layer_name] = layer
+    # The post control dependencies (tf.GraphKeys.UPDATE_OPS) are part of the imported meta graph.
+    # Initialize all (imported) variables. The params will be loaded via the saver afterwards.
+    session.run(tf.variables_initializer(tf.global_variables()))
+    return network
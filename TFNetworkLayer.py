@@ -43,6 +43,7 @@ class LayerBase(object):
 
   layer_class = None  # type: str|None  # for get_layer_class()
   recurrent = False  # if the order in the time-dimension is relevant
+  supports_param_storage_quantization = False  # see param_storage_quantization
 
   def __init__(self, name, network, output=None, n_out=None, out_type=None, sources=(),
                target=None, loss=None, loss_scale=1.0, size_target=None,
@@ -56,7 +57,8 @@ class LayerBase(object):
                rec_previous_layer=None,
                trainable=True,
                custom_param_importer=None,
-               register_as_extern_data=None):
+               register_as_extern_data=None,
+               param_storage_quantization=None):
     """
     Usually the arguments, when specified in the network dict,
     are going through :func:`transform_config_dict`, before they are passed to here.
@@ -90,6 +92,16 @@ class LayerBase(object):
     :param bool trainable: whether the parameters of this layer will be trained
     :param str|callable|None custom_param_importer: used by :func:`set_param_values_by_dict`
     :param str|None register_as_extern_data:
+    :param str|bool|None param_storage_quantization: e.g. "int8", or False to disable.
+      only used in inference (train_flag is False).
+      the weight matrices are quantized to int8 with a scale per output channel
+      (see :func:`TFUtil.quantize_weights_int8`) when the params are loaded,
+      and the dequantized float32 weights are cached in another variable, i.e. there is no dequantization per run.
+      the matmuls run in float32, i.e. this does not speed up the computation,
+      and it does not reduce the resident param memory (int8 + float32 copy).
+      it simulates the effect of int8 weights on the model outputs (see tools/calibrate_param_storage_quantization.py).
+      the checkpoint stays the same (float32).
+      if not given, the global config option "param_storage_quantization" is used for all layers which support it.
     """
     self.name = name
     self.network = network
@@ -141,6 +153,7 @@ class LayerBase(object):
     self.trainable = trainable
     self.custom_param_importer = custom_param_importer
     self.register_as_extern_data = register_as_extern_data
+    self.param_storage_quantization = self._get_param_storage_quantization(param_storage_quantization)
     # Stats will be collected by the engine.
     self.stats = {}  # type: dict[str,tf.Tensor]
 
@@ -514,6 +527,9 @@ class LayerBase(object):
     # e.g. see ReuseParams.LazyLayerResolver.
     kwargs = kwargs.copy()
     kwargs.setdefault("reuse", getattr(tf, "AUTO_REUSE", None))
+    if self.param_storage_quantization:
+      assert "custom_getter" not in kwargs
+      kwargs["custom_getter"] = self._param_storage_quantization_custom_getter
     with var_creation_scope() as dep:
       if self.reuse_params:
         with reuse_name_scope(self.reuse_params.get_variable_scope(base_layer=self, **kwargs)) as scope:
@@ -522,6 +538,65 @@ class LayerBase(object):
         with reuse_name_scope(tf.get_variable_scope(), **kwargs) as scope:
           yield scope
 
+  def _get_param_storage_quantization(self, param_storage_quantization):
+    """
+    :param str|bool|None param_storage_quantization: from the layer opts
+    :return: param_storage_quantization which is used for this layer, or None
+    :rtype: str|None
+    """
+    if param_storage_quantization is False:
+      return None
+    if param_storage_quantization is None:
+      if not self.supports_param_storage_quantization or self.reuse_params:
+        return None
+      param_storage_quantization = self.network.get_config().value("param_storage_quantization", None)
+      if not param_storage_quantization:
+        return None
+    assert self.supports_param_storage_quantization, "%s: param_storage_quantization not supported" % self
+    assert not self.reuse_params, "%s: param_storage_quantization not supported with reuse_params" % self
+    assert param_storage_quantization in ["int8"], "%s: param_storage_quantization %r not supported" % (
+      self, param_storage_quantization)
+    if self.network.train_flag is not False:
+      return None  # only in inference
+    return param_storage_quantization
+
+  def _param_storage_quantization_custom_getter(self, getter, name, shape=None, dtype=None, *args, **kwargs):
+    """
+    Custom getter for :func:`tf.get_variable`, used via :func:`var_creation_scope` if param_storage_quantization is set.
+    Weight matrices (float32, 2D) will be created as int8 variable with a scale variable,
+    and we return a float32 variable with the dequantized weights, which is used by the layer as usual.
+    All three variables are set once when the params are loaded (see :class:`TFUtil.Int8WeightsSaveable`).
+    All other variables (e.g. biases) are kept as-is.
+
+    :param (...)->tf.Variable getter:
+    :param str name:
+    :param tuple[int]|None shape:
+    :param tf.DType|None dtype:
+    :rtype: tf.Variable
+    """
+    from TFUtil import Int8WeightsSaveable
+    if shape is None or len(shape) != 2 or tf.as_dtype(dtype or tf.float32) != tf.float32:
+      return getter(name, shape=shape, dtype=dtype, *args, **kwargs)
+    assert self.param_storage_quantization == "int8"
+    for key in ["initializer", "trainable", "dtype", "regularizer", "constraint"]:
+      kwargs.pop(key, None)
+    # The values will be set when the params are loaded (the checkpoint has float32). See Int8WeightsSaveable.
+    quantized = getter(
+      name, shape=shape, dtype=tf.int8, initializer=tf.zeros_initializer(), trainable=False, *args, **kwargs)
+    scale = getter(
+      name + "_int8_scale", shape=shape[-1:], dtype=tf.float32, initializer=tf.ones_initializer(), trainable=False,
+      *args, **kwargs)
+    dequantized = getter(
+      name + "_int8_dequantized", shape=shape, dtype=tf.float32, initializer=tf.zeros_initializer(), trainable=False,
+      *args, **kwargs)
+    self.add_param(quantized)
+    self.add_param(scale, saveable=False)
+    self.add_param(dequantized, saveable=False)
+    if quantized not in self.saveable_param_replace:
+      self.saveable_param_replace[quantized] = Int8WeightsSaveable(
+        quantized=quantized, scale=scale, dequantized=dequantized, name=quantized.op.name)
+    return dequantized
+
   def add_param(self, param, custom_update=None, trainable=None, saveable=None, axes_split_info=None):
     """
     :param tf.Variable|tf.Tensor param:
@@ -1881,6 +1956,7 @@ class LinearLayer(_ConcatInputLayer):
   See also :class:`DotLayer`, :class:`ElemwiseProdLayer`, :class:`WeightedSumLayer`.
   """
   layer_class = "linear"
+  supports_param_storage_quantization = True
 
   def __init__(self, activation, with_bias=True, grad_filter=None,
                forward_weights_init="glorot_uniform", bias_init=0.0,
@@ -1922,6 +1998,9 @@ class LinearLayer(_ConcatInputLayer):
       else:
         assert not bias_init
         b = None
+    # The tensors as used below (e.g. dequantized with param_storage_quantization). Also used by ChoiceLayer.
+    self.linear_weights = W  # (n_in, n_out)
+    self.linear_bias = b  # (n_out,) or None
 
     with tf.name_scope("linear"):
       from TFUtil import dot, to_int32_64
@@ -66,6 +66,7 @@ class RecLayer(_ConcatInputLayer):
 
   layer_class = "rec"
   recurrent = True
+  supports_param_storage_quantization = True
   _default_lstm_unit = "nativelstm"  # TFNativeOp.NativeLstmCell
 
   def __init__(self,
@@ -77,6 +78,7 @@ class RecLayer(_ConcatInputLayer):
                optimize_move_layers_out=None,
                cheating=False,
                unroll=False,
+               search_early_finish=False,
                **kwargs):
     """
     :param str|dict[str,dict[str]] unit: the RNNCell/etc name, e.g. "nativelstm". see comment below.
@@ -93,6 +95,9 @@ class RecLayer(_ConcatInputLayer):
     :param bool|None optimize_move_layers_out: will automatically move layers out of the loop when possible
     :param bool cheating: make targets available, and determine length by them
     :param bool unroll: if possible, unroll the loop (implementation detail)
+    :param bool search_early_finish: in search, with an 'end' layer: mark a batch entry as ended
+      as soon as its best ended hypothesis cannot be beaten anymore by any continuation of the other hypotheses.
+      With length normalization, this needs max_seq_len. See :func:`_SubnetworkRecCell._search_early_finish`.
     """
     super(RecLayer, self).__init__(**kwargs)
     import re
@@ -116,6 +121,10 @@ class RecLayer(_ConcatInputLayer):
     self._optimize_move_layers_out = optimize_move_layers_out
     self._cheating = cheating
     self._unroll = unroll
+    self._search_early_finish = search_early_finish
+    if not isinstance(unit, str):
+      # For a subnetwork, the layers inside the subnetwork handle param_storage_quantization themselves.
+      self.param_storage_quantization = None
     # On the random initialization:
     # For many cells, e.g. NativeLSTM: there will be a single recurrent weight matrix, (output.dim, output.dim * 4),
     # and a single input weight matrix (input_data.dim, output.dim * 4), and a single bias (output.dim * 4,).
@@ -208,6 +217,8 @@ class RecLayer(_ConcatInputLayer):
       if not p.name.startswith(scope_name_prefix):
         continue
       assert p.name.startswith(scope_name_prefix) and p.name.endswith(":0")
+      if p in self.params.values():  # e.g. already added via param_storage_quantization
+        continue
       self.params[p.name[len(scope_name_prefix):-2]] = p
 
   def get_dep_layers(self):
@@ -1510,7 +1521,11 @@ class _SubnetworkRecCell(object):
               end_flag,
               constant_with_shape(0, shape=tf.shape(end_flag)),
               constant_with_shape(1, shape=tf.shape(end_flag)))  # (batch * beam,)
-            seq_len_info = (end_flag, dyn_seq_len)
+          if rec_layer._search_early_finish:
+            end_flag = self._search_early_finish(
+              i=i, end_flag=end_flag, search_choices=choices,
+              max_seq_len=max_seq_len if max_seq_len is not None else rec_layer._max_seq_len)
+          seq_len_info = (end_flag, dyn_seq_len)
         assert len(acc_tas) == len(outputs_to_accumulate)
         acc_tas = [
           acc_ta.write(i, out.get(), name="%s_acc_ta_write" % out.name)
@@ -1971,6 +1986,43 @@ class _SubnetworkRecCell(object):
       for layer_name in self.input_layers_moved_out:
         get_layer(layer_name)
 
+  @classmethod
+  def _search_early_finish(cls, i, end_flag, search_choices, max_seq_len):
+    """
+    Marks all hypotheses of a batch entry as ended if the best ended hypothesis cannot be beaten anymore.
+    Log-probabilities are <= 0, thus the score of any continuation of a hypothesis can only get lower.
+    With length normalization (see :class:`ChoiceLayer`), the normalized score of a continuation
+    can at most be score/max_seq_len.
+    The ended hypotheses have the scores scaled such that score/(i+1) is their normalized score.
+    The remaining loop frames then do not change the hypotheses of this batch entry anymore,
+    and the loop can stop as soon as all batch entries are finished.
+
+    :param tf.Tensor i: loop counter, scalar
+    :param tf.Tensor end_flag: (batch * beam,), bool
+    :param SearchChoices search_choices: of the 'end' layer
+    :param int|tf.Tensor|None max_seq_len:
+    :return: new end_flag, (batch * beam,)
+    :rtype: tf.Tensor
+    """
+    length_normalization = (
+      isinstance(search_choices.owner, ChoiceLayer) and search_choices.owner.length_normalization)
+    with tf.name_scope("search_early_finish"):
+      scores = search_choices.beam_scores  # (batch, beam)
+      end_flags = tf.reshape(end_flag, tf.shape(scores))  # (batch, beam)
+      if length_normalization:
+        assert max_seq_len is not None, "%r: search_early_finish with length normalization needs max_seq_len" % (
+          search_choices.owner)
+        # Compare in the frame of score/(i+1): any continuation has normalized score <= score/max_seq_len.
+        active_scores_bound = scores * (tf.to_float(i + 1) / tf.to_float(max_seq_len))
+      else:
+        active_scores_bound = scores
+      neg_inf = tf.fill(tf.shape(scores), float("-inf"))
+      best_ended = tf.reduce_max(tf.where(end_flags, scores, neg_inf), axis=1)  # (batch,)
+      best_active_bound = tf.reduce_max(tf.where(end_flags, neg_inf, active_scores_bound), axis=1)  # (batch,)
+      batch_finished = tf.greater_equal(best_ended, best_active_bound)  # (batch,)
+      batch_finished = tf.tile(tf.expand_dims(batch_finished, axis=1), [1, tf.shape(scores)[1]])  # (batch, beam)
+      return tf.logical_or(end_flag, tf.reshape(batch_finished, tf.shape(end_flag)))
+
   def _construct_output_layers_moved_out(self, loop_accumulated, seq_len, extra_output_layers):
     """
     See self._move_outside_loop().
@@ -2766,6 +2818,8 @@ class ChoiceLayer(LayerBase):
   def __init__(self, beam_size, input_type="prob", explicit_search_source=None, length_normalization=True,
                scheduled_sampling=False,
                cheating=False,
+               shortlist=None, shortlist_fallback_mass=None,
+               two_stage_top_k=False,
                **kwargs):
     """
     :param int beam_size: the outgoing beam size. i.e. our output will be (batch * beam_size, ...)
@@ -2775,10 +2829,25 @@ class ChoiceLayer(LayerBase):
     :param dict|None scheduled_sampling:
     :param bool length_normalization: evaluates score_t/len in search
     :param bool cheating: if True, will always add the true target in the beam
+    :param LayerBase|None shortlist: only in search. candidate labels per sentence, shape (batch, K), int32,
+      e.g. via some source-conditioned lexical table. The search will only consider these labels (and label 0).
+      Duplicate labels are ignored.
+      If the source is a softmax layer (LinearLayer with softmax activation on dense input),
+      only the rows of the shortlist are computed of its output projection,
+      and the scores are normalized over the shortlist (i.e. they are not the same as in the full search).
+      Then the full projection is not needed anymore, as long as nothing else uses the softmax output.
+    :param float|None shortlist_fallback_mass: if the probability mass of the shortlist of any hypothesis
+      is below this value, we use the full vocabulary in this frame.
+      This needs the normalization over the full vocabulary, i.e. the full output projection in every frame.
+    :param bool two_stage_top_k: in search, first select the top-k labels of each incoming hypothesis,
+      and then the top-k over all (beam_in * k). This gives the same result as the top-k over (beam_in * dim),
+      but it avoids the top-k over the huge flattened row, which is faster for large beams and vocabularies.
     """
     super(ChoiceLayer, self).__init__(**kwargs)
     from Util import CollectionReadCheckCovered
     self.explicit_search_source = explicit_search_source
+    self.shortlist = shortlist
+    self.length_normalization = length_normalization
     self.scheduled_sampling = CollectionReadCheckCovered.from_bool_or_dict(scheduled_sampling)
     # We assume log-softmax here, inside the rec layer.
     assert self.target
@@ -2835,64 +2904,176 @@ class ChoiceLayer(LayerBase):
               tf.ones(tf.shape(end_flags)) * (tf.to_float(t + 1) / tf.to_float(t)),
               tf.ones(tf.shape(end_flags)))
         scores_base = tf.expand_dims(scores_base, axis=-1)  # (batch, beam_in, dim)
-        scores_in = self.sources[0].output.placeholder  # (batch * beam_in, dim)
-        # We present the scores in +log space, and we will add them up along the path.
-        if input_type == "prob":
-          if self.sources[0].output_before_activation:
-            scores_in = self.sources[0].output_before_activation.get_log_output()
+        from TFUtil import filter_ended_scores, nd_indices, safe_log
+
+        def get_scores_in(shortlist_labels=None, shortlist_dup_mask=None):
+          """
+          :param tf.Tensor|None shortlist_labels: (batch, K), int32, label 0 at position 0, see get_shortlist_labels
+          :param tf.Tensor|None shortlist_dup_mask: (batch, K), bool, True for duplicates in shortlist_labels
+          :return: scores in +log space, (batch * beam_in, dim), or (batch * beam_in, K) with shortlist
+          :rtype: tf.Tensor
+          """
+          def mask_shortlist_dups(x):
+            """
+            :param tf.Tensor x: (batch * beam_in, K)
+            :return: x with -inf (approx) for the duplicates, such that they are never selected
+            :rtype: tf.Tensor
+            """
+            dup_mask = tf.reshape(
+              tf.tile(tf.expand_dims(shortlist_dup_mask, axis=1), [1, scores_beam_in, 1]),
+              tf.shape(x))  # (batch * beam_in, K)
+            return tf.where(dup_mask, tf.fill(tf.shape(x), -1.e30), x)
+
+          def gather_shortlist(x):
+            """
+            :param tf.Tensor x: (batch * beam_in, dim)
+            :return: (batch * beam_in, K)
+            """
+            if shortlist_labels is None:
+              return x
+            x = tf.reshape(x, [net_batch_dim, scores_beam_in, self.sources[0].output.dim])  # (batch, beam_in, dim)
+            x = tf.transpose(x, [0, 2, 1])  # (batch, dim, beam_in)
+            x = tf.gather_nd(x, indices=nd_indices(shortlist_labels))  # (batch, K, beam_in)
+            x = tf.transpose(x, [0, 2, 1])  # (batch, beam_in, K)
+            return tf.reshape(x, [net_batch_dim * scores_beam_in, tf.shape(shortlist_labels)[1]])
+
+          scores_in = self.sources[0].output.placeholder  # (batch * beam_in, dim)
+          # We present the scores in +log space, and we will add them up along the path.
+          if input_type == "prob" and shortlist_labels is not None and not shortlist_fallback_mass and (
+                self._can_use_shortlist_projection(self.sources[0])):
+            source = self.sources[0]  # type: LinearLayer
+            # Only compute the output projection for the shortlist, and normalize over the shortlist.
+            with tf.name_scope("shortlist_projection"):
+              x = source.input_data.placeholder  # (batch * beam_in, n_in)
+              n_in = source.input_data.dim
+              x = tf.reshape(x, [net_batch_dim, scores_beam_in, n_in])  # (batch, beam_in, n_in)
+              weights = tf.gather(source.linear_weights, shortlist_labels, axis=1)  # (n_in, batch, K)
+              weights = tf.transpose(weights, [1, 0, 2])  # (batch, n_in, K)
+              logits = tf.matmul(x, weights)  # (batch, beam_in, K)
+              if source.linear_bias is not None:
+                logits += tf.expand_dims(tf.gather(source.linear_bias, shortlist_labels), axis=1)
+              logits = tf.reshape(logits, [net_batch_dim * scores_beam_in, tf.shape(shortlist_labels)[1]])
+              logits = mask_shortlist_dups(logits)
+              return logits - tf.reduce_logsumexp(logits, axis=-1, keep_dims=True)  # (batch * beam_in, K)
+          if input_type == "prob":
+            output_before_activation = self.sources[0].output_before_activation
+            if output_before_activation and shortlist_labels is not None:
+              if output_before_activation.is_softmax_act_func():
+                logits = output_before_activation.x  # (batch * beam_in, dim)
+                scores_in = gather_shortlist(logits) - tf.reduce_logsumexp(logits, axis=-1, keep_dims=True)
+              else:
+                scores_in = safe_log(gather_shortlist(scores_in))
+            elif output_before_activation:
+              scores_in = output_before_activation.get_log_output()
+            else:
+              scores_in = safe_log(gather_shortlist(scores_in))
+          elif input_type == "log_prob":
+            scores_in = gather_shortlist(scores_in)
           else:
-            from TFUtil import safe_log
-            scores_in = safe_log(scores_in)
-        elif input_type == "log_prob":
-          pass
+            raise Exception("%r: invalid input type %r" % (self, input_type))
+          if shortlist_labels is not None:
+            # Otherwise the duplicates would compete in the top-k.
+            scores_in = mask_shortlist_dups(scores_in)
+          return scores_in
+
+        def search_top_k(scores_in, shortlist_labels=None):
+          """
+          :param tf.Tensor scores_in: (batch * beam_in, dim) in +log space, see get_scores_in
+          :param tf.Tensor|None shortlist_labels: (batch, K), int32, if scores_in is for the shortlist
+          :return: scores (batch, beam), src_beams (batch, beam), labels (batch, beam) (dim idx),
+            and scores_in, scores_comb for debugging
+          :rtype: (tf.Tensor, tf.Tensor, tf.Tensor, tf.Tensor, tf.Tensor)
+          """
+          if shortlist_labels is None:
+            scores_in_dim = self.sources[0].output.dim
+          else:
+            scores_in_dim = tf.shape(shortlist_labels)[1]
+          if self.network.have_rec_step_info():
+            scores_in = filter_ended_scores(
+              scores_in, end_flags=self.network.get_rec_step_info().get_end_flag(),
+              dim=scores_in_dim, batch_dim=net_batch_dim * scores_beam_in)  # (batch * beam_in, dim)
+          scores_in = tf.reshape(scores_in, [net_batch_dim, scores_beam_in, scores_in_dim])  # (batch, beam_in, dim)
+          with tf.control_dependencies([
+                # See comment above. This checks that all is as expected.
+                tf.Assert(tf.logical_or(
+                  tf.equal(base_beam_in, 1),
+                  tf.logical_and(
+                    tf.equal(base_beam_in, scores_beam_in),
+                    tf.equal(base_beam_in, beam_size))),
+                  [
+                    "base_beam_in", base_beam_in,
+                    "scores_beam_in", scores_beam_in,
+                    "beam_size", beam_size])]):
+            # See the comment above. It could be that scores_in has a wider beam
+            # than what should be used here now.
+            scores_in = scores_in[:, :base_beam_in]  # (batch, beam_in, dim)
+          scores_comb = scores_in + scores_base  # (batch, beam_in, dim)
+          # `tf.nn.top_k` is the core function performing our search.
+          # We get scores/labels of shape (batch, beam) with indices in [0..beam_in*dim-1].
+          if two_stage_top_k:
+            with tf.name_scope("two_stage_top_k"):
+              # Any of the final top-k entries is also within the top-k of its incoming hypothesis.
+              k_per_beam = tf.minimum(beam_size, scores_in_dim)
+              scores_per_beam, labels_per_beam = tf.nn.top_k(scores_comb, k=k_per_beam)  # (batch, beam_in, k)
+              scores_per_beam = tf.reshape(scores_per_beam, [net_batch_dim, base_beam_in * k_per_beam])
+              labels_per_beam = tf.reshape(labels_per_beam, [net_batch_dim, base_beam_in * k_per_beam])
+              scores, idxs = tf.nn.top_k(scores_per_beam, k=beam_size)  # (batch, beam) -> idx in beam_in * k
+              # Convert to the same format as above, i.e. indices in [0..beam_in*dim-1].
+              labels = (idxs // k_per_beam) * scores_in_dim + tf.gather_nd(
+                labels_per_beam, indices=nd_indices(idxs))  # (batch, beam)
+          else:
+            scores_comb_flat = tf.reshape(
+              scores_comb, [net_batch_dim, base_beam_in * scores_in_dim])  # (batch, beam_in * dim)
+            scores, labels = tf.nn.top_k(scores_comb_flat, k=beam_size)
+          if cheating:
+            assert shortlist_labels is None, "%r: cheating with shortlist not supported" % self
+            # It assumes that sorted=True in top_k, and the last entries in scores/labels are the worst.
+            # We replace them by the true labels.
+            gold_targets = self._static_get_target_value(
+              target=self.target, network=self.network,
+              mark_data_key_as_used=True).get_placeholder_as_batch_major()  # (batch*beam,), int32
+            # gold_targets will get automatically expanded for the beam. Undo that.
+            gold_targets = tf.reshape(gold_targets, [net_batch_dim, beam_size])[:, 0]
+            gold_beam_in_idx = base_beam_in - 1  # also assume last index
+            gold_labels = gold_beam_in_idx * scores_in_dim + gold_targets  # (batch,)
+            gold_labels_bc = tf.expand_dims(gold_labels, axis=1)  # (batch,1)
+            labels = tf.concat([labels[:, :beam_size - 1], gold_labels_bc], axis=1)  # (batch,beam)
+            gold_scores = tf.gather_nd(
+              scores_comb[:, gold_beam_in_idx], indices=nd_indices(gold_targets))  # (batch,)
+            gold_scores_bc = tf.expand_dims(gold_scores, axis=1)  # (batch,1)
+            scores = tf.concat([scores[:, :beam_size - 1], gold_scores_bc], axis=1)  # (batch,beam)
+          src_beams = labels // scores_in_dim  # (batch, beam) -> beam_in idx
+          labels = labels % scores_in_dim  # (batch, beam) -> dim idx, or shortlist idx
+          if shortlist_labels is not None:
+            labels = tf.gather_nd(shortlist_labels, indices=nd_indices(labels))  # (batch, beam) -> dim idx
+          return scores, src_beams, labels, scores_in, scores_comb
+
+        if shortlist:
+          shortlist_labels, shortlist_dup_mask = self._get_shortlist_labels(
+            shortlist, net_batch_dim=net_batch_dim)  # (batch, K)
+          scores_in_shortlist = get_scores_in(
+            shortlist_labels=shortlist_labels, shortlist_dup_mask=shortlist_dup_mask)  # (batch * beam_in, K)
+          if shortlist_fallback_mass:
+            import math
+            with tf.name_scope("shortlist_fallback"):
+              # If the shortlist does not cover enough probability mass for any active hypothesis,
+              # we do the search over the full vocabulary in this frame.
+              shortlist_mass = tf.reduce_logsumexp(scores_in_shortlist, axis=-1)  # (batch * beam_in,)
+              use_full_vocab = tf.less(shortlist_mass, math.log(shortlist_fallback_mass))
+              if self.network.have_rec_step_info():
+                use_full_vocab = tf.logical_and(
+                  use_full_vocab, tf.logical_not(self.network.get_rec_step_info().get_end_flag()))
+              use_full_vocab = tf.reduce_any(use_full_vocab)
+            scores, src_beams, labels, scores_in, scores_comb = tf.cond(
+              use_full_vocab,
+              lambda: search_top_k(get_scores_in()),
+              lambda: search_top_k(scores_in_shortlist, shortlist_labels=shortlist_labels))
+          else:
+            scores, src_beams, labels, scores_in, scores_comb = search_top_k(
+              scores_in_shortlist, shortlist_labels=shortlist_labels)
         else:
-          raise Exception("%r: invalid input type %r" % (self, input_type))
-        from TFUtil import filter_ended_scores
-        scores_in_dim = self.sources[0].output.dim
-        if self.network.have_rec_step_info():
-          scores_in = filter_ended_scores(
-            scores_in, end_flags=self.network.get_rec_step_info().get_end_flag(),
-            dim=scores_in_dim, batch_dim=net_batch_dim * scores_beam_in)  # (batch * beam_in, dim)
-        scores_in = tf.reshape(scores_in, [net_batch_dim, scores_beam_in, scores_in_dim])  # (batch, beam_in, dim)
-        with tf.control_dependencies([
-              # See comment above. This checks that all is as expected.
-              tf.Assert(tf.logical_or(
-                tf.equal(base_beam_in, 1),
-                tf.logical_and(
-                  tf.equal(base_beam_in, scores_beam_in),
-                  tf.equal(base_beam_in, beam_size))),
-                [
-                  "base_beam_in", base_beam_in,
-                  "scores_beam_in", scores_beam_in,
-                  "beam_size", beam_size])]):
-          # See the comment above. It could be that scores_in has a wider beam
-          # than what should be used here now.
-          scores_in = scores_in[:, :base_beam_in]  # (batch, beam_in, dim)
-        scores_comb = scores_in + scores_base  # (batch, beam_in, dim)
-        scores_comb_flat = tf.reshape(
-          scores_comb, [net_batch_dim, base_beam_in * scores_in_dim])  # (batch, beam_in * dim)
-        # `tf.nn.top_k` is the core function performing our search.
-        # We get scores/labels of shape (batch, beam) with indices in [0..beam_in*dim-1].
-        scores, labels = tf.nn.top_k(scores_comb_flat, k=beam_size)
-        if cheating:
-          # It assumes that sorted=True in top_k, and the last entries in scores/labels are the worst.
-          # We replace them by the true labels.
-          gold_targets = self._static_get_target_value(
-            target=self.target, network=self.network,
-            mark_data_key_as_used=True).get_placeholder_as_batch_major()  # (batch*beam,), int32
-          # gold_targets will get automatically expanded for the beam. Undo that.
-          gold_targets = tf.reshape(gold_targets, [net_batch_dim, beam_size])[:, 0]
-          gold_beam_in_idx = base_beam_in - 1  # also assume last index
-          gold_labels = gold_beam_in_idx * scores_in_dim + gold_targets  # (batch,)
-          gold_labels_bc = tf.expand_dims(gold_labels, axis=1)  # (batch,1)
-          labels = tf.concat([labels[:, :beam_size - 1], gold_labels_bc], axis=1)  # (batch,beam)
-          from TFUtil import nd_indices
-          gold_scores = tf.gather_nd(
-            scores_comb[:, gold_beam_in_idx], indices=nd_indices(gold_targets))  # (batch,)
-          gold_scores_bc = tf.expand_dims(gold_scores, axis=1)  # (batch,1)
-          scores = tf.concat([scores[:, :beam_size - 1], gold_scores_bc], axis=1)  # (batch,beam)
-        self.search_choices.src_beams = labels // scores_in_dim  # (batch, beam) -> beam_in idx
-        labels = labels % scores_in_dim  # (batch, beam) -> dim idx
+          scores, src_beams, labels, scores_in, scores_comb = search_top_k(get_scores_in())
+        self.search_choices.src_beams = src_beams  # (batch, beam) -> beam_in idx
         labels = tf.reshape(labels, [net_batch_dim * beam_size])  # (batch * beam)
         labels = tf.cast(labels, self.output.dtype)
         self.search_choices.set_beam_scores(scores)  # (batch, beam) -> log score
@@ -2981,6 +3162,8 @@ class ChoiceLayer(LayerBase):
       d["from"] = []
     if d.get("explicit_search_source"):
       d["explicit_search_source"] = get_layer(d["explicit_search_source"]) if network.search_flag else None
+    if d.get("shortlist"):
+      d["shortlist"] = get_layer(d["shortlist"]) if network.search_flag else None
     super(ChoiceLayer, cls).transform_config_dict(d, network=network, get_layer=get_layer)
 
   @classmethod
@@ -3018,8 +3201,48 @@ class ChoiceLayer(LayerBase):
     l = super(ChoiceLayer, self).get_dep_layers()
     if self.explicit_search_source:
       l.append(self.explicit_search_source)
+    if self.shortlist:
+      l.append(self.shortlist)
     return l
 
+  @classmethod
+  def _get_shortlist_labels(cls, shortlist, net_batch_dim):
+    """
+    :param LayerBase shortlist: candidate labels, (batch, K) or (batch * beam, K)
+    :param tf.Tensor|int net_batch_dim:
+    :return: labels (batch, K+1), int32, sorted, with label 0 at position 0
+      (we add it, as filter_ended_scores uses label 0 for ended hyps),
+      and the duplicate mask (batch, K+1), bool, True where the label is the same as the one before
+    :rtype: (tf.Tensor, tf.Tensor)
+    """
+    with tf.name_scope("shortlist_labels"):
+      assert shortlist.output.batch_ndim == 2, "%r: expect shape (batch, K)" % shortlist
+      labels = shortlist.output.get_placeholder_as_batch_major()  # (batch[ * beam], K)
+      labels = tf.cast(labels, tf.int32)
+      # All beams have the same shortlist. Undo the beam expansion if there was any.
+      labels = tf.reshape(labels, [net_batch_dim, -1, tf.shape(labels)[-1]])[:, 0]  # (batch, K)
+      labels = tf.concat([tf.zeros([net_batch_dim, 1], dtype=tf.int32), labels], axis=1)  # (batch, K+1)
+      # Sort ascending, so label 0 comes first, and duplicates are next to each other.
+      neg_labels, _ = tf.nn.top_k(-labels, k=tf.shape(labels)[1])
+      labels = -neg_labels
+      dup_mask = tf.concat([
+        tf.zeros([net_batch_dim, 1], dtype=tf.bool), tf.equal(labels[:, 1:], labels[:, :-1])], axis=1)
+      return labels, dup_mask
+
+  @classmethod
+  def _can_use_shortlist_projection(cls, source):
+    """
+    :param LayerBase source: the input of the ChoiceLayer
+    :return: whether we can compute the output projection of the source only for the shortlist
+    :rtype: bool
+    """
+    from TFNetworkLayer import LinearLayer
+    if not isinstance(source, LinearLayer):
+      return False
+    if source.input_data.sparse or source.input_data.batch_ndim != 2:
+      return False
+    return bool(source.output_before_activation and source.output_before_activation.is_softmax_act_func())
+
 
 class DecideLayer(LayerBase):
   """
@@ -3516,9 +3739,10 @@ class SelfAttentionLayer(_ConcatInputLayer):
   """
   layer_class = "self_attention"
   recurrent = True
+  supports_param_storage_quantization = True
 
   def __init__(self, num_heads, total_key_dim, forward_weights_init="glorot_uniform", attention_dropout=0.0,
-               attention_left_only=False,
+               attention_left_only=False, kv_cache_max_len=None,
                **kwargs):
     """
     :param int num_heads:
@@ -3526,6 +3750,11 @@ class SelfAttentionLayer(_ConcatInputLayer):
     :param str forward_weights_init: see :func:`TFUtil.get_initializer`
     :param float attention_dropout:
     :param bool attention_left_only: will mask out the future. see Attention is all you need.
+    :param int|str|None kv_cache_max_len: only inside a RecLayer.
+      If set, we keep the keys/values in a preallocated buffer of this length (in time frames)
+      and write the current frame into it, instead of concatenating to the history in every frame.
+      This keeps the shape of the loop var fixed.
+      "max_seq_len" will use the max_seq_len of the RecLayer.
     """
     super(SelfAttentionLayer, self).__init__(**kwargs)
     assert self._rec_previous_layer or self.input_data.time_dim_axis is not None, (
@@ -3570,11 +3799,37 @@ class SelfAttentionLayer(_ConcatInputLayer):
       # Memory for kv.
       kv_cur = tf.concat([k, v], axis=-1)  # (batch,heads,1,kv-dim//heads)
       kv_cur.set_shape((None, num_heads, 1, (total_key_dim + total_value_dim) // num_heads))
-      # (batch,heads,time,kv-dim//heads)
-      kv_left = self._rec_previous_layer.rec_vars_outputs["kv_left"]
-      kv_left = tf.concat([kv_left, kv_cur], axis=2)
-      kv_left.set_shape((None, num_heads, None, (total_key_dim + total_value_dim) // num_heads))
-      self.rec_vars_outputs["kv_left"] = kv_left
+      if kv_cache_max_len:
+        # (batch,heads,max_len,kv-dim//heads), see get_rec_initial_extra_outputs
+        kv_cache = self._rec_previous_layer.rec_vars_outputs["kv_cache"]
+        kv_cache_shape = kv_cache.get_shape()
+        step = self.network.get_rec_step_index()
+        kv_cache_len = tf.shape(kv_cache)[2]
+        with tf.control_dependencies([tf.assert_less(
+              step, kv_cache_len, data=["%s: kv_cache_max_len too small, step: " % self, step])]):
+          step = tf.identity(step)
+        # Beam reordering is done on the whole buffer via select_src_beams, like for all rec_vars_outputs.
+        from TFUtil import tf_version_tuple
+        if tf_version_tuple() >= (1, 13):
+          # Only write the current frame, i.e. the cost per step does not depend on max_len.
+          kv_cache_batch_dim = tf.shape(kv_cache)[0]
+          batch_idxs, head_idxs = tf.meshgrid(tf.range(kv_cache_batch_dim), tf.range(num_heads), indexing="ij")
+          indices = tf.stack([batch_idxs, head_idxs, tf.fill(tf.shape(batch_idxs), step)], axis=-1)  # (batch,heads,3)
+          # tf.tensor_scatter_update is the older name (TF 1.13).
+          tensor_scatter_nd_update = getattr(tf, "tensor_scatter_nd_update", None) or tf.tensor_scatter_update
+          kv_cache = tensor_scatter_nd_update(kv_cache, indices, kv_cur[:, :, 0])
+        else:
+          # Older TF: no scatter into a tensor. Replace the frame via the slices before and after it.
+          kv_cache = tf.concat([kv_cache[:, :, :step], kv_cur, kv_cache[:, :, step + 1:]], axis=2)
+        kv_cache.set_shape(kv_cache_shape)
+        self.rec_vars_outputs["kv_cache"] = kv_cache
+        kv_left = kv_cache[:, :, :step + 1]  # (batch,heads,time,kv-dim//heads)
+      else:
+        # (batch,heads,time,kv-dim//heads)
+        kv_left = self._rec_previous_layer.rec_vars_outputs["kv_left"]
+        kv_left = tf.concat([kv_left, kv_cur], axis=2)
+        kv_left.set_shape((None, num_heads, None, (total_key_dim + total_value_dim) // num_heads))
+        self.rec_vars_outputs["kv_left"] = kv_left
       k, v = tf.split(kv_left, [total_key_dim // num_heads, total_value_dim // num_heads], axis=-1)
     # Dot-attention. Resulting last time dimension will be used to perform the softmax over, and will the be reduced.
     energy = tf.matmul(q, k, transpose_b=True)  # (batch,heads,time,time)
@@ -3638,7 +3893,22 @@ class SelfAttentionLayer(_ConcatInputLayer):
     return out
 
   @classmethod
-  def get_rec_initial_extra_outputs(cls, batch_dim, rec_layer, num_heads, total_key_dim, n_out, sources=(), **kwargs):
+  def _get_kv_cache_max_len(cls, kv_cache_max_len, rec_layer):
+    """
+    :param int|str kv_cache_max_len:
+    :param RecLayer|None rec_layer:
+    :rtype: int|tf.Tensor
+    """
+    if kv_cache_max_len == "max_seq_len":
+      assert isinstance(rec_layer, RecLayer) and rec_layer._max_seq_len is not None, (
+        "%s: kv_cache_max_len 'max_seq_len' needs RecLayer with max_seq_len" % cls.__name__)
+      return rec_layer._max_seq_len
+    assert isinstance(kv_cache_max_len, int)
+    return kv_cache_max_len
+
+  @classmethod
+  def get_rec_initial_extra_outputs(cls, batch_dim, rec_layer, num_heads, total_key_dim, n_out, sources=(),
+                                    kv_cache_max_len=None, **kwargs):
     data = get_concat_sources_data_template(sources)
     data = data.copy_as_batch_major()
     if data.time_dim_axis is None:
@@ -3646,18 +3916,27 @@ class SelfAttentionLayer(_ConcatInputLayer):
       # Before, we used a tf.TensorArray.
       # However, that has higher memory consumptions than just using a tensor and concatenating to it.
       total_value_dim = n_out
+      if kv_cache_max_len:
+        max_len = cls._get_kv_cache_max_len(kv_cache_max_len, rec_layer=rec_layer)
+        # (batch,heads,max_len,kv-dim//heads)
+        kv_cache = tf.zeros((batch_dim, num_heads, max_len, (total_key_dim + total_value_dim) // num_heads))
+        return {"kv_cache": kv_cache}
       # (batch,heads,time,kv-dim//heads)
       kv_left = tf.zeros((batch_dim, num_heads, 0, (total_key_dim + total_value_dim) // num_heads))
       return {"kv_left": kv_left}
     return {}
 
   @classmethod
-  def get_rec_initial_extra_outputs_shape_invariants(cls, num_heads, total_key_dim, n_out, sources, **kwargs):
+  def get_rec_initial_extra_outputs_shape_invariants(cls, num_heads, total_key_dim, n_out, sources,
+                                                     kv_cache_max_len=None, **kwargs):
     data = get_concat_sources_data_template(sources)
     data = data.copy_as_batch_major()
     if data.time_dim_axis is None:
       # Assume inside RecLayer. See get_rec_initial_extra_outputs.
       total_value_dim = n_out
+      if kv_cache_max_len:
+        max_len = kv_cache_max_len if isinstance(kv_cache_max_len, int) else None
+        return {"kv_cache": tf.TensorShape((None, num_heads, max_len, (total_key_dim + total_value_dim) // num_heads))}
       return {"kv_left": tf.TensorShape((None, num_heads, None, (total_key_dim + total_value_dim) // num_heads))}
     return {}
 
@@ -3746,7 +4025,7 @@ class KenLmStateLayer(_ConcatInputLayer):
   recurrent = True
 
   def __init__(self, lm_file, vocab_file=None, vocab_unknown_label="UNK", bpe_merge_symbol=None,
-               input_step_offset=0, dense_output=False,
+               input_step_offset=0, dense_output=False, incremental=True,
                debug=False,
                **kwargs):
     """
@@ -3756,6 +4035,9 @@ class KenLmStateLayer(_ConcatInputLayer):
     :param str|None bpe_merge_symbol: e.g. "@@" if you want to apply BPE merging
     :param int input_step_offset: if provided, will consider the input only from this step onwards
     :param bool dense_output: whether we output the score for all possible succeeding tokens
+    :param bool incremental: keep the KenLM state in rec_vars_outputs["lm_state"] and only score new words.
+      Otherwise we keep the whole string so far in rec_vars_outputs["state"] and rescore it in every step.
+      Both give the same scores.
     :param bool debug: prints debug info
     """
     if callable(lm_file):
@@ -3800,25 +4082,46 @@ class KenLmStateLayer(_ConcatInputLayer):
         new_input, tf.zeros_like(new_input))
     # See :class:`CumsumLayer` for comparison.
     prev_strings = self._rec_previous_layer.rec_vars_outputs["state"]
-    next_strings = prev_strings + new_input
-    self.rec_vars_outputs["state"] = next_strings
     prev_scores = self._rec_previous_layer.rec_vars_outputs["scores"]
-    if dense_output:
-      assert self.tf_vocab, "%s: provide vocab_file" % self
-      new_abs_scores, new_abs_scores_dense = TFKenLM.ken_lm_abs_score_bpe_strings_dense(
-        handle=self.lm_handle,
-        bpe_merge_symbol=bpe_merge_symbol or "",
-        strings=next_strings,
-        labels=self.tf_vocab)
-      new_abs_scores_bc = expand_multiple_dims(
-        new_abs_scores, [i + new_abs_scores.get_shape().ndims for i in range(self.tf_vocab.get_shape().ndims)])
-      new_rel_scores = new_abs_scores_dense - new_abs_scores_bc
+    if incremental:
+      # "state" is only the (not yet scored) incomplete last word here.
+      prev_lm_states = self._rec_previous_layer.rec_vars_outputs["lm_state"]
+      if dense_output:
+        assert self.tf_vocab, "%s: provide vocab_file" % self
+        next_lm_states, next_strings, new_abs_scores, new_abs_scores_dense = TFKenLM.ken_lm_score_bpe_step_dense(
+          handle=self.lm_handle,
+          bpe_merge_symbol=bpe_merge_symbol or "",
+          states=prev_lm_states, partial_strings=prev_strings, new_strings=new_input,
+          labels=self.tf_vocab)
+        new_abs_scores_bc = expand_multiple_dims(
+          new_abs_scores, [i + new_abs_scores.get_shape().ndims for i in range(self.tf_vocab.get_shape().ndims)])
+        new_rel_scores = new_abs_scores_dense - new_abs_scores_bc
+      else:
+        next_lm_states, next_strings, new_abs_scores = TFKenLM.ken_lm_score_bpe_step(
+          handle=self.lm_handle,
+          bpe_merge_symbol=bpe_merge_symbol or "",
+          states=prev_lm_states, partial_strings=prev_strings, new_strings=new_input)
+        new_rel_scores = new_abs_scores - prev_scores
+      self.rec_vars_outputs["lm_state"] = next_lm_states
     else:
-      new_abs_scores = TFKenLM.ken_lm_abs_score_bpe_strings(
-        handle=self.lm_handle,
-        bpe_merge_symbol=bpe_merge_symbol or "",
-        strings=next_strings)
-      new_rel_scores = new_abs_scores - prev_scores
+      next_strings = prev_strings + new_input
+      if dense_output:
+        assert self.tf_vocab, "%s: provide vocab_file" % self
+        new_abs_scores, new_abs_scores_dense = TFKenLM.ken_lm_abs_score_bpe_strings_dense(
+          handle=self.lm_handle,
+          bpe_merge_symbol=bpe_merge_symbol or "",
+          strings=next_strings,
+          labels=self.tf_vocab)
+        new_abs_scores_bc = expand_multiple_dims(
+          new_abs_scores, [i + new_abs_scores.get_shape().ndims for i in range(self.tf_vocab.get_shape().ndims)])
+        new_rel_scores = new_abs_scores_dense - new_abs_scores_bc
+      else:
+        new_abs_scores = TFKenLM.ken_lm_abs_score_bpe_strings(
+          handle=self.lm_handle,
+          bpe_merge_symbol=bpe_merge_symbol or "",
+          strings=next_strings)
+        new_rel_scores = new_abs_scores - prev_scores
+    self.rec_vars_outputs["state"] = next_strings
     if debug:
       # Print some info. Only for the first 3 steps because it will spam a lot.
       new_rel_scores = tf.cond(tf.less_equal(prev_step, 2), lambda: tf.Print(new_rel_scores, [
@@ -3855,15 +4158,19 @@ class KenLmStateLayer(_ConcatInputLayer):
     return data
 
   @classmethod
-  def get_rec_initial_extra_outputs(cls, batch_dim, rec_layer, sources=(), **kwargs):
+  def get_rec_initial_extra_outputs(cls, batch_dim, rec_layer, sources=(), incremental=True, **kwargs):
     data = get_concat_sources_data_template(sources)
     # Assume inside RecLayer.
     assert all(data.shape)
     batch_shape = data.get_batch_shape(batch_dim=batch_dim)
-    return {
+    d = {
       "state": tf.zeros(batch_shape, dtype=tf.string),
       "step": tf.constant(0, dtype=tf.int32),
       "scores": tf.zeros(batch_shape, dtype=tf.float32)}
+    if incremental:
+      import TFKenLM
+      d["lm_state"] = TFKenLM.ken_lm_initial_states(batch_shape)
+    return d
 
 
 class BaseRNNCell(rnn_cell.RNNCell):
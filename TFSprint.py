@@ -27,7 +27,8 @@ def py_get_sprint_automata_for_batch(sprint_opts, tags):
 
 def get_sprint_automata_for_batch_op(sprint_opts, tags):
   """
-  :param dict[str] sprint_opts:
+  :param dict[str] sprint_opts: for SprintInstancePool. set "automataCacheDir" to cache the automata on disk,
+    so that Sprint only needs to generate them once per segment (see SprintAutomataCache)
   :param tf.Tensor tags: shape (batch,), of dtype string
   :return: (edges, weights, start_end_states). all together in one automaton.
     edges are of shape (4, num_edges), each (from, to, emission-idx, seq-idx), of dtype int32.
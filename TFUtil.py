@@ -4,6 +4,7 @@ from __future__ import print_function, division
 import tensorflow as tf
 from tensorflow.python.client import device_lib
 from tensorflow.python.ops import init_ops
+from tensorflow.python.training import saver as tf_saver
 import contextlib
 import os
 import sys
@@ -3081,6 +3082,7 @@ class OpCodeCompiler(NativeCodeCompiler):
   """
 
   CacheDirName = "returnn_tf_cache/ops"
+  LoadedLibFilenames = []  # type: list[str]  # e.g. for TFNetwork.NetworkGraphCache
 
   def __init__(self, use_cuda_if_available=True, cuda_auto_min_compute_capability=True,
                include_paths=(), ld_flags=(), **kwargs):
@@ -3136,6 +3138,8 @@ class OpCodeCompiler(NativeCodeCompiler):
       return self._tf_mod
     self._maybe_compile()
     self._tf_mod = tf.load_op_library(self._so_filename)
+    if self._so_filename not in self.LoadedLibFilenames:
+      self.LoadedLibFilenames.append(self._so_filename)
     return self._tf_mod
 
 
@@ -6472,3 +6476,75 @@ def get_positional_encoding(num_channels, length=None, position=None, min_timesc
   signal = tf.concat([tf.sin(scaled_time), tf.cos(scaled_time)], axis=1)
   signal = tf.pad(signal, [[0, 0], [0, num_channels % 2]])  # (length, channels)
   return signal
+
+
+def quantize_weights_int8(w, name="quantize_weights_int8"):
+  """
+  Symmetric linear quantization to int8, with one scale per output channel (last axis).
+
+  :param tf.Tensor w: float32, e.g. (n_in, n_out)
+  :param str name:
+  :return: (quantized, scale), quantized is int8 of the same shape as w, scale is float32 of shape (n_out,),
+    such that w ~= tf.cast(quantized, tf.float32) * scale. See :func:`dequantize_weights_int8`.
+  :rtype: (tf.Tensor, tf.Tensor)
+  """
+  with tf.name_scope(name):
+    w = tf.convert_to_tensor(w)
+    axes = list(range(w.get_shape().ndims - 1))
+    scale = tf.reduce_max(tf.abs(w), axis=axes) / 127.
+    scale = tf.where(tf.greater(scale, 0.), scale, tf.ones_like(scale))  # avoid div by zero for all-zero channels
+    quantized = tf.cast(tf.clip_by_value(tf.round(w / scale), -127., 127.), tf.int8)
+    return quantized, scale
+
+
+def dequantize_weights_int8(quantized, scale, name="dequantize_weights_int8"):
+  """
+  Inverse of :func:`quantize_weights_int8`.
+
+  :param tf.Tensor|tf.Variable quantized: int8, e.g. (n_in, n_out)
+  :param tf.Tensor|tf.Variable scale: float32, (n_out,)
+  :param str name:
+  :return: float32, same shape as quantized
+  :rtype: tf.Tensor
+  """
+  with tf.name_scope(name):
+    return tf.cast(quantized, tf.float32) * scale
+
+
+class Int8WeightsSaveable(tf_saver.BaseSaverBuilder.SaveableObject):
+  """
+  Used for weights which are stored as int8 with a float32 scale per output channel (see :func:`quantize_weights_int8`).
+  In the checkpoint, the weights are stored as the dequantized float32 weights under the original name,
+  i.e. the checkpoint is compatible with the non-quantized variant,
+  and the quantization happens when we restore.
+  Optionally, the dequantized weights are also set on restore, such that they are not computed in every session run.
+  Used via :class:`LayerBase.saveable_param_replace`, like the cuDNN saveables.
+  """
+
+  def __init__(self, quantized, scale, name, dequantized=None):
+    """
+    :param tf.Variable quantized: int8
+    :param tf.Variable scale: float32, (n_out,)
+    :param str name: name in the checkpoint, e.g. "layer/W"
+    :param tf.Variable|None dequantized: float32, same shape as quantized. set to the dequantized weights on restore
+    """
+    self.quantized = quantized
+    self.scale = scale
+    self.dequantized = dequantized
+    spec = tf_saver.BaseSaverBuilder.SaveSpec(dequantize_weights_int8(quantized, scale), "", name)
+    super(Int8WeightsSaveable, self).__init__(quantized, [spec], name)
+
+  def restore(self, restored_tensors, restored_shapes):
+    """
+    :param list[tf.Tensor] restored_tensors:
+    :param list[tf.TensorShape]|None restored_shapes:
+    :rtype: tf.Operation
+    """
+    w, = restored_tensors
+    if restored_shapes:
+      w = tf.reshape(w, restored_shapes[0])
+    quantized, scale = quantize_weights_int8(w)
+    ops = [tf.assign(self.quantized, quantized), tf.assign(self.scale, scale)]
+    if self.dequantized is not None:
+      ops.append(tf.assign(self.dequantized, dequantize_weights_int8(quantized, scale)))
+    return tf.group(*ops)
@@ -5,7 +5,7 @@ most of them quite low level.
 """
 
 from __future__ import print_function
-from threading import Lock, currentThread
+from threading import Lock, RLock, currentThread
 import sys
 PY3 = sys.version_info[0] >= 3
 import os
@@ -217,6 +217,31 @@ class SharedMem:
       self.check_ccall_error(self.ptr != self.ctypes.c_void_p(-1).value, "shmat")
       self.check_ccall_error(self.ptr > 0, "shmat")
 
+    def remove_on_detach(self):
+      """
+      Marks the segment to be removed once the last process has detached from it,
+      which the kernel also does if a process crashes.
+      On Linux, other processes can still attach via the shmid until then (but not via shmget).
+      """
+      assert self.is_creator
+      res = self.shmctl(self.shmid, self.IPC_RMID, 0)
+      self.check_ccall_error(res == 0, "shmctl")
+
+    def get_numpy_array(self, offset, shape, dtype):
+      """
+      :param int offset: in bytes
+      :param tuple[int] shape:
+      :param str|numpy.dtype dtype:
+      :return: view into the shared memory. only valid as long as we are attached
+      :rtype: numpy.ndarray
+      """
+      import ctypes
+      dtype = numpy.dtype(dtype)
+      nbytes = int(numpy.prod(shape, dtype="int64")) * dtype.itemsize
+      assert self.ptr and 0 <= offset and offset + nbytes <= self.size
+      buf = (ctypes.c_char * nbytes).from_address(self.ptr + offset)
+      return numpy.frombuffer(buf, dtype=dtype).reshape(shape)
+
     def remove(self):
       if self.ptr:
         self.shmdt(self.ptr)
@@ -240,6 +265,108 @@ class SharedMem:
       return "<SharedMem shmid=%r size=%r is_creator=%r>" % (self.shmid, self.size, self.is_creator)
 
 
+class NodeSharedMem(object):
+  """
+  A :class:`SharedMem` segment which is shared by multiple processes on the same node (e.g. Horovod ranks),
+  which all use the same key. One of them (e.g. local rank 0) creates it, the others attach to it.
+  The shmid is passed via a small file in the tmp dir.
+  The segment is marked to be removed on detach right after creation, i.e. it is freed by the kernel
+  once all processes have detached or exited, also if they crashed.
+  The first bytes of the segment are a header (magic, token, size), so that we recognize a stale file.
+  """
+
+  Magic = 0x52544e4e53484d31  # "RTNNSHM1"
+  HeaderBytes = 64
+
+  def __init__(self, key, size, is_creator, init_func=None, timeout=600.):
+    """
+    :param str key: should identify the content and the group of processes (e.g. the job)
+    :param int size: in bytes, not counting the header
+    :param bool is_creator:
+    :param ((NodeSharedMem)->None)|None init_func: called by the creator before the others can attach
+    :param float timeout: in secs, how long to wait for the creator
+    """
+    import tempfile
+    self.key = key
+    self.size = size
+    self.is_creator = is_creator
+    self.filename = os.path.join(tempfile.gettempdir(), "returnn-node-shm-%i-%s" % (os.getuid(), key))
+    self.mem = None  # type: SharedMem|None
+    if is_creator:
+      import random
+      token = random.getrandbits(63)
+      self.mem = SharedMem(size=self.HeaderBytes + size)
+      self.mem.remove_on_detach()
+      header = self._get_header()
+      header[1:3] = (token, size)
+      header[0] = self.Magic
+      if init_func:
+        init_func(self)
+      tmp_filename = "%s.%i.tmp" % (self.filename, os.getpid())
+      with open(tmp_filename, "w") as f:
+        f.write("%i %i\n" % (self.mem.shmid, token))
+      os.rename(tmp_filename, self.filename)  # atomic
+      import atexit
+      atexit.register(self.remove)
+    else:
+      start_time = time.time()
+      while not self._try_attach():
+        if time.time() - start_time > timeout:
+          raise SharedMem.ShmException("NodeSharedMem: timeout while waiting for %r" % self.filename)
+        time.sleep(0.1)
+
+  def _get_header(self):
+    """
+    :return: (magic, token, size)
+    :rtype: numpy.ndarray
+    """
+    return self.mem.get_numpy_array(offset=0, shape=(3,), dtype="uint64")
+
+  def _try_attach(self):
+    """
+    :return: whether we successfully attached to the segment of the creator
+    :rtype: bool
+    """
+    try:
+      with open(self.filename) as f:
+        shmid, token = [int(v) for v in f.read().split()]
+    except (IOError, OSError, ValueError):  # not yet created, or incomplete
+      return False
+    try:
+      mem = SharedMem(size=self.HeaderBytes + self.size, shmid=shmid)
+    except SharedMem.ShmException:  # stale file, the segment does not exist anymore
+      return False
+    self.mem = mem
+    header = self._get_header()
+    if header[0] != self.Magic or int(header[1]) != token or int(header[2]) != self.size:
+      self.mem.remove()
+      self.mem = None
+      return False
+    return True
+
+  def get_numpy_array(self, offset, shape, dtype):
+    """
+    :param int offset: in bytes, not counting the header
+    :param tuple[int] shape:
+    :param str|numpy.dtype dtype:
+    :rtype: numpy.ndarray
+    """
+    return self.mem.get_numpy_array(offset=self.HeaderBytes + offset, shape=shape, dtype=dtype)
+
+  def remove(self):
+    if self.is_creator and os.path.exists(self.filename):
+      try:
+        os.remove(self.filename)
+      except OSError:
+        pass
+    if self.mem:
+      self.mem.remove()
+      self.mem = None
+
+  def __repr__(self):
+    return "<NodeSharedMem key=%r size=%r is_creator=%r mem=%r>" % (self.key, self.size, self.is_creator, self.mem)
+
+
 def next_power_of_two(n):
   return 2 ** (int(n - 1).bit_length())
 
@@ -471,6 +598,213 @@ class SharedNumpyArray:
     return "<%s is_server=%r state=%r>" % (self.__class__.__name__, self.is_server, self.__getstate__())
 
 
+class SharedMemRingBuffer:
+  """
+  A ring buffer in shared memory to transfer Numpy arrays to another process without pickling their data.
+  It is meant for one direction of a pipe, i.e. there is one writer process and one reader process.
+  The writer passes it to the :class:`Pickler` (via ``ring_buffer=...``),
+  which then copies each big enough array into the ring buffer and only pickles a small header,
+  which is sent over the pipe as usual.
+  The :class:`Unpickler` on the reader side attaches to the shared memory via the shmid from the header
+  and returns a Numpy array which directly references the shared memory (see :class:`SharedMemRingBufferArray`).
+  Once the reader does not need the array anymore (numpy_set_unused(), or when the array gets deleted),
+  the memory is marked as free again.
+  If there is not enough free space, the Pickler falls back to the normal pickling, i.e. we never block.
+
+  The shared memory is usually created by the parent process, no matter which side it is on,
+  so that it lives as long as the parent, and the child process attaches to it via the shmid.
+  Positions are logical byte offsets which only increase, the offset in the data area is pos % capacity.
+  The writer owns the write position, the reader owns the read position, which is stored in the shared memory.
+  """
+
+  HeaderBytes = 64
+  Alignment = 64
+  SanityCheckValue = 43
+  ReaderInstances = {}  # shmid -> SharedMemRingBuffer
+  ReaderLock = RLock()
+
+  def __init__(self, size, shmid=None, is_writer=None, min_array_size=4096):
+    """
+    :param int size: total size of the shared memory in bytes
+    :param int|None shmid: if given, we attach to this existing shared memory, otherwise we create it
+    :param bool|None is_writer: by default, the creator is the writer
+    :param int min_array_size: in bytes. smaller arrays are pickled as usual
+    """
+    from collections import deque
+    self.is_writer = (shmid is None) if is_writer is None else is_writer
+    self.mem = SharedMem(size=size, shmid=shmid)
+    self.capacity = (self.mem.size - self.HeaderBytes) // self.Alignment * self.Alignment
+    assert self.capacity > 0
+    self.min_array_size = min_array_size
+    self.lock = Lock()
+    self._read_pos_ref = self._get_read_pos_ref()
+    if self.mem.is_creator:
+      self._get_sanity_check_flag_ref().value = self.SanityCheckValue
+      self._read_pos_ref.value = 0
+    else:
+      assert self._get_sanity_check_flag_ref().value == self.SanityCheckValue
+    self.write_pos = 0  # writer side
+    self.pending = deque()  # reader side. [start, end, released] of the arrays which we gave out, in order
+    if not self.is_writer:
+      with self.ReaderLock:
+        self.ReaderInstances[self.mem.shmid] = self
+
+  def reset(self):
+    """
+    Called by the creator of the shared memory when the other process was (re)started.
+    Any arrays which the reader still references will be overwritten.
+    """
+    with self.lock:
+      self.write_pos = 0
+      self.pending.clear()
+      self._read_pos_ref.value = 0
+
+  @classmethod
+  def get_reader_instance(cls, shmid, size):
+    """
+    :param int shmid:
+    :param int size:
+    :return: the reader side of the ring buffer, attached once per process
+    :rtype: SharedMemRingBuffer
+    """
+    with cls.ReaderLock:
+      if shmid not in cls.ReaderInstances:
+        SharedMemRingBuffer(size=size, shmid=shmid, is_writer=False)  # will register itself
+      return cls.ReaderInstances[shmid]
+
+  def _get_sanity_check_flag_ref(self):
+    import ctypes
+    return ctypes.cast(ctypes.c_void_p(self.mem.ptr), ctypes.POINTER(ctypes.c_uint64)).contents
+
+  def _get_read_pos_ref(self):
+    import ctypes
+    return ctypes.cast(ctypes.c_void_p(self.mem.ptr + 8), ctypes.POINTER(ctypes.c_uint64)).contents
+
+  def _get_data_ptr(self, pos):
+    return self.mem.ptr + self.HeaderBytes + pos % self.capacity
+
+  def write_array(self, array):
+    """
+    Copies the array into the ring buffer. Called on the writer side.
+
+    :param numpy.ndarray array:
+    :return: args for shared_mem_ring_buffer_get_array, or None if there is not enough free space
+    :rtype: tuple|None
+    """
+    assert self.is_writer
+    array = numpy.ascontiguousarray(array)
+    nbytes = array.nbytes
+    if nbytes > self.capacity:
+      return None
+    with self.lock:
+      start = self.write_pos
+      if start % self.capacity + nbytes > self.capacity:
+        start += self.capacity - start % self.capacity  # does not fit at the end, so wrap around
+      end = start + nbytes
+      end += (-end) % self.Alignment
+      if end - self._read_pos_ref.value > self.capacity:
+        return None  # not enough free space
+      self.write_pos = end
+    if nbytes > 0:
+      SharedMem.memcpy(self._get_data_ptr(start), array.ctypes.data, nbytes)
+    return self.mem.shmid, self.mem.size, start, end, array.dtype.str, array.shape
+
+  def get_array(self, start, end, typestr, shape):
+    """
+    Called on the reader side.
+
+    :param int start: logical position
+    :param int end: logical position, after the array, including any alignment padding
+    :param str typestr:
+    :param tuple[int] shape:
+    :return: array which references the shared memory
+    :rtype: numpy.ndarray
+    """
+    assert not self.is_writer
+    entry = [start, end, False]
+    with self.lock:
+      self.pending.append(entry)
+    return SharedMemRingBufferArray(ring_buffer=self, entry=entry, typestr=typestr, shape=shape).create_numpy_array()
+
+  def release(self, entry):
+    """
+    Called on the reader side, when the array is not used anymore.
+
+    :param list entry: [start, end, released], from get_array
+    """
+    with self.lock:
+      entry[2] = True
+      read_pos = None
+      while self.pending and self.pending[0][2]:
+        read_pos = self.pending.popleft()[1]
+      if read_pos is not None and self.mem.ptr:  # mem.ptr is unset when the memory was detached already
+        self._read_pos_ref.value = read_pos
+
+  def __repr__(self):
+    return "<%s is_writer=%r mem=%r>" % (self.__class__.__name__, self.is_writer, self.mem)
+
+
+class SharedMemRingBufferArray:
+  """
+  Reader side: the base object of a Numpy array which lives in a :class:`SharedMemRingBuffer`.
+  """
+
+  def __init__(self, ring_buffer, entry, typestr, shape):
+    """
+    :param SharedMemRingBuffer ring_buffer:
+    :param list entry: [start, end, released]
+    :param str typestr:
+    :param tuple[int] shape:
+    """
+    self.ring_buffer = ring_buffer
+    self.entry = entry
+    self.typestr = typestr
+    self.shape = tuple(shape)
+
+  @property
+  def __array_interface__(self):
+    return {
+      "data": (self.ring_buffer._get_data_ptr(self.entry[0]), False),
+      "shape": self.shape,
+      "strides": None,
+      "typestr": self.typestr,
+      "version": 3
+    }
+
+  def create_numpy_array(self):
+    a = numpy.asarray(self)
+    assert a.base is self
+    return a
+
+  def is_in_use(self):
+    return not self.entry[2]
+
+  def set_unused(self):
+    if self.is_in_use():
+      self.ring_buffer.release(self.entry)
+
+  def __del__(self):
+    self.set_unused()
+
+
+def shared_mem_ring_buffer_get_array(shmid, size, start, end, typestr, shape):
+  """
+  Used by the Unpickler for arrays which were pickled via a :class:`SharedMemRingBuffer`.
+
+  :param int shmid:
+  :param int size: size of the shared memory
+  :param int start:
+  :param int end:
+  :param str typestr:
+  :param tuple[int] shape:
+  :rtype: numpy.ndarray
+  """
+  if isinstance(typestr, bytes) and not isinstance(typestr, str):  # Python 2 pickle, Python 3 reader
+    typestr = typestr.decode("utf8")
+  ring_buffer = SharedMemRingBuffer.get_reader_instance(shmid=shmid, size=size)
+  return ring_buffer.get_array(start=start, end=end, typestr=typestr, shape=shape)
+
+
 def attrChain(base, *attribs, **kwargs):
   default = kwargs.get("default", None)
   obj = base
@@ -613,7 +947,7 @@ def numpy_set_unused(v):
   """
   if v is None: return
   assert isinstance(v, numpy.ndarray)
-  if isinstance(v.base, SharedNumpyArray):
+  if isinstance(v.base, (SharedNumpyArray, SharedMemRingBufferArray)):
     assert v.base.is_in_use()  # must not be called multiple times
     v.base.set_unused()
 
@@ -627,7 +961,7 @@ def numpy_copy_and_set_unused(v):
   In all other cases, we will also just return the object as it is and do nothing.
   """
   if isinstance(v, numpy.ndarray):
-    if isinstance(v.base, SharedNumpyArray):
+    if isinstance(v.base, (SharedNumpyArray, SharedMemRingBufferArray)):
       newv = v.copy(order="A")
       numpy_set_unused(v)
       return newv
@@ -669,6 +1003,10 @@ class Pickler(_BasePickler):
   """
 
   def __init__(self, *args, **kwargs):
+    """
+    :param SharedMemRingBuffer|None ring_buffer: if given, big Numpy arrays are transferred via this
+    """
+    self.ring_buffer = kwargs.pop("ring_buffer", None)
     if not "protocol" in kwargs:
       kwargs["protocol"] = pickle.HIGHEST_PROTOCOL
     _BasePickler.__init__(self, *args, **kwargs)
@@ -771,6 +1109,13 @@ class Pickler(_BasePickler):
         self.save(())
         self.write(pickle.REDUCE)
         return
+    if self.ring_buffer and obj.nbytes >= self.ring_buffer.min_array_size:
+      args = self.ring_buffer.write_array(obj)
+      if args is not None:
+        self.save(shared_mem_ring_buffer_get_array)
+        self.save(args)
+        self.write(pickle.REDUCE)
+        return
     # For some reason, Numpy fromstring/tostring is faster than Numpy loads/dumps.
     self.save(make_numpy_ndarray_fromstring)
     self.save((obj.tostring(), str(obj.dtype), obj.shape))
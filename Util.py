@@ -2189,6 +2189,11 @@ class NativeCodeCompiler(object):
 
   CacheDirName = "returnn_native"
   CollectedCompilers = None  # type: None|list[NativeCodeCompiler]
+  # Optional read-only cache dir, e.g. on a shared file system, which is checked before we compile ourselves.
+  # It has the same structure as the local cache dir. Fill it via ``tools/compile_native_op.py --shared_cache_dir``.
+  SharedCacheDir = os.environ.get("RETURNN_NATIVE_CODE_SHARED_CACHE_DIR") or None  # type: str|None
+  # If True, we copy all libs which we compiled or found locally into the shared cache dir.
+  SharedCachePublish = False
 
   def __init__(self, base_name, code_version, code,
                is_cpp=True, c_macro_defines=None, ld_flags=None,
@@ -2229,6 +2234,7 @@ class NativeCodeCompiler(object):
     self._info_dict = self._make_info_dict()
     self._hash = self._make_hash()
     self._ctypes_lib = None
+    self._use_shared_cache = False
     if should_cleanup_old_all:
       self._cleanup_old()
     self._should_cleanup_old_mydir = should_cleanup_old_mydir
@@ -2239,9 +2245,17 @@ class NativeCodeCompiler(object):
   def __repr__(self):
     return "<%s %r in %r>" % (self.__class__.__name__, self.base_name, self._mod_path)
 
+  def _get_mod_path(self, cache_dir):
+    """
+    :param str cache_dir:
+    :return: e.g. cache_dir/base_name/hash
+    :rtype: str
+    """
+    return "%s/%s/%s" % (cache_dir, self.base_name, self.static_version_name or self._hash[:10])
+
   @property
   def _mod_path(self):
-    return "%s/%s/%s" % (self.cache_dir, self.base_name, self.static_version_name or self._hash[:10])
+    return self._get_mod_path(self.cache_dir)
 
   @property
   def _info_filename(self):
@@ -2364,18 +2378,89 @@ class NativeCodeCompiler(object):
     """
     On successful return, self._so_filename should exist and be up-to-date.
     """
+    start_time = time.time()
     if not self._need_recompile():
       if self.verbose:
         print("%s: No need to recompile: %s" % (self.__class__.__name__, self._so_filename))
-      # Touch it so that we can see that we used it recently.
-      os.utime(self._info_filename, None)
+      if not self._use_shared_cache:  # the shared cache is read-only
+        # Touch it so that we can see that we used it recently.
+        os.utime(self._info_filename, None)
+      if self.verbose:
+        print("%s: Using cached %r (%.3f sec)." % (self.__class__.__name__, self.base_name, time.time() - start_time))
+    elif self._maybe_use_shared_cache():
+      if self.verbose:
+        print("%s: Using shared cached %r: %s (%.3f sec)." % (
+          self.__class__.__name__, self.base_name, self._mod_path, time.time() - start_time))
+      return
+    else:
+      lock = LockFile(self._mod_path)
+      if self._should_cleanup_old_mydir and not lock.is_locked():
+        if os.path.exists(self._mod_path):
+          self._cleanup_old_path(self._mod_path, reason="need recompile")
+      with lock:
+        self._maybe_compile_inner()
+      print("%s: Compiled %r in %.3f sec." % (self.__class__.__name__, self.base_name, time.time() - start_time))
+    if self.SharedCachePublish:
+      self._maybe_publish_to_shared_cache()
+
+  def _get_shared_cache_dir(self):
+    """
+    :return: shared cache dir for this compiler class, if configured
+    :rtype: str|None
+    """
+    if not self.SharedCacheDir:
+      return None
+    return "%s/%s" % (self.SharedCacheDir, self.CacheDirName)
+
+  def _maybe_use_shared_cache(self):
+    """
+    If the shared cache dir has an up-to-date lib, we switch over to use it (read-only).
+
+    :return: whether we switched to the shared cache dir
+    :rtype: bool
+    """
+    shared_cache_dir = self._get_shared_cache_dir()
+    if not shared_cache_dir or shared_cache_dir == self.cache_dir:
+      return False
+    local_cache_dir = self.cache_dir
+    self.cache_dir = shared_cache_dir
+    if not self._need_recompile():
+      self._use_shared_cache = True
+      return True
+    self.cache_dir = local_cache_dir
+    return False
+
+  def _maybe_publish_to_shared_cache(self):
+    """
+    Copies our compiled lib dir into the shared cache dir, if it is not there yet.
+    We copy into a temporary dir first, which we then rename,
+    such that other processes never see an incomplete dir.
+    """
+    shared_cache_dir = self._get_shared_cache_dir()
+    assert shared_cache_dir
+    shared_mod_path = self._get_mod_path(shared_cache_dir)
+    if shared_mod_path == self._mod_path or os.path.exists(shared_mod_path):
+      return
+    import shutil
+    import tempfile
+    try:
+      os.makedirs(os.path.dirname(shared_mod_path))
+    except OSError:
+      pass  # Ignore any errors, e.g. if it exists already.
+    tmp_path = tempfile.mkdtemp(
+      prefix=".tmp-%s-" % os.path.basename(shared_mod_path), dir=os.path.dirname(shared_mod_path))
+    for fn in os.listdir(self._mod_path):
+      if fn == LockFile(self._mod_path).name:
+        continue
+      shutil.copy2("%s/%s" % (self._mod_path, fn), "%s/%s" % (tmp_path, fn))
+    os.chmod(tmp_path, 0o755)  # mkdtemp creates it private, but others should be able to read it
+    try:
+      os.rename(tmp_path, shared_mod_path)
+    except OSError:
+      # Most likely, some other process published it in the meantime.
+      shutil.rmtree(tmp_path, ignore_errors=True)
       return
-    lock = LockFile(self._mod_path)
-    if self._should_cleanup_old_mydir and not lock.is_locked():
-      if os.path.exists(self._mod_path):
-        self._cleanup_old_path(self._mod_path, reason="need recompile")
-    with lock:
-      self._maybe_compile_inner()
+    print("%s: Published %r to shared cache: %s" % (self.__class__.__name__, self.base_name, shared_mod_path))
 
   def _get_compiler_bin(self):
     if self.is_cpp:
@@ -2590,6 +2675,34 @@ class Stats:
     self.mean_sq += delta_sq / new_total_data_len
     self.total_data_len = new_total_data_len
 
+  def merge(self, other):
+    """
+    Merges the stats of another instance into this one,
+    e.g. when the stats were collected in parallel over different parts of the data.
+    Uses the pairwise update of Chan et al., like :func:`collect`.
+
+    :param Stats other:
+    """
+    import numpy
+    if other.num_seqs == 0:
+      return
+    if self.num_seqs == 0:
+      self.mean, self.mean_sq, self.var = other.mean, other.mean_sq, other.var
+      self.min, self.max = other.min, other.max
+      self.total_data_len, self.num_seqs = other.total_data_len, other.num_seqs
+      return
+    n_a, n_b = self.total_data_len, other.total_data_len
+    n = n_a + n_b
+    mean_diff = other.mean - self.mean
+    m2 = self.var * n_a + other.var * n_b + mean_diff ** 2 * n_a * n_b / n
+    self.var = m2 / n
+    self.mean = self.mean + mean_diff * n_b / n
+    self.mean_sq = (self.mean_sq * n_a + other.mean_sq * n_b) / n
+    self.min = numpy.minimum(self.min, other.min)
+    self.max = numpy.maximum(self.max, other.max)
+    self.total_data_len = n
+    self.num_seqs += other.num_seqs
+
   def get_mean(self):
     """
     :return: mean, shape (dim,)
@@ -45,11 +45,21 @@ GeForce GTX 680:
     CPU:LSTMBlock: 0:03:51.9667
     CPU:StandardLSTM: 0:03:56.6404
     CPU:BasicLSTM: 0:03:58.1545
+
+On CPU, NativeLstm2 runs the batch in parallel chunks on the TF intra-op thread pool.
+To see how the implementations scale with the number of CPU cores, use e.g.::
+
+  demo-tf-lstm-benchmark.py --no-gpu --cpu-threads 1,4,16 --selected BasicLSTM,LSTMBlock,NativeLstm2
+
+Every thread setting runs in its own subprocess, as the TF thread pools can only be setup once per process.
 """
 
 import sys
 import os
 import time
+import json
+import subprocess
+import tempfile
 from argparse import ArgumentParser
 from pprint import pprint
 
@@ -152,6 +162,30 @@ def benchmark(lstm_unit, use_gpu):
   return runtime
 
 
+def benchmark_cpu_in_subprocess(num_threads, lstm_units):
+  """
+  :param int num_threads: for the TF thread pools
+  :param list[str] lstm_units: e.g. ["LSTMBlock", "NativeLstm2"]
+  :return: key -> runtime in seconds, like benchmarks in main()
+  :rtype: dict[str,float]
+  """
+  fd, results_file = tempfile.mkstemp(prefix="returnn-lstm-benchmark", suffix=".json")
+  os.close(fd)
+  cmd = [sys.executable, os.path.abspath(__file__)]
+  cmd += ["%s=%s" % (key, value) for (key, value) in sorted(base_settings.items())]
+  cmd += [
+    "--no-gpu", "--cpu-threads", str(num_threads), "--selected", ",".join(lstm_units),
+    "--results-file", results_file]
+  print(">>> Run: %s" % " ".join(cmd))
+  # Also restrict the BLAS lib (used by the native ops) to the same number of threads.
+  env = dict(os.environ, OMP_NUM_THREADS=str(num_threads), OPENBLAS_NUM_THREADS=str(num_threads))
+  subprocess.check_call(cmd, env=env)
+  with open(results_file) as f:
+    results = json.load(f)
+  os.remove(results_file)
+  return results
+
+
 def main():
   global LstmCellTypes
   print("Benchmarking LSTMs.")
@@ -163,6 +197,9 @@ def main():
   arg_parser.add_argument("--no-gpu", action="store_true")
   arg_parser.add_argument("--selected", help="comma-separated list from %r" % LstmCellTypes)
   arg_parser.add_argument("--no-setup-tf-thread-pools", action="store_true")
+  arg_parser.add_argument(
+    "--cpu-threads", help="comma-separated list of number of threads for the CPU benchmarks, e.g. '1,4,16'")
+  arg_parser.add_argument("--results-file", help="if given, will write the results as JSON to this file")
   args = arg_parser.parse_args()
   for opt in args.cfg:
     key, value = opt.split("=", 1)
@@ -176,8 +213,11 @@ def main():
   print("Returnn:", describe_crnn_version(), file=log.v3)
   print("TensorFlow:", describe_tensorflow_version(), file=log.v3)
   print("Python:", sys.version.replace("\n", ""), sys.platform)
-  if not args.no_setup_tf_thread_pools:
-    setup_tf_thread_pools(log_file=log.v2)
+  cpu_threads = [int(n) for n in args.cpu_threads.split(",")] if args.cpu_threads else []
+  if len(cpu_threads) > 1:
+    print("CPU benchmarks with num threads %r, each in a subprocess." % cpu_threads)
+  elif not args.no_setup_tf_thread_pools:
+    setup_tf_thread_pools(num_threads=cpu_threads[0] if cpu_threads else None, log_file=log.v2)
   else:
     print("Not setting up the TF thread pools. Will be done automatically by TF to number of CPU cores.")
   if args.no_gpu:
@@ -192,11 +232,21 @@ def main():
   if not args.no_gpu and is_gpu_available():
     for lstm_unit in LstmCellTypes:
       benchmarks["GPU:" + lstm_unit] = benchmark(lstm_unit=lstm_unit, use_gpu=True)
-  if not args.no_cpu:
+  if not args.no_cpu and len(cpu_threads) > 1:
+    for num_threads in cpu_threads:
+      benchmarks.update(benchmark_cpu_in_subprocess(
+        num_threads=num_threads, lstm_units=[u for u in LstmCellTypes if u not in GpuOnlyCellTypes]))
+  elif not args.no_cpu:
     for lstm_unit in LstmCellTypes:
       if lstm_unit in GpuOnlyCellTypes:
         continue
-      benchmarks["CPU:" + lstm_unit] = benchmark(lstm_unit=lstm_unit, use_gpu=False)
+      key = "CPU:" + lstm_unit
+      if cpu_threads:
+        key = "CPU(%i threads):%s" % (cpu_threads[0], lstm_unit)
+      benchmarks[key] = benchmark(lstm_unit=lstm_unit, use_gpu=False)
+  if args.results_file:
+    with open(args.results_file, "w") as f:
+      json.dump(benchmarks, f)
 
   print("-" * 20)
   print("Settings:")
@@ -104,6 +104,9 @@ def initConfig(configFilename=None, commandLineOptions=(), extra_updates=None):
   if config.bool("EnableAutoNumpySharedMemPickling", False):
     import TaskSystem
     TaskSystem.SharedMemNumpyConfig["enabled"] = True
+  if config.value("native_code_shared_cache_dir", None):
+    from Util import NativeCodeCompiler
+    NativeCodeCompiler.SharedCacheDir = config.value("native_code_shared_cache_dir", None)
   # Server default options
   if config.value('task', 'train') == 'server':
     config.set('num_inputs', 2)
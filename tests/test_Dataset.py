@@ -6,10 +6,11 @@ from __future__ import print_function
 import sys
 sys.path += ["."]  # Python 3 hack
 
-from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false
+from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false, assert_raises
 from GeneratingDataset import GeneratingDataset, DummyDataset, DummyDatasetMultipleSequenceLength
 from EngineBatch import Batch
 from Dataset import DatasetSeq
+from CachedDataset import CachedDataset
 from Util import NumbersDict
 import numpy as np
 
@@ -323,3 +324,345 @@ def test_task12ax_window():
   assert_equal(list(data2a[1, 1]), list(data1[1]))
   assert_equal(list(data2a[1, 2]), list(data1[2]))
   assert_equal(list(data2a[-1, 2]), [0] * input_dim)  # zero-padded right
+
+
+def test_get_seq_order_for_epoch_seq_lens():
+  from Dataset import Dataset
+  rnd = np.random.RandomState(42)
+  seq_lens = rnd.randint(1, 20, size=(50,)).astype("int32")  # has duplicates, to check the stable sorting
+  for seq_ordering in ["sorted", "sorted_reverse", "laplace:5"]:
+    dataset = Dataset(seq_ordering=seq_ordering)
+    order_ref = dataset.get_seq_order_for_epoch(
+      epoch=1, num_seqs=len(seq_lens), get_seq_len=lambda i: seq_lens[i])
+    order = dataset.get_seq_order_for_epoch(epoch=1, num_seqs=len(seq_lens), seq_lens=seq_lens)
+    assert_equal(list(order), list(order_ref))
+
+
+def test_MetaDataset_load_seq_lens_npz():
+  import tempfile
+  import json
+  import os
+  from MetaDataset import load_seq_lens, save_seq_lens
+  seq_list = ["seq-%i" % i for i in range(5)]
+  seq_lens_json = {tag: {"data": 10 + i, "classes": 3 + i} for (i, tag) in enumerate(seq_list)}
+  tmp_dir = tempfile.mkdtemp()
+  json_filename = os.path.join(tmp_dir, "seq_lens.json")
+  npz_filename = os.path.join(tmp_dir, "seq_lens.npz")
+  with open(json_filename, "w") as f:
+    json.dump(seq_lens_json, f)
+  seq_lens = load_seq_lens(filename=json_filename, seq_list=seq_list[::-1])
+  assert_equal(sorted(seq_lens.keys()), ["classes", "data"])
+  assert_equal(list(seq_lens["data"]), [14, 13, 12, 11, 10])
+  save_seq_lens(filename=npz_filename, seq_lens=seq_lens, seq_list=seq_list[::-1])
+  seq_lens_ = load_seq_lens(filename=npz_filename, seq_list=seq_list[::-1])
+  assert_equal(sorted(seq_lens_.keys()), ["classes", "data"])
+  for key in seq_lens.keys():
+    assert_equal(seq_lens_[key].dtype, np.int32)
+    assert_equal(list(seq_lens_[key]), list(seq_lens[key]))
+  # Another order of the seq list.
+  assert_raises(Exception, load_seq_lens, filename=npz_filename, seq_list=seq_list)
+  # Without the seq list hash.
+  np.savez(npz_filename, **seq_lens)
+  assert_raises(Exception, load_seq_lens, filename=npz_filename, seq_list=seq_list[::-1])
+
+
+def test_SubDatasetsLoader_parallel():
+  from MetaDataset import SubDatasetsLoader
+  datasets = {
+    key: DummyDataset(input_dim=2 + i, output_dim=3, num_seqs=10, seq_len=5 + i)
+    for (i, key) in enumerate(["a", "b", "c"])}
+  for dataset in datasets.values():
+    dataset.init_seq_order(epoch=1)
+  loader = SubDatasetsLoader(name="test", parallel=True)
+  loader.load_seqs([(key, datasets[key], 2, 5) for key in sorted(datasets.keys())])
+  assert_equal(loader.num_calls, 1)
+  assert_equal(sorted(loader.load_times.keys()), ["a", "b", "c"])
+  for i, key in enumerate(sorted(datasets.keys())):
+    assert_equal(datasets[key].get_data(4, "data").shape, (5 + i, 2 + i))
+  loader.print_stats_and_reset()
+  assert_equal(loader.num_calls, 0)
+  assert_equal(loader.load_times, {})
+
+
+def test_SubDatasetsLoader_parallel_exception():
+  from MetaDataset import SubDatasetsLoader
+  dataset = DummyDataset(input_dim=2, output_dim=3, num_seqs=10)
+  dataset.init_seq_order(epoch=1)
+
+  class _BrokenDataset(DummyDataset):
+    def load_seqs(self, start, end):
+      raise ValueError("broken")
+
+  broken_dataset = _BrokenDataset(input_dim=2, output_dim=3, num_seqs=10)
+  loader = SubDatasetsLoader(name="test", parallel=True)
+  try:
+    loader.load_seqs([("a", dataset, 0, 2), ("b", broken_dataset, 0, 2)])
+  except ValueError as exc:
+    assert_equal(str(exc), "broken")
+  else:
+    assert False, "expected exception"
+
+
+def test_CachedDataset2_prefetch():
+  from CachedDataset2 import CachedDataset2
+  import time
+
+  class _Dataset(CachedDataset2):
+    def __init__(self, **kwargs):
+      super(_Dataset, self).__init__(**kwargs)
+      self.num_inputs = 3
+      self.num_outputs = {"data": (3, 2), "classes": (5, 1)}
+      self.collected_seq_idxs = []
+
+    def _collect_single_seq(self, seq_idx):
+      if seq_idx >= 17:
+        return None
+      self.collected_seq_idxs.append(seq_idx)
+      time.sleep(0.001)
+      rnd = np.random.RandomState(seq_idx + self.epoch * 100)
+      seq_len = 3 + seq_idx % 5
+      return DatasetSeq(
+        seq_idx=seq_idx,
+        features=rnd.normal(size=(seq_len, 3)).astype("float32"),
+        targets={"classes": rnd.randint(5, size=(seq_len,)).astype("int32")})
+
+  def collect(dataset, epoch):
+    dataset.init_seq_order(epoch=epoch)
+    res = []
+    seq_idx = 0
+    while dataset.is_less_than_num_seqs(seq_idx):
+      dataset.load_seqs(seq_idx, seq_idx + 2)
+      if dataset._prefetcher:
+        assert dataset._prefetcher.next_seq_idx - dataset._prefetcher.taken_seq_idx_end <= 4
+      res.append((dataset.get_data(seq_idx, "data"), dataset.get_data(seq_idx, "classes")))
+      seq_idx += 1
+    assert_equal(dataset.num_seqs, 17)
+    return res
+
+  ref_dataset = _Dataset()
+  dataset = _Dataset(prefetch_num_seqs=4)
+  for epoch in [1, 2]:
+    ref = collect(ref_dataset, epoch=epoch)
+    res = collect(dataset, epoch=epoch)
+    assert_equal(len(res), len(ref))
+    for (ref_x, ref_y), (x, y) in zip(ref, res):
+      assert np.array_equal(ref_x, x)
+      assert np.array_equal(ref_y, y)
+  assert_equal(dataset.collected_seq_idxs, list(range(17)) * 2)
+
+
+class _CorpusCachedDataset(CachedDataset):
+  """
+  Like HDFDataset, but the corpus is generated (deterministic per real seq idx).
+  """
+
+  def __init__(self, num_seqs=20, **kwargs):
+    super(_CorpusCachedDataset, self).__init__(**kwargs)
+    self.num_inputs = 3
+    self.num_outputs = {"data": (3, 2), "classes": (5, 1)}
+    self.target_keys = ["classes"]
+    self._num_seqs = num_seqs
+    seq_lens = [5 + (i * 7) % 11 for i in range(num_seqs)]
+    self._seq_lengths = np.array([[l, l] for l in seq_lens])
+    self._seq_start = [np.zeros((2,), "int64")]
+    self._num_timesteps = sum(seq_lens)
+    self._tags = ["seq-%i" % i for i in range(num_seqs)]
+    self.targets = {"classes": None}  # see _alloc_targets
+    self.num_loaded_seqs = 0
+
+  def _get_targets_shape_dtype(self, key):
+    assert key == "classes"
+    return (self._num_timesteps,), "int32"
+
+  @staticmethod
+  def get_corpus_data(real_idx, seq_len):
+    rnd = np.random.RandomState(real_idx)
+    return rnd.normal(size=(seq_len, 3)).astype("float32"), rnd.randint(5, size=(seq_len,)).astype("int32")
+
+  def _load_seqs(self, start, end):
+    for idc in self._get_uncached_seqs(start, end):
+      real_idx = self._seq_index[self._index_map[idc]]
+      seq_len = self._seq_lengths[real_idx][0]
+      data, targets = self.get_corpus_data(real_idx, seq_len)
+      q = self.get_real_seq_start(real_idx)
+      if self.targets["classes"] is None:
+        self.targets["classes"] = self._alloc_targets("classes")
+      self.targets["classes"][q[1]:q[1] + seq_len] = targets
+      self._set_cached_seq_data(idc, data)
+      self.num_loaded_seqs += 1
+
+  def get_tag(self, sorted_seq_idx):
+    return self._tags[self._seq_index[self._index_map[sorted_seq_idx]]]
+
+
+def test_CachedDataset_lru_cache():
+  bytes_per_seq = 15 * 3 * 4  # max seq len 15
+  dataset = _CorpusCachedDataset(seq_ordering="random", cache_byte_size=bytes_per_seq * 12)
+  dataset.initialize()
+  num_loaded = []
+  num_loaded_before = 0  # count at the end of the epoch, where the background preloading is finished
+  for epoch in [1, 2, 3]:
+    dataset.init_seq_order(epoch=epoch)
+    for seq_idx in range(dataset.num_seqs):
+      dataset.load_seqs(seq_idx, seq_idx + 1)
+      real_idx = dataset._seq_index[seq_idx]
+      data_ref, targets_ref = dataset.get_corpus_data(real_idx, dataset.get_seq_length(seq_idx)["data"])
+      assert np.array_equal(dataset.get_data(seq_idx, "data"), data_ref)
+      assert np.array_equal(dataset.get_data(seq_idx, "classes"), targets_ref)
+      assert dataset._lru_cache_bytes <= dataset.cache_byte_size_total_limit
+    num_loaded.append(dataset.num_loaded_seqs - num_loaded_before)
+    num_loaded_before = dataset.num_loaded_seqs
+  assert_equal(num_loaded[0], dataset.num_seqs)
+  for n in num_loaded[1:]:
+    assert 0 < n < dataset.num_seqs, "num loaded seqs per epoch %r" % (num_loaded,)  # cache hits, no full flush
+
+
+def test_CachedDataset_unlimited_cache():
+  dataset = _CorpusCachedDataset(seq_ordering="random", cache_byte_size=-1)
+  dataset.initialize()
+  for epoch in [1, 2]:
+    dataset.init_seq_order(epoch=epoch)
+    dataset.load_seqs(0, dataset.num_seqs)
+  assert_equal(dataset.num_loaded_seqs, dataset.num_seqs)
+
+
+def test_CachedDataset_shuffle_frames():
+  dataset = _CorpusCachedDataset(shuffle_frames_of_nseqs=2, cache_byte_size=-1)
+  dataset.initialize()
+  dataset.init_seq_order(epoch=1)
+  dataset.load_seqs(0, 2)
+  pairs = []
+  pairs_ref = []
+  for seq_idx in range(2):
+    data_ref, targets_ref = dataset.get_corpus_data(seq_idx, dataset.get_seq_length(seq_idx)["data"])
+    pairs_ref += [(tuple(x), y) for (x, y) in zip(data_ref, targets_ref)]
+    pairs += [(tuple(x), y) for (x, y) in zip(dataset.get_data(seq_idx, "data"), dataset.get_data(seq_idx, "classes"))]
+  assert_equal(sorted(pairs), sorted(pairs_ref))
+  assert pairs != pairs_ref
+
+
+def test_CachedDataset_shuffle_frames_reference():
+  num_seqs_per_shuffle = 2
+  dataset = _CorpusCachedDataset(
+    seq_ordering="random", shuffle_frames_of_nseqs=num_seqs_per_shuffle, cache_byte_size=-1)
+  dataset.initialize()
+  dataset.init_seq_order(epoch=1)
+  dataset.load_seqs(0, dataset.num_seqs)
+  for start in range(0, dataset.num_seqs, num_seqs_per_shuffle):
+    seq_idxs = list(range(start, start + num_seqs_per_shuffle))
+    real_idxs = [dataset._seq_index[dataset._index_map[i]] for i in seq_idxs]
+    seq_lens = [dataset.get_seq_length(i)["data"] for i in seq_idxs]
+    corpus = [dataset.get_corpus_data(real_idx, seq_len) for (real_idx, seq_len) in zip(real_idxs, seq_lens)]
+    perm = np.random.RandomState(start).permutation(sum(seq_lens))
+    data_ref = np.concatenate([data for (data, _) in corpus])[perm]
+    targets_ref = np.concatenate([targets for (_, targets) in corpus])[perm]
+    data = np.concatenate([dataset.get_data(i, "data") for i in seq_idxs])
+    targets = np.concatenate([dataset.get_data(i, "classes") for i in seq_idxs])
+    assert np.array_equal(data, data_ref)
+    assert np.array_equal(targets, targets_ref)
+  # The seqs of a shuffle are not next to each other in the targets (placed by real seq idx).
+  assert any(
+    abs(dataset._seq_index[dataset._index_map[i]] - dataset._seq_index[dataset._index_map[i + 1]]) > 1
+    for i in range(0, dataset.num_seqs, num_seqs_per_shuffle))
+
+
+def test_CachedDataset_shared_cache():
+  import os
+
+  class _SharedCorpusCachedDataset(_CorpusCachedDataset):
+    is_creator = True
+
+    def _is_shared_cache_creator(self):
+      return self.is_creator
+
+  key = "test-shared-cache-%i" % os.getpid()
+  dataset1 = _SharedCorpusCachedDataset(shared_cache=True, shared_cache_key=key, cache_byte_size=0)
+  dataset1.initialize()
+  dataset2 = _SharedCorpusCachedDataset(shared_cache=True, shared_cache_key=key, cache_byte_size=0)
+  dataset2.is_creator = False
+  dataset2.initialize()
+  for dataset in [dataset1, dataset2]:
+    dataset.init_seq_order(epoch=1)
+  num_loaded = dataset1.num_loaded_seqs + dataset2.num_loaded_seqs
+  dataset1.load_seqs(0, 10)
+  dataset2.load_seqs(5, 20)
+  dataset1.load_seqs(10, 20)
+  assert_equal(dataset1.num_loaded_seqs + dataset2.num_loaded_seqs - num_loaded, dataset1.num_seqs)
+  for seq_idx in range(dataset1.num_seqs):
+    data_ref, targets_ref = dataset1.get_corpus_data(seq_idx, dataset1.get_seq_length(seq_idx)["data"])
+    for dataset in [dataset1, dataset2]:
+      data = dataset.get_data(seq_idx, "data")
+      assert np.array_equal(data, data_ref)
+      assert not data.flags.writeable
+      assert np.array_equal(dataset.get_data(seq_idx, "classes"), targets_ref)
+  dataset2._shared_cache_mem.remove()
+  dataset1._shared_cache_mem.remove()
+
+
+def test_collect_dataset_statistics_parallel():
+  from Dataset import collect_dataset_statistics
+  dataset_opts = {"class": "DummyDataset", "input_dim": 3, "output_dim": 7, "num_seqs": 23, "seq_len": 5}
+  stats = collect_dataset_statistics(dataset_opts, num_workers=3)
+  dataset = DummyDataset(input_dim=3, output_dim=7, num_seqs=23, seq_len=5)
+  dataset.init_seq_order(epoch=1)
+  dataset.load_seqs(0, 23)
+  data = np.concatenate([dataset.get_data(i, "data") for i in range(23)])
+  classes = np.concatenate([dataset.get_data(i, "classes") for i in range(23)])
+  assert_equal(stats.num_seqs, 23)
+  assert_equal(stats.dense_stats["data"].total_data_len, 23 * 5)
+  assert np.allclose(stats.dense_stats["data"].get_mean(), np.mean(data, axis=0))
+  assert np.allclose(stats.dense_stats["data"].get_std_dev(), np.std(data, axis=0))
+  assert_equal(stats.class_counts["classes"].tolist(), np.bincount(classes, minlength=7).tolist())
+  assert_equal(stats.seq_len_counts["data"].tolist(), [0] * 5 + [23])
+  assert np.allclose(stats.get_priors("classes"), np.bincount(classes, minlength=7) / float(len(classes)))
+
+
+def test_CachedDataset_calculate_priori_float_targets():
+  class _FloatTargetsCorpusCachedDataset(_CorpusCachedDataset):
+    """
+    Sparse targets stored as float, like in HDFDataset.
+    """
+    def _get_targets_shape_dtype(self, key):
+      assert key == "classes"
+      return (self._num_timesteps,), "float32"
+
+  dataset = _FloatTargetsCorpusCachedDataset(cache_byte_size=-1)
+  dataset.initialize()
+  dataset.init_seq_order(epoch=1)
+  priori = dataset.calculate_priori()
+  classes = np.concatenate([
+    _CorpusCachedDataset.get_corpus_data(i, dataset._seq_lengths[i][0])[1] for i in range(dataset.num_seqs)])
+  assert_equal(priori.shape, (5,))
+  assert np.allclose(priori, np.bincount(classes, minlength=5) / float(len(classes)))
+
+
+def test_CachedDataset_lazy_window():
+  dataset = _CorpusCachedDataset(window=5, cache_byte_size=-1)
+  dataset.initialize()
+  dataset_lazy = _CorpusCachedDataset(window=5, lazy_window=True, cache_byte_size=-1)
+  dataset_lazy.initialize()
+  assert_equal(dataset.nbytes, 4 * (3 * 5 + 2))
+  assert_equal(dataset_lazy.nbytes, 4 * (3 + 2))
+  for d in [dataset, dataset_lazy]:
+    d.init_seq_order(epoch=1)
+    d.load_seqs(0, 20)
+  assert_equal(dataset_lazy._get_cached_input_data(0).shape, (dataset.get_seq_length(0)["data"], 3))
+  for seq_idx in range(20):
+    data = dataset.get_data(seq_idx, "data")
+    assert_equal(data.shape, (dataset.get_seq_length(seq_idx)["data"], 15))
+    assert np.array_equal(dataset_lazy.get_data(seq_idx, "data"), data)
+    for start_frame, end_frame in [(0, 1), (1, 4), (3, data.shape[0]), (data.shape[0] - 1, data.shape[0])]:
+      data_slice = dataset_lazy.get_data_slice(seq_idx, "data", start_frame, end_frame)
+      assert np.array_equal(data_slice, data[start_frame:end_frame])
+
+
+def test_lazy_window_not_supported():
+  # E.g. via the global config option. DummyDataset (GeneratingDataset) constructs the windows itself.
+  dataset = DummyDataset(input_dim=3, output_dim=4, num_seqs=2, window=5, lazy_window=True)
+  dataset.initialize()
+  assert_false(dataset.lazy_window)
+  assert_equal(dataset.nbytes, 4 * (3 * 5 + 2))
+
+
+def test_CachedDataset_lazy_window_shuffle_frames():
+  assert_raises(AssertionError, _CorpusCachedDataset, window=5, lazy_window=True, shuffle_frames_of_nseqs=2)
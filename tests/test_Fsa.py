@@ -13,6 +13,7 @@ import unittest
 import time
 import numpy
 import tensorflow as tf
+from nose.tools import assert_equal
 
 print("TF version:", tf.__version__)
 
@@ -23,7 +24,6 @@ sys.path.insert(0, base_path)
 
 # Returnn imports
 import Fsa
-from TFUtil import is_gpu_available
 
 
 class Lexicon:
@@ -335,8 +335,6 @@ def check_fast_bw_fsa_staircase(num_classes, out_seq_len, with_loop):
   assert is_close
 
 
-# Note: we could replace tf_baum_welch by some CPU/Python code...
-@unittest.skipIf(not is_gpu_available(), "no gpu on this system; needed for tf_baum_welch")
 def test_fast_bw_fsa_staircase():
   check_fast_bw_fsa_staircase(2, 2, with_loop=False)
   check_fast_bw_fsa_staircase(2, 2, with_loop=True)
@@ -346,6 +344,75 @@ def test_fast_bw_fsa_staircase():
   check_fast_bw_fsa_staircase(3, 3, with_loop=True)
 
 
+def test_fast_bw_fsa_staircase_batch():
+  fsa = Fsa.fast_bw_fsa_staircase(seq_lens=[3, 1, 2], with_loop=True)
+  assert fsa.num_batch == 3
+  numpy.testing.assert_array_equal(fsa.start_end_states, [[0, 4, 6], [3, 5, 8]])
+  for batch, (start, end) in enumerate(fsa.start_end_states.T):
+    batch_edges = fsa.edges[:, fsa.edges[3] == batch]
+    assert batch_edges.shape[1] > 0
+    assert (batch_edges[:2] >= start).all() and (batch_edges[:2] <= end).all()
+  # Same seq len again should give the same edges, just offset.
+  fsa2 = Fsa.fast_bw_fsa_staircase(seq_lens=[1, 3], with_loop=True)
+  numpy.testing.assert_array_equal(fsa2.edges[:3, fsa2.edges[3] == 1] - [[2], [2], [0]], fsa.edges[:3, fsa.edges[3] == 0])
+
+
+def test_FastBwFsaShared_get_fast_bw_fsa():
+  shared = Fsa.FastBwFsaShared()
+  shared.add_edge(0, 1, emission_idx=0, weight=0.5)
+  shared.add_edge(1, 1, emission_idx=1)
+  shared.add_edge(1, 2, emission_idx=2, weight=1.5)
+  fsa = shared.get_fast_bw_fsa(n_batch=2)
+  numpy.testing.assert_array_equal(
+    fsa.edges, [[0, 1, 1, 3, 4, 4], [1, 1, 2, 4, 4, 5], [0, 1, 2, 0, 1, 2], [0, 0, 0, 1, 1, 1]])
+  numpy.testing.assert_array_equal(fsa.weights, [0.5, 0.0, 1.5, 0.5, 0.0, 1.5])
+  numpy.testing.assert_array_equal(fsa.start_end_states, [[0, 3], [2, 5]])
+
+
+def test_ctc_fsa_for_label_seq():
+  import itertools
+
+  def collapse(seq, blank):
+    res = []
+    prev = None
+    for x in seq:
+      if x != prev and x != blank:
+        res.append(x)
+      prev = x
+    return res
+
+  blank_idx = 3
+  for labels in [[], [1], [1, 1], [0, 1, 0], [2, 2, 1]]:
+    num_states, edges = Fsa.ctc_fsa_for_label_seq(num_labels=3, label_seq=labels)
+    for num_frames in range(1, 6):
+      expected = 0
+      accepted = 0
+      for emissions in itertools.product(range(blank_idx + 1), repeat=num_frames):
+        if collapse(emissions, blank=blank_idx) == labels:
+          expected += 1
+        states = {0: 1}  # state -> num paths
+        for emission in emissions:
+          new_states = {}
+          for from_state, to_state, edge_emission in edges.T:
+            if from_state in states and edge_emission == emission:
+              new_states[to_state] = new_states.get(to_state, 0) + states[from_state]
+          states = new_states
+        accepted += states.get(num_states - 1, 0)
+      assert_equal(accepted, expected)
+
+
+def test_fast_bw_fsa_ctc_cache():
+  cache = Fsa.make_fast_bw_fsa_ctc_cache(num_labels=5)
+  fsa = Fsa.fast_bw_fsa_ctc([[1, 2], [3], [1, 2]], num_labels=5, cache=cache)
+  assert_equal(len(cache._cache), 2)
+  assert fsa.num_batch == 3
+  num_states_0 = fsa.start_end_states[1, 0] + 1
+  numpy.testing.assert_array_equal(
+    fsa.edges[:3, fsa.edges[3] == 2] - [[fsa.start_end_states[0, 2]], [fsa.start_end_states[0, 2]], [0]],
+    fsa.edges[:3, fsa.edges[3] == 0])
+  assert_equal(fsa.start_end_states[0, 1], num_states_0)
+
+
 if __name__ == "__main__":
   import better_exchook
   better_exchook.install()
@@ -54,3 +54,78 @@ class TestHDFDataset(object):
     toy_dataset = self.test_init()
     # TODO: auto-generate file, then use here
     #toy_dataset.add_file("/u/kulikov/develop/crnn/tests/toy_set.hdf")
+
+
+def test_SegmentAlignmentStreamParser_read_data():
+  import h5py
+  import numpy
+  from HDFDataset import SegmentAlignmentStreamParser
+  f = h5py.File("segment_alignment.hdf", "w", driver="core", backing_store=False)
+  stream = f.create_group("streams/alignment")
+  stream.create_dataset("feature_names", data=numpy.array([b"a", b"b", b"c"]))
+  stream.create_dataset("data/seq-0", data=numpy.array([[2, 3], [0, 1], [1, 2]], dtype="int32"))
+  parser = SegmentAlignmentStreamParser(["seq-0"], stream)
+  assert_equal(parser.get_seq_length("seq-0"), 12)
+  alignment = parser.get_data("seq-0").reshape((-1, 2))
+  assert_equal(alignment[:, 0].tolist(), [2, 2, 2, 0, 1, 1])
+  assert_equal(alignment[:, 1].tolist(), [0, 0, 1, 1, 0, 1])
+  f.close()
+
+
+def _create_next_gen_hdf_file(filename, seq_lens, num_features=3, num_classes=5):
+  """
+  :param str filename:
+  :param list[int] seq_lens:
+  :param int num_features:
+  :param int num_classes:
+  """
+  import h5py
+  import numpy
+  rnd = numpy.random.RandomState(42)
+  seq_names = ["seq-%i" % i for i in range(len(seq_lens))]
+  f = h5py.File(filename, "w")
+  f.create_dataset("seq_names", data=numpy.array([name.encode("utf8") for name in seq_names]))
+  features = f.create_group("streams/features")
+  features.attrs["parser"] = "feature_sequence"
+  classes = f.create_group("streams/classes")
+  classes.attrs["parser"] = "sparse"
+  classes.create_dataset("feature_names", data=numpy.array([b"c%i" % i for i in range(num_classes)]))
+  for name, seq_len in zip(seq_names, seq_lens):
+    features.create_dataset("data/%s" % name, data=rnd.normal(size=(seq_len, num_features)).astype("float32"))
+    classes.create_dataset("data/%s" % name, data=rnd.randint(0, num_classes, size=(seq_len,)).astype("int32"))
+  f.close()
+
+
+def test_NextGenHDFDataset_num_reader_processes():
+  import tempfile
+  import numpy
+  from HDFDataset import NextGenHDFDataset
+  hdf_filename = tempfile.mktemp(suffix=".hdf", prefix="nose-next-gen-hdf")
+  _create_next_gen_hdf_file(hdf_filename, seq_lens=[3, 7, 2, 5, 4, 6, 1, 8])
+  try:
+    results = {}
+    for num_reader_processes in [0, 2]:
+      dataset = NextGenHDFDataset(
+        input_stream_name="features", files=[hdf_filename], seq_ordering="random",
+        num_reader_processes=num_reader_processes, reader_lookahead=3)
+      dataset.initialize()
+      dataset.init_seq_order(epoch=1)
+      seqs = {}
+      seq_idx = 0
+      while dataset.is_less_than_num_seqs(seq_idx):
+        if seq_idx == 2:
+          seq_idx += 2  # skip some seqs, which were already submitted to the reader processes
+          continue
+        dataset.load_seqs(seq_idx, seq_idx + 1)
+        seqs[dataset.get_tag(seq_idx)] = (dataset.get_data(seq_idx, "data"), dataset.get_data(seq_idx, "classes"))
+        seq_idx += 1
+      assert_equal(dataset._reader_pending, {})  # no stale results
+      dataset.close_reader_pool()
+      assert dataset._reader_pool is None
+      results[num_reader_processes] = seqs
+    assert_equal(sorted(results[0].keys()), sorted(results[2].keys()))
+    for tag, (features, classes) in results[0].items():
+      numpy.testing.assert_array_equal(results[2][tag][0], features)
+      numpy.testing.assert_array_equal(results[2][tag][1], classes)
+  finally:
+    os.remove(hdf_filename)
@@ -0,0 +1,108 @@
+
+import sys
+sys.path += ["."]  # Python 3 hack
+
+from nose.tools import assert_equal, assert_is_none, assert_is_not_none
+import numpy
+import tempfile
+import shutil
+from SprintErrorSignals import SprintInstancePool, SprintAutomataCache
+import better_exchook
+better_exchook.replace_traceback_format_tb()
+
+
+def _make_automaton(num_states, emission_offset=0):
+  """
+  :param int num_states:
+  :param int emission_offset:
+  :return: linear automaton: (num_states, edges, weights), like from Sprint
+  :rtype: (int,numpy.ndarray,numpy.ndarray)
+  """
+  num_edges = num_states - 1
+  edges = numpy.array([
+    numpy.arange(num_edges), numpy.arange(num_edges) + 1, numpy.arange(num_edges) + emission_offset],
+    dtype="uint32")  # (3, num_edges)
+  weights = numpy.arange(num_edges, dtype="float32") * 0.5
+  return num_states, edges, weights
+
+
+def test_join_automata():
+  automata = [_make_automaton(num_states=2, emission_offset=5), _make_automaton(num_states=3, emission_offset=2)]
+  edges, weights, start_end_states = SprintInstancePool._join_automata(automata)
+  assert_equal(edges.dtype, numpy.uint32)
+  assert_equal(edges.tolist(), [
+    [0, 2, 3],  # from, with state offset 2 for the 2nd seq
+    [1, 3, 4],  # to
+    [5, 2, 3],  # emission idx
+    [0, 1, 1]])  # seq idx
+  assert_equal(weights.tolist(), [0., 0., 0.5])
+  assert_equal(start_end_states.tolist(), [[0, 2], [1, 4]])
+
+
+def test_join_automata_empty():
+  edges, weights, start_end_states = SprintInstancePool._join_automata([])
+  assert_equal(edges.shape, (4, 0))
+  assert_equal(weights.shape, (0,))
+  assert_equal(start_end_states.shape, (2, 0))
+
+
+class _DummySprintInstancePool(SprintInstancePool):
+  """
+  Does not start Sprint, but creates some dummy automata, and records the requested segments.
+  """
+
+  def __init__(self, sprint_opts):
+    super(_DummySprintInstancePool, self).__init__(sprint_opts=sprint_opts)
+    self.requested_segment_names = []
+
+  def _get_automata_from_sprint(self, segment_names):
+    self.requested_segment_names.extend(segment_names)
+    return [_make_automaton(num_states=2 + len(name)) for name in segment_names]
+
+
+def test_get_automata_for_batch_cache():
+  cache_dir = tempfile.mkdtemp()
+  try:
+    sprint_opts = {"sprintExecPath": "dummy", "automataCacheDir": cache_dir, "automataCacheMaxInMemory": 10}
+    pool = _DummySprintInstancePool(sprint_opts=sprint_opts)
+    assert_is_not_none(pool.automata_cache)
+    res1 = pool.get_automata_for_batch(["a", "bb"])
+    assert_equal(pool.requested_segment_names, ["a", "bb"])
+    assert_equal((pool.automata_cache.num_hits, pool.automata_cache.num_misses), (0, 2))
+    # Same seqs: all from the cache.
+    res2 = pool.get_automata_for_batch(["a", "bb"])
+    assert_equal(pool.requested_segment_names, ["a", "bb"])
+    assert_equal((pool.automata_cache.num_hits, pool.automata_cache.num_misses), (2, 2))
+    for x1, x2 in zip(res1, res2):
+      assert_equal(x1.tolist(), x2.tolist())
+    # Other seq tags: only the new ones are requested.
+    pool.get_automata_for_batch(["bb", "ccc"])
+    assert_equal(pool.requested_segment_names, ["a", "bb", "ccc"])
+    assert_equal((pool.automata_cache.num_hits, pool.automata_cache.num_misses), (3, 3))
+    # New pool, same Sprint options: from the disk cache.
+    pool = _DummySprintInstancePool(sprint_opts=sprint_opts)
+    res3 = pool.get_automata_for_batch(["a", "bb"])
+    assert_equal(pool.requested_segment_names, [])
+    for x1, x3 in zip(res1, res3):
+      assert_equal(x1.tolist(), x3.tolist())
+    # Other Sprint options: all misses.
+    pool = _DummySprintInstancePool(sprint_opts=dict(sprint_opts, sprintConfigStr="--other"))
+    pool.get_automata_for_batch(["a", "bb"])
+    assert_equal(pool.requested_segment_names, ["a", "bb"])
+  finally:
+    shutil.rmtree(cache_dir)
+
+
+def test_SprintAutomataCache_in_memory_lru():
+  cache_dir = tempfile.mkdtemp()
+  try:
+    cache = SprintAutomataCache(cache_dir=cache_dir, sprint_opts={}, max_num_in_memory=2)
+    for name in ["a", "b", "c"]:
+      cache.add(name, *_make_automaton(num_states=3))
+    assert_equal(list(cache.in_memory.keys()), ["b", "c"])
+    assert_is_not_none(cache.get("a"))  # from disk, now most recently used in memory
+    assert_equal(list(cache.in_memory.keys()), ["c", "a"])
+    assert_is_none(cache.get("d"))
+    assert_equal((cache.num_hits, cache.num_misses), (1, 1))
+  finally:
+    shutil.rmtree(cache_dir)
@@ -521,9 +521,10 @@ def test_engine_rec_subnet_count():
   engine.finalize()
 
 
-def check_engine_search(extra_rec_kwargs=None):
+def check_engine_search(extra_rec_kwargs=None, output_file_format=None):
   """
   :param dict[str] extra_rec_kwargs:
+  :param str|None output_file_format: if given, will write the search output to a file
   """
   from Util import dict_joined
   from GeneratingDataset import DummyDataset
@@ -577,12 +578,63 @@ def check_engine_search(extra_rec_kwargs=None):
   print("Reinit network with search flag.")
   engine.init_network_from_config(config=config)
 
-  engine.search(dataset=dataset)
+  output_file = None
+  if output_file_format:
+    import tempfile
+    output_file = tempfile.mktemp(suffix="." + output_file_format, prefix="nose-tf-search")
+    dataset.labels["classes"] = ["label%i" % i for i in range(n_classes_dim)]
+  engine.search(dataset=dataset, output_file=output_file, output_file_format=output_file_format or "txt")
   print("error keys:")
   pprint(engine.network.losses_dict)
   assert engine.network.total_objective is not None
   assert "decision" in engine.network.losses_dict
 
+  if output_file:
+    output = open(output_file).read()
+    print("search output:")
+    print(output)
+    os.remove(output_file)
+    if output_file_format == "txt":
+      assert_equal(len(output.splitlines()), dataset.num_seqs)
+    else:
+      output = eval(output)
+      assert isinstance(output, dict)
+      assert_equal(set(output.keys()), {"seq-%i" % i for i in range(dataset.num_seqs)})
+
+  engine.finalize()
+
+
+def test_engine_get_seq_tags_in_default_order():
+  from GeneratingDataset import DummyDataset
+
+  class CountingDummyDataset(DummyDataset):
+    num_load_calls = 0
+    all_tags = None
+
+    def load_seqs(self, start, end):
+      self.num_load_calls += 1
+      super(CountingDummyDataset, self).load_seqs(start, end)
+
+    def get_all_tags(self):
+      if self.all_tags is None:
+        raise NotImplementedError
+      return self.all_tags
+
+  engine = Engine(config=Config())
+  dataset = CountingDummyDataset(input_dim=2, output_dim=3, num_seqs=4)
+  dataset.init_seq_order(epoch=1)
+  seq_tags = engine._get_seq_tags_in_default_order(dataset, epoch=1)
+  assert_equal(seq_tags, ["seq-%i" % i for i in range(4)])
+  num_load_calls = dataset.num_load_calls
+  assert num_load_calls > 0
+  # Cached.
+  assert_equal(engine._get_seq_tags_in_default_order(dataset, epoch=1), seq_tags)
+  assert_equal(dataset.num_load_calls, num_load_calls)
+  # From the seq list of the dataset, without a pass over the dataset.
+  dataset2 = CountingDummyDataset(input_dim=2, output_dim=3, num_seqs=4)
+  dataset2.all_tags = ["tag-%i" % i for i in range(4)]
+  assert_equal(engine._get_seq_tags_in_default_order(dataset2, epoch=1), dataset2.all_tags)
+  assert_equal(dataset2.num_load_calls, 0)
   engine.finalize()
 
 
@@ -590,10 +642,150 @@ def test_engine_search_no_optim():
   check_engine_search({"optimize_move_layers_out": False})
 
 
+def test_engine_search_output_file_txt():
+  check_engine_search(output_file_format="txt")
+
+
+def test_engine_search_output_file_py():
+  check_engine_search(output_file_format="py")
+
+
 def test_engine_search():
   check_engine_search()
 
 
+def test_engine_search_network_graph_cache():
+  import tempfile
+  import shutil
+  from GeneratingDataset import DummyDataset
+  from TFNetworkLayer import InternalLayer
+  n_data_dim = 2
+  n_classes_dim = 7
+  dataset = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=2, seq_len=5)
+  dataset.init_seq_order(epoch=1)
+  cache_dir = tempfile.mkdtemp(prefix="nose-tf-graph-cache")
+  model_filename = tempfile.mktemp(prefix="nose-tf-model")
+  config = Config()
+  config.update({
+    "model": "/tmp/model",
+    "batch_size": 5000,
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network_graph_cache_dir": cache_dir,
+    "search_do_eval": False,
+    "network": {
+      "output": {
+        "class": "rec", "from": [], "max_seq_len": 10, "target": "classes",
+        "unit": {
+          "prob": {"class": "softmax", "from": ["prev:output"], "loss": "ce", "target": "classes"},
+          "output": {"class": "choice", "beam_size": 4, "from": ["prob"], "target": "classes", "initial_output": 0},
+          "end": {"class": "compare", "from": ["output"], "value": 0}
+        }
+      }
+    }
+  })
+  engine = Engine(config=config)
+  # Random init. Training is not affected by the cache.
+  engine.init_train_from_config(config=config, train_data=dataset, dev_data=None, eval_data=None)
+  assert not engine.network_from_graph_cache
+  engine.network.save_params_to_file(filename=model_filename, session=engine.tf_session)
+  outputs = []
+  for i in range(2):
+    engine.use_search_flag = True
+    engine.use_dynamic_train_flag = False
+    engine.init_network_from_config(config=config)
+    assert_equal(engine.network_from_graph_cache, i > 0)
+    if i > 0:
+      assert isinstance(engine.network.layers["output"], InternalLayer)
+    engine.network.load_params_from_file(filename=model_filename, session=engine.tf_session)
+    output_file = tempfile.mktemp(suffix=".py", prefix="nose-tf-search")
+    engine.search(dataset=dataset, do_eval=False, output_file=output_file, output_file_format="py")
+    outputs.append(eval(open(output_file).read()))
+    os.remove(output_file)
+  engine.finalize()
+  shutil.rmtree(cache_dir)
+  assert_equal(outputs[0], outputs[1])
+
+
+def test_engine_search_network_graph_cache_do_eval():
+  import tempfile
+  import shutil
+  from GeneratingDataset import DummyDataset
+  n_data_dim = 2
+  n_classes_dim = 7
+  dataset = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=2, seq_len=5)
+  dataset.init_seq_order(epoch=1)
+  cache_dir = tempfile.mkdtemp(prefix="nose-tf-graph-cache")
+  config = Config()
+  config.update({
+    "model": "/tmp/model",
+    "batch_size": 5000,
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network_graph_cache_dir": cache_dir,  # search_do_eval is True by default
+    "network": {
+      "output": {
+        "class": "rec", "from": [], "max_seq_len": 10, "target": "classes",
+        "unit": {
+          "prob": {"class": "softmax", "from": ["prev:output"], "loss": "ce", "target": "classes"},
+          "output": {"class": "choice", "beam_size": 4, "from": ["prob"], "target": "classes", "initial_output": 0},
+          "end": {"class": "compare", "from": ["output"], "value": 0}
+        }
+      },
+      "decision": {"class": "decide", "from": ["output"], "loss": "edit_distance"}
+    }
+  })
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=dataset, dev_data=None, eval_data=None)
+  # Like two separate search jobs with the default search_do_eval.
+  for i in range(2):
+    engine.use_search_flag = True
+    engine.use_dynamic_train_flag = False
+    engine.init_network_from_config(config=config)
+    assert not engine.network_from_graph_cache
+    engine.search(dataset=dataset, do_eval=config.bool("search_do_eval", True))
+    assert "decision" in engine.network.losses_dict
+  engine.finalize()
+  assert_equal(os.listdir(cache_dir), [])  # nothing stored, as it could not be used
+  shutil.rmtree(cache_dir)
+
+
+def test_network_graph_cache_key():
+  from TFNetwork import NetworkGraphCache
+  from Util import dict_joined
+
+  def make_net_dict(eval_func):
+    return {"output": {"class": "eval", "eval": eval_func, "from": ["data"]}}
+
+  def get_key(net_dict, **config_opts):
+    config = Config()
+    config.update(dict_joined({"num_outputs": 3, "num_inputs": 3}, config_opts))
+    return NetworkGraphCache._get_key(config=config, net_dict=net_dict, search_flag=True, eval_flag=True)
+
+  key = get_key(make_net_dict(lambda source, **kwargs: source(0) * 2.))
+  # Equal configs give equal keys, also when the functions are different objects.
+  assert_equal(key, get_key(make_net_dict(lambda source, **kwargs: source(0) * 2.)))
+  # Functions which differ only in their body, or constants, or closure.
+  assert key != get_key(make_net_dict(lambda source, **kwargs: source(0) * 3.))
+  assert key != get_key(make_net_dict(lambda source, **kwargs: source(0) + 2.))
+  factors = []
+  for factor in [2., 3.]:
+    factors.append(get_key(make_net_dict((lambda f: lambda source, **kwargs: source(0) * f)(factor))))
+  assert factors[0] != factors[1]
+  def get_key_eval_flag(eval_flag):
+    config = Config()
+    config.update({"num_outputs": 3, "num_inputs": 3})
+    return NetworkGraphCache._get_key(
+      config=config, net_dict=make_net_dict(lambda source, **kwargs: source(0) * 2.),
+      search_flag=True, eval_flag=eval_flag)
+
+  assert_equal(key, get_key_eval_flag(True))
+  assert key != get_key_eval_flag(False)
+  # Config options which have an influence on the graph.
+  assert key != get_key(make_net_dict(lambda source, **kwargs: source(0) * 2.), device="gpu")
+  assert key != get_key(make_net_dict(lambda source, **kwargs: source(0) * 2.), param_storage_quantization="int8")
+
+
 def check_engine_search_attention(extra_rec_kwargs=None):
   """
   :param dict[str] extra_rec_kwargs:
@@ -686,7 +686,7 @@ def native_lstm2_slice(name, **kwargs):
   return wrap_lstm_slice_start_step(op=native_lstm2, name="%s_slice" % name, **kwargs)
 
 
-def check_lstm_ops(op1, op2, name1, name2, rtol=1e-7, **kwargs):
+def check_lstm_ops(op1, op2, name1, name2, rtol=1e-7, atol=0, **kwargs):
   mask_bc = tf.expand_dims(kwargs["mask"], axis=2)
   mask_bc.set_shape(tf.TensorShape((kwargs["n_time"], kwargs["n_batch"], 1)))
   for start, step in [(0, 1), (0, -1), (1, 1), (1, -1), (0, 2), (0, -2)]:
@@ -710,9 +710,9 @@ def check_lstm_ops(op1, op2, name1, name2, rtol=1e-7, **kwargs):
     print(vd1)
     print("vd2:")
     print(vd2)
-    assert_allclose(vh1[start_::step] * vmask[start_::step], vh2[start_::step] * vmask[start_::step], rtol=rtol)
-    assert_allclose(vc1[start_::step] * vmask[start_::step], vc2[start_::step] * vmask[start_::step], rtol=rtol)
-    assert_allclose(vd1, vd2, rtol=rtol)
+    assert_allclose(vh1[start_::step] * vmask[start_::step], vh2[start_::step] * vmask[start_::step], rtol=rtol, atol=atol)
+    assert_allclose(vc1[start_::step] * vmask[start_::step], vc2[start_::step] * vmask[start_::step], rtol=rtol, atol=atol)
+    assert_allclose(vd1, vd2, rtol=rtol, atol=atol)
 
 
 def check_lstm_op_start_step(op, name, **kwargs):
@@ -828,7 +828,7 @@ def wrap_lstm_grad(op, x, h_0, c_0, dy, dd, mask, W_f, W_r, b, n_time, n_batch,
   return y, d, dx, dh0, dc0, dWf, dWr, db
 
 
-def check_lstm_grad_ops_single(op1, op2, name1, name2, dy, dd, rtol=1e-7, exclude=(), **kwargs):
+def check_lstm_grad_ops_single(op1, op2, name1, name2, dy, dd, rtol=1e-7, atol=0, exclude=(), **kwargs):
   mask_bc = tf.expand_dims(kwargs["mask"], axis=2)
   mask_bc.set_shape(tf.TensorShape((kwargs["n_time"], kwargs["n_batch"], 1)))
   y1, d1, dx1, dh01, dc01, dWf1, dWr1, db1 = wrap_lstm_grad(op=op1, dy=dy, dd=dd, name=name1, **kwargs)
@@ -854,7 +854,7 @@ def check_lstm_grad_ops_single(op1, op2, name1, name2, dy, dd, rtol=1e-7, exclud
       v1 = (v1 * vmask)[start_::step]
       v2 = (v2 * vmask)[start_::step]
     print("check", k)
-    assert_allclose(v1, v2, rtol=rtol, err_msg="no match for %s" % k)
+    assert_allclose(v1, v2, rtol=rtol, atol=atol, err_msg="no match for %s" % k)
 
 
 def check_lstm_grad_ops(name1, name2, **kwargs):
@@ -897,6 +897,43 @@ def test_native_lstm2_grad():
     rtol=1e-5, **kwargs)
 
 
+def lstm_large_batch_kwargs():
+  """
+  Like lstm_grad_kwargs, but with a batch large enough such that the CPU implementation
+  of NativeLstm2 splits it into multiple chunks for the thread pool.
+
+  :return: kwargs for check_lstm_ops / check_lstm_grad_ops
+  :rtype: dict[str]
+  """
+  rnd = numpy.random.RandomState(42)
+  n_time, n_batch, n_in_dim, n_cells = 5, 37, 3, 16
+  seq_lens = rnd.randint(1, n_time + 1, size=(n_batch,))
+  seq_lens[0] = n_time
+  kwargs = {
+    "n_time": n_time, "n_batch": n_batch, "n_in_dim": n_in_dim, "n_cells": n_cells,
+    "mask": (numpy.arange(n_time)[:, None] < seq_lens[None, :]).astype("float32")}
+  kwargs["x"] = rnd.normal(size=(n_time, n_batch, n_in_dim)).astype("float32")
+  kwargs["h_0"] = rnd.normal(scale=0.5, size=(n_batch, n_cells)).astype("float32")
+  kwargs["c_0"] = rnd.normal(scale=0.5, size=(n_batch, n_cells)).astype("float32")
+  kwargs["W_f"] = rnd.normal(scale=0.3, size=(n_in_dim, n_cells * 4)).astype("float32")
+  kwargs["W_r"] = rnd.normal(scale=0.3, size=(n_cells, n_cells * 4)).astype("float32")
+  kwargs["b"] = rnd.normal(scale=0.1, size=(n_cells * 4,)).astype("float32")
+  kwargs["dy"] = rnd.normal(size=(n_time, n_batch, n_cells)).astype("float32") * kwargs["mask"][:, :, None]
+  kwargs["dd"] = rnd.normal(size=(n_batch, n_cells)).astype("float32")
+  return kwargs
+
+
+def test_native_lstm2_large_batch():
+  kwargs = lstm_large_batch_kwargs()
+  dy, dd = kwargs.pop("dy"), kwargs.pop("dd")
+  check_lstm_ops(
+    op1=pure_tf_unrolled_lstm, op2=native_lstm2, name1="ref_lstm_large", name2="native_lstm2_large",
+    rtol=1e-4, atol=1e-5, **kwargs)
+  check_lstm_grad_ops(
+    op1=pure_tf_unrolled_lstm, name1="ref_lstm_large", op2=native_lstm2, name2="native_lstm2_large",
+    dy=dy, dd=dd, rtol=1e-4, atol=1e-5, **kwargs)
+
+
 def dummy_lstm_op(x, h_0, c_0, mask, W_f, W_r, b, n_time, n_batch, n_in_dim, n_cells, start, step, name):
   x = tf.convert_to_tensor(x)
   x.set_shape(tf.TensorShape((n_time, n_batch, n_in_dim)))
@@ -1027,7 +1064,6 @@ def test_tensorarray_grad_simple():
   assert_allclose(vdy, vdx)
 
 
-@unittest.skipIf(not is_gpu_available(), "no gpu on this system")
 def test_FastBaumWelch():
   print("Make op...")
   op = make_fast_baum_welch_op(compiler_opts=dict(verbose=True))  # will be cached, used inside :func:`fast_baum_welch`
@@ -1054,7 +1090,6 @@ def test_FastBaumWelch():
   print("score:", score)
 
 
-@unittest.skipIf(not is_gpu_available(), "no gpu on this system")
 def test_fast_bw_uniform():
   print("Make op...")
   op = make_fast_baum_welch_op(compiler_opts=dict(verbose=True))  # will be cached, used inside :func:`fast_baum_welch`
@@ -1120,6 +1155,169 @@ def test_fast_bw_uniform():
   print("Done.")
 
 
+def numpy_fast_baum_welch(am_scores, edges, weights, start_end_states, float_idx):
+  """
+  Simple (slow) reference implementation of :func:`fast_baum_welch`, separately for each seq.
+
+  :param numpy.ndarray am_scores: (time, batch, dim), in -log space
+  :param numpy.ndarray edges: (4,num_edges), edges of the graph (from,to,emission_idx,sequence_idx)
+  :param numpy.ndarray weights: (num_edges,), weights of the edges
+  :param numpy.ndarray start_end_states: (2, batch)
+  :param numpy.ndarray float_idx: (time, batch)
+  :return: (fwdbwd, obs_scores), like fast_baum_welch
+  :rtype: (numpy.ndarray, numpy.ndarray)
+  """
+  n_batch = am_scores.shape[1]
+  return numpy_multi_end_fast_baum_welch(
+    am_scores=am_scores, edges=edges, weights=weights, start_states=start_end_states[0],
+    end_states=numpy.stack([numpy.arange(n_batch), start_end_states[1]], axis=1),
+    end_state_weights=numpy.zeros((n_batch,), dtype="float32"), float_idx=float_idx)
+
+
+def numpy_multi_end_fast_baum_welch(am_scores, edges, weights, start_states, end_states, end_state_weights, float_idx):
+  """
+  Simple (slow) reference implementation of :class:`NativeOp.MultiEndFastBaumWelchOp`, separately for each seq.
+
+  :param numpy.ndarray am_scores: (time, batch, dim), in -log space
+  :param numpy.ndarray edges: (4,num_edges), edges of the graph (from,to,emission_idx,sequence_idx)
+  :param numpy.ndarray weights: (num_edges,), weights of the edges
+  :param numpy.ndarray start_states: (num_start_states,), state idx
+  :param numpy.ndarray end_states: (num_end_states, 2), (seq idx, state idx)
+  :param numpy.ndarray end_state_weights: (num_end_states,), in -log space
+  :param numpy.ndarray float_idx: (time, batch)
+  :return: (fwdbwd, obs_scores), like fast_baum_welch
+  :rtype: (numpy.ndarray, numpy.ndarray)
+  """
+  n_time, n_batch, n_dim = am_scores.shape
+  n_states = max(numpy.max(edges[:2]), numpy.max(start_states), numpy.max(end_states[:, 1])) + 1
+  from_, to, emission_idxs, seq_idxs = edges
+
+  def log_sum_exp(x):  # in -log space
+    if len(x) == 0 or numpy.isinf(numpy.min(x)):
+      return numpy.inf
+    return numpy.min(x) - numpy.log(numpy.sum(numpy.exp(numpy.min(x) - numpy.array(x))))
+
+  fwdbwd = numpy.full((n_time, n_batch, n_dim), numpy.inf)
+  obs_scores = numpy.zeros((n_time, n_batch))
+  for b in range(n_batch):
+    seq_len = int(numpy.sum(float_idx[:, b]))
+    seq_edges = [e for e in range(edges.shape[1]) if seq_idxs[e] == b]
+    scores = {e: [weights[e] + am_scores[t, b, emission_idxs[e]] for t in range(seq_len)] for e in seq_edges}
+    fwd = numpy.full((seq_len + 1, n_states), numpy.inf)
+    fwd[0, start_states] = 0.
+    for t in range(seq_len):
+      for s in range(n_states):
+        fwd[t + 1, s] = log_sum_exp([fwd[t, from_[e]] + scores[e][t] for e in seq_edges if to[e] == s])
+    bwd = numpy.full((seq_len + 1, n_states), numpy.inf)
+    for (end_seq_idx, end_state), end_state_weight in zip(end_states, end_state_weights):
+      if end_seq_idx == b:
+        bwd[seq_len, end_state] = end_state_weight
+    for t in reversed(range(seq_len)):
+      for s in range(n_states):
+        bwd[t, s] = log_sum_exp([bwd[t + 1, to[e]] + scores[e][t] for e in seq_edges if from_[e] == s])
+    for t in range(seq_len):
+      edge_scores = {e: fwd[t, from_[e]] + scores[e][t] + bwd[t + 1, to[e]] for e in seq_edges}
+      obs_scores[t, b] = log_sum_exp(list(edge_scores.values()))
+      for i in range(n_dim):
+        fwdbwd[t, b, i] = log_sum_exp(
+          [v - obs_scores[t, b] for (e, v) in edge_scores.items() if emission_idxs[e] == i])
+  return numpy.minimum(fwdbwd, 1e32), obs_scores
+
+
+def test_fast_bw_random_unequal_lens():
+  n_batch = 3
+  seq_lens = [7, 4, 6]
+  n_time = max(seq_lens)
+  n_classes = 4
+  rnd = numpy.random.RandomState(42)
+  # Linear HMM with loops and skips for each seq, different for each seq.
+  edges = []
+  start_end_states = []
+  state_offset = 0
+  for b in range(n_batch):
+    n_states = n_classes + 1 - b
+    for i in range(n_states - 1):
+      edges.append((state_offset + i, state_offset + i + 1, rnd.randint(n_classes), b))  # fwd
+      edges.append((state_offset + i + 1, state_offset + i + 1, rnd.randint(n_classes), b))  # loop
+      if i + 2 < n_states:
+        edges.append((state_offset + i, state_offset + i + 2, rnd.randint(n_classes), b))  # skip
+    start_end_states.append((state_offset, state_offset + n_states - 1))
+    state_offset += n_states
+  edges = numpy.array(edges, dtype="int32").transpose()
+  weights = rnd.uniform(0., 2., size=(edges.shape[1],)).astype("float32")
+  start_end_states = numpy.array(start_end_states, dtype="int32").transpose()
+  am_scores = rnd.uniform(0.1, 3., size=(n_time, n_batch, n_classes)).astype("float32")
+  float_idx = (numpy.arange(n_time)[:, None] < numpy.array(seq_lens)[None, :]).astype("float32")
+  ref_fwdbwd, ref_obs_scores = numpy_fast_baum_welch(
+    am_scores=am_scores, edges=edges, weights=weights, start_end_states=start_end_states, float_idx=float_idx)
+  devices = ["/cpu:0"]
+  if is_gpu_available():
+    devices.append("/gpu:0")
+  for device in devices:
+    print("Device:", device)
+    with tf.device(device):
+      fwdbwd, obs_scores = fast_baum_welch(
+        am_scores=tf.constant(am_scores), edges=tf.constant(edges), weights=tf.constant(weights),
+        start_end_states=tf.constant(start_end_states), float_idx=tf.constant(float_idx))
+    fwdbwd, obs_scores = session.run([fwdbwd, obs_scores])
+    print("score:")
+    print(repr(obs_scores))
+    assert_allclose(obs_scores, ref_obs_scores, rtol=1e-5)
+    assert_allclose(numpy.exp(-fwdbwd), numpy.exp(-ref_fwdbwd), rtol=1e-4, atol=1e-6)
+
+
+def test_multi_end_fast_bw_random_unequal_lens():
+  n_batch = 3
+  seq_lens = [7, 4, 6]
+  n_time = max(seq_lens)
+  n_classes = 4
+  rnd = numpy.random.RandomState(42)
+  # Linear HMM with loops and skips for each seq, different for each seq.
+  # The last two states of each seq are end states, with different weights.
+  edges = []
+  start_states = []
+  end_states = []
+  end_state_weights = []
+  state_offset = 0
+  for b in range(n_batch):
+    n_states = n_classes + 1 - b
+    for i in range(n_states - 1):
+      edges.append((state_offset + i, state_offset + i + 1, rnd.randint(n_classes), b))  # fwd
+      edges.append((state_offset + i + 1, state_offset + i + 1, rnd.randint(n_classes), b))  # loop
+      if i + 2 < n_states:
+        edges.append((state_offset + i, state_offset + i + 2, rnd.randint(n_classes), b))  # skip
+    start_states.append(state_offset)
+    end_states.extend([(b, state_offset + n_states - 1), (b, state_offset + n_states - 2)])
+    end_state_weights.extend([0., rnd.uniform(0.5, 2.)])
+    state_offset += n_states
+  edges = numpy.array(edges, dtype="int32").transpose()
+  weights = rnd.uniform(0., 2., size=(edges.shape[1],)).astype("float32")
+  start_states = numpy.array(start_states, dtype="int32")
+  end_states = numpy.array(end_states, dtype="int32")
+  end_state_weights = numpy.array(end_state_weights, dtype="float32")
+  am_scores = rnd.uniform(0.1, 3., size=(n_time, n_batch, n_classes)).astype("float32")
+  float_idx = (numpy.arange(n_time)[:, None] < numpy.array(seq_lens)[None, :]).astype("float32")
+  ref_fwdbwd, ref_obs_scores = numpy_multi_end_fast_baum_welch(
+    am_scores=am_scores, edges=edges, weights=weights, start_states=start_states,
+    end_states=end_states, end_state_weights=end_state_weights, float_idx=float_idx)
+  op = make_op(NativeOp.MultiEndFastBaumWelchOp)
+  devices = ["/cpu:0"]
+  if is_gpu_available():
+    devices.append("/gpu:0")
+  for device in devices:
+    print("Device:", device)
+    with tf.device(device):
+      fwdbwd, obs_scores = op(
+        tf.constant(am_scores), tf.constant(edges), tf.constant(weights), tf.constant(start_states),
+        tf.constant(end_states), tf.constant(end_state_weights), tf.constant(float_idx),
+        tf.zeros((2, state_offset)))
+    fwdbwd, obs_scores = session.run([fwdbwd, obs_scores])
+    print("score:")
+    print(repr(obs_scores))
+    assert_allclose(obs_scores, ref_obs_scores, rtol=1e-5)
+    assert_allclose(numpy.exp(-fwdbwd), numpy.exp(-ref_fwdbwd), rtol=1e-4, atol=1e-6)
+
+
 @unittest.skipIf(not is_gpu_available(), "no gpu on this system")
 @unittest.skipIf(is_gpu_available() and get_available_gpu_min_compute_capability() < 3.5, "too low compute capability")
 def test_init_blocksparse():
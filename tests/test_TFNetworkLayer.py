@@ -822,6 +822,73 @@ def test_subnet_load_on_init():
         numpy.testing.assert_array_equal(param_orig, param_subnet)
 
 
+def test_param_storage_quantization_int8():
+  import tempfile
+  model_filename = tempfile.mktemp(prefix="nose-tf-model")
+  n_in, n_hidden, n_out = 3, 8, 5
+  net_dict = {
+    "lstm": {"class": "rec", "unit": "nativelstm2", "n_out": n_hidden},
+    "att": {"class": "self_attention", "num_heads": 2, "total_key_dim": n_hidden, "n_out": n_hidden, "from": ["lstm"]},
+    "output": {"class": "linear", "activation": None, "n_out": n_out, "from": ["att"]}}
+  rnd = numpy.random.RandomState(42)
+  n_batch, n_time = 2, 7
+  input_value = rnd.normal(size=(n_batch, n_time, n_in)).astype("float32")
+
+  def run(network, session):
+    data = network.extern_data.data["data"]
+    return session.run(network.get_default_output_layer().output.placeholder, feed_dict={
+      data.placeholder: input_value, data.size_placeholder[0]: [n_time] * n_batch})
+
+  with make_scope() as session:
+    config = Config({"extern_data": {"data": {"dim": n_in}}})
+    network = TFNetwork(config=config, train_flag=False)
+    network.construct_from_dict(net_dict)
+    network.initialize_params(session)
+    output_float = run(network, session)
+    network.save_params_to_file(filename=model_filename, session=session)
+
+  with make_scope() as session:
+    config = Config({"extern_data": {"data": {"dim": n_in}}, "param_storage_quantization": "int8"})
+    network = TFNetwork(config=config, train_flag=False)
+    network.construct_from_dict(net_dict)
+    for layer_name in ["lstm", "att", "output"]:
+      assert network.layers[layer_name].param_storage_quantization == "int8"
+    assert_equal(network.layers["output"].params["W"].dtype.base_dtype, tf.int8)
+    assert_equal(network.layers["att"].params["QKV"].dtype.base_dtype, tf.int8)
+    # Bias is not quantized.
+    assert_equal(network.layers["output"].params["b"].dtype.base_dtype, tf.float32)
+    network.initialize_params(session)
+    network.load_params_from_file(filename=model_filename, session=session)
+    # The dequantized weights are set once on load.
+    layer = network.layers["output"]
+    w_q, w_scale, w_deq = session.run(
+      [layer.params["W"], layer.params["W_int8_scale"], layer.params["W_int8_dequantized"]])
+    assert_equal(w_deq.dtype, numpy.float32)
+    numpy.testing.assert_array_equal(w_deq, w_q.astype("float32") * w_scale)
+    assert numpy.any(w_deq != 0)
+    output_quantized = run(network, session)
+    print("max abs diff:", numpy.max(numpy.abs(output_float - output_quantized)))
+    numpy.testing.assert_allclose(output_float, output_quantized, rtol=0.05, atol=0.05)
+    # The saved checkpoint is float32 and compatible with the non-quantized network.
+    network.save_params_to_file(filename=model_filename, session=session)
+
+  with make_scope() as session:
+    config = Config({"extern_data": {"data": {"dim": n_in}}})
+    network = TFNetwork(config=config, train_flag=False)
+    network.construct_from_dict(net_dict)
+    network.load_params_from_file(filename=model_filename, session=session)
+    output_float2 = run(network, session)
+    numpy.testing.assert_allclose(output_quantized, output_float2, rtol=1e-5, atol=1e-5)
+
+  # In training, the option is ignored.
+  with make_scope() as session:
+    config = Config({"extern_data": {"data": {"dim": n_in}}, "param_storage_quantization": "int8"})
+    network = TFNetwork(config=config, train_flag=True)
+    network.construct_from_dict(net_dict)
+    assert not network.layers["output"].param_storage_quantization
+    assert_equal(network.layers["output"].params["W"].dtype.base_dtype, tf.float32)
+
+
 if __name__ == "__main__":
   try:
     better_exchook.install()
@@ -1430,6 +1430,145 @@ def test_rec_layer_move_out_of_loop():
   train(train_not_optim_net)
 
 
+def _run_search_over_log_probs(log_probs, beam_size, shortlist=None, rec_opts=None, **choice_opts):
+  """
+  Runs the search with a ChoiceLayer directly on the given log probs, i.e. without any model params.
+  Label 0 is EOS.
+
+  :param numpy.ndarray log_probs: (batch,time,dim)
+  :param int beam_size:
+  :param list[int]|None shortlist: the same for all seqs of the batch
+  :param dict[str]|None rec_opts: additional options for the RecLayer
+  :param choice_opts: additional options for the ChoiceLayer
+  :return: output labels (time,batch*beam), output seq lens (batch*beam,), beam scores (batch,beam)
+  :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+  """
+  n_batch, n_time, n_classes = log_probs.shape
+  extern_data = ExternData({
+    "data": {"dim": n_classes},
+    "shortlist": {"shape": (None,), "dtype": "int32", "time_dim_axis": None},
+    "classes": {"dim": n_classes, "sparse": True, "available_for_inference": False}})
+  choice_opts = dict(choice_opts)
+  if shortlist is not None:
+    choice_opts["shortlist"] = "base:data:shortlist"
+  with make_scope() as session:
+    net = TFNetwork(extern_data=extern_data, search_flag=True, train_flag=False, eval_flag=False)
+    net.construct_from_dict({
+      "output": dict({
+        "class": "rec", "from": ["data"], "max_seq_len": n_time,
+        "unit": {
+          "output": dict({
+            "class": "choice", "from": ["data:source"], "input_type": "log_prob",
+            "explicit_search_source": "prev:output", 'initial_output': 0,
+            "beam_size": beam_size, "target": "classes"}, **choice_opts),
+          "end": {"class": "compare", "from": ["output"], "value": 0}}}, **(rec_opts or {}))})
+    rec_layer = net.layers["output"]
+    feed_dict = {
+      net.extern_data.data["data"].placeholder: log_probs,
+      net.extern_data.data["data"].size_placeholder[0]: [n_time] * n_batch}
+    if shortlist is not None:
+      feed_dict[net.extern_data.data["shortlist"].placeholder] = [shortlist] * n_batch
+    out, out_sizes, scores = session.run(
+      (rec_layer.output.placeholder, rec_layer.output.get_sequence_lengths(),
+       rec_layer.get_search_choices().beam_scores),
+      feed_dict=feed_dict)
+    print("search with shortlist %r, rec opts %r, choice opts %r: output %r, seq lens %r, scores %r" % (
+      shortlist, rec_opts, choice_opts, out.tolist(), out_sizes.tolist(), scores.tolist()))
+    return out, out_sizes, scores
+
+
+def test_search_early_finish():
+  # Label 0 is EOS. In frame 0, EOS is already better than any other label, thus we can stop the search.
+  log_probs = numpy.array([[
+    [-0.1, -1., -2., -3.],
+    [-1., -0.1, -2., -3.],
+    [-1., -0.1, -2., -3.]]], dtype="float32")  # (batch,time,dim)
+  results = {}
+  for search_early_finish in [False, True]:
+    out, out_sizes, _ = _run_search_over_log_probs(
+      log_probs, beam_size=3, length_normalization=False, rec_opts={"search_early_finish": search_early_finish})
+    results[search_early_finish] = (out, out_sizes)
+  assert_equal(results[False][0].shape[0], 3)
+  assert_equal(results[True][0].shape[0], 1)
+  # The best hypothesis is the same.
+  assert_equal(results[True][0][0, 0], results[False][0][0, 0])
+  assert_equal(results[True][1][0], results[False][1][0])
+
+
+def test_search_shortlist():
+  log_probs = numpy.array([[
+    [-1., -2., -3., -9.],
+    [-0.6, -6., -0.5, -2.],
+    [-0.4, -0.6, -0.7, -1.]]], dtype="float32")  # (batch,time,dim). label 0 is EOS
+  opts = dict(beam_size=3, length_normalization=False)
+  full_out, _, full_scores = _run_search_over_log_probs(log_probs, **opts)
+  # The full vocab as shortlist. Label 0 is always added, thus we also get a duplicate here.
+  out, _, scores = _run_search_over_log_probs(log_probs, shortlist=[0, 1, 2, 3], **opts)
+  numpy.testing.assert_array_equal(out, full_out)
+  numpy.testing.assert_allclose(scores, full_scores)
+  # Only label 2 (and EOS).
+  out, _, _ = _run_search_over_log_probs(log_probs, shortlist=[2], **opts)
+  assert set(out.flatten().tolist()).issubset({0, 2})
+  # The fallback will always use the full vocab here.
+  out, _, scores = _run_search_over_log_probs(log_probs, shortlist=[2], shortlist_fallback_mass=0.99, **opts)
+  numpy.testing.assert_array_equal(out, full_out)
+  numpy.testing.assert_allclose(scores, full_scores)
+
+
+def test_search_shortlist_projection():
+  beam_size = 3
+  n_in = 5
+  n_classes = 7
+  rnd = numpy.random.RandomState(42)
+  x = rnd.normal(size=(1, 1, n_in)).astype("float32")  # (batch,time,dim)
+  shortlist = [5, 3, 5]  # with duplicate
+  extern_data = ExternData({
+    "data": {"dim": n_in},
+    "shortlist": {"shape": (None,), "dtype": "int32", "time_dim_axis": None},
+    "classes": {"dim": n_classes, "sparse": True, "available_for_inference": False}})
+  with make_scope() as session:
+    net = TFNetwork(extern_data=extern_data, search_flag=True, train_flag=False, eval_flag=False)
+    net.construct_from_dict({
+      "output": {
+        "class": "rec", "from": ["data"], "max_seq_len": 1,
+        "unit": {
+          "prob": {"class": "softmax", "from": ["data:source"], "target": "classes"},
+          "output": {
+            "class": "choice", "from": ["prob"], "input_type": "prob",
+            "explicit_search_source": "prev:output", 'initial_output': 0,
+            "shortlist": "base:data:shortlist",
+            "beam_size": beam_size, "length_normalization": False, "target": "classes"},
+          "end": {"class": "compare", "from": ["output"], "value": 0}}}})
+    rec_layer = net.layers["output"]
+    session.run(tf.global_variables_initializer())
+    params = {param.op.name.split("/")[-1]: session.run(param) for param in net.get_params_list()}
+    out, scores = session.run(
+      (rec_layer.output.placeholder, rec_layer.get_search_choices().beam_scores),
+      feed_dict={
+        net.extern_data.data["data"].placeholder: x,
+        net.extern_data.data["data"].size_placeholder[0]: [1],
+        net.extern_data.data["shortlist"].placeholder: [shortlist]})
+  print("output %r, scores %r" % (out.tolist(), scores.tolist()))
+  # Reference: logits only for the (unique) shortlist labels, normalized over the shortlist.
+  labels = [0, 3, 5]
+  logits = numpy.dot(x[0, 0], params["W"][:, labels]) + params["b"][labels]
+  ref_scores = logits - numpy.log(numpy.sum(numpy.exp(logits)))
+  assert_equal(sorted(out[0].tolist()), labels)  # no duplicates
+  numpy.testing.assert_allclose(sorted(scores[0].tolist()), sorted(ref_scores.tolist()), rtol=1e-5)
+
+
+def test_search_two_stage_top_k():
+  rnd = numpy.random.RandomState(42)
+  log_probs = rnd.normal(size=(3, 5, 11)).astype("float32")  # (batch,time,dim)
+  log_probs -= numpy.log(numpy.sum(numpy.exp(log_probs), axis=-1, keepdims=True))  # log-softmax
+  results = {}
+  for two_stage_top_k in [False, True]:
+    out, _, scores = _run_search_over_log_probs(log_probs, beam_size=4, two_stage_top_k=two_stage_top_k)
+    results[two_stage_top_k] = (out, scores)
+  numpy.testing.assert_array_equal(results[True][0], results[False][0])
+  numpy.testing.assert_allclose(results[True][1], results[False][1], rtol=1e-5)
+
+
 def test_rec_layer_search_select_src():
   from TFNetworkRecLayer import _SubnetworkRecCell
   n_src_dim = 5
@@ -1808,6 +1947,12 @@ def test_reclayer_optimize_out_selfatt_left():
     "class": "self_attention", "attention_left_only": True, "num_heads": 2, "total_key_dim": 6, "n_out": 18})
 
 
+def test_reclayer_optimize_out_selfatt_left_kv_cache():
+  check_reclayer_optimize_out({
+    "class": "self_attention", "attention_left_only": True, "num_heads": 2, "total_key_dim": 6, "n_out": 18,
+    "kv_cache_max_len": 10})
+
+
 def test_reclayer_optimize_out_dot():
   # Used for multi-head dot-attention.
   AttNumHeads = 4
@@ -1988,7 +2133,7 @@ def test_KenLmStateLayer():
         name="data", shape=(), time_dim_axis=None, dim=len(labels), sparse=True,
         auto_create_placeholders=True))
       data_layer = net.construct_layer(name="data", net_dict={})
-      layer_base_opts = dict(name="output", network=net, sources=[data_layer])
+      layer_base_opts = dict(name="output", network=net, sources=[data_layer], incremental=False)
       layer_out = KenLmStateLayer.get_out_data_from_opts(**layer_base_opts)
       rec_state = session.run(
         KenLmStateLayer.get_rec_initial_extra_outputs(batch_dim=1, rec_layer=None, **layer_base_opts))
@@ -2065,7 +2210,8 @@ def test_KenLmStateLayer_dense():
         vocab_file=tmp_bpe_vocab_file.name, vocab_unknown_label="<unk>",
         bpe_merge_symbol="@@",
         input_step_offset=1,
-        dense_output=True)
+        dense_output=True,
+        incremental=False)
       layer_out = KenLmStateLayer.get_out_data_from_opts(**layer_base_opts)
       batch_dim = 1
       rec_state = session.run(
@@ -2123,6 +2269,78 @@ def test_KenLmStateLayer_dense():
       print("Scores are as expected.")
 
 
+def _check_KenLmStateLayer_incremental(dense_output):
+  import TFKenLM
+  TFKenLM.get_tf_mod(verbose=True)
+  test_lm_file = TFKenLM.kenlm_dir + "/lm/test.arpa"
+  assert os.path.exists(test_lm_file)
+  from GeneratingDataset import Vocabulary
+  from TFNetworkLayer import InternalLayer
+  import tempfile
+  with make_scope() as session:
+    with tempfile.NamedTemporaryFile(mode="w", prefix="vocab") as tmp_bpe_vocab_file:
+      labels = "</s> <unk> be@@ yond imm@@ edi@@ ate conc@@ erns".split()
+      bpe_vocab_dict = Vocabulary.create_vocab_dict_from_labels(labels)
+      tmp_bpe_vocab_file.write(repr(bpe_vocab_dict))
+      tmp_bpe_vocab_file.flush()
+
+      net = TFNetwork(extern_data=ExternData())
+      net.extern_data.register_data(Data(
+        name="data", shape=(), time_dim_axis=None, dim=len(labels), sparse=True,
+        auto_create_placeholders=True))
+      data_layer = net.construct_layer(name="data", net_dict={})
+      layers = {}
+      rec_states = {}
+      for incremental in [False, True]:
+        layer_base_opts = dict(
+          name="output_%s" % ("incremental" if incremental else "full"), network=net, sources=[data_layer],
+          lm_file=test_lm_file,
+          vocab_file=tmp_bpe_vocab_file.name, vocab_unknown_label="<unk>",
+          bpe_merge_symbol="@@",
+          dense_output=dense_output,
+          incremental=incremental)
+        layer_out = KenLmStateLayer.get_out_data_from_opts(**layer_base_opts)
+        rec_state = session.run(
+          KenLmStateLayer.get_rec_initial_extra_outputs(batch_dim=2, rec_layer=None, **layer_base_opts))
+        prev_layer = InternalLayer(name="prev:%s" % layer_base_opts["name"], network=net, output=layer_out.copy())
+        prev_layer.rec_vars_outputs = {
+          k: tf.placeholder(name="prev_layer_%s" % k, shape=v.shape, dtype=v.dtype) for (k, v) in rec_state.items()}
+        with reuse_name_scope(KenLmStateLayer.cls_get_tf_scope_name(layer_base_opts["name"])):
+          layer = KenLmStateLayer(output=layer_out, rec_previous_layer=prev_layer, **layer_base_opts)
+          net.layers[layer.name] = layer
+        layers[incremental] = layer
+        rec_states[incremental] = rec_state
+      net.initialize_params(session=session)
+
+      input_word_ids = [
+        [labels.index(w) for w in "be@@ yond imm@@ edi@@ ate conc@@ erns </s>".split()],
+        [labels.index(w) for w in "imm@@ edi@@ ate be@@ yond conc@@ erns </s>".split()]]
+      for i in range(len(input_word_ids[0])):
+        if i == 4:
+          # Like in beam search, where the hypotheses get reordered.
+          for incremental in [False, True]:
+            rec_states[incremental] = {k: v[[1, 0]] if v.ndim else v for (k, v) in rec_states[incremental].items()}
+          input_word_ids = input_word_ids[::-1]
+        outputs = {}
+        for incremental, layer in layers.items():
+          feed_dict = {net.extern_data.data["data"].placeholder: [seq[i] for seq in input_word_ids]}
+          prev_layer = layer._rec_previous_layer
+          feed_dict.update({prev_layer.rec_vars_outputs[k]: v for (k, v) in rec_states[incremental].items()})
+          outputs[incremental], rec_states[incremental] = session.run(
+            (layer.output.placeholder, layer.rec_vars_outputs), feed_dict=feed_dict)
+        print("step %i, scores:" % i, outputs[True], "partial strings:", rec_states[True]["state"])
+        assert_almost_equal(outputs[False], outputs[True])
+        assert_almost_equal(rec_states[False]["scores"], rec_states[True]["scores"])
+
+
+def test_KenLmStateLayer_incremental():
+  _check_KenLmStateLayer_incremental(dense_output=False)
+
+
+def test_KenLmStateLayer_incremental_dense():
+  _check_KenLmStateLayer_incremental(dense_output=True)
+
+
 @unittest.skipIf(not is_gpu_available(), "no gpu on this system")
 def test_BlocksparseLSTM_load_params_from_native_lstm():
   from TFNativeOp import have_blocksparse_requirements, init_blocksparse
@@ -1927,6 +1927,19 @@ def test_same_context_loop():
   print("magic (totally arbitrary) res:", session.run(x))
 
 
+def test_quantize_weights_int8():
+  rnd = numpy.random.RandomState(42)
+  w = rnd.normal(size=(7, 5)).astype("float32")
+  w[:, 2] = 0.  # all-zero channel
+  q, scale = session.run(quantize_weights_int8(w))
+  assert_equal(q.dtype, numpy.int8)
+  assert_equal(scale.shape, (5,))
+  assert_equal(numpy.max(numpy.abs(q), axis=0)[[0, 1, 3, 4]].tolist(), [127] * 4)
+  w2 = session.run(dequantize_weights_int8(q, scale))
+  numpy.testing.assert_allclose(w, w2, atol=numpy.max(scale) * 0.5 + 1e-6)
+  assert_equal(w2[:, 2].tolist(), [0.] * 7)
+
+
 if __name__ == "__main__":
   try:
     better_exchook.install()
@@ -159,3 +159,35 @@ def test_pickle_unpickle_auto_unused():
       assert isinstance(s, SharedNumpyArray)
       assert s.is_server
       assert not s.is_in_use()
+
+
+@unittest.skipIf(not have_working_shmget(), "shmget does not work")
+def test_pickle_ring_buffer():
+  ring_buffer = SharedMemRingBuffer(size=64 * 1024, min_array_size=1)
+  old_enabled = SharedMemNumpyConfig["enabled"]
+  SharedMemNumpyConfig["enabled"] = False  # we want to test the ring buffer, not SharedNumpyArray
+  try:
+    kept = []
+    for i in range(50):
+      m = numpy.random.randn(i % 7 + 1, 100).astype("float32")
+      sio = StringIO()
+      Pickler(sio, ring_buffer=ring_buffer).dump((m, "foo"))
+      p = sio.getvalue()
+      assert len(p) < m.nbytes
+      m2, s = pickle_loads(p)
+      assert s == "foo"
+      assert numpy.allclose(m, m2)
+      assert isinstance(m2.base, SharedMemRingBufferArray)
+      if i % 2 == 0:
+        kept.append((m, m2))  # keep some in use while we wrap around
+      else:
+        numpy_set_unused(m2)
+      m2 = None
+      if len(kept) > 3:
+        m, m2 = kept.pop(i % 3)  # release out of order
+        assert numpy.allclose(m, m2)
+        m2 = None  # freed by the GC
+    for m, m2 in kept:
+      assert numpy.allclose(m, m2)
+  finally:
+    SharedMemNumpyConfig["enabled"] = old_enabled
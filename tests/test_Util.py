@@ -177,6 +177,35 @@ def test_NativeCodeCompiler():
   assert_equal(lib.get_magic(), 42)
 
 
+def test_NativeCodeCompiler_shared_cache():
+  import tempfile
+  import shutil
+  code = """
+    extern "C" int get_magic() { return 13; }
+    """
+  shared_cache_dir = tempfile.mkdtemp()
+  local_cache_dir = tempfile.mkdtemp()
+
+  class PublishingCompiler(NativeCodeCompiler):
+    SharedCacheDir = shared_cache_dir
+    SharedCachePublish = True
+
+  class ReadingCompiler(NativeCodeCompiler):
+    SharedCacheDir = shared_cache_dir
+
+  try:
+    PublishingCompiler(base_name="test_NativeCodeCompiler_shared_cache", code_version=1, code=code).get_lib_filename()
+    native = ReadingCompiler(base_name="test_NativeCodeCompiler_shared_cache", code_version=1, code=code)
+    native.cache_dir = local_cache_dir  # empty, thus it must use the shared cache
+    lib_filename = native.get_lib_filename()
+    assert lib_filename.startswith(shared_cache_dir + "/")
+    assert not os.listdir(local_cache_dir)
+    assert_equal(native.load_lib_ctypes().get_magic(), 13)
+  finally:
+    shutil.rmtree(shared_cache_dir)
+    shutil.rmtree(local_cache_dir)
+
+
 def test_Stats():
   rnd = numpy.random.RandomState(42)
   m = rnd.uniform(-2., 10., (1000, 3))
@@ -0,0 +1,77 @@
+
+import sys
+import os
+sys.path += ["."]  # Python 3 hack
+sys.path += [os.path.dirname(os.path.abspath(__file__)) + "/.."]
+sys.path += [os.path.dirname(os.path.abspath(__file__)) + "/../tools"]
+
+import tensorflow as tf
+from nose.tools import assert_equal, assert_not_in
+import numpy
+import numpy.testing
+from TFNetwork import TFNetwork, ExternData
+from compile_tf_graph import export_inference_graph, get_quantizable_param_names
+import better_exchook
+better_exchook.replace_traceback_format_tb()
+
+from Log import log
+log.initialize(verbosity=[5])
+
+
+def _export_and_compare(quantize, rtol, atol):
+  """
+  Exports a small net (like ``compile_tf_graph.py --inference 1 --quantize ...``),
+  and compares the outputs of the exported graph with the original net.
+
+  :param str|None quantize: "fp16" or "int8"
+  :param float rtol:
+  :param float atol:
+  """
+  n_in, n_hidden, n_out = 5, 7, 3
+  rnd = numpy.random.RandomState(42)
+  x = rnd.normal(size=(2, 4, n_in)).astype("float32")  # (batch,time,dim)
+  seq_lens = [4, 3]
+  with tf.Graph().as_default():
+    with tf.Session() as session:
+      net = TFNetwork(extern_data=ExternData({"data": {"dim": n_in}}), train_flag=False)
+      net.construct_from_dict({
+        "hidden": {"class": "linear", "activation": "tanh", "n_out": n_hidden, "from": ["data"]},
+        "output": {"class": "linear", "activation": None, "n_out": n_out, "from": ["hidden"]},
+        # Not needed for the output, thus its params are not in the exported graph.
+        "aux": {"class": "linear", "activation": None, "n_out": n_out, "from": ["hidden"]}})
+      net.initialize_params(session)
+      output = tf.identity(net.get_default_output_layer().output.get_placeholder_as_batch_major(), name="output")
+      data = net.extern_data.data["data"]
+      feed_dict = {data.placeholder.name: x, data.size_placeholder[0].name: seq_lens}
+      ref_output = session.run(output.name, feed_dict=feed_dict)
+      param_names = get_quantizable_param_names(net)
+      assert_equal(param_names, {"hidden/W", "output/W", "aux/W"})
+      graph_def = export_inference_graph(
+        session=session, network=net, output_tensors=[output], quantize=quantize)
+  const_nodes = {node.name: node for node in graph_def.node if node.op == "Const"}
+  assert_not_in("aux/W", const_nodes)
+  for param_name in param_names - {"aux/W"}:
+    if quantize:
+      # The float32 weights were replaced.
+      assert_not_in(param_name, const_nodes)
+      assert_not_in(param_name + "/read", const_nodes)
+      quantized_names = [
+        name for name in const_nodes if name.startswith(param_name + "/") and name.endswith("/" + quantize)]
+      assert_equal(len(quantized_names), 1)
+  with tf.Graph().as_default() as graph:
+    tf.import_graph_def(graph_def, name="")
+    with tf.Session(graph=graph) as session:
+      output_value = session.run("output:0", feed_dict=feed_dict)
+  numpy.testing.assert_allclose(output_value, ref_output, rtol=rtol, atol=atol)
+
+
+def test_export_inference_graph():
+  _export_and_compare(quantize=None, rtol=1e-5, atol=1e-6)
+
+
+def test_export_inference_graph_quantize_fp16():
+  _export_and_compare(quantize="fp16", rtol=1e-2, atol=1e-2)
+
+
+def test_export_inference_graph_quantize_int8():
+  _export_and_compare(quantize="int8", rtol=5e-2, atol=5e-2)
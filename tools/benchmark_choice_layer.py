@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the search in :class:`TFNetworkRecLayer.ChoiceLayer` (on CPU by default),
+for different vocabulary sizes and beam sizes.
+The scores are given as log-probs (random), so this only measures the search itself (log, top-k, beam reordering).
+Compares the search over the full vocabulary with the two-stage top-k (option ``two_stage_top_k``)
+and with the search over a shortlist (option ``shortlist``),
+and reports the speed and the difference of the best search score.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import numpy
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+import tensorflow as tf
+from TFNetwork import TFNetwork, ExternData
+import TFUtil
+
+
+def create_network(vocab_size, beam_size, mode):
+  """
+  :param int vocab_size:
+  :param int beam_size:
+  :param str mode: "full", "two_stage" or "shortlist"
+  :rtype: TFNetwork
+  """
+  extern_data = ExternData({
+    "data": {"dim": vocab_size},
+    "shortlist": {"shape": (None,), "dtype": "int32", "time_dim_axis": None},
+    "classes": {"dim": vocab_size, "sparse": True, "available_for_inference": False}})
+  choice_opts = {
+    "class": "choice", "from": ["data:source"], "input_type": "log_prob",
+    "explicit_search_source": "prev:output", "initial_output": 0,
+    "beam_size": beam_size, "length_normalization": False, "target": "classes"}
+  if mode == "shortlist":
+    choice_opts["shortlist"] = "base:data:shortlist"
+  elif mode == "two_stage":
+    choice_opts["two_stage_top_k"] = True
+  else:
+    assert mode == "full", "invalid mode %r" % mode
+  network = TFNetwork(extern_data=extern_data, search_flag=True, train_flag=False, eval_flag=False)
+  network.construct_from_dict({
+    "output": {
+      "class": "rec", "from": ["data"], "optimize_move_layers_out": False,
+      "unit": {"output": choice_opts}}})
+  return network
+
+
+def create_data(n_batch, n_time, vocab_size, shortlist_size, rnd):
+  """
+  :param int n_batch:
+  :param int n_time:
+  :param int vocab_size:
+  :param int shortlist_size:
+  :param numpy.random.RandomState rnd:
+  :return: log-probs (batch,time,vocab), shortlist (batch,shortlist_size).
+    The shortlist are the labels with the highest max prob over time in this sentence,
+    i.e. something like a source-conditioned lexical table would give us.
+  :rtype: (numpy.ndarray, numpy.ndarray)
+  """
+  x = rnd.normal(scale=3., size=(n_batch, n_time, vocab_size)).astype("float32")
+  x -= numpy.log(numpy.sum(numpy.exp(x), axis=-1, keepdims=True))  # log-softmax
+  shortlist = numpy.argsort(-numpy.max(x, axis=1), axis=-1)[:, :shortlist_size].astype("int32")
+  return x, shortlist
+
+
+def benchmark(session, network, data, shortlist, num_runs):
+  """
+  :param tf.Session session:
+  :param TFNetwork network:
+  :param numpy.ndarray data: (batch,time,vocab)
+  :param numpy.ndarray shortlist: (batch,shortlist_size)
+  :param int num_runs:
+  :return: seconds per step, best scores (batch,)
+  :rtype: (float, numpy.ndarray)
+  """
+  n_batch, n_time, _ = data.shape
+  feed_dict = {
+    network.extern_data.data["data"].placeholder: data,
+    network.extern_data.data["data"].size_placeholder[0]: numpy.array([n_time] * n_batch, dtype="int32"),
+    network.extern_data.data["shortlist"].placeholder: shortlist}
+  rec_layer = network.get_default_output_layer()
+  fetches = (rec_layer.output.placeholder, rec_layer.get_search_choices().beam_scores)
+  session.run(fetches, feed_dict=feed_dict)  # warmup
+  start_time = time.time()
+  scores = None
+  for _ in range(num_runs):
+    _, scores = session.run(fetches, feed_dict=feed_dict)
+  return (time.time() - start_time) / (num_runs * n_time), numpy.max(scores, axis=1)
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--vocab_sizes", default="1000,30000,100000")
+  arg_parser.add_argument("--beam_sizes", default="4,12,32")
+  arg_parser.add_argument("--modes", default="full,two_stage,shortlist")
+  arg_parser.add_argument("--shortlist_size", type=int, default=1000)
+  arg_parser.add_argument("--batch", type=int, default=8)
+  arg_parser.add_argument("--len", type=int, default=20)
+  arg_parser.add_argument("--num_runs", type=int, default=3)
+  arg_parser.add_argument("--device", default="cpu")
+  args = arg_parser.parse_args()
+  modes = args.modes.split(",")
+  rnd = numpy.random.RandomState(42)
+  print("vocab\tbeam\tmode\tms/step\tscore delta (best hyp, vs first mode)")
+  for vocab_size in [int(v) for v in args.vocab_sizes.split(",")]:
+    data, shortlist = create_data(
+      n_batch=args.batch, n_time=args.len, vocab_size=vocab_size,
+      shortlist_size=min(args.shortlist_size, vocab_size), rnd=rnd)
+    for beam_size in [int(b) for b in args.beam_sizes.split(",")]:
+      ref_scores = None
+      for mode in modes:
+        with tf.Graph().as_default() as graph, tf.device("/%s:0" % args.device):
+          with tf.Session(graph=graph) as session:
+            network = create_network(vocab_size=vocab_size, beam_size=beam_size, mode=mode)
+            step_time, scores = benchmark(
+              session=session, network=network, data=data, shortlist=shortlist, num_runs=args.num_runs)
+        if ref_scores is None:
+          ref_scores = scores
+        print("%i\t%i\t%s\t%.3f\t%.4f" % (
+          vocab_size, beam_size, mode, step_time * 1000., float(numpy.mean(scores - ref_scores))))
+
+
+if __name__ == "__main__":
+  import better_exchook
+  better_exchook.install()
+  TFUtil.setup_tf_thread_pools()
+  main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks :func:`TFNativeOp.fast_baum_welch` (i.e. :class:`NativeOp.FastBaumWelchOp`) on CPU and GPU (if available),
+with automata like we get them from Sprint for ASR training:
+for every seq a linear HMM (with loop and skip transitions) over the allophone states of the transcription,
+where the emission labels are e.g. CART labels.
+The number of HMM states per seq is derived from the seq length (e.g. ~2.5 frames per HMM state).
+Reports the runtime per batch and the max difference of the outputs between the devices.
+The number of CPU threads is set via ``--threads`` (the TF intra-op thread pool is global for the process).
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import numpy
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+import tensorflow as tf
+import TFUtil
+from TFNativeOp import fast_baum_welch
+
+
+def create_automata(seq_lens, frames_per_state, num_emissions, rnd):
+  """
+  :param list[int] seq_lens:
+  :param float frames_per_state: avg num frames per HMM state, to determine the num states per seq
+  :param int num_emissions: e.g. num CART labels
+  :param numpy.random.RandomState rnd:
+  :return: edges (4,num_edges), weights (num_edges,), start_end_states (2,batch)
+  :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+  """
+  edges = []
+  weights = []
+  start_end_states = []
+  state_offset = 0
+  for seq_idx, seq_len in enumerate(seq_lens):
+    num_hmm_states = max(int(seq_len / frames_per_state), 1)
+    labels = rnd.randint(num_emissions, size=(num_hmm_states,))
+    # State i (0 <= i <= num_hmm_states): we have consumed the first i HMM states. State 0 is the start state.
+    for i in range(num_hmm_states):
+      edges.append((state_offset + i, state_offset + i + 1, labels[i], seq_idx))  # forward
+      weights.append(0.7)
+      edges.append((state_offset + i + 1, state_offset + i + 1, labels[i], seq_idx))  # loop
+      weights.append(0.7)
+      if i + 1 < num_hmm_states:
+        edges.append((state_offset + i, state_offset + i + 2, labels[i + 1], seq_idx))  # skip
+        weights.append(3.0)
+    start_end_states.append((state_offset, state_offset + num_hmm_states))
+    state_offset += num_hmm_states + 1
+  return (
+    numpy.array(edges, dtype="int32").transpose(),
+    numpy.array(weights, dtype="float32"),
+    numpy.array(start_end_states, dtype="int32").transpose())
+
+
+def benchmark(device, am_scores, float_idx, edges, weights, start_end_states, num_runs):
+  """
+  :param str device: e.g. "cpu" or "gpu"
+  :param numpy.ndarray am_scores: (time,batch,dim)
+  :param numpy.ndarray float_idx: (time,batch)
+  :param numpy.ndarray edges:
+  :param numpy.ndarray weights:
+  :param numpy.ndarray start_end_states:
+  :param int num_runs:
+  :return: seconds per run, (fwdbwd, obs_scores)
+  :rtype: (float, (numpy.ndarray, numpy.ndarray))
+  """
+  with tf.Graph().as_default() as graph, tf.device("/%s:0" % device):
+    with tf.Session(graph=graph) as session:
+      inputs = {
+        "am_scores": am_scores, "float_idx": float_idx,
+        "edges": edges, "weights": weights, "start_end_states": start_end_states}
+      placeholders = {key: tf.placeholder(tf.as_dtype(value.dtype), shape=value.shape) for (key, value) in inputs.items()}
+      out = fast_baum_welch(**placeholders)
+      feed_dict = {placeholders[key]: value for (key, value) in inputs.items()}
+      res = session.run(out, feed_dict=feed_dict)  # warmup, and also compiles the op
+      start_time = time.time()
+      for _ in range(num_runs):
+        session.run(out, feed_dict=feed_dict)
+      return (time.time() - start_time) / num_runs, res
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--batch", type=int, default=20)
+  arg_parser.add_argument("--len", type=int, default=500, help="max num frames. seq lens are between len/2 and len")
+  arg_parser.add_argument("--frames_per_state", type=float, default=2.5)
+  arg_parser.add_argument("--num_emissions", type=int, default=4501, help="e.g. num CART labels")
+  arg_parser.add_argument("--devices", default=None, help="e.g. 'cpu,gpu'. by default cpu and gpu if available")
+  arg_parser.add_argument("--threads", type=int, default=None, help="for the CPU. by default num CPUs")
+  arg_parser.add_argument("--num_runs", type=int, default=5)
+  args = arg_parser.parse_args()
+  TFUtil.setup_tf_thread_pools(num_threads=args.threads)
+  if args.devices:
+    devices = args.devices.split(",")
+  else:
+    devices = ["cpu"] + (["gpu"] if TFUtil.is_gpu_available() else [])
+  rnd = numpy.random.RandomState(42)
+  seq_lens = rnd.randint(args.len // 2, args.len + 1, size=(args.batch,))
+  seq_lens[0] = args.len
+  edges, weights, start_end_states = create_automata(
+    seq_lens=seq_lens, frames_per_state=args.frames_per_state, num_emissions=args.num_emissions, rnd=rnd)
+  am_scores = rnd.normal(size=(args.len, args.batch, args.num_emissions)).astype("float32")
+  am_scores = numpy.log(numpy.sum(numpy.exp(am_scores), axis=-1, keepdims=True)) - am_scores  # -log softmax
+  float_idx = (numpy.arange(args.len)[:, None] < seq_lens[None, :]).astype("float32")
+  print("Batch: %i seqs, %i frames total, automata with %i states, %i edges, %i emission labels." % (
+    args.batch, int(numpy.sum(seq_lens)), int(numpy.max(start_end_states)) + 1, edges.shape[1], args.num_emissions))
+  ref_res = None
+  for device in devices:
+    run_time, res = benchmark(
+      device=device, am_scores=am_scores, float_idx=float_idx,
+      edges=edges, weights=weights, start_end_states=start_end_states, num_runs=args.num_runs)
+    if ref_res is None:
+      ref_res = res
+    fwdbwd_diff = numpy.max(numpy.abs(numpy.exp(-res[0]) - numpy.exp(-ref_res[0])))
+    score_diff = numpy.max(numpy.abs(res[1] - ref_res[1]))
+    print("%s: %.1f ms/batch, %.0f frames/sec, max diff to %s: posteriors %.2e, scores %.2e" % (
+      device, run_time * 1000., numpy.sum(seq_lens) / run_time, devices[0], fwdbwd_diff, score_diff))
+
+
+if __name__ == "__main__":
+  import better_exchook
+  better_exchook.install()
+  main()
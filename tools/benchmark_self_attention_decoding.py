@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the per-step latency of stacked left-only :class:`TFNetworkRecLayer.SelfAttentionLayer`
+inside a :class:`TFNetworkRecLayer.RecLayer` loop (like in decoding), depending on the decoded length.
+Compares the default behavior (concatenating the keys/values in every frame)
+with the preallocated key/value cache (option ``kv_cache_max_len``).
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import numpy
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+import tensorflow as tf
+from Config import Config
+from TFNetwork import TFNetwork
+import TFUtil
+
+
+def create_network(num_layers, num_heads, dim, kv_cache_max_len):
+  """
+  :param int num_layers:
+  :param int num_heads:
+  :param int dim:
+  :param int|None kv_cache_max_len:
+  :rtype: TFNetwork
+  """
+  subnet = {}
+  src = "data:source"
+  for i in range(num_layers):
+    subnet["att_%i" % i] = {
+      "class": "self_attention", "attention_left_only": True, "num_heads": num_heads,
+      "total_key_dim": dim, "n_out": dim, "from": [src]}
+    if kv_cache_max_len:
+      subnet["att_%i" % i]["kv_cache_max_len"] = kv_cache_max_len
+    src = "att_%i" % i
+  subnet["output"] = {"class": "copy", "from": [src]}
+  config = Config({"extern_data": {"data": {"dim": dim}}})
+  network = TFNetwork(config=config, train_flag=False, name="root")
+  network.construct_from_dict({
+    "output": {
+      "class": "rec", "from": ["data"], "unit": subnet, "n_out": dim,
+      "optimize_move_layers_out": False}})
+  return network
+
+
+def benchmark(session, network, n_batch, n_time, num_runs):
+  """
+  :param tf.Session session:
+  :param TFNetwork network:
+  :param int n_batch:
+  :param int n_time:
+  :param int num_runs:
+  :return: seconds per step
+  :rtype: float
+  """
+  data = network.extern_data.data["data"]
+  feed_dict = {
+    data.placeholder: numpy.random.normal(size=(n_batch, n_time, data.dim)).astype("float32"),
+    data.size_placeholder[0]: numpy.array([n_time] * n_batch, dtype="int32")}
+  output = network.get_default_output_layer().output.placeholder
+  session.run(output, feed_dict=feed_dict)  # warmup
+  start_time = time.time()
+  for _ in range(num_runs):
+    session.run(output, feed_dict=feed_dict)
+  return (time.time() - start_time) / (num_runs * n_time)
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--num_layers", type=int, default=6)
+  arg_parser.add_argument("--num_heads", type=int, default=8)
+  arg_parser.add_argument("--dim", type=int, default=512)
+  arg_parser.add_argument("--batch", type=int, default=12, help="e.g. beam size")
+  arg_parser.add_argument("--lens", default="10,50,100,200,400", help="decoded lengths")
+  arg_parser.add_argument("--num_runs", type=int, default=3)
+  args = arg_parser.parse_args()
+  lens = [int(n) for n in args.lens.split(",")]
+  results = {}
+  for mode in ["concat", "kv_cache"]:
+    with tf.Graph().as_default() as graph:
+      with tf.Session(graph=graph) as session:
+        network = create_network(
+          num_layers=args.num_layers, num_heads=args.num_heads, dim=args.dim,
+          kv_cache_max_len=max(lens) if mode == "kv_cache" else None)
+        network.initialize_params(session)
+        for n_time in lens:
+          results[(mode, n_time)] = benchmark(
+            session=session, network=network, n_batch=args.batch, n_time=n_time, num_runs=args.num_runs)
+          print("%s, len %i: %.3f ms/step" % (mode, n_time, results[(mode, n_time)] * 1000.))
+  print("Summary (ms/step):")
+  print("len\tconcat\tkv_cache")
+  for n_time in lens:
+    print("%i\t%.3f\t%.3f" % (n_time, results[("concat", n_time)] * 1000., results[("kv_cache", n_time)] * 1000.))
+
+
+if __name__ == "__main__":
+  import better_exchook
+  better_exchook.install()
+  TFUtil.setup_tf_thread_pools()
+  main()
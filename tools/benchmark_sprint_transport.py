@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the transport of Numpy arrays over a pipe to a subprocess,
+like we do it in SprintErrorSignals.SprintSubprocessInstance (posteriors to Sprint, error signals back)
+and ExternSprintDataset (features from Sprint).
+Compares the plain TaskSystem.Pickler with TaskSystem.SharedMemRingBuffer.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import numpy
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+import TaskSystem
+from TaskSystem import Pickler, Unpickler, SharedMemRingBuffer, numpy_set_unused
+
+
+def pipe_open():
+  readend, writeend = os.pipe()
+  return os.fdopen(readend, "rb", 0), os.fdopen(writeend, "wb", 0)
+
+
+def child_loop(pipe_p2c, pipe_c2p, ring_buffer_size, ring_buffer_shmid):
+  """
+  Like SprintControl.PythonControl.
+
+  :param file pipe_p2c:
+  :param file pipe_c2p:
+  :param int ring_buffer_size:
+  :param int|None ring_buffer_shmid: for the child-to-parent direction
+  """
+  ring_buffer = None
+  if ring_buffer_shmid is not None:
+    ring_buffer = SharedMemRingBuffer(size=ring_buffer_size, shmid=ring_buffer_shmid, is_writer=True)
+  while True:
+    cmd, arg = Unpickler(pipe_p2c).load()
+    if cmd == "exit":
+      break
+    elif cmd == "p2c":  # arg is the array. we only send back a small result
+      res = float(arg[-1, -1])
+      numpy_set_unused(arg)
+    elif cmd == "c2p":  # arg is the shape
+      res = numpy.ones(arg, dtype="float32")
+    else:
+      raise Exception("unknown cmd %r" % cmd)
+    Pickler(pipe_c2p, ring_buffer=ring_buffer).dump(("ok", res))
+
+
+def benchmark(transport, direction, num_frames, dim, num_seqs, ring_buffer_size):
+  """
+  :param str transport: "pickle" or "shm"
+  :param str direction: "p2c" or "c2p"
+  :param int num_frames: per seq
+  :param int dim:
+  :param int num_seqs:
+  :param int ring_buffer_size:
+  :return: frames per second
+  :rtype: float
+  """
+  ring_buffer_p2c = ring_buffer_c2p = None
+  if transport == "shm":
+    ring_buffer_p2c = SharedMemRingBuffer(size=ring_buffer_size, is_writer=True)
+    ring_buffer_c2p = SharedMemRingBuffer(size=ring_buffer_size, is_writer=False)
+  pipe_p2c = pipe_open()
+  pipe_c2p = pipe_open()
+  pid = os.fork()
+  if pid == 0:  # child
+    try:
+      pipe_p2c[1].close()
+      pipe_c2p[0].close()
+      child_loop(
+        pipe_p2c=pipe_p2c[0], pipe_c2p=pipe_c2p[1], ring_buffer_size=ring_buffer_size,
+        ring_buffer_shmid=ring_buffer_c2p.mem.shmid if ring_buffer_c2p else None)
+    except BaseException:
+      sys.excepthook(*sys.exc_info())
+    finally:
+      os._exit(0)  # no atexit handlers, they would remove the shared memory of the parent
+  pipe_p2c[0].close()
+  pipe_c2p[1].close()
+
+  def send(v):
+    Pickler(pipe_p2c[1], ring_buffer=ring_buffer_p2c).dump(v)
+
+  def read():
+    return Unpickler(pipe_c2p[0]).load()
+
+  posteriors = numpy.random.uniform(size=(num_frames, dim)).astype("float32")
+  start_time = time.time()
+  for i in range(num_seqs):
+    if direction == "p2c":
+      send(("p2c", posteriors))
+      status, res = read()
+    else:
+      send(("c2p", (num_frames, dim)))
+      status, res = read()
+      assert res.shape == (num_frames, dim)
+      res = float(res.sum())  # use the data, like the caller would do
+    assert status == "ok"
+  elapsed = time.time() - start_time
+  send(("exit", None))
+  os.waitpid(pid, 0)
+  pipe_p2c[1].close()
+  pipe_c2p[0].close()
+  return num_frames * num_seqs / elapsed
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--num_frames", type=int, default=1000, help="frames per seq")
+  arg_parser.add_argument("--dim", type=int, default=4501, help="e.g. number of output labels")
+  arg_parser.add_argument("--num_seqs", type=int, default=200)
+  arg_parser.add_argument("--ring_buffer_size", type=int, default=256 * 1024 * 1024)
+  arg_parser.add_argument("--transports", default="pickle,shm")
+  args = arg_parser.parse_args()
+  assert not TaskSystem.SharedMemNumpyConfig["enabled"]
+  print("Array per seq: (%i, %i) float32, %.1f MB." % (args.num_frames, args.dim, args.num_frames * args.dim * 4 / 1e6))
+  for direction in ["p2c", "c2p"]:
+    for transport in args.transports.split(","):
+      frames_per_sec = benchmark(
+        transport=transport, direction=direction,
+        num_frames=args.num_frames, dim=args.dim, num_seqs=args.num_seqs, ring_buffer_size=args.ring_buffer_size)
+      print("%s, %s: %.1f frames/sec" % (direction, transport, frames_per_sec))
+
+
+if __name__ == "__main__":
+  import better_exchook
+  better_exchook.install()
+  main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+"""
+Calibration for the int8 weight storage compression in inference
+(layer option / config option ``param_storage_quantization``, see :class:`TFNetworkLayer.LayerBase`).
+The weights are quantized to int8 when loaded, and the matmuls run in float32 on the (cached) dequantized weights,
+so this is about the effect of int8 weights on the outputs, not about speed or memory.
+The runtime is reported to check that there is no overhead.
+
+Runs the network (forward, CPU by default) over (a part of) some dataset,
+once with float32 weights as the reference, and then with quantized weights, and reports:
+
+* the error of the output of each layer relative to the float32 network,
+  either with all supported layers quantized,
+  or (``--per_layer``) with each layer quantized on its own, to find the sensitive layers,
+* the runtime and the losses/errors (if the dataset provides the targets) of the whole network.
+
+Layers which should not be quantized can then be excluded via ``"param_storage_quantization": False``
+in the net dict, or only selected layers get ``"param_storage_quantization": "int8"``.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import numpy
+import tensorflow as tf
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+import rnn
+from Log import log
+import Util
+
+config = None  # type: Config.Config
+
+
+def init(config_filename, log_verbosity, device):
+  """
+  :param str config_filename: filename to config-file
+  :param int log_verbosity:
+  :param str device:
+  """
+  rnn.initBetterExchook()
+  rnn.initThreadJoinHack()
+  print("Using config file %r." % config_filename)
+  assert os.path.exists(config_filename)
+  rnn.initConfig(configFilename=config_filename, commandLineOptions=[])
+  global config
+  config = rnn.config
+  config.set("log", None)
+  config.set("log_verbosity", log_verbosity)
+  config.set("use_tensorflow", True)
+  config.set("device", device)
+  config.set("param_storage_quantization", None)  # we set this explicitly per network
+  rnn.initLog()
+  print("Returnn calibrate-param-storage-quantization starting up.", file=log.v1)
+  rnn.returnnGreeting()
+  rnn.initBackendEngine()
+  assert Util.BackendEngine.is_tensorflow_selected(), "this is only for TensorFlow"
+  rnn.initFaulthandler()
+  rnn.initConfigJsonNetwork()
+
+
+def get_quantized_net_dict(net_dict, layer_names):
+  """
+  :param dict[str,dict[str]] net_dict:
+  :param list[str]|None layer_names: if None, all layers (via config)
+  :return: copy of net_dict with param_storage_quantization set for the given layers
+  :rtype: dict[str,dict[str]]
+  """
+  import copy
+  net_dict = copy.deepcopy(net_dict)
+  for name in layer_names or []:
+    net_dict[name]["param_storage_quantization"] = "int8"
+  return net_dict
+
+
+def get_supported_layer_names(network):
+  """
+  :param TFNetwork.TFNetwork network:
+  :return: names of layers (top-level) which support param_storage_quantization and have weight matrices
+  :rtype: list[str]
+  """
+  return [
+    name for (name, layer) in sorted(network.layers.items())
+    if layer.supports_param_storage_quantization and any([p.get_shape().ndims == 2 for p in layer.params.values()])]
+
+
+def run_network(net_dict, dataset, model_filename, quantize, max_seqs):
+  """
+  :param dict[str,dict[str]] net_dict:
+  :param Dataset.Dataset dataset:
+  :param str model_filename:
+  :param bool quantize: whether to set the global param_storage_quantization option
+  :param int max_seqs: max num seqs to use from the dataset
+  :return: layer outputs per batch (batch idx -> layer name -> output), runtime in secs, losses and errors summed,
+    network
+  :rtype: (list[dict[str,numpy.ndarray]], float, dict[str,float], TFNetwork.TFNetwork)
+  """
+  from TFEngine import Engine
+  from TFDataPipeline import FeedDictDataProvider
+  config.set("param_storage_quantization", "int8" if quantize else None)
+  with tf.Graph().as_default() as graph:
+    with tf.Session(graph=graph) as session:
+      network, _ = Engine.create_network(
+        config=config, rnd_seed=1, train_flag=False, eval_flag=True, search_flag=False, net_dict=net_dict)
+      network.maybe_construct_objective()
+      network.load_params_from_file(model_filename, session=session)
+      layer_outputs = {
+        name: layer.output.placeholder for (name, layer) in network.layers.items()
+        if layer.output.placeholder is not None and layer.output.dtype.startswith("float")}
+      losses = {}
+      for name, loss in network.losses_dict.items():
+        if loss.get_loss_value_for_fetch() is not None:
+          losses["cost:%s" % name] = loss.get_loss_value_for_fetch()
+        if loss.get_error_value() is not None:
+          losses["error:%s" % name] = loss.get_error_value()
+      dataset.init_seq_order(epoch=1)
+      batches = dataset.generate_batches(
+        recurrent_net=network.recurrent, batch_size=config.int("batch_size", 1), max_seqs=config.int("max_seqs", -1))
+      data_provider = FeedDictDataProvider(
+        tf_session=session, extern_data=network.extern_data, data_keys=network.used_data_keys,
+        dataset=dataset, batches=batches)
+      outputs = []
+      loss_sums = {key: 0.0 for key in losses}
+      run_time = 0.0
+      num_seqs = 0
+      while batches.has_more() and num_seqs < max_seqs:
+        feed_dict, meta = data_provider.get_feed_dict(single_threaded=True)
+        num_seqs += len(meta["seq_idx"])
+        start_time = time.time()
+        # First only the network output, to measure the runtime.
+        session.run(network.get_default_output_layer().output.placeholder, feed_dict=feed_dict)
+        run_time += time.time() - start_time
+        outputs_np, losses_np = session.run((layer_outputs, losses), feed_dict=feed_dict)
+        outputs.append(outputs_np)
+        for key, value in losses_np.items():
+          loss_sums[key] += float(value)
+  return outputs, run_time, loss_sums, network
+
+
+def compare_outputs(ref_outputs, outputs, layer_names=None):
+  """
+  :param list[dict[str,numpy.ndarray]] ref_outputs:
+  :param list[dict[str,numpy.ndarray]] outputs:
+  :param list[str]|None layer_names: if None, all
+  :return: layer name -> (relative L2 error, max abs error)
+  :rtype: dict[str,(float,float)]
+  """
+  assert len(ref_outputs) == len(outputs)
+  if layer_names is None:
+    layer_names = sorted(ref_outputs[0].keys()) if ref_outputs else []
+  res = {}
+  for name in layer_names:
+    diff_sq_sum, ref_sq_sum, max_abs = 0.0, 0.0, 0.0
+    for ref_batch, batch in zip(ref_outputs, outputs):
+      diff = batch[name].astype("float64") - ref_batch[name].astype("float64")
+      diff_sq_sum += float(numpy.sum(numpy.square(diff)))
+      ref_sq_sum += float(numpy.sum(numpy.square(ref_batch[name].astype("float64"))))
+      max_abs = max(max_abs, float(numpy.max(numpy.abs(diff))) if diff.size else 0.0)
+    res[name] = (numpy.sqrt(diff_sq_sum / max(ref_sq_sum, 1e-30)), max_abs)
+  return res
+
+
+def print_errors(errors):
+  """
+  :param dict[str,(float,float)] errors: via compare_outputs
+  """
+  print("  layer\trel L2 err\tmax abs err")
+  for name, (rel_err, max_abs) in sorted(errors.items()):
+    print("  %s\t%.6f\t%.6f" % (name, rel_err, max_abs))
+
+
+def main(argv):
+  argparser = argparse.ArgumentParser(description=__doc__)
+  argparser.add_argument("config_file", help="RETURNN config")
+  argparser.add_argument("--load", required=True, help="model checkpoint (float32) to load the params from")
+  argparser.add_argument("--data", default="dev", help="config key of the dataset, e.g. 'dev' or 'eval'")
+  argparser.add_argument("--max_seqs", type=int, default=100, help="max num seqs to use from the dataset")
+  argparser.add_argument("--per_layer", action="store_true", help="also quantize each layer on its own")
+  argparser.add_argument("--device", default="cpu")
+  argparser.add_argument("--verbosity", type=int, default=3)
+  args = argparser.parse_args(argv[1:])
+  init(config_filename=args.config_file, log_verbosity=args.verbosity, device=args.device)
+  from Dataset import init_dataset
+  dataset = init_dataset(config.typed_value(args.data))
+  net_dict = config.typed_value("network")
+  assert isinstance(net_dict, dict)
+
+  print("Running with float32 params.", file=log.v2)
+  ref_outputs, ref_time, ref_losses, ref_network = run_network(
+    net_dict=net_dict, dataset=dataset, model_filename=args.load, quantize=False, max_seqs=args.max_seqs)
+  supported_layer_names = get_supported_layer_names(ref_network)
+  print("Layers which support param_storage_quantization:", supported_layer_names)
+
+  if args.per_layer:
+    print("Per layer quantization (only the layer itself is quantized), output error of that layer:")
+    errors = {}
+    for name in supported_layer_names:
+      outputs, _, _, _ = run_network(
+        net_dict=get_quantized_net_dict(net_dict, [name]), dataset=dataset, model_filename=args.load,
+        quantize=False, max_seqs=args.max_seqs)
+      errors.update(compare_outputs(ref_outputs, outputs, layer_names=[name]))
+    print_errors(errors)
+
+  print("Running with all supported layers quantized.", file=log.v2)
+  outputs, run_time, losses, _ = run_network(
+    net_dict=net_dict, dataset=dataset, model_filename=args.load, quantize=True, max_seqs=args.max_seqs)
+  print("All layers quantized, output error of each layer:")
+  print_errors(compare_outputs(ref_outputs, outputs))
+
+  print("End-to-end:")
+  print("  \tfloat32\tint8")
+  print("  runtime (sec)\t%.3f\t%.3f" % (ref_time, run_time))
+  for key in sorted(ref_losses.keys()):
+    print("  %s\t%.6f\t%.6f" % (key, ref_losses[key], losses[key]))
+  rnn.finalize()
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""
+Collects statistics over a whole dataset in one pass, optionally in parallel worker processes
+(see :func:`Dataset.collect_dataset_statistics`):
+mean/std-dev/min/max of dense data (e.g. for feature normalization),
+class counts/priors of sparse data, and histograms of the seq lengths.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+import rnn
+from Log import log
+from Util import hms
+
+config = None  # type: Config.Config
+
+
+def init(config_str, log_verbosity):
+  """
+  :param str config_str: either filename to config-file, or dict for dataset
+  :param int log_verbosity:
+  :return: dataset opts, for :func:`Dataset.init_dataset`
+  :rtype: dict[str]|str|None
+  """
+  rnn.initBetterExchook()
+  rnn.initThreadJoinHack()
+  if config_str.strip().startswith("{"):
+    print("Using dataset %s." % config_str)
+    dataset_opts = eval(config_str.strip())
+    config_filename = None
+  else:
+    dataset_opts = None
+    config_filename = config_str
+    print("Using config file %r." % config_filename)
+    assert os.path.exists(config_filename)
+  rnn.initConfig(configFilename=config_filename, commandLineOptions=[])
+  global config
+  config = rnn.config
+  config.set("log", None)
+  config.set("log_verbosity", log_verbosity)
+  rnn.initLog()
+  print("Returnn collect-dataset-statistics starting up.", file=log.v1)
+  rnn.returnnGreeting()
+  rnn.initFaulthandler()
+  return dataset_opts
+
+
+def main(argv):
+  argparser = argparse.ArgumentParser(description=__doc__)
+  argparser.add_argument("returnn_config", help="either filename to config-file, or dict for dataset")
+  argparser.add_argument("--data", default="train", help="if config-file: config key of the dataset (default: train)")
+  argparser.add_argument("--epoch", type=int, default=1)
+  argparser.add_argument("--keys", help="comma-separated data keys (default: all)")
+  argparser.add_argument("--workers", type=int, default=1, help="num of worker processes (default: 1)")
+  argparser.add_argument("--shards", type=int, default=None, help="num of shards of the seqs (default: 4 * workers)")
+  argparser.add_argument("--dump_prefix", help="file-prefix to dump mean/std-dev, priors and seq len histograms to")
+  argparser.add_argument("--verbosity", type=int, default=3)
+  args = argparser.parse_args(argv[1:])
+  dataset_opts = init(config_str=args.returnn_config, log_verbosity=args.verbosity)
+  if dataset_opts is None:
+    dataset_opts = config.typed_value(args.data)
+    assert dataset_opts, "no dataset %r in config" % args.data
+  from Dataset import collect_dataset_statistics
+  start_time = time.time()
+  try:
+    stats = collect_dataset_statistics(
+      dataset_opts, keys=args.keys.split(",") if args.keys else None, epoch=args.epoch,
+      num_workers=args.workers, num_shards=args.shards)
+  except KeyboardInterrupt:
+    print("KeyboardInterrupt")
+    sys.exit(1)
+  print("Done. Total time %s." % hms(time.time() - start_time), file=log.v1)
+  stats.dump(output_file_prefix=args.dump_prefix, stream=log.v1)
+  rnn.finalize()
+
+
+if __name__ == '__main__':
+  main(sys.argv)
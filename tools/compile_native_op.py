@@ -58,6 +58,50 @@ def init(config_filename, log_verbosity):
     network.construct_from_dict(config.typed_dict["network"])
 
 
+def get_all_native_op_classes():
+  """
+  :return: all ops from :mod:`NativeOp` which we can compile
+  :rtype: list[type[NativeOp.NativeOpGenBase]]
+  """
+  import inspect
+  import NativeOp
+  return [
+    cls for (name, cls) in sorted(vars(NativeOp).items())
+    if inspect.isclass(cls) and issubclass(cls, NativeOp.NativeOpGenBase) and cls.c_fw_code is not None]
+
+
+def compile_all(search_for_numpy_blas):
+  """
+  Compiles all native ops from :mod:`NativeOp` and other native TF modules (e.g. KenLM)
+  for the current TF version (and CUDA, if available).
+
+  :param bool search_for_numpy_blas:
+  :return: list of names which failed to compile
+  :rtype: list[str]
+  """
+  from TFNativeOp import make_op
+  import TFKenLM
+  failed = []
+  compile_funcs = [
+    (cls.__name__, lambda cls=cls: make_op(cls, search_for_numpy_blas=search_for_numpy_blas))
+    for cls in get_all_native_op_classes()]
+  if os.path.exists("%s/lm" % TFKenLM.kenlm_dir):
+    compile_funcs.append(("KenLM", TFKenLM.get_tf_mod))
+  else:
+    print("KenLM not checked out in %r, skipping." % TFKenLM.kenlm_dir)
+  for name, func in compile_funcs:
+    print("Compile %r ..." % name)
+    start_time = time.time()
+    try:
+      func()
+    except Exception as exc:
+      print("Compile %r failed: %s: %s" % (name, type(exc).__name__, exc))
+      failed.append(name)
+      continue
+    print("Compile %r: %.3f sec." % (name, time.time() - start_time))
+  return failed
+
+
 def main(argv):
   from TFUtil import CudaEnv, NativeCodeCompiler
   CudaEnv.verbose_find_cuda = True
@@ -66,6 +110,10 @@ def main(argv):
   argparser = argparse.ArgumentParser(description='Compile some op')
   argparser.add_argument('--config', help="filename to config-file")
   argparser.add_argument('--native_op', help="op name. e.g. 'LstmGenericBase'")
+  argparser.add_argument('--all', action='store_true', help="compile all native ops (and KenLM, if available)")
+  argparser.add_argument(
+    '--shared_cache_dir',
+    help="publish all compiled libs to this shared cache dir (see config option native_code_shared_cache_dir)")
   argparser.add_argument('--search_for_numpy_blas', dest='search_for_numpy_blas', action='store_true',
                          help="search for blas inside numpys .libs folder")
   argparser.add_argument('--no_search_for_numpy_blas', dest='search_for_numpy_blas', action='store_false',
@@ -73,6 +121,9 @@ def main(argv):
   argparser.add_argument("--verbosity", default=4, type=int, help="5 for all seqs (default: 4)")
   argparser.add_argument("--output_file", help='if given, will write the list of libs to this file')
   args = argparser.parse_args(argv[1:])
+  if args.shared_cache_dir:
+    NativeCodeCompiler.SharedCacheDir = args.shared_cache_dir
+    NativeCodeCompiler.SharedCachePublish = True
   init(config_filename=args.config, log_verbosity=args.verbosity)
 
   import NativeOp
@@ -81,6 +132,9 @@ def main(argv):
     print("Loading native op %r" % args.native_op)
     make_op(getattr(NativeOp, args.native_op), compiler_opts={"verbose": True},
             search_for_numpy_blas=args.search_for_numpy_blas)
+  failed = []
+  if args.all:
+    failed = compile_all(search_for_numpy_blas=args.search_for_numpy_blas)
 
   libs = []
   if OpMaker.with_cuda and OpMaker.tf_blas_gemm_workaround:
@@ -99,7 +153,7 @@ def main(argv):
     for fn in libs:
       print(fn)
   else:
-    print("no libs compiled. use --native_op or --config")
+    print("no libs compiled. use --native_op, --all or --config")
 
   if args.output_file:
     with open(args.output_file, "w") as f:
@@ -107,6 +161,10 @@ def main(argv):
         f.write(fn + '\n')
     print("Wrote lib list to file:", args.output_file)
 
+  if failed:
+    print("Failed to compile:", ", ".join(failed))
+    sys.exit(1)
+
 
 if __name__ == '__main__':
   main(sys.argv)
@@ -64,6 +64,248 @@ def create_graph(train_flag, eval_flag, search_flag):
   return network
 
 
+def strip_asserts(graph_def):
+  """
+  Removes all Assert ops and the control dependencies on them.
+
+  :param tf.GraphDef graph_def:
+  :rtype: tf.GraphDef
+  """
+  assert_names = {node.name for node in graph_def.node if node.op == "Assert"}
+  out = tf.GraphDef()
+  out.versions.CopyFrom(graph_def.versions)
+  out.library.CopyFrom(graph_def.library)
+  for node in graph_def.node:
+    if node.name in assert_names:
+      continue
+    new_node = out.node.add()
+    new_node.CopyFrom(node)
+    del new_node.input[:]
+    new_node.input.extend([x for x in node.input if not (x.startswith("^") and x[1:] in assert_names)])
+  print("Removed %i Assert ops." % len(assert_names))
+  return out
+
+
+def fold_constants(graph_def, input_names, output_names):
+  """
+  :param tf.GraphDef graph_def:
+  :param list[str] input_names:
+  :param list[str] output_names:
+  :rtype: tf.GraphDef
+  """
+  try:
+    from tensorflow.tools.graph_transforms import TransformGraph
+  except ImportError:
+    print("TransformGraph not available in this TF version, constants will not be folded.")
+    return graph_def
+  return TransformGraph(
+    graph_def, input_names, output_names,
+    ["strip_unused_nodes", "fold_constants(ignore_errors=true)", "sort_by_execution_order"])
+
+
+def quantize_weights(graph_def, param_names, mode):
+  """
+  Replaces the given (frozen) float32 weights by a float16 or int8 constant and the conversion back to float32.
+  The conversion keeps the original node name, so all consumers stay the same.
+  For int8, we use a symmetric scale per output channel (last axis).
+
+  This must run after :func:`fold_constants`, otherwise the folding would undo the quantization.
+
+  :param tf.GraphDef graph_def: frozen, i.e. the params are Const nodes
+  :param set[str] param_names: names of the param variables. see :func:`get_param_const_node_names`
+  :param str mode: "fp16" or "int8"
+  :rtype: tf.GraphDef
+  """
+  from tensorflow.python.framework import tensor_util
+  assert mode in ["fp16", "int8"], "invalid quantize mode %r" % mode
+  param_names = set(get_param_const_node_names(graph_def, param_names).values())
+  out = tf.GraphDef()
+  out.versions.CopyFrom(graph_def.versions)
+  out.library.CopyFrom(graph_def.library)
+  num_bytes_before = num_bytes_after = 0
+
+  def make_const(name, value, device):
+    node = out.node.add()
+    node.op = "Const"
+    node.name = name
+    node.device = device
+    node.attr["dtype"].type = tf.as_dtype(value.dtype).as_datatype_enum
+    node.attr["value"].tensor.CopyFrom(tensor_util.make_tensor_proto(value))
+    return node
+
+  for node in graph_def.node:
+    if node.name not in param_names:
+      out.node.add().CopyFrom(node)
+      continue
+    value = tensor_util.MakeNdarray(node.attr["value"].tensor)
+    num_bytes_before += value.nbytes
+    if mode == "fp16":
+      make_const("%s/fp16" % node.name, value.astype("float16"), device=node.device)
+      num_bytes_after += value.nbytes // 2
+      cast_input = "%s/fp16" % node.name
+      cast_src_dtype = tf.float16
+    else:
+      reduce_axes = tuple(range(value.ndim - 1))
+      scale = numpy.max(numpy.abs(value), axis=reduce_axes) / 127.  # (n_out,)
+      scale[scale == 0] = 1.
+      value_q = numpy.clip(numpy.round(value / scale), -127, 127).astype("int8")
+      make_const("%s/int8" % node.name, value_q, device=node.device)
+      make_const("%s/scale" % node.name, scale.astype("float32"), device=node.device)
+      num_bytes_after += value_q.nbytes + scale.nbytes
+      cast_input = "%s/int8" % node.name
+      cast_src_dtype = tf.int8
+    cast_node = out.node.add()
+    cast_node.op = "Cast"
+    cast_node.name = node.name if mode == "fp16" else "%s/cast" % node.name
+    cast_node.device = node.device
+    cast_node.input.append(cast_input)
+    cast_node.attr["SrcT"].type = cast_src_dtype.as_datatype_enum
+    cast_node.attr["DstT"].type = tf.float32.as_datatype_enum
+    if mode == "int8":
+      mul_node = out.node.add()
+      mul_node.op = "Mul"
+      mul_node.name = node.name
+      mul_node.device = node.device
+      mul_node.input.extend([cast_node.name, "%s/scale" % node.name])
+      mul_node.attr["T"].type = tf.float32.as_datatype_enum
+  print("Quantized weights (%s): %s -> %s." % (
+    mode, Util.human_bytes_size(num_bytes_before), Util.human_bytes_size(num_bytes_after)))
+  return out
+
+
+def get_param_const_node_names(graph_def, param_names):
+  """
+  After freezing, a param is a Const node with the same name as the variable.
+  Constant folding might have replaced it, e.g. by the folded Identity (``<name>/read``),
+  or by a node with a generated name (``<name>/read/_0__cf__0``).
+  Params which are not needed for the outputs were removed by ``extract_sub_graph``, those are skipped.
+
+  :param tf.GraphDef graph_def: frozen
+  :param set[str] param_names: names of the param variables
+  :return: param name -> name of the float32 Const node in graph_def, only for the params found in graph_def
+  :rtype: dict[str,str]
+  """
+  import re
+  const_node_names = [
+    node.name for node in graph_def.node
+    if node.op == "Const" and node.attr["dtype"].type == tf.float32.as_datatype_enum]
+  res = {}
+  missing = []
+  for param_name in sorted(param_names):
+    pattern = re.compile(r"^%s(/read)?(/_\d+__cf__\d+)?$" % re.escape(param_name))
+    matches = [name for name in const_node_names if pattern.match(name)]
+    if not matches:
+      missing.append(param_name)
+      continue
+    if len(matches) > 1:
+      raise Exception("param %r is ambiguous in graph, Const nodes %r" % (param_name, matches))
+    res[param_name] = matches[0]
+  if missing:
+    print("Params not in graph (not needed for the outputs), not quantized: %s" % ", ".join(missing))
+  return res
+
+
+def get_quantizable_param_names(network):
+  """
+  :param TFNetwork.TFNetwork network:
+  :return: names of the weight matrices of LinearLayer/RecLayer (and sub layers)
+  :rtype: set[str]
+  """
+  from TFNetworkLayer import LinearLayer
+  from TFNetworkRecLayer import RecLayer
+  names = set()
+  layers = list(network.layers.values())
+  while layers:
+    layer = layers.pop(0)
+    if isinstance(layer, RecLayer) and hasattr(layer.cell, "net"):
+      layers.extend(layer.cell.net.layers.values())  # the subnetwork
+    if not isinstance(layer, (LinearLayer, RecLayer)):
+      continue
+    for param in layer.params.values():
+      if param.get_shape().ndims >= 2:  # not the bias
+        names.add(param.op.name)
+  return names
+
+
+def get_benchmark_feed_dict(network, seq_len):
+  """
+  :param TFNetwork.TFNetwork network:
+  :param int seq_len:
+  :return: feed dict with random data for all used data keys, batch 1, placeholder name -> value
+  :rtype: dict[str,numpy.ndarray]
+  """
+  rnd = numpy.random.RandomState(42)
+  feed_dict = {}
+  for key in sorted(network.used_data_keys):
+    data = network.extern_data.data[key]
+    shape = [1 if i == data.batch_dim_axis else (seq_len if d is None else d) for (i, d) in enumerate(data.batch_shape)]
+    if data.sparse or data.dtype.startswith("int"):
+      value = rnd.randint(0, max(data.dim or 1, 1), size=shape).astype(data.dtype)
+    else:
+      value = rnd.normal(size=shape).astype(data.dtype)
+    feed_dict[data.placeholder.name] = value
+    for axis, size in sorted((data.size_placeholder or {}).items()):
+      feed_dict[size.name] = numpy.array([seq_len], dtype="int32")
+  return feed_dict
+
+
+def measure_latency(session, feed_dict, fetches, num_runs=10):
+  """
+  :param tf.Session session:
+  :param dict[str,numpy.ndarray] feed_dict: tensor name -> value
+  :param list[str] fetches: tensor names
+  :param int num_runs:
+  :return: average time in secs of one run
+  :rtype: float
+  """
+  session.run(fetches, feed_dict=feed_dict)  # warmup
+  start_time = time.time()
+  for _ in range(num_runs):
+    session.run(fetches, feed_dict=feed_dict)
+  return (time.time() - start_time) / num_runs
+
+
+def export_inference_graph(session, network, output_tensors, quantize=None, benchmark_seq_len=0):
+  """
+  Freezes the params (converts to constants), removes asserts and everything not needed for the outputs,
+  folds constants, and optionally quantizes the weights.
+
+  :param tf.Session session: params are loaded in here
+  :param TFNetwork.TFNetwork network:
+  :param list[tf.Tensor] output_tensors:
+  :param str|None quantize: "fp16" or "int8"
+  :param int benchmark_seq_len: if set, compare the latency before/after
+  :rtype: tf.GraphDef
+  """
+  from tensorflow.python.framework import graph_util
+  output_names = [x.op.name for x in output_tensors]
+  input_names = []
+  for key in sorted(network.used_data_keys):
+    data = network.extern_data.data[key]
+    input_names.append(data.placeholder.op.name)
+    input_names.extend([size.op.name for (_, size) in sorted((data.size_placeholder or {}).items())])
+  graph_def = session.graph.as_graph_def()
+  print("Graph def size before:", Util.human_bytes_size(graph_def.ByteSize()), "num nodes:", len(graph_def.node))
+  graph_def = graph_util.convert_variables_to_constants(session, graph_def, output_names)
+  graph_def = strip_asserts(graph_def)
+  graph_def = graph_util.extract_sub_graph(graph_def, output_names)
+  graph_def = fold_constants(graph_def, input_names=input_names, output_names=output_names)
+  if quantize:
+    graph_def = quantize_weights(graph_def, param_names=get_quantizable_param_names(network), mode=quantize)
+  print("Graph def size after:", Util.human_bytes_size(graph_def.ByteSize()), "num nodes:", len(graph_def.node))
+  if benchmark_seq_len:
+    feed_dict = get_benchmark_feed_dict(network, seq_len=benchmark_seq_len)
+    fetches = [x.name for x in output_tensors]
+    latency_before = measure_latency(session, feed_dict=feed_dict, fetches=fetches)
+    with tf.Graph().as_default() as graph:
+      tf.import_graph_def(graph_def, name="")
+      with tf.Session(graph=graph) as inference_session:
+        latency_after = measure_latency(inference_session, feed_dict=feed_dict, fetches=fetches)
+    print("Latency (batch 1, seq len %i): before %.2f ms, after %.2f ms." % (
+      benchmark_seq_len, latency_before * 1000., latency_after * 1000.))
+  return graph_def
+
+
 def main(argv):
   argparser = argparse.ArgumentParser(description='Compile some op')
   argparser.add_argument('config', help="filename to config-file")
@@ -75,8 +317,22 @@ def main(argv):
   argparser.add_argument("--output_file", help='output pb, pbtxt or meta, metatxt file')
   argparser.add_argument("--output_file_model_params_list", help="line-based, names of model params")
   argparser.add_argument("--output_file_state_vars_list", help="line-based, name of state vars")
+  argparser.add_argument(
+    "--inference", type=int, default=0,
+    help="1: inference-optimized export (frozen params, no asserts, folded constants). needs --load")
+  argparser.add_argument("--load", help="model checkpoint to load the params from (for --inference)")
+  argparser.add_argument("--quantize", help="for --inference: quantize weights of linear/rec layers: fp16 or int8")
+  argparser.add_argument(
+    "--benchmark_seq_len", type=int, default=10, help="for --inference: compare latency before/after. 0 disables")
   args = argparser.parse_args(argv[1:])
   assert args.train in [0, 1, 2] and args.eval in [0, 1] and args.search in [0, 1]
+  if args.inference:
+    assert args.train == 0, "inference export needs a fixed train flag"
+    assert args.load, "inference export needs --load"
+    assert not args.summaries_tensor_name, "inference export does not have summaries"
+    assert not args.output_file or os.path.splitext(args.output_file)[1] in [".pb", ".pbtxt"]
+  else:
+    assert not args.quantize, "--quantize only with --inference"
   init(config_filename=args.config, log_verbosity=args.verbosity)
   with tf.Graph().as_default() as graph:
     assert isinstance(graph, tf.Graph)
@@ -93,12 +349,17 @@ def main(argv):
     network = create_graph(train_flag=train_flag, eval_flag=eval_flag, search_flag=search_flag)
 
     from TFNetworkLayer import LayerBase
+    output_tensors = []  # for the inference export
     for layer in network.layers.values():
       assert isinstance(layer, LayerBase)
       if layer.output.time_dim_axis is None:
+        if layer.is_output_layer():
+          output_tensors.append(layer.output.placeholder)
         continue
       with layer.cls_layer_scope(layer.name):
-        tf.identity(layer.output.get_placeholder_as_batch_major(), name="output_batch_major")
+        output_batch_major = tf.identity(layer.output.get_placeholder_as_batch_major(), name="output_batch_major")
+      if layer.is_output_layer():
+        output_tensors.append(output_batch_major)
 
     tf.group(*network.get_post_control_dependencies(), name="post_control_dependencies")
 
@@ -107,7 +368,15 @@ def main(argv):
       assert isinstance(summaries_tensor, tf.Tensor), "no summaries in the graph?"
       tf.identity(summaries_tensor, name=args.summaries_tensor_name)
 
-    if args.output_file and os.path.splitext(args.output_file)[1] in [".meta", ".metatxt"]:
+    if args.inference:
+      assert output_tensors, "no output layers"
+      with tf.Session() as session:
+        network.initialize_params(session)
+        network.load_params_from_file(args.load, session=session)
+        graph_def = export_inference_graph(
+          session=session, network=network, output_tensors=output_tensors,
+          quantize=args.quantize, benchmark_seq_len=args.benchmark_seq_len)
+    elif args.output_file and os.path.splitext(args.output_file)[1] in [".meta", ".metatxt"]:
       # https://www.tensorflow.org/api_guides/python/meta_graph
       saver = tf.train.Saver(
         var_list=network.get_saveable_params_list(), max_to_keep=2 ** 31 - 1)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+Converts the seq lens json file for :class:`MetaDataset.MetaDataset` (option ``seq_lens_file``),
+i.e. dict[str,dict[str,int]], seq-tag -> data-key -> len,
+into the compact binary format (npz), i.e. data-key -> int32 array of lens, aligned to the seq list,
+and a hash of the seq list, which is checked when loading it.
+Use the same seq list file as for the MetaDataset (option ``seq_list_file``).
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import numpy
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+from MetaDataset import load_seq_lens, save_seq_lens
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("seq_lens_file", help="json")
+  arg_parser.add_argument("seq_list_file", help="line-separated, or pkl, like for MetaDataset")
+  arg_parser.add_argument("out_file", help="npz")
+  arg_parser.add_argument(
+    "--dataset_key", help="if the pkl seq list is a dict: the dataset key of the 'data' key in the MetaDataset")
+  args = arg_parser.parse_args()
+  assert args.out_file.endswith(".npz"), "out_file should end with .npz, as this is how MetaDataset detects the format"
+
+  start_time = time.time()
+  if args.seq_list_file.endswith(".pkl"):
+    import pickle
+    seq_list = pickle.load(open(args.seq_list_file, 'rb'))
+  else:
+    seq_list = open(args.seq_list_file).read().splitlines()
+  if isinstance(seq_list, dict):
+    assert args.dataset_key, "need --dataset_key, seq list has keys %r" % (sorted(seq_list.keys()),)
+    seq_list = seq_list[args.dataset_key]
+  assert isinstance(seq_list, list)
+  print("Seq list: %i seqs." % len(seq_list))
+
+  seq_lens = load_seq_lens(filename=args.seq_lens_file, seq_list=seq_list)
+  print("Loaded json in %.1f secs. Data keys: %r." % (time.time() - start_time, sorted(seq_lens.keys())))
+  for key, lens in sorted(seq_lens.items()):
+    print("  %s: total len %i, max len %i" % (key, int(numpy.sum(lens)), int(numpy.max(lens)) if len(lens) else 0))
+
+  save_seq_lens(filename=args.out_file, seq_lens=seq_lens, seq_list=seq_list)
+  print("Wrote %s." % args.out_file)
+
+  # Check.
+  seq_lens_ = load_seq_lens(filename=args.out_file, seq_list=seq_list)
+  assert sorted(seq_lens_.keys()) == sorted(seq_lens.keys())
+  for key in seq_lens.keys():
+    assert numpy.array_equal(seq_lens_[key], seq_lens[key])
+
+
+if __name__ == "__main__":
+  import better_exchook
+  better_exchook.install()
+  main()